@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 import dj_database_url
 from dotenv import load_dotenv
 from datetime import timedelta
@@ -60,6 +61,10 @@ INSTALLED_APPS = [
 
 # Промежуточное ПО для обработки HTTP-запросов
 MIDDLEWARE = [
+    'logistic.profiling.RequestProfilingMiddleware',           # Профилирование запросов (по заголовку или выборке)
+    'logistic.metrics.MetricsMiddleware',                      # Метрики запросов для /api/metrics/
+    'logistic.db_router.ReplicaStickinessMiddleware',          # Чтение из основной базы после записи
+    'logistic.compression.CompressionMiddleware',              # Сжатие ответов (br, zstd, gzip)
     'django.middleware.security.SecurityMiddleware',           # Безопасность
     'django.contrib.sessions.middleware.SessionMiddleware',    # Сессии
     'corsheaders.middleware.CorsMiddleware',                  # CORS (Cross-Origin Resource Sharing)
@@ -89,26 +94,72 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': dj_database_url.config(
-        default=os.getenv('DATABASE_URL'),
-        conn_max_age=600,
-        conn_health_checks=True,
-    )
+# Пул соединений PostgreSQL (psycopg 3): соединения процесса переиспользуются между запросами
+DATABASE_POOL = os.getenv('DATABASE_POOL', 'False') == 'True'
+DATABASE_POOL_OPTIONS = {
+    'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', 2)),
+    'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', 10)),
+    # Сколько секунд ждать свободного соединения
+    'timeout': float(os.getenv('DATABASE_POOL_TIMEOUT', 10)),
 }
 
-# Резервная SQLite база данных для разработки, если переменная DATABASE_URL не задана
-if not os.getenv('DATABASE_URL'):
+
+def _database_config(url):
+    config = dj_database_url.parse(
+        url,
+        # Под ASGI постоянные соединения не переиспользуются между запросами - задайте 0
+        conn_max_age=int(os.getenv('DATABASE_CONN_MAX_AGE', 600)),
+        conn_health_checks=True,
+    )
+    if DATABASE_POOL and config['ENGINE'] == 'django.db.backends.postgresql':
+        # С пулом соединение возвращается в пул после запроса, CONN_MAX_AGE должен быть 0
+        config['CONN_MAX_AGE'] = 0
+        config.setdefault('OPTIONS', {})['pool'] = dict(DATABASE_POOL_OPTIONS)
+    return config
+
+
+DATABASES = {}
+if os.getenv('DATABASE_URL'):
+    DATABASES['default'] = _database_config(os.getenv('DATABASE_URL'))
+else:
+    # Резервная SQLite база данных для разработки, если переменная DATABASE_URL не задана
     DATABASES['default'] = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 
+# Реплика для чтения: на нее направляются list/retrieve, аналитика и балансы (logistic/db_router.py)
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL', '')
+REPLICA_DATABASE_ALIAS = 'replica'
+if DATABASE_REPLICA_URL:
+    DATABASES[REPLICA_DATABASE_ALIAS] = _database_config(DATABASE_REPLICA_URL)
+    # В тестах реплика - зеркало основной базы
+    DATABASES[REPLICA_DATABASE_ALIAS]['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['logistic.db_router.ReplicaRouter']
+# Сколько секунд после записи чтения пользователя идут в основную базу (задержка репликации)
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 10))
+
+# Кеш: Redis при заданном REDIS_URL (общий для всех процессов), иначе память процесса
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -159,7 +210,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'logistic.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
@@ -211,8 +262,35 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    # Токены с ролью, компанией и профилем пользователя (logistic/authentication.py)
+    'TOKEN_OBTAIN_SERIALIZER': 'logistic.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'logistic.authentication.ClaimsTokenRefreshSerializer',
 }
 
+# Сколько секунд данные пользователя, профиля и компании для аутентификации хранятся в кеше
+AUTH_PRINCIPAL_CACHE_SECONDS = int(os.getenv('AUTH_PRINCIPAL_CACHE_SECONDS', 60))
+# Сколько секунд справочники компании для /api/bootstrap/ хранятся в кеше (ключ меняется при изменении)
+BOOTSTRAP_CACHE_SECONDS = int(os.getenv('BOOTSTRAP_CACHE_SECONDS', 3600))
+# Срок жизни версии справочников компании (в секундах). Без общего кеша (REDIS_URL) другие
+# процессы не видят смену версии и отдают прежние справочники не дольше этого срока
+BOOTSTRAP_VERSION_SECONDS = int(os.getenv('BOOTSTRAP_VERSION_SECONDS', 60))
+
+# Пакетные GET-запросы (/api/batch/)
+# Максимальное количество подзапросов в пакете
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 20))
+# Потоков для параллельного выполнения подзапросов
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', 4))
+
+# Сжатие ответов (logistic/compression.py)
+# Кодировки в порядке предпочтения (brotli и zstandard входят в requirements.txt;
+# без них остается gzip)
+COMPRESSION_ENCODINGS = [name.strip() for name in os.getenv('COMPRESSION_ENCODINGS', 'br,zstd,gzip').split(',') if name.strip()]
+# Ответы меньше этого размера (в байтах) не сжимаются
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+# Сколько секунд сжатые ответы с ETag хранятся в кеше и максимальный размер записи
+COMPRESSION_CACHE_SECONDS = int(os.getenv('COMPRESSION_CACHE_SECONDS', 3600))
+COMPRESSION_CACHE_MAX_SIZE = int(os.getenv('COMPRESSION_CACHE_MAX_SIZE', 1024 * 1024))
+
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -234,3 +312,124 @@ EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True') == 'True'
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@example.com')
+
+# Фоновые задачи
+# Количество потоков для фоновых задач (очистка файлов и т.п.)
+BACKGROUND_TASKS_WORKERS = int(os.getenv('BACKGROUND_TASKS_WORKERS', 2))
+# Выполнять фоновые задачи синхронно (удобно для тестов и отладки)
+BACKGROUND_TASKS_SYNC = os.getenv('BACKGROUND_TASKS_SYNC', 'False') == 'True'
+
+# Отложенное удаление файлов
+# Размер пачки при обработке журнала удаления
+FILE_CLEANUP_BATCH_SIZE = int(os.getenv('FILE_CLEANUP_BATCH_SIZE', 200))
+# Максимальное количество попыток удаления одного пути
+FILE_CLEANUP_MAX_ATTEMPTS = int(os.getenv('FILE_CLEANUP_MAX_ATTEMPTS', 5))
+
+# Хранилище вложений (файлы заявок и отправок)
+# ATTACHMENT_STORAGE_BACKEND: local - MEDIA_ROOT, sharded - несколько директорий, s3 - объектное хранилище
+ATTACHMENT_STORAGE_BACKEND = os.getenv('ATTACHMENT_STORAGE_BACKEND', 'local')
+if ATTACHMENT_STORAGE_BACKEND == 'sharded':
+    ATTACHMENT_STORAGE = {
+        'BACKEND': 'logistic.storage.ShardedStorage',
+        'OPTIONS': {
+            # Директории томов через запятую
+            'locations': [d.strip() for d in os.getenv('ATTACHMENT_SHARD_DIRS', '').split(',') if d.strip()],
+        },
+    }
+elif ATTACHMENT_STORAGE_BACKEND == 's3':
+    ATTACHMENT_STORAGE = {
+        'BACKEND': 'logistic.storage.S3Storage',
+        'OPTIONS': {
+            'bucket': os.getenv('S3_BUCKET', ''),
+            'endpoint_url': os.getenv('S3_ENDPOINT_URL') or None,
+            'access_key': os.getenv('S3_ACCESS_KEY') or None,
+            'secret_key': os.getenv('S3_SECRET_KEY') or None,
+            'region': os.getenv('S3_REGION') or None,
+            'prefix': os.getenv('S3_PREFIX', ''),
+        },
+    }
+else:
+    ATTACHMENT_STORAGE = {
+        'BACKEND': 'logistic.storage.LocalStorage',
+        'OPTIONS': {},
+    }
+# Срок действия подписанных ссылок на скачивание (секунды)
+ATTACHMENT_URL_EXPIRES = int(os.getenv('ATTACHMENT_URL_EXPIRES', 300))
+# Ограничения загрузки вложений (logistic/uploads.py): максимальный размер файла в байтах
+UPLOAD_MAX_FILE_SIZE = int(os.getenv('UPLOAD_MAX_FILE_SIZE', 500 * 1024 * 1024))
+# Запрещенные расширения файлов через запятую
+UPLOAD_BLOCKED_EXTENSIONS = [
+    ext.strip().lower() for ext in os.getenv(
+        'UPLOAD_BLOCKED_EXTENSIONS', '.exe,.dll,.bat,.cmd,.com,.msi,.scr,.vbs,.ps1,.jar'
+    ).split(',') if ext.strip()
+]
+
+# Превью файлов
+# Файлы больше этого размера (в байтах) не обрабатываются генератором превью
+PREVIEW_MAX_SOURCE_SIZE = int(os.getenv('PREVIEW_MAX_SOURCE_SIZE', 50 * 1024 * 1024))
+# Веб-версии изображений: максимальная сторона в пикселях и качество JPEG
+RENDITION_MAX_SIDE = int(os.getenv('RENDITION_MAX_SIDE', 2048))
+RENDITION_QUALITY = int(os.getenv('RENDITION_QUALITY', 82))
+
+# ZIP-архивы «скачать все» (logistic/bundles.py)
+# Процессов для параллельного сжатия (0 - сжатие в процессе запроса)
+BUNDLE_WORKERS = int(os.getenv('BUNDLE_WORKERS', min(4, os.cpu_count() or 1)))
+# Общий объем сжимаемых файлов (в байтах), начиная с которого используется пул процессов
+BUNDLE_PARALLEL_MIN_SIZE = int(os.getenv('BUNDLE_PARALLEL_MIN_SIZE', 4 * 1024 * 1024))
+# Директория кеша готовых архивов, срок хранения неиспользуемого архива (секунды) и общий размер кеша (байты)
+BUNDLE_CACHE_DIR = os.getenv('BUNDLE_CACHE_DIR', os.path.join(MEDIA_ROOT, 'bundles'))
+BUNDLE_CACHE_SECONDS = int(os.getenv('BUNDLE_CACHE_SECONDS', 24 * 60 * 60))
+BUNDLE_CACHE_MAX_SIZE = int(os.getenv('BUNDLE_CACHE_MAX_SIZE', 2 * 1024 * 1024 * 1024))
+
+# Дерево файлов отправки
+# Размер страницы по умолчанию и максимальный размер страницы
+FILE_TREE_PAGE_SIZE = int(os.getenv('FILE_TREE_PAGE_SIZE', 500))
+FILE_TREE_MAX_PAGE_SIZE = int(os.getenv('FILE_TREE_MAX_PAGE_SIZE', 5000))
+# Срок жизни версии дерева для ETag (в секундах). Без общего кеша (REDIS_URL) другие
+# процессы не видят смену версии и отдают 304 на измененное дерево не дольше этого срока
+FILE_TREE_VERSION_SECONDS = int(os.getenv('FILE_TREE_VERSION_SECONDS', 60))
+
+# Профилирование запросов
+# Значение заголовка X-Profile, включающее профилирование (в DEBUG подходит любое)
+REQUEST_PROFILING_TOKEN = os.getenv('REQUEST_PROFILING_TOKEN', '')
+# Доля случайно профилируемых запросов (0.0 - выключено, 1.0 - все)
+REQUEST_PROFILING_SAMPLE_RATE = float(os.getenv('REQUEST_PROFILING_SAMPLE_RATE', 0.0))
+# Количество последних профилей, хранимых в памяти процесса
+REQUEST_PROFILING_BUFFER_SIZE = int(os.getenv('REQUEST_PROFILING_BUFFER_SIZE', 200))
+
+# Метрики Prometheus (/api/metrics/)
+# Токен для заголовка 'Authorization: Bearer <токен>' (без токена метрики доступны только в DEBUG)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Директория снимков метрик для нескольких процессов (gunicorn); очищается при запуске
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', '')
+# Минимальный интервал между записями снимка процесса (секунды)
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+# Обнаружение N+1 запросов (logistic/nplusone.py)
+# Режим: 'log' - предупреждение в лог, 'raise' - исключение (в тестах), 'off' - выключено.
+# Проверка добавляет обход стека на каждый запрос к базе и обертку на каждое поле
+# сериализатора, поэтому по умолчанию включена только в DEBUG и при запуске тестов;
+# в режиме 'off' перехватчики DRF не устанавливаются
+RUNNING_TESTS = sys.argv[1:2] == ['test']
+NPLUSONE_MODE = os.getenv('NPLUSONE_MODE', 'log' if DEBUG or RUNNING_TESTS else 'off')
+# Сколько одинаковых запросов из одного места считается N+1
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', 3))
+
+# Тестовый раннер, превращающий N+1 запросы в ошибки
+TEST_RUNNER = 'logistic.test_runner.NPlusOneTestRunner'
+
+# Выгрузка списков в CSV/XLSX (logistic/exports.py)
+# Сколько строк читается из курсора базы за одну пачку
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+# Размер блока ответа (байт), по достижении которого блок отправляется клиенту
+EXPORT_BUFFER_SIZE = int(os.getenv('EXPORT_BUFFER_SIZE', 64 * 1024))
+
+# Импорт заявок и финансовых операций из CSV/XLSX (logistic/imports.py)
+# Количество строк в пачке: проверка, вставка и фиксация прогресса выполняются по пачкам
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 500))
+# Сколько ошибок строк сохраняется в задании для отчета
+IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', 1000))
+# Максимальный размер загружаемого файла (байт)
+IMPORT_MAX_FILE_SIZE = int(os.getenv('IMPORT_MAX_FILE_SIZE', 100 * 1024 * 1024))
+# Через сколько секунд без обновления выполняющееся задание можно продолжить заново
+IMPORT_STALE_SECONDS = int(os.getenv('IMPORT_STALE_SECONDS', 300))
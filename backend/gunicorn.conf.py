@@ -0,0 +1,43 @@
+"""
+Профиль развертывания под ASGI: gunicorn управляет процессами,
+uvicorn обслуживает асинхронные запросы в каждом процессе.
+
+Запуск:
+    gunicorn backend.asgi:application -c gunicorn.conf.py
+
+Параметры переопределяются переменными окружения GUNICORN_*.
+"""
+import multiprocessing
+import os
+import shutil
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn_worker.UvicornWorker'
+# Процессы: по одному на ядро; параллельность внутри процесса обеспечивает цикл событий
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+# Долгие скачивания и загрузки файлов не должны прерываться
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 300))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Перезапуск процессов для ограничения роста памяти
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+
+
+def on_starting(server):
+    """
+    Очищает директорию снимков метрик перед запуском процессов и
+    предупреждает о нескольких процессах без общего кеша.
+    """
+    directory = os.getenv('METRICS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+    if workers > 1 and not os.getenv('REDIS_URL'):
+        # Версии ETag, кеш пользователей и отметки реплики хранятся в памяти каждого процесса
+        server.log.warning(
+            'REDIS_URL не задан: %s процессов используют раздельные кеши, изменения справочников '
+            'и дерева файлов видны другим процессам с задержкой до BOOTSTRAP_VERSION_SECONDS '
+            'и FILE_TREE_VERSION_SECONDS', workers,
+        )
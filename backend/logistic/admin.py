@@ -2,7 +2,8 @@ from django.contrib import admin
 from .models import (
     UserProfile, Company, Shipment, Request, 
     RequestFile, ShipmentFolder, ShipmentFile, 
-    Article, Finance, ShipmentCalculation
+    Article, Finance, ShipmentCalculation, PendingFileDeletion, FileBlob, ImportJob,
+    CurrencyRate, StatusTransition
 )
 
 class UserProfileAdmin(admin.ModelAdmin):
@@ -71,6 +72,54 @@ class ShipmentCalculationAdmin(admin.ModelAdmin):
     list_display = ('shipment', 'euro_rate', 'usd_rate')
     autocomplete_fields = ['shipment']
 
+class PendingFileDeletionAdmin(admin.ModelAdmin):
+    """
+    Админ-класс для журнала отложенного удаления файлов.
+    Позволяет видеть пути, которые не удалось удалить, и причину ошибки.
+    """
+    list_display = ('path', 'is_directory', 'attempts', 'created_at')
+    list_filter = ('is_directory',)
+    search_fields = ('path', 'last_error')
+
+class FileBlobAdmin(admin.ModelAdmin):
+    """
+    Админ-класс для содержимого файлов.
+    Отображает хеш, размер и количество ссылок на блоб.
+    """
+    list_display = ('sha256', 'size', 'ref_count', 'created_at')
+    search_fields = ('sha256',)
+
+class ImportJobAdmin(admin.ModelAdmin):
+    """
+    Админ-класс для заданий импорта.
+    Отображает ход выполнения и результаты импорта.
+    """
+    list_display = ('id', 'company', 'kind', 'status', 'dry_run', 'processed_rows', 'imported_rows', 'error_rows', 'created_at')
+    list_filter = ('kind', 'status', 'dry_run', 'company')
+    search_fields = ('file_name', 'message')
+
+class CurrencyRateAdmin(admin.ModelAdmin):
+    """
+    Админ-класс для истории курсов валют.
+    """
+    list_display = ('date', 'currency', 'rate', 'source')
+    list_filter = ('currency', 'source')
+    date_hierarchy = 'date'
+
+class StatusTransitionAdmin(admin.ModelAdmin):
+    """
+    Админ-класс для журнала смены статусов (только просмотр).
+    """
+    list_display = ('at', 'company', 'entity', 'object_id', 'from_status', 'to_status', 'duration_seconds', 'changed_by')
+    list_filter = ('entity', 'company')
+    date_hierarchy = 'at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # Регистрируем модели и соответствующие им админ-классы
 admin.site.register(UserProfile, UserProfileAdmin)
 admin.site.register(Company, CompanyAdmin)
@@ -81,4 +130,9 @@ admin.site.register(ShipmentFolder)
 admin.site.register(ShipmentFile)
 admin.site.register(Article, ArticleAdmin)
 admin.site.register(Finance, FinanceAdmin)
-admin.site.register(ShipmentCalculation, ShipmentCalculationAdmin)
\ No newline at end of file
+admin.site.register(ShipmentCalculation, ShipmentCalculationAdmin)
+admin.site.register(PendingFileDeletion, PendingFileDeletionAdmin)
+admin.site.register(FileBlob, FileBlobAdmin)
+admin.site.register(ImportJob, ImportJobAdmin)
+admin.site.register(CurrencyRate, CurrencyRateAdmin)
+admin.site.register(StatusTransition, StatusTransitionAdmin)
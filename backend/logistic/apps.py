@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class LogisticConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'logistic'
+
+    def ready(self):
+        # Подключаем обработчики сигналов
+        from . import signals  # noqa: F401
+
+        # Обнаружение N+1 запросов во всех представлениях DRF (кроме режима 'off')
+        if settings.NPLUSONE_MODE != 'off':
+            from .nplusone import install_hooks
+            install_hooks()
@@ -0,0 +1,477 @@
+"""
+Асинхронные версии эндпоинтов с долгим вводом-выводом (маршруты /api/async/).
+
+DRF не поддерживает асинхронные представления, поэтому здесь используются
+асинхронные представления Django. Аутентификация (JWT), проверка разрешений
+и выборка объектов выполняются теми же классами, что и в синхронном API.
+
+Под ASGI-сервером (см. раздел «Развертывание под ASGI» документации) эти
+представления не занимают поток на время ожидания: обращения к базе данных
+выполняются асинхронным ORM или короткими синхронными участками, файлы
+отдаются потоком с чтением блоков в общем пуле потоков, а отправка email
+использует aiosmtplib, если он установлен. Медленный клиент, скачивающий
+большой файл, удерживает только сопрограмму.
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Count
+from django.http import Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from djangorestframework_camel_case.util import camelize
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.renderers import JSONRenderer
+
+from . import metrics
+from .authentication import ClaimsJWTAuthentication
+from .currency import COUNTERPARTY_FIELDS, BalanceTotals, balance_data, counterparty_balances, finance_totals, target_currency
+from .db_router import use_replica
+from .models import Finance, Request, RequestFile, Shipment, ShipmentFile, ShipmentFolder
+from .serializers import (
+    AnalyticsSummarySerializer, BalanceSerializer, CounterpartyBalanceSerializer, EmailSerializer,
+    RequestFileSerializer, ShipmentFileSerializer,
+)
+from .storage import get_storage
+from .uploads import upload_rejections, use_storage_upload
+from .views import (
+    RequestViewSet, ShipmentViewSet, build_email_message, create_request_files, create_shipment_files,
+    send_email_message, wants_original,
+)
+
+# Размер блока при потоковой отдаче файлов
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+def json_response(data, status_code=status.HTTP_200_OK, camel_case=False):
+    """
+    Ответ в JSON. Ключи переводятся в camelCase там, где синхронный
+    эндпоинт использует рендерер по умолчанию.
+    """
+    if camel_case:
+        data = camelize(data)
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def _authenticate(request):
+    """
+    Аутентифицирует запрос по JWT. Возвращает пользователя или AnonymousUser.
+    """
+    try:
+        result = ClaimsJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return AnonymousUser()
+    if result is None:
+        return AnonymousUser()
+    user, _ = result
+    # Профиль загружается здесь (для токенов без утверждений), чтобы проверки разрешений не обращались к базе
+    getattr(user, 'userprofile', None)
+    return user
+
+
+def _check_view(viewset_class, request, action):
+    """
+    Создает ViewSet синхронного API для действия и проверяет его разрешения.
+    Возвращает представление, которое используется для выборки объектов.
+    """
+    view = viewset_class()
+    view.request = request
+    view.action = action
+    view.args, view.kwargs, view.format_kwarg = (), {}, None
+    if not all(permission.has_permission(request, view) for permission in view.get_permissions()):
+        return None
+    return view
+
+
+def async_api_view(methods):
+    """
+    Декоратор асинхронного представления API: проверяет метод запроса
+    и аутентифицирует пользователя (без CSRF, как и JWT-эндпоинты DRF).
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(request, *args, **kwargs):
+            request.user = await sync_to_async(_authenticate)(request)
+            if not request.user.is_authenticated:
+                return json_response(
+                    {'detail': 'Учетные данные не были предоставлены.'}, status.HTTP_401_UNAUTHORIZED
+                )
+            return await func(request, *args, **kwargs)
+
+        decorated = csrf_exempt(wrapper)
+        return require_GET(decorated) if methods == ['GET'] else require_POST(decorated)
+    return decorator
+
+
+def _forbidden():
+    return json_response({'detail': 'У вас недостаточно прав для выполнения данного действия.'}, status.HTTP_403_FORBIDDEN)
+
+
+async def _read_chunks(source):
+    """
+    Асинхронно читает открытый файл блоками. Чтение выполняется в общем
+    пуле потоков, поэтому ожидание диска или сети не блокирует цикл событий.
+    """
+    try:
+        while True:
+            chunk = await asyncio.to_thread(source.read, STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await asyncio.to_thread(source.close)
+
+
+def _open_attachment(name):
+    """
+    Открывает содержимое файла в хранилище и возвращает (файл, размер).
+    """
+    storage = get_storage()
+    if not storage.exists(name):
+        return None, None
+    return storage.open(name), storage.size(name)
+
+
+async def _attachment_response(request, file_instance, kind):
+    """
+    Асинхронный аналог views.attachment_response: ?redirect=1 перенаправляет
+    на подписанную ссылку хранилища, иначе файл отдается потоком.
+    """
+    name, filename = file_instance.get_download(wants_original(request.GET))
+    if request.GET.get('redirect') in ('1', 'true'):
+        url = await sync_to_async(get_storage().url)(name, filename=filename)
+        return HttpResponseRedirect(request.build_absolute_uri(url))
+
+    source, size = await sync_to_async(_open_attachment)(name)
+    if source is None:
+        raise Http404("Файл не найден")
+
+    response = StreamingHttpResponse(_read_chunks(source), content_type='application/octet-stream')
+    response['Content-Length'] = str(size)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+    metrics.record_download(kind, response)
+    return response
+
+
+def _zip_response(buffer_response, filename, kind):
+    """
+    Отдает ZIP-архив, собранный моделью, потоком без блокировки цикла событий.
+    """
+    source = buffer_response.file_to_stream
+    response = StreamingHttpResponse(_read_chunks(source), content_type='application/zip')
+    response['Content-Length'] = buffer_response['Content-Length']
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+    metrics.record_zip(kind, response)
+    return response
+
+
+@async_api_view(['GET'])
+async def shipment_download_file(request, pk, file_id):
+    """
+    Скачивает файл отправки (асинхронная версия download-file).
+    """
+    view = await sync_to_async(_check_view)(ShipmentViewSet, request, 'download_single_file')
+    if view is None:
+        return _forbidden()
+    shipments = await sync_to_async(view.get_queryset)()
+    file_instance = await ShipmentFile.objects.select_related('blob').filter(
+        id=file_id, shipment_id=pk, shipment__in=shipments.values('id')
+    ).afirst()
+    if file_instance is None:
+        raise Http404("Файл не найден")
+    return await _attachment_response(request, file_instance, 'shipment')
+
+
+@async_api_view(['GET'])
+async def request_download_file(request, pk, file_id):
+    """
+    Скачивает файл заявки (асинхронная версия download-file).
+    """
+    view = await sync_to_async(_check_view)(RequestViewSet, request, 'download_single_file')
+    if view is None:
+        return _forbidden()
+    requests = await sync_to_async(view.get_queryset)()
+    file_instance = await RequestFile.objects.select_related('blob').filter(
+        id=file_id, request_id=pk, request__in=requests.values('id')
+    ).afirst()
+    if file_instance is None:
+        raise Http404("Файл не найден")
+    return await _attachment_response(request, file_instance, 'request')
+
+
+@async_api_view(['GET'])
+async def shipment_download_all_files(request, pk):
+    """
+    Скачивает все файлы отправки одним ZIP-архивом.
+    Архив собирается синхронным участком и отдается потоком.
+    """
+    view = await sync_to_async(_check_view)(ShipmentViewSet, request, 'download_all_files')
+    if view is None:
+        return _forbidden()
+    shipments = await sync_to_async(view.get_queryset)()
+    shipment = await shipments.filter(pk=pk).afirst()
+    if shipment is None:
+        raise Http404("Отправка не найдена")
+    archive = await sync_to_async(shipment.get_files_zip)(wants_original(request.GET))
+    return _zip_response(archive, f'shipment_{shipment.number}_files.zip', 'shipment')
+
+
+@async_api_view(['GET'])
+async def request_download_all_files(request, pk):
+    """
+    Скачивает все файлы заявки одним ZIP-архивом.
+    """
+    view = await sync_to_async(_check_view)(RequestViewSet, request, 'download_all_files')
+    if view is None:
+        return _forbidden()
+    requests = await sync_to_async(view.get_queryset)()
+    request_instance = await requests.filter(pk=pk).afirst()
+    if request_instance is None:
+        raise Http404("Заявка не найдена")
+    archive = await sync_to_async(request_instance.get_files_zip)(wants_original(request.GET))
+    return _zip_response(archive, f'request_{request_instance.number}_files.zip', 'request')
+
+
+def _upload_shipment_files(request, view, pk):
+    shipment = view.get_queryset().filter(pk=pk).first()
+    if shipment is None:
+        raise Http404("Отправка не найдена")
+    use_storage_upload(request)
+    files = request.FILES.getlist('files')
+    if upload_rejections(request) or not files:
+        return None
+    folder = None
+    folder_id = request.POST.get('folder_id')
+    if folder_id:
+        folder = ShipmentFolder.objects.filter(id=folder_id, shipment=shipment).first()
+        if folder is None:
+            raise Http404("Папка не найдена")
+    created_files = create_shipment_files(shipment, files, folder, getattr(request.user, 'userprofile', None))
+    return ShipmentFileSerializer(created_files, many=True).data
+
+
+def _upload_request_files(request, view, pk):
+    request_instance = view.get_queryset().filter(pk=pk).first()
+    if request_instance is None:
+        raise Http404("Заявка не найдена")
+    use_storage_upload(request)
+    files = request.FILES.getlist('files')
+    if upload_rejections(request) or not files:
+        return None
+    created_files = create_request_files(request_instance, files, getattr(request.user, 'userprofile', None))
+    return RequestFileSerializer(created_files, many=True).data
+
+
+def _upload_error(request):
+    rejected = upload_rejections(request)
+    if rejected:
+        return json_response({"error": "Files rejected", "rejected": rejected}, status.HTTP_400_BAD_REQUEST)
+    return json_response({"error": "No files provided"}, status.HTTP_400_BAD_REQUEST)
+
+
+@async_api_view(['POST'])
+async def shipment_upload_files(request, pk):
+    """
+    Загружает файлы отправки (асинхронная версия upload_files).
+
+    Тело запроса принимается ASGI-обработчиком Django без занятия потока
+    и буферизуется им (в памяти до FILE_UPLOAD_MAX_MEMORY_SIZE, дальше во
+    временном файле). Разбор multipart из этого буфера, хеширование и
+    запись во временную директорию хранилища выполняются одним
+    синхронным участком в транзакции.
+    """
+    view = await sync_to_async(_check_view)(ShipmentViewSet, request, 'upload_files')
+    if view is None:
+        return _forbidden()
+    data = await sync_to_async(_upload_shipment_files)(request, view, pk)
+    if data is None:
+        return _upload_error(request)
+    return json_response(data, status.HTTP_201_CREATED, camel_case=True)
+
+
+@async_api_view(['POST'])
+async def request_upload_files(request, pk):
+    """
+    Загружает файлы заявки (асинхронная версия request_upload_files).
+    """
+    view = await sync_to_async(_check_view)(RequestViewSet, request, 'request_upload_files')
+    if view is None:
+        return _forbidden()
+    data = await sync_to_async(_upload_request_files)(request, view, pk)
+    if data is None:
+        return _upload_error(request)
+    return json_response(data, status.HTTP_201_CREATED, camel_case=True)
+
+
+async def _send_email(data, msg):
+    """
+    Отправляет сообщение через aiosmtplib, если он установлен,
+    иначе синхронным SMTP-клиентом в пуле потоков.
+    """
+    try:
+        import aiosmtplib
+    except ImportError:
+        aiosmtplib = None
+
+    if aiosmtplib is None:
+        await asyncio.to_thread(send_email_message, data, msg)
+        return
+
+    import ssl
+    import certifi
+    await aiosmtplib.send(
+        msg,
+        hostname="smtp.example.com",
+        port=465,
+        use_tls=True,
+        tls_context=ssl.create_default_context(cafile=certifi.where()),
+        username=data['sender_email'],
+        password='password',  # В реальной жизни пароль должен быть в безопасном хранилище
+    )
+
+
+@async_api_view(['POST'])
+async def send_email(request):
+    """
+    Отправляет email (асинхронная версия EmailView).
+    """
+    import json
+
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return json_response({"error": "Некорректный JSON"}, status.HTTP_400_BAD_REQUEST)
+    serializer = EmailSerializer(data=payload)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    try:
+        await _send_email(data, build_email_message(data))
+    except Exception as e:
+        # Обработка ошибок отправки
+        metrics.EMAILS.inc(outcome='failure')
+        return json_response({"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+    metrics.EMAILS.inc(outcome='success')
+    return json_response({"message": "Email sent successfully"})
+
+
+def replica_read(func):
+    """
+    Чтение представления идет на реплику (как у ReplicaReadMixin в синхронном API).
+    """
+    @wraps(func)
+    async def wrapper(request, *args, **kwargs):
+        with use_replica(request.user.pk):
+            return await func(request, *args, **kwargs)
+    return wrapper
+
+
+def _user_company(request):
+    profile = getattr(request.user, 'userprofile', None)
+    return profile.company if profile else None
+
+
+@async_api_view(['GET'])
+@replica_read
+async def analytics_summary(request):
+    """
+    Сводная аналитика компании (асинхронная версия AnalyticsSummaryView).
+    """
+    company = await sync_to_async(_user_company)(request)
+    try:
+        currency = target_currency(request)
+    except ValidationError as exc:
+        return json_response(exc.detail, status.HTTP_400_BAD_REQUEST)
+
+    shipments = Shipment.objects.filter(company=company)
+    requests = Request.objects.filter(company=company)
+    finances = Finance.objects.filter(company=company)
+
+    total_shipments = await shipments.acount()
+    shipments_by_status = {
+        item['status__code']: item['count']
+        async for item in shipments.values('status__code').annotate(count=Count('id'))
+    }
+    total_requests = await requests.acount()
+    requests_by_status = {
+        item['status__code']: item['count']
+        async for item in requests.values('status__code').annotate(count=Count('id'))
+    }
+
+    totals = BalanceTotals(currency)
+    async for row in finance_totals(finances, currency):
+        totals.add(row)
+
+    serializer = AnalyticsSummarySerializer(data={
+        'total_shipments': total_shipments,
+        'total_requests': total_requests,
+        'currency': currency,
+        'total_revenue': totals.total_income,
+        'total_expenses': totals.total_expenses,
+        'total_profit': totals.total_balance,
+        'unconverted_operations': totals.unconverted,
+        'shipments_by_status': shipments_by_status,
+        'requests_by_status': requests_by_status,
+        'revenue_by_currency': totals.income,
+        'expenses_by_currency': totals.expenses,
+    })
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    return json_response(serializer.data)
+
+
+@async_api_view(['GET'])
+@replica_read
+async def finance_balance(request):
+    """
+    Баланс компании по валютам (асинхронная версия BalanceView).
+    """
+    company = await sync_to_async(_user_company)(request)
+    if company is None:
+        return json_response({"error": "Unauthorized"}, status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        currency = target_currency(request)
+    except ValidationError as exc:
+        return json_response(exc.detail, status.HTTP_400_BAD_REQUEST)
+
+    totals = BalanceTotals(currency)
+    async for row in finance_totals(Finance.objects.filter(company=company), currency):
+        totals.add(row)
+    result = balance_data(totals)
+
+    serializer = BalanceSerializer(data=result)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    return json_response(serializer.data)
+
+
+@async_api_view(['GET'])
+@replica_read
+async def counterparty_balance(request):
+    """
+    Балансы контрагентов по валютам (асинхронная версия CounterpartyBalanceView).
+    """
+    company = await sync_to_async(_user_company)(request)
+    if company is None:
+        return json_response({"error": "Unauthorized"}, status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        currency = target_currency(request)
+    except ValidationError as exc:
+        return json_response(exc.detail, status.HTTP_400_BAD_REQUEST)
+
+    operations = Finance.objects.filter(company=company, counterparty__isnull=False)
+    rows = [row async for row in finance_totals(operations, currency, group_by=COUNTERPARTY_FIELDS)]
+    result = counterparty_balances(rows, currency)
+
+    serializer = CounterpartyBalanceSerializer(data=result, many=True)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    return json_response(serializer.data)
@@ -0,0 +1,164 @@
+"""
+Аутентификация JWT без запросов к базе на горячем пути.
+
+При выдаче и обновлении токена в него записываются роль пользователя,
+id компании и id профиля (role, company_id, profile_id). При проверке
+токена пользователь, профиль и компания собираются из кеша Django: запись
+хранится AUTH_PRINCIPAL_CACHE_SECONDS секунд и удаляется при изменении
+User, UserProfile или Company (signals.py). При промахе кеша все три
+объекта читаются одним запросом.
+
+Если роль, компания или профиль из кеша не совпадают с утверждениями
+токена, токен отклоняется как недействительный: клиент обновляет его и
+получает актуальные утверждения. С общим кешем (REDIS_URL) понижение роли
+действует сразу, а не по истечении срока токена. С кешем в памяти процесса
+(LocMemCache) сигнал удаляет запись только в процессе, где изменили данные:
+остальные процессы принимают старый токен еще до AUTH_PRINCIPAL_CACHE_SECONDS
+секунд.
+
+Собранные объекты - обычные экземпляры моделей. У пользователя не
+загружены пароль и дата входа: они читаются из базы при обращении, а
+save() сохраняет только загруженные поля.
+
+Токены без утверждений (выданные до их появления) проверяются как раньше,
+с чтением пользователя из базы.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import Company, UserProfile
+
+# Поля пользователя в кеше (пароль и дата входа не кешируются)
+USER_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields if field.attname not in ('password', 'last_login')
+)
+PROFILE_FIELDS = tuple(field.attname for field in UserProfile._meta.concrete_fields)
+COMPANY_FIELDS = tuple(field.attname for field in Company._meta.concrete_fields)
+
+PRINCIPAL_CLAIMS = ('role', 'company_id', 'profile_id')
+
+
+def _cache_key(user_id):
+    return f'logistic:principal:{user_id}'
+
+
+def invalidate_principals(user_ids):
+    """Удаляет из кеша данные пользователей (после изменения профиля или компании)."""
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def principal_claims(user):
+    """Утверждения токена о роли, компании и профиле пользователя."""
+    profile = getattr(user, 'userprofile', None)
+    if profile is None:
+        return {'role': None, 'company_id': None, 'profile_id': None}
+    return {'role': profile.user_group, 'company_id': profile.company_id, 'profile_id': profile.pk}
+
+
+def load_principal_data(user_id):
+    """
+    Значения полей пользователя, профиля и компании из кеша или одним
+    запросом к базе. None, если пользователя нет.
+    """
+    key = _cache_key(user_id)
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    user = User.objects.select_related('userprofile__company').filter(pk=user_id).first()
+    if user is None:
+        return None
+    profile = getattr(user, 'userprofile', None)
+    company = profile.company if profile is not None else None
+    data = {
+        'user': [getattr(user, name) for name in USER_FIELDS],
+        'profile': [getattr(profile, name) for name in PROFILE_FIELDS] if profile is not None else None,
+        'company': [getattr(company, name) for name in COMPANY_FIELDS] if company is not None else None,
+    }
+    cache.set(key, data, settings.AUTH_PRINCIPAL_CACHE_SECONDS)
+    return data
+
+
+def build_principal(data):
+    """
+    Собирает пользователя с профилем и компанией из load_principal_data
+    без обращения к базе.
+    """
+    user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, data['user'])
+    profile = None
+    if data['profile'] is not None:
+        profile = UserProfile.from_db(DEFAULT_DB_ALIAS, PROFILE_FIELDS, data['profile'])
+        UserProfile._meta.get_field('user').set_cached_value(profile, user)
+        if data['company'] is not None:
+            company = Company.from_db(DEFAULT_DB_ALIAS, COMPANY_FIELDS, data['company'])
+            UserProfile._meta.get_field('company').set_cached_value(profile, company)
+    # None в кеше связи означает «профиля нет» без запроса к базе
+    User.userprofile.related.set_cached_value(user, profile)
+    return user
+
+
+def get_principal(user_id):
+    data = load_principal_data(user_id)
+    if data is None:
+        raise AuthenticationFailed(_('User not found'), code='user_not_found')
+    user = build_principal(data)
+    if not user.is_active:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication, которая собирает пользователя из кеша и сверяет его
+    роль и компанию с утверждениями токена.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN or any(claim not in validated_token for claim in PRINCIPAL_CLAIMS):
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = get_principal(user_id)
+        claims = {claim: validated_token[claim] for claim in PRINCIPAL_CLAIMS}
+        if principal_claims(user) != claims:
+            raise InvalidToken('Роль или компания пользователя изменились, обновите токен')
+        return user
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Выдает токены с утверждениями о роли, компании и профиле."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim, value in principal_claims(user).items():
+            token[claim] = value
+        return token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Обновляет access-токен с текущими ролью и компанией пользователя,
+    а не скопированными из refresh-токена.
+    """
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data['access'])
+        user = get_principal(access[api_settings.USER_ID_CLAIM])
+        for claim, value in principal_claims(user).items():
+            access[claim] = value
+        data['access'] = str(access)
+        return data
@@ -0,0 +1,164 @@
+"""
+Пакетное выполнение GET-запросов API (/api/batch/).
+
+Страницы фронтенда запрашивают параллельно несколько ресурсов (отправку,
+ее файлы, расчет, расходы, связанные заявки), и каждый запрос заново
+проходит промежуточное ПО, аутентификацию и разбор токена. Пакет
+выполняет подзапросы в одном HTTP-запросе:
+- пути разрешаются тем же URLconf, что и обычные запросы, и обрабатываются
+  теми же представлениями, поэтому разрешения, фильтры и формат ответов
+  совпадают с отдельными запросами;
+- пользователь, аутентифицированный для пакета, передается подзапросам
+  (вместе с уже загруженными профилем и компанией), повторной проверки
+  токена нет;
+- промежуточное ПО для подзапросов не выполняется.
+
+Подзапросы выполняются по очереди или, с parallel, в общем пуле потоков
+(BATCH_WORKERS). Каждый поток получает собственное соединение с базой,
+которое закрывается после подзапроса.
+
+Поддерживаются только синхронные представления с ответом в JSON: файлы и
+выгрузки скачиваются отдельными запросами.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+from . import nplusone
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = '/api/'
+
+# Заголовки пакета, которые не относятся к подзапросам
+_EXCLUDED_META = ('CONTENT_LENGTH', 'CONTENT_TYPE', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """
+    Возвращает общий пул потоков для подзапросов, создавая его при первом обращении.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BATCH_WORKERS', 4),
+                    thread_name_prefix='logistic-batch',
+                )
+    return _executor
+
+
+def _result(item_id, status_code, body=None, error=None):
+    result = {'id': item_id, 'status': status_code, 'body': body}
+    if error is not None:
+        result['body'] = {'detail': error}
+    return result
+
+
+def _split_path(path):
+    """
+    Путь и строка запроса подзапроса. Путь без ведущей косой черты
+    считается относительным /api/. None, если путь вне API.
+    """
+    parts = urlsplit(path)
+    if parts.scheme or parts.netloc:
+        return None
+    route = parts.path if parts.path.startswith('/') else API_PREFIX + parts.path
+    if not route.startswith(API_PREFIX):
+        return None
+    return route, parts.query
+
+
+def _subrequest(request, route, query, match):
+    """
+    GET-запрос Django для подзапроса с заголовками и пользователем пакета.
+    request - запрос DRF пакета.
+    """
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = route
+    sub.META = {key: value for key, value in request.META.items() if key not in _EXCLUDED_META}
+    sub.META.update(REQUEST_METHOD='GET', PATH_INFO=route, QUERY_STRING=query)
+    sub.GET = QueryDict(query)
+    sub.COOKIES = request.COOKIES
+    sub.resolver_match = match
+    sub.user = request.user
+    # DRF использует эти атрибуты вместо классов аутентификации представления
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    return sub
+
+
+def _response_body(response):
+    if response.status_code in (204, 304):
+        return None, None
+    if getattr(response, 'streaming', False) or not response.get('Content-Type', '').startswith('application/json'):
+        return None, 'Ответ не в формате JSON: файлы и выгрузки запрашиваются отдельно'
+    return (json.loads(response.content) if response.content else None), None
+
+
+def run_subrequest(request, item):
+    """
+    Выполняет один подзапрос пакета. item - словарь с path и id.
+    Возвращает {'id', 'status', 'body'}; ошибки подзапроса не прерывают пакет.
+    """
+    item_id = item['id']
+    split = _split_path(item['path'])
+    if split is None:
+        return _result(item_id, 400, error=f'Путь должен начинаться с {API_PREFIX} или быть относительным')
+    route, query = split
+    try:
+        match = resolve(route)
+    except Resolver404:
+        return _result(item_id, 404, error='Не найдено.')
+    if match.url_name == 'batch' or iscoroutinefunction(match.func):
+        return _result(item_id, 400, error='Эндпоинт не поддерживается в пакете')
+
+    response = None
+    try:
+        # Одинаковые подзапросы не считаются N+1 запросами пакета
+        with nplusone.isolated():
+            response = match.func(_subrequest(request, route, query, match), *match.args, **match.kwargs)
+            if callable(getattr(response, 'render', None)):
+                response = response.render()
+            body, error = _response_body(response)
+    except Exception:
+        logger.exception('Ошибка подзапроса пакета %s', route)
+        return _result(item_id, 500, error='Внутренняя ошибка сервера.')
+    finally:
+        if response is not None:
+            response.close()
+    if error is not None:
+        return _result(item_id, 406, error=error)
+    return _result(item_id, response.status_code, body)
+
+
+def _run_in_thread(request, item):
+    try:
+        return run_subrequest(request, item)
+    finally:
+        # Соединения с БД привязаны к потоку - закрываем их после подзапроса
+        connections.close_all()
+
+
+def run_batch(request, items, parallel=False):
+    """
+    Выполняет подзапросы пакета. Результаты возвращаются в порядке items.
+    """
+    if parallel and len(items) > 1:
+        executor = _get_executor()
+        futures = [executor.submit(_run_in_thread, request, item) for item in items]
+        return [future.result() for future in futures]
+    return [run_subrequest(request, item) for item in items]
@@ -0,0 +1,405 @@
+"""
+Нагрузочные замеры API.
+
+Каждый маршрут из logistic/urls.py, доступный на чтение, вызывается через
+тестовый клиент Django от имени пользователя каждой роли (admin, boss,
+manager, warehouse, client) на заранее заполненной базе (см. команду
+seed_benchmark_data). Для каждой пары маршрут/роль записываются:
+- перцентили времени ответа (p50, p90, p99);
+- количество SQL-запросов;
+- количество строк, прочитанных из базы;
+- пиковое потребление памяти Python (tracemalloc);
+- размер ответа.
+
+Замеряются только успешные (2xx) ответы. Маршруты, закрытые для роли
+(401/403), помечаются как пропущенные; любой другой код ответа помечается
+как ошибка, время по нему не замеряется, а команда run_api_benchmark
+завершается с ошибкой.
+
+Результаты сохраняются в JSON и могут сравниваться с сохраненным базовым
+замером, чтобы находить регрессии.
+"""
+import contextlib
+import io
+import json
+import math
+import platform
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .authentication import ClaimsTokenObtainPairSerializer
+from .models import (
+    Article, Company, Finance, Request, RequestFile, Shipment, ShipmentCalculation,
+    ShipmentFile, ShipmentStatus, RequestStatus, UserProfile,
+)
+
+ROLES = ['admin', 'boss', 'manager', 'warehouse', 'client']
+
+
+@dataclass
+class Endpoint:
+    """
+    Маршрут для замера.
+    path - шаблон пути с подстановками из контекста роли ({shipment}, {request}, ...).
+    """
+    name: str
+    path: str
+
+
+ENDPOINTS = [
+    Endpoint('companies-list', '/api/companies/'),
+    Endpoint('companies-detail', '/api/companies/{company}/'),
+    Endpoint('userprofiles-list', '/api/userprofiles/'),
+    Endpoint('userprofiles-me', '/api/userprofiles/me/'),
+    Endpoint('shipment-statuses-list', '/api/shipment-statuses/'),
+    Endpoint('request-statuses-list', '/api/request-statuses/'),
+    Endpoint('shipments-list', '/api/shipments/'),
+    Endpoint('shipments-detail', '/api/shipments/{shipment}/'),
+    Endpoint('shipments-files', '/api/shipments/{shipment}/files/'),
+    Endpoint('shipments-files-tree', '/api/shipments/{shipment}/files/tree/'),
+    Endpoint('shipments-download-file', '/api/shipments/{shipment}/download-file/{shipment_file}/'),
+    Endpoint('shipments-download-all', '/api/shipments/{shipment}/download-all-files/'),
+    Endpoint('requests-list', '/api/requests/'),
+    Endpoint('requests-detail', '/api/requests/{request}/'),
+    Endpoint('requests-download-file', '/api/requests/{request}/download-file/{request_file}/'),
+    Endpoint('requests-download-all', '/api/requests/{request}/download-all-files/'),
+    Endpoint('shipment-calculations-list', '/api/shipment-calculations/'),
+    Endpoint('shipment-calculations-by-shipment', '/api/shipment-calculations/by-shipment/{shipment}/'),
+    Endpoint('analytics-summary', '/api/analytics/summary/'),
+    Endpoint('finance-list', '/api/finance/'),
+    Endpoint('finance-detail', '/api/finance/{finance}/'),
+    Endpoint('finance-balance', '/api/finance/balance/'),
+    Endpoint('finance-counterparty-balance', '/api/finance/counterparty-balance/'),
+    Endpoint('articles-list', '/api/articles/'),
+    Endpoint('articles-detail', '/api/articles/{article}/'),
+]
+
+
+@dataclass
+class Result:
+    endpoint: str
+    role: str
+    path: str
+    status: int = 0
+    skipped: str = ''
+    error: str = ''
+    p50_ms: float = 0.0
+    p90_ms: float = 0.0
+    p99_ms: float = 0.0
+    mean_ms: float = 0.0
+    queries: int = 0
+    rows: int = 0
+    peak_kb: float = 0.0
+    response_bytes: int = 0
+    samples: list = field(default_factory=list, repr=False)
+
+    @property
+    def key(self):
+        return f'{self.endpoint}:{self.role}'
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class RowCounter:
+    """
+    Считает строки, прочитанные из курсоров базы данных.
+
+    На время замера в CursorWrapper добавляются методы fetchone/fetchmany/
+    fetchall, которые считают возвращенные строки и передают вызов
+    настоящему курсору.
+    """
+
+    def __init__(self):
+        self.rows = 0
+
+    def __enter__(self):
+        counter = self
+
+        def fetchone(cursor_wrapper):
+            row = cursor_wrapper.cursor.fetchone()
+            if row is not None:
+                counter.rows += 1
+            return row
+
+        def fetchmany(cursor_wrapper, *args, **kwargs):
+            rows = cursor_wrapper.cursor.fetchmany(*args, **kwargs)
+            counter.rows += len(rows)
+            return rows
+
+        def fetchall(cursor_wrapper):
+            rows = cursor_wrapper.cursor.fetchall()
+            counter.rows += len(rows)
+            return rows
+
+        CursorWrapper.fetchone = fetchone
+        CursorWrapper.fetchmany = fetchmany
+        CursorWrapper.fetchall = fetchall
+        return self
+
+    def __exit__(self, *exc_info):
+        del CursorWrapper.fetchone
+        del CursorWrapper.fetchmany
+        del CursorWrapper.fetchall
+
+
+# Коды ответа для маршрутов, закрытых для роли: такие маршруты не замеряются
+DENIED_STATUSES = (401, 403)
+
+
+def _pick_user(company, role):
+    return (
+        UserProfile.objects.filter(company=company, user_group=role, is_active=True)
+        .select_related('user').order_by('id').first()
+    )
+
+
+def build_context(profile):
+    """
+    Подбирает объекты для подстановки в пути маршрутов от имени пользователя.
+
+    Берутся объекты с наибольшим количеством связанных данных, чтобы замеры
+    отражали худший типичный случай. Объекты выбираются из тех же выборок
+    for_user, что и в API, поэтому каждой роли подставляются только
+    видимые ей объекты (менеджеру - его и не назначенные заявки, клиенту -
+    его заявки и отправки).
+    """
+    company = profile.company
+    user = profile.user
+    requests = Request.objects.for_user(user).filter(company=company)
+    shipments = Shipment.objects.for_user(user).filter(company=company)
+    finances = Finance.objects.for_user(user).filter(company=company)
+
+    context = {'company': company.id}
+    shipment = shipments.annotate(n=Count('files')).order_by('-n', 'id').first()
+    if shipment:
+        context['shipment'] = shipment.id
+        shipment_file = ShipmentFile.objects.filter(shipment=shipment).order_by('id').first()
+        if shipment_file:
+            context['shipment_file'] = shipment_file.id
+    request = requests.annotate(n=Count('files')).order_by('-n', 'id').first()
+    if request:
+        context['request'] = request.id
+        request_file = RequestFile.objects.filter(request=request).order_by('id').first()
+        if request_file:
+            context['request_file'] = request_file.id
+    finance = finances.order_by('number').first()
+    if finance:
+        context['finance'] = finance.number
+    article = Article.objects.filter(company=company).order_by('id').first()
+    if article:
+        context['article'] = article.id
+    return context
+
+
+def dataset_summary():
+    """Размер данных, на которых выполнялся замер."""
+    return {
+        model.__name__: model.objects.count()
+        for model in (
+            Company, UserProfile, Shipment, Request, Finance, ShipmentFile, RequestFile,
+            ShipmentCalculation, ShipmentStatus, RequestStatus, Article,
+        )
+    }
+
+
+def _consume(response):
+    """Читает тело ответа, включая потоковые ответы, и возвращает его размер."""
+    if getattr(response, 'streaming', False):
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    response.close()
+    return size
+
+
+def measure(client, path, iterations, warmup):
+    """
+    Выполняет GET-запросы к маршруту и возвращает Result без имени маршрута.
+    Первый запрос проверяет код ответа: если он не успешный (не 2xx),
+    время не замеряется, а результат помечается как пропущенный (401/403)
+    или ошибочный.
+    """
+    result = Result(endpoint='', role='', path=path)
+    # Вывод print() из классов разрешений не должен попадать в отчет
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = client.get(path)
+        _consume(response)
+        result.status = response.status_code
+        if result.status in DENIED_STATUSES:
+            result.skipped = f'нет доступа ({result.status})'
+            return result
+        if not 200 <= result.status < 300:
+            result.error = f'код ответа {result.status}'
+            return result
+
+        for _ in range(warmup):
+            _consume(client.get(path))
+
+        with CaptureQueriesContext(connection) as queries, RowCounter() as rows:
+            response = client.get(path)
+            result.response_bytes = _consume(response)
+        result.status = response.status_code
+        result.queries = len(queries)
+        result.rows = rows.rows
+
+        for _ in range(iterations):
+            started = time.perf_counter()
+            _consume(client.get(path))
+            result.samples.append((time.perf_counter() - started) * 1000)
+
+        tracemalloc.start()
+        try:
+            _consume(client.get(path))
+            result.peak_kb = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally:
+            tracemalloc.stop()
+
+    result.p50_ms = round(percentile(result.samples, 50), 2)
+    result.p90_ms = round(percentile(result.samples, 90), 2)
+    result.p99_ms = round(percentile(result.samples, 99), 2)
+    result.mean_ms = round(sum(result.samples) / len(result.samples), 2) if result.samples else 0.0
+    return result
+
+
+def run_benchmark(company=None, roles=None, endpoints=None, iterations=20, warmup=2, log=None):
+    """
+    Выполняет замеры всех маршрутов для всех ролей.
+
+    Args:
+        company: компания с данными (по умолчанию - с наибольшим числом заявок)
+        roles: список ролей (по умолчанию все)
+        endpoints: подстроки имен маршрутов для фильтрации
+        log: функция для вывода прогресса
+
+    Returns:
+        dict: результаты в формате, пригодном для сохранения в JSON
+    """
+    if company is None:
+        company = Company.objects.annotate(n=Count('request')).order_by('-n', 'id').first()
+    if company is None:
+        raise ValueError('В базе нет компаний. Заполните ее командой seed_benchmark_data')
+
+    selected = [
+        endpoint for endpoint in ENDPOINTS
+        if not endpoints or any(part in endpoint.name for part in endpoints)
+    ]
+    results = []
+    for role in roles or ROLES:
+        profile = _pick_user(company, role)
+        if profile is None:
+            results.extend(
+                Result(endpoint=endpoint.name, role=role, path=endpoint.path, skipped='нет пользователя с ролью')
+                for endpoint in selected
+            )
+            continue
+
+        token = str(ClaimsTokenObtainPairSerializer.get_token(profile.user).access_token)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        context = build_context(profile)
+
+        for endpoint in selected:
+            try:
+                path = endpoint.path.format(**context)
+            except KeyError as e:
+                results.append(Result(
+                    endpoint=endpoint.name, role=role, path=endpoint.path,
+                    skipped=f'нет объекта {e.args[0]}',
+                ))
+                continue
+            result = measure(client, path, iterations, warmup)
+            result.endpoint, result.role = endpoint.name, role
+            results.append(result)
+            if log:
+                log(format_result(result))
+
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'company': company.id,
+            'iterations': iterations,
+            'dataset': dataset_summary(),
+        },
+        'results': [
+            {key: value for key, value in asdict(result).items() if key != 'samples'}
+            for result in results
+        ],
+    }
+
+
+def format_result(result):
+    if result.skipped:
+        return f'{result.endpoint:<36} {result.role:<10} пропущено: {result.skipped}'
+    if result.error:
+        return f'{result.endpoint:<36} {result.role:<10} ОШИБКА: {result.error} ({result.path})'
+    return (
+        f'{result.endpoint:<36} {result.role:<10} {result.status:>3} '
+        f'p50={result.p50_ms:>8.2f}ms p90={result.p90_ms:>8.2f}ms p99={result.p99_ms:>8.2f}ms '
+        f'q={result.queries:<4} rows={result.rows:<7} mem={result.peak_kb:>8.1f}KB'
+    )
+
+
+def compare_with_baseline(current, baseline, time_threshold=0.2, min_time_delta_ms=2.0, count_threshold=0.1):
+    """
+    Сравнивает результаты с базовым замером.
+
+    Регрессией считается:
+    - рост p90 больше чем на time_threshold (и больше чем на min_time_delta_ms);
+    - рост количества запросов;
+    - рост количества прочитанных строк больше чем на count_threshold;
+    - изменение кода ответа.
+
+    Returns:
+        list: описания регрессий
+    """
+    previous = {f"{item['endpoint']}:{item['role']}": item for item in baseline.get('results', [])}
+    regressions = []
+    for item in current['results']:
+        key = f"{item['endpoint']}:{item['role']}"
+        before = previous.get(key)
+        if before is None or item['skipped'] or before['skipped']:
+            continue
+        if item['status'] != before['status']:
+            regressions.append(f"{key}: код ответа {before['status']} -> {item['status']}")
+        if item.get('error') or before.get('error'):
+            # Время и запросы ошибочного ответа не сравниваются
+            continue
+        if (item['p90_ms'] > before['p90_ms'] * (1 + time_threshold)
+                and item['p90_ms'] - before['p90_ms'] > min_time_delta_ms):
+            regressions.append(f"{key}: p90 {before['p90_ms']}ms -> {item['p90_ms']}ms")
+        if item['queries'] > before['queries']:
+            regressions.append(f"{key}: запросов {before['queries']} -> {item['queries']}")
+        if item['rows'] > before['rows'] * (1 + count_threshold):
+            regressions.append(f"{key}: строк {before['rows']} -> {item['rows']}")
+    return regressions
+
+
+def failed_results(results):
+    """Результаты с неуспешным кодом ответа (не 2xx и не 401/403)."""
+    return [item for item in results['results'] if item.get('error')]
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as destination:
+        json.dump(results, destination, ensure_ascii=False, indent=2)
@@ -0,0 +1,210 @@
+"""
+Хранилище содержимого файлов с адресацией по SHA-256.
+
+Загружаемый файл потоково записывается во временный файл, одновременно
+вычисляется его хеш (файлы, принятые StorageUploadHandler из uploads.py,
+уже записаны во временную директорию хранилища и захешированы). Если блоб с таким хешем уже есть, временный файл
+удаляется, и новая запись RequestFile/ShipmentFile просто ссылается
+на существующий блоб. Иначе временный файл помещается в хранилище вложений
+(для локального хранилища - переименованием, без повторного копирования).
+
+Содержимое помещается в хранилище до фиксации транзакции, чтобы
+зафиксированная запись блоба не оказалась без файла. Ссылки на блобы
+создаются в blob_transaction(): если ее транзакция откатывается, новые
+файлы блобов, записи которых откатились вместе с ней, сразу удаляются.
+Откат внешней транзакции после выхода из blob_transaction() оставляет
+файл без записи - его находит cleanup_orphans.
+
+Количество ссылок на блоб хранится в FileBlob.ref_count. Когда последняя
+запись удаляется, блоб и его превью ставятся в журнал отложенного удаления.
+
+Для новых блобов после фиксации транзакции в фоне генерируются превью
+(см. previews.py).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import F
+
+from .cleanup import schedule_deletion
+from .models import FileBlob
+from .previews import generate_previews
+from .storage import COPY_CHUNK_SIZE, get_storage
+from .tasks import run_on_commit
+
+logger = logging.getLogger(__name__)
+
+# Файлы блобов, помещенные в хранилище в текущей blob_transaction(): [(sha256, имя)]
+_placed = ContextVar('logistic_placed_blobs', default=None)
+
+
+def _write_chunks(chunks):
+    """
+    Записывает поток байтов во временный файл, вычисляя SHA-256.
+
+    Returns:
+        tuple: (путь к временному файлу, sha256, размер)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=get_storage().temp_dir(), suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                destination.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+@contextmanager
+def blob_transaction():
+    """
+    Транзакция, в которой создаются записи файлов со ссылками на блобы.
+    При ее откате файлы блобов, помещенные в хранилище внутри нее и
+    оставшиеся без записи FileBlob, удаляются.
+    """
+    placed = []
+    token = _placed.set(placed)
+    try:
+        with transaction.atomic():
+            yield
+    except BaseException:
+        _discard_placed(placed)
+        raise
+    finally:
+        _placed.reset(token)
+
+
+def _discard_placed(placed):
+    """Удаляет файлы блобов, записи которых откатились."""
+    storage = get_storage()
+    for sha256, name in placed:
+        try:
+            # Запись могла существовать до транзакции (файл блоба был потерян) - тогда файл нужен
+            if not FileBlob.objects.filter(sha256=sha256).exists():
+                storage.delete(name)
+        except Exception:
+            logger.exception("Не удалось удалить файл блоба %s после отката", name)
+
+
+def _acquire(sha256, size, place_content, discard_content=None):
+    """
+    Возвращает блоб для содержимого и увеличивает счетчик ссылок на него.
+
+    Должна вызываться внутри blob_transaction(), в которой создается
+    ссылающаяся на блоб запись. Строка блоба блокируется, чтобы параллельное удаление
+    последней ссылки не удалило блоб, который в этот момент переиспользуется.
+
+    Args:
+        place_content: функция, помещающая содержимое в хранилище под заданным именем
+        discard_content: функция, вызываемая, если содержимое уже хранится
+    """
+    blob, created = FileBlob.objects.select_for_update().get_or_create(
+        sha256=sha256, defaults={'size': size}
+    )
+    name = blob.get_storage_name()
+
+    if get_storage().exists(name):
+        # Дубликат - содержимое уже хранится
+        if discard_content:
+            discard_content()
+    else:
+        place_content(name)
+        placed = _placed.get()
+        if placed is not None:
+            placed.append((sha256, name))
+
+    FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    blob.ref_count += 1
+
+    if created:
+        run_on_commit(generate_previews, blob.pk)
+    return blob
+
+
+def acquire_local_file(local_path, sha256, size):
+    """
+    Возвращает блоб для локального временного файла.
+    Временный файл перемещается в хранилище или удаляется, если это дубликат.
+    """
+    storage = get_storage()
+    return _acquire(
+        sha256, size,
+        place_content=lambda name: storage.save_local_file(name, local_path),
+        discard_content=lambda: os.remove(local_path),
+    )
+
+
+def acquire_stored_file(source_name, sha256, size):
+    """
+    Возвращает блоб для файла, уже лежащего в хранилище под другим именем.
+    Исходный файл не удаляется.
+    """
+    storage = get_storage()
+    return _acquire(
+        sha256, size,
+        place_content=lambda name: storage.copy(source_name, name),
+    )
+
+
+def store_upload(uploaded_file):
+    """
+    Сохраняет загруженный файл в хранилище и возвращает блоб.
+    Вызывается внутри blob_transaction(), в которой создается запись файла.
+    """
+    if getattr(uploaded_file, 'sha256', None) is not None:
+        # Файл принят StorageUploadHandler: временный файл перемещается без копирования
+        uploaded_file.file.flush()
+        try:
+            return acquire_local_file(uploaded_file.temporary_file_path(), uploaded_file.sha256, uploaded_file.size)
+        finally:
+            # Закрытие удаляет временный файл, если он не был перемещен (ошибка)
+            uploaded_file.close()
+    tmp_path, sha256, size = _write_chunks(uploaded_file.chunks())
+    try:
+        return acquire_local_file(tmp_path, sha256, size)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def hash_stored_file(name):
+    """
+    Вычисляет SHA-256 и размер файла в хранилище.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with get_storage().open(name) as source:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def release_blob(blob_id):
+    """
+    Уменьшает счетчик ссылок на блоб.
+    Когда ссылок не остается, запись блоба удаляется, а файл ставится
+    в очередь на удаление после фиксации транзакции.
+    """
+    with transaction.atomic():
+        blob = FileBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+        schedule_deletion(blob.get_storage_name())
+        for name in blob.get_preview_names():
+            schedule_deletion(name)
+        blob.delete()
@@ -0,0 +1,138 @@
+"""
+Данные для старта сессии фронтенда (/api/bootstrap/) и кеш справочников компании.
+
+Справочники компании (статусы заявок и отправок, статьи, активные клиенты
+и менеджеры, данные компании) сериализуются один раз и хранятся в кеше
+Django под ключом с версией компании. Версия - случайная строка в кеше;
+она меняется после фиксации транзакции, изменившей справочник (signals.py),
+поэтому старые записи просто перестают читаться и истекают по
+BOOTSTRAP_CACHE_SECONDS.
+
+Смену версии видят процессы с тем же кешем. С кешем в памяти процесса
+(без REDIS_URL) остальные процессы узнают об изменении, когда версия
+истечет: она хранится BOOTSTRAP_VERSION_SECONDS секунд.
+
+ETag ответа строится из версии компании и профиля пользователя, который
+уже собран аутентификацией (authentication.py). Повторный старт с
+If-None-Match получает 304 без обращений к базе.
+"""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .currency import BASE_CURRENCY, TARGET_CURRENCIES
+from .models import Article, Company, RequestStatus, ShipmentStatus, UserProfile
+from .permissions import check_role_hierarchy
+from .serializers import (
+    ArticleSerializer, CompanySerializer, RequestStatusSerializer, ShipmentStatusSerializer, UserProfileSerializer,
+)
+
+
+def _version_key(company_id):
+    return f'logistic:company_version:{company_id}'
+
+
+def company_version(company_id):
+    """Текущая версия справочников компании (создается при первом обращении)."""
+    if company_id is None:
+        return 'none'
+    key = _version_key(company_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add не перезапишет версию, которую параллельно создал другой процесс
+        if not cache.add(key, version, settings.BOOTSTRAP_VERSION_SECONDS):
+            version = cache.get(key) or version
+    return version
+
+
+def bump_company_version(company_id):
+    """Меняет версию справочников компании после фиксации транзакции."""
+    if company_id is not None:
+        transaction.on_commit(
+            lambda: cache.set(_version_key(company_id), uuid.uuid4().hex, settings.BOOTSTRAP_VERSION_SECONDS)
+        )
+
+
+def company_dictionaries(company_id):
+    """
+    Сериализованные справочники компании из кеша или из базы.
+    Возвращает (версия, данные).
+    """
+    version = company_version(company_id)
+    key = f'logistic:company_dictionaries:{company_id}:{version}'
+    data = cache.get(key)
+    if data is not None:
+        return version, data
+
+    profiles = UserProfile.objects.filter(company_id=company_id, is_active=True).select_related('user', 'company')
+    company = Company.objects.filter(pk=company_id).first()
+    data = {
+        'company': CompanySerializer(company).data if company is not None else None,
+        'shipment_statuses': ShipmentStatusSerializer(
+            ShipmentStatus.objects.for_company(company_id).select_related('request_status').order_by('order'), many=True
+        ).data,
+        'request_statuses': RequestStatusSerializer(
+            RequestStatus.objects.for_company(company_id).order_by('name'), many=True
+        ).data,
+        'articles': ArticleSerializer(
+            Article.objects.for_company(company_id).select_related('company').order_by('name'), many=True
+        ).data,
+        'clients': UserProfileSerializer(profiles.filter(user_group='client').order_by('name', 'pk'), many=True).data,
+        'managers': UserProfileSerializer(profiles.filter(user_group='manager').order_by('name', 'pk'), many=True).data,
+    }
+    # Данные сериализуются в простые типы, чтобы запись кеша не зависела от классов DRF
+    data = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+    cache.set(key, data, settings.BOOTSTRAP_CACHE_SECONDS)
+    return version, data
+
+
+def bootstrap_etag(user, profile_data):
+    """ETag стартовых данных: версия справочников компании и профиль пользователя."""
+    company_id = getattr(getattr(user, 'userprofile', None), 'company_id', None)
+    payload = json.dumps(
+        [company_version(company_id), user.pk, user.is_superuser, profile_data], cls=DjangoJSONEncoder, sort_keys=True
+    )
+    return '"%s"' % hashlib.md5(payload.encode()).hexdigest()
+
+
+def profile_data(user):
+    """Профиль пользователя в формате /api/userprofiles/me/ или None."""
+    profile = getattr(user, 'userprofile', None)
+    return UserProfileSerializer(profile).data if profile is not None else None
+
+
+def bootstrap_data(user, profile):
+    """
+    Стартовые данные пользователя. Разделы, которые недоступны роли
+    пользователя через соответствующие эндпоинты, равны None.
+    """
+    company_id = getattr(getattr(user, 'userprofile', None), 'company_id', None)
+    version, dictionaries = company_dictionaries(company_id) if company_id is not None else (company_version(None), {})
+    is_member = company_id is not None
+
+    def section(name, role):
+        if not is_member or not check_role_hierarchy(user, role):
+            return None
+        return dictionaries[name]
+
+    return {
+        'version': version,
+        'profile': profile,
+        'company': dictionaries.get('company') if is_member else None,
+        'settings': {
+            'base_currency': BASE_CURRENCY,
+            'currencies': list(TARGET_CURRENCIES),
+            'page_size': settings.REST_FRAMEWORK.get('PAGE_SIZE'),
+        },
+        'shipment_statuses': section('shipment_statuses', 'client'),
+        'request_statuses': section('request_statuses', 'warehouse'),
+        'articles': section('articles', 'boss'),
+        'clients': section('clients', 'boss'),
+        'managers': section('managers', 'boss'),
+    }
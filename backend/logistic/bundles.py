@@ -0,0 +1,296 @@
+"""
+Сборка ZIP-архивов файлов отправки и заявки («скачать все»).
+
+Для каждого файла способ хранения в архиве выбирается отдельно:
+- уже сжатые форматы (изображения, PDF, архивы, документы Office, видео)
+  определяются по расширению и записываются без сжатия (STORE);
+- для остальных читается первый блок, и при высокой энтропии байтов
+  (зашифрованные и сжатые данные) файл тоже записывается без сжатия;
+- остальные файлы сжимаются DEFLATE.
+
+Сжатие DEFLATE выполняется параллельно в общем пуле процессов
+(BUNDLE_WORKERS): каждый процесс читает файл из хранилища и пишет сжатый
+поток во временный файл, а архив собирается в исходном порядке файлов.
+Пока процессы сжимают, в архив дописываются файлы без сжатия. Небольшие
+объемы (меньше BUNDLE_PARALLEL_MIN_SIZE) сжимаются в текущем процессе.
+
+Готовые архивы хранятся в BUNDLE_CACHE_DIR под отпечатком набора файлов:
+имена в хранилище (блобы адресуются хешем содержимого) и имена в архиве.
+Повторное скачивание неизмененного набора отдает готовый файл. Архивы
+старше BUNDLE_CACHE_SECONDS и сверх BUNDLE_CACHE_MAX_SIZE удаляются
+после сборки нового архива, начиная с давно не использованных.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.http import FileResponse
+
+from . import metrics
+from .storage import COPY_CHUNK_SIZE, get_storage
+
+logger = logging.getLogger(__name__)
+
+# Версия формата архива: входит в отпечаток, меняется при изменении сборки
+BUNDLE_FORMAT = 1
+
+DEFLATE_LEVEL = 6
+
+# Расширения форматов, которые уже сжаты и почти не уменьшаются при DEFLATE
+STORED_EXTENSIONS = frozenset((
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.heif', '.avif',
+    '.pdf', '.zip', '.rar', '.7z', '.gz', '.tgz', '.bz2', '.xz', '.zst',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp',
+    '.mp3', '.mp4', '.m4a', '.mov', '.avi', '.mkv', '.webm',
+))
+
+# Размер блока для оценки энтропии и порог в битах на байт,
+# начиная с которого файл считается несжимаемым
+ENTROPY_SAMPLE_SIZE = 64 * 1024
+ENTROPY_THRESHOLD = 7.5
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker():
+    # Процессы пула могут запускаться без унаследованного состояния Django
+    import django
+    django.setup()
+
+
+def _get_executor():
+    """
+    Возвращает общий пул процессов для сжатия, создавая его при первом обращении.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=settings.BUNDLE_WORKERS, initializer=_init_worker)
+    return _executor
+
+
+def bundle_fingerprint(entries):
+    """
+    Отпечаток набора файлов архива: entries - пары (имя в хранилище, имя в архиве).
+    """
+    payload = json.dumps([BUNDLE_FORMAT, [list(entry) for entry in entries]])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _entropy(data):
+    """Энтропия байтов блока в битах на байт (0-8)."""
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+
+def is_stored_by_name(arcname):
+    """Записывается ли файл без сжатия по расширению."""
+    return os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS
+
+
+def deflate_file(storage_name, temp_dir):
+    """
+    Сжимает файл из хранилища в поток DEFLATE во временном файле.
+
+    Returns:
+        dict | None: {'path', 'crc', 'size', 'compress_size'};
+        {'path': None} - файл несжимаемый и записывается без сжатия;
+        None - файла нет в хранилище.
+    """
+    storage = get_storage()
+    if not storage.exists(storage_name):
+        return None
+    with storage.open(storage_name) as source:
+        chunk = source.read(COPY_CHUNK_SIZE)
+        if chunk and _entropy(chunk[:ENTROPY_SAMPLE_SIZE]) >= ENTROPY_THRESHOLD:
+            return {'path': None}
+
+        compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+        crc = size = 0
+        with tempfile.NamedTemporaryFile(dir=temp_dir, suffix='.deflate', delete=False) as destination:
+            try:
+                while chunk:
+                    crc = zlib.crc32(chunk, crc)
+                    size += len(chunk)
+                    destination.write(compressor.compress(chunk))
+                    chunk = source.read(COPY_CHUNK_SIZE)
+                destination.write(compressor.flush())
+            except BaseException:
+                os.remove(destination.name)
+                raise
+    compress_size = os.path.getsize(destination.name)
+    if compress_size >= size:
+        os.remove(destination.name)
+        return {'path': None}
+    return {'path': destination.name, 'crc': crc, 'size': size, 'compress_size': compress_size}
+
+
+def _write_stored(zip_file, storage_name, arcname):
+    """Потоково копирует файл из хранилища в архив без сжатия. Отсутствующие файлы пропускаются."""
+    storage = get_storage()
+    if not storage.exists(storage_name):
+        return
+    info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    with storage.open(storage_name) as source, zip_file.open(info, 'w', force_zip64=True) as destination:
+        shutil.copyfileobj(source, destination, COPY_CHUNK_SIZE)
+
+
+def _write_deflated(zip_file, arcname, result):
+    """
+    Дописывает в архив заранее сжатый поток DEFLATE.
+    zipfile не умеет принимать готовые сжатые данные, поэтому заголовок
+    записывается напрямую, а запись добавляется в центральный каталог
+    так же, как это делает ZipFile.open().
+    """
+    info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = 0o600 << 16
+    info.CRC = result['crc']
+    info.file_size = result['size']
+    info.compress_size = result['compress_size']
+
+    zip_file.fp.seek(zip_file.start_dir)
+    info.header_offset = zip_file.start_dir
+    zip_file.fp.write(info.FileHeader(None))
+    with open(result['path'], 'rb') as source:
+        shutil.copyfileobj(source, zip_file.fp, COPY_CHUNK_SIZE)
+    zip_file.start_dir = zip_file.fp.tell()
+    zip_file.filelist.append(info)
+    zip_file.NameToInfo[arcname] = info
+
+
+def _prune_cache(cache_dir):
+    """
+    Удаляет устаревшие архивы (и временные файлы прерванных сборок)
+    и давно не использованные архивы сверх BUNDLE_CACHE_MAX_SIZE.
+    """
+    now = time.time()
+    bundles = []
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith(('.zip', '.partial', '.deflate')) or not entry.is_file():
+            continue
+        stat = entry.stat()
+        if now - stat.st_mtime > settings.BUNDLE_CACHE_SECONDS:
+            _remove(entry.path)
+        elif entry.name.endswith('.zip'):
+            bundles.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in bundles)
+    for _, size, path in sorted(bundles):
+        if total <= settings.BUNDLE_CACHE_MAX_SIZE:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _build(entries, target_path, cache_dir):
+    """
+    Собирает архив из entries в target_path.
+    Файлы для DEFLATE сжимаются параллельно, архив пишется в порядке entries.
+    """
+    # Одинаковые файлы под разными именами сжимаются один раз
+    to_deflate = list(dict.fromkeys(
+        storage_name for storage_name, arcname in entries if not is_stored_by_name(arcname)
+    ))
+    futures = {}
+    if settings.BUNDLE_WORKERS > 0 and len(to_deflate) > 1:
+        storage = get_storage()
+        deflate_size = sum(storage.size(name) for name in to_deflate if storage.exists(name))
+        if deflate_size >= settings.BUNDLE_PARALLEL_MIN_SIZE:
+            executor = _get_executor()
+            futures = {name: executor.submit(deflate_file, name, cache_dir) for name in to_deflate}
+
+    results = {}
+    try:
+        with zipfile.ZipFile(target_path, 'w') as zip_file:
+            for storage_name, arcname in entries:
+                if is_stored_by_name(arcname):
+                    _write_stored(zip_file, storage_name, arcname)
+                    metrics.BUNDLE_FILES.inc(method='stored')
+                    continue
+
+                if storage_name not in results:
+                    future = futures.get(storage_name)
+                    results[storage_name] = future.result() if future is not None else deflate_file(storage_name, cache_dir)
+                result = results[storage_name]
+                if result is None:
+                    continue
+                if result['path'] is None:
+                    _write_stored(zip_file, storage_name, arcname)
+                    metrics.BUNDLE_FILES.inc(method='stored')
+                else:
+                    _write_deflated(zip_file, arcname, result)
+                    metrics.BUNDLE_FILES.inc(method='deflated')
+    finally:
+        # При ошибке сборки дожидаемся запущенных заданий, чтобы удалить их временные файлы
+        for storage_name, future in futures.items():
+            if storage_name not in results and not future.cancel():
+                try:
+                    results[storage_name] = future.result()
+                except Exception:
+                    pass
+        for result in results.values():
+            if result and result['path']:
+                _remove(result['path'])
+
+
+def bundle_response(entries, filename):
+    """
+    Ответ с ZIP-архивом файлов. entries - пары (имя в хранилище, имя в архиве)
+    в порядке следования в архиве. Готовый архив берется из кеша, если набор
+    файлов не изменился.
+
+    Returns:
+        FileResponse: Ответ с ZIP-файлом
+    """
+    cache_dir = settings.BUNDLE_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f'{bundle_fingerprint(entries)}.zip')
+
+    try:
+        bundle = open(path, 'rb')
+    except FileNotFoundError:
+        bundle = None
+    if bundle is not None:
+        # Время изменения - время последнего использования для очистки кеша
+        os.utime(path)
+        metrics.BUNDLE_CACHE.inc(result='hit')
+        return FileResponse(bundle, as_attachment=True, filename=filename)
+
+    metrics.BUNDLE_CACHE.inc(result='miss')
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.partial')
+    os.close(fd)
+    try:
+        _build(entries, temp_path, cache_dir)
+        # Параллельная сборка того же набора просто заменит файл таким же
+        os.replace(temp_path, path)
+    except BaseException:
+        _remove(temp_path)
+        raise
+    bundle = open(path, 'rb')
+    try:
+        _prune_cache(cache_dir)
+    except OSError:
+        logger.exception('Не удалось очистить кеш ZIP-архивов')
+    return FileResponse(bundle, as_attachment=True, filename=filename)
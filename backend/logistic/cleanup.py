@@ -0,0 +1,264 @@
+"""
+Отложенное удаление файлов заявок и отправок.
+
+Представления и модели не удаляют файлы из хранилища напрямую. Вместо этого
+в той же транзакции, что и удаление записей из базы, в журнал
+PendingFileDeletion добавляется запись с именем файла в хранилище. После
+фиксации транзакции фоновая задача обрабатывает журнал пачками. При откате
+транзакции записи журнала откатываются вместе с данными, и файлы остаются
+на месте.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import FileBlob, ImportJob, PendingFileDeletion, Request, RequestFile, Shipment, ShipmentFile, ShipmentFolder
+from .storage import get_storage
+from .tasks import run_in_background
+
+logger = logging.getLogger(__name__)
+
+# Корневая директория файлов приложения в хранилище
+LOGISTIC_ROOT = 'logistic'
+
+# Временные файлы незавершенных загрузок младше этого возраста
+# не считаются сиротами
+TMP_UPLOAD_MAX_AGE = timedelta(days=1)
+
+_sweep_lock = threading.Lock()
+_sweep_queued = False
+
+
+def request_dir(request_id):
+    """Имя директории файлов заявки в хранилище."""
+    return f'{LOGISTIC_ROOT}/requests/{request_id}'
+
+
+def shipment_dir(shipment_id, folder_name=None):
+    """Имя директории файлов отправки (или ее папки) в хранилище."""
+    if folder_name:
+        return f'{LOGISTIC_ROOT}/shipments/{shipment_id}/{folder_name}'
+    return f'{LOGISTIC_ROOT}/shipments/{shipment_id}'
+
+
+def schedule_deletion(name, is_directory=False):
+    """
+    Добавляет файл в журнал удаления.
+    Файл будет удален фоновой задачей после фиксации текущей транзакции.
+    """
+    PendingFileDeletion.objects.create(path=name, is_directory=is_directory)
+    transaction.on_commit(request_sweep)
+
+
+def schedule_legacy_files(files):
+    """
+    Ставит в журнал удаления старые файлы (без блоба) из queryset
+    RequestFile или ShipmentFile.
+
+    Файлы с блобом не трогаются - их содержимое освобождается
+    при удалении записей через счетчик ссылок.
+    """
+    names = [
+        file_obj.get_storage_name()
+        for file_obj in files.filter(blob__isnull=True).select_related(
+            *(['folder'] if files.model is ShipmentFile else [])
+        )
+    ]
+    if not names:
+        return
+    PendingFileDeletion.objects.bulk_create(
+        [PendingFileDeletion(path=name) for name in names],
+        batch_size=1000,
+    )
+    transaction.on_commit(request_sweep)
+
+
+def request_sweep():
+    """
+    Ставит обработку журнала в фоновую очередь.
+    Повторные вызовы, пока обработка еще не началась, объединяются.
+    """
+    global _sweep_queued
+    with _sweep_lock:
+        if _sweep_queued:
+            return
+        _sweep_queued = True
+    run_in_background(_background_sweep)
+
+
+def _background_sweep():
+    global _sweep_queued
+    with _sweep_lock:
+        _sweep_queued = False
+    sweep_pending_deletions()
+
+
+def is_path_referenced(name):
+    """
+    Проверяет, ссылаются ли на файл актуальные записи в базе.
+
+    Защищает от удаления файла, который был загружен заново под тем же
+    именем после постановки старого файла в очередь на удаление.
+    """
+    parts = name.strip('/').split('/')
+    if len(parts) >= 2 and parts[:2] == [LOGISTIC_ROOT, 'blobs']:
+        if len(parts) != 5:
+            return False
+        sha256, _, suffix = parts[4].partition('.')
+        blobs = FileBlob.objects.filter(sha256=sha256)
+        if suffix == 'web.jpg':
+            # Веб-версия занята, если она есть у блоба или превью блоба еще генерируются
+            return blobs.filter(
+                Q(rendition_size__isnull=False) | Q(preview_status=FileBlob.PREVIEW_PENDING)
+            ).exists()
+        # Сам блоб и его превью ('<sha256>.thumb.webp') заняты, пока существует блоб
+        return blobs.exists()
+    if len(parts) < 3 or parts[0] != LOGISTIC_ROOT or not parts[2].isdigit():
+        return False
+    kind, object_id, rest = parts[1], int(parts[2]), parts[3:]
+
+    # Старые пути файлов заняты только записями без блоба
+    if kind == 'requests':
+        if not rest:
+            return Request.objects.filter(id=object_id).exists()
+        return RequestFile.objects.filter(
+            request_id=object_id, file='/'.join(rest), blob__isnull=True
+        ).exists()
+
+    if kind == 'shipments':
+        if not rest:
+            return Shipment.objects.filter(id=object_id).exists()
+        if len(rest) == 1:
+            # В корне отправки одно имя может означать и папку, и файл
+            return (
+                ShipmentFolder.objects.filter(shipment_id=object_id, name=rest[0]).exists() or
+                ShipmentFile.objects.filter(
+                    shipment_id=object_id, folder=None, file=rest[0], blob__isnull=True
+                ).exists()
+            )
+        return ShipmentFile.objects.filter(
+            shipment_id=object_id, folder__name=rest[0], file='/'.join(rest[1:]), blob__isnull=True
+        ).exists()
+
+    return False
+
+
+def _delete_entry(entry):
+    """
+    Удаляет из хранилища файл или директорию из записи журнала.
+    """
+    if is_path_referenced(entry.path):
+        logger.info("Путь %s снова используется, удаление пропущено", entry.path)
+        return
+
+    if entry.is_directory:
+        get_storage().delete_tree(entry.path)
+    else:
+        get_storage().delete(entry.path)
+
+
+def sweep_pending_deletions(batch_size=None, max_attempts=None):
+    """
+    Обрабатывает журнал удаления пачками.
+
+    Успешно обработанные записи удаляются из журнала, для неудачных
+    увеличивается счетчик попыток. Записи, превысившие max_attempts,
+    больше не обрабатываются и остаются в журнале для разбора.
+
+    Returns:
+        int: Количество удаленных путей
+    """
+    batch_size = batch_size or settings.FILE_CLEANUP_BATCH_SIZE
+    max_attempts = max_attempts or settings.FILE_CLEANUP_MAX_ATTEMPTS
+    processed = 0
+    last_id = 0
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                PendingFileDeletion.objects
+                .select_for_update(skip_locked=True)
+                .filter(id__gt=last_id, attempts__lt=max_attempts)
+                .order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+
+            done_ids = []
+            failed = []
+            for entry in batch:
+                try:
+                    _delete_entry(entry)
+                    done_ids.append(entry.id)
+                except Exception as e:
+                    logger.warning("Не удалось удалить %s: %s", entry.path, e)
+                    entry.attempts += 1
+                    entry.last_error = str(e)
+                    failed.append(entry)
+
+            PendingFileDeletion.objects.filter(id__in=done_ids).delete()
+            if failed:
+                PendingFileDeletion.objects.bulk_update(failed, ['attempts', 'last_error'])
+
+        last_id = batch[-1].id
+        processed += len(done_ids)
+
+    return processed
+
+
+def expected_file_paths():
+    """
+    Возвращает множество имен файлов в хранилище, на которые ссылаются
+    записи RequestFile, ShipmentFile, FileBlob (включая превью блобов)
+    и незавершенные задания импорта.
+    """
+    paths = set()
+    for request_id, name in RequestFile.objects.filter(blob__isnull=True).values_list(
+        'request_id', 'file'
+    ).iterator():
+        paths.add(f'{request_dir(request_id)}/{name}')
+    for shipment_id, folder_name, name in ShipmentFile.objects.filter(blob__isnull=True).values_list(
+        'shipment_id', 'folder__name', 'file'
+    ).iterator():
+        paths.add(f'{shipment_dir(shipment_id, folder_name)}/{name}')
+    for blob in FileBlob.objects.only('sha256', 'preview_status', 'rendition_size').iterator():
+        paths.add(blob.get_storage_name())
+        paths.update(blob.get_preview_names())
+    # Исходные файлы незавершенных заданий импорта
+    paths.update(ImportJob.objects.exclude(storage_name='').values_list('storage_name', flat=True))
+    return paths
+
+
+def find_orphan_files(expected=None):
+    """
+    Возвращает файлы в хранилище (logistic/...), на которые не ссылается ни одна запись.
+    """
+    if expected is None:
+        expected = expected_file_paths()
+    storage = get_storage()
+    tmp_prefix = f'{LOGISTIC_ROOT}/tmp/'
+    min_tmp_mtime = timezone.now() - TMP_UPLOAD_MAX_AGE
+    orphans = []
+    for name in storage.walk(LOGISTIC_ROOT):
+        if name in expected:
+            continue
+        # Свежие временные файлы могут принадлежать загрузке, которая еще идет
+        if name.startswith(tmp_prefix) and storage.modified_time(name) > min_tmp_mtime:
+            continue
+        orphans.append(name)
+    return sorted(orphans)
+
+
+def find_missing_files(expected=None):
+    """
+    Возвращает имена файлов из базы, для которых нет файла в хранилище.
+    """
+    if expected is None:
+        expected = expected_file_paths()
+    storage = get_storage()
+    return sorted(name for name in expected if not storage.exists(name))
@@ -0,0 +1,252 @@
+"""
+Сжатие ответов (Content-Encoding: br, zstd, gzip).
+
+Списки и детальные ответы API (отправка с вложенными заявками и файлами,
+финансовые операции) - это сотни килобайт повторяющегося JSON, который
+сжимается в десятки раз. CompressionMiddleware выбирает кодировку по
+Accept-Encoding клиента в порядке COMPRESSION_ENCODINGS; brotli и zstd
+используются, если установлены пакеты brotli и zstandard, gzip доступен
+всегда.
+
+Сжимаются только текстовые типы (JSON, CSV, XML, текст) размером от
+COMPRESSION_MIN_SIZE байт. Файлы вложений (FileResponse), ответы с уже
+заданным Content-Encoding и ответы с Cache-Control: no-transform отдаются
+как есть: архивы, изображения и PDF уже сжаты. Потоковые ответы (выгрузки
+CSV) сжимаются по мере отдачи без накопления в памяти.
+
+Ответы с сильным ETag (стартовые данные, дерево файлов) сжимаются один
+раз: сжатое тело хранится в кеше Django под ключом из пути, ETag и
+кодировки, и повторный запрос того же содержимого не сжимается заново.
+ETag сжатого ответа становится слабым (как в GZipMiddleware Django), и
+проверки If-None-Match в представлениях продолжают работать.
+"""
+import gzip
+import hashlib
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+
+GZIP_LEVEL = 6
+# Средние уровни: сжатие почти как на максимальных, но в разы быстрее
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+# Типы содержимого, которые сжимаются (кроме text/*, +json и +xml)
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/javascript', 'application/xml',
+    'application/vnd.oai.openapi', 'image/svg+xml',
+)
+
+
+def _gzip_stream():
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    # Каждый блок дожимается до границы, чтобы клиент получал данные сразу
+    return (lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+
+def _load_encoders():
+    """
+    Доступные кодировки: имя -> (сжатие целиком, фабрика потокового сжатия).
+    Фабрика возвращает пару функций (сжать блок, завершить поток).
+    """
+    encoders = {
+        'gzip': (lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0), _gzip_stream),
+    }
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    if brotli is not None:
+        def brotli_stream():
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            return (lambda data: compressor.process(data) + compressor.flush()), compressor.finish
+
+        encoders['br'] = (lambda data: brotli.compress(data, quality=BROTLI_QUALITY), brotli_stream)
+
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+    if zstandard is not None:
+        def zstd_stream():
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            return (
+                lambda data: compressor.compress(data) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            ), compressor.flush
+
+        encoders['zstd'] = (lambda data: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), zstd_stream)
+    return encoders
+
+
+ENCODERS = _load_encoders()
+
+
+def available_encodings():
+    """Кодировки из COMPRESSION_ENCODINGS, для которых установлены библиотеки, в порядке предпочтения."""
+    return [name for name in settings.COMPRESSION_ENCODINGS if name in ENCODERS]
+
+
+def _accepted_encodings(header):
+    """Кодировки из Accept-Encoding с их весами q."""
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def negotiate_encoding(header):
+    """
+    Кодировка ответа по заголовку Accept-Encoding: с наибольшим весом,
+    при равных весах - первая в COMPRESSION_ENCODINGS. None - без сжатия.
+    """
+    accepted = _accepted_encodings(header or '')
+    default = accepted.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for name in available_encodings():
+        quality = accepted.get(name, default)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def is_compressible(response):
+    """Можно ли сжимать ответ (без учета размера и Accept-Encoding)."""
+    if isinstance(response, FileResponse) or response.has_header('Content-Encoding'):
+        return False
+    if response.status_code < 200 or response.status_code >= 300 or response.status_code in (204, 206):
+        return False
+    if 'no-transform' in response.get('Cache-Control', ''):
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    return (
+        content_type.startswith('text/')
+        or content_type in COMPRESSIBLE_TYPES
+        or content_type.endswith(('+json', '+xml'))
+    )
+
+
+def _cache_key(request, encoding, etag, size):
+    digest = hashlib.md5(f'{request.get_full_path()}|{etag}|{size}'.encode()).hexdigest()
+    return f'logistic:compressed:{encoding}:{digest}'
+
+
+def compress_content(request, response, encoding):
+    """
+    Сжатое тело ответа. Для ответов с сильным ETag берется из кеша или
+    сохраняется в кеш после сжатия.
+    """
+    compress = ENCODERS[encoding][0]
+    etag = response.get('ETag', '')
+    if not etag.startswith('"') or request.method != 'GET':
+        metrics.COMPRESSED_RESPONSES.inc(encoding=encoding, source='compressed')
+        return compress(response.content)
+
+    key = _cache_key(request, encoding, etag, len(response.content))
+    content = cache.get(key)
+    if content is not None:
+        metrics.COMPRESSED_RESPONSES.inc(encoding=encoding, source='cache')
+        return content
+    content = compress(response.content)
+    if len(content) <= settings.COMPRESSION_CACHE_MAX_SIZE:
+        cache.set(key, content, settings.COMPRESSION_CACHE_SECONDS)
+    metrics.COMPRESSED_RESPONSES.inc(encoding=encoding, source='compressed')
+    return content
+
+
+def _compress_sequence(chunks, encoding):
+    process, finish = ENCODERS[encoding][1]()
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+async def _acompress_sequence(chunks, encoding):
+    process, finish = ENCODERS[encoding][1]()
+    async for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы в кодировке, согласованной с клиентом.
+    Поддерживает синхронный (WSGI) и асинхронный (ASGI) режимы.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if response.streaming:
+            # Потоковое тело сжимается при отдаче, здесь только заголовки
+            return self.process_response(request, response)
+        # Сжатие и обращение к кешу - синхронные операции
+        return await sync_to_async(self.process_response)(request, response)
+
+    def process_response(self, request, response):
+        if not is_compressible(response):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        # Ответ зависит от Accept-Encoding, даже если этот клиент сжатие не принимает
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _acompress_sequence(response.streaming_content, encoding)
+            else:
+                response.streaming_content = _compress_sequence(response.streaming_content, encoding)
+            metrics.COMPRESSED_RESPONSES.inc(encoding=encoding, source='stream')
+            del response['Content-Length']
+        else:
+            original_size = len(response.content)
+            content = compress_content(request, response, encoding)
+            if len(content) >= original_size:
+                return response
+            metrics.COMPRESSION_BYTES.inc(original_size, encoding=encoding, stage='original')
+            metrics.COMPRESSION_BYTES.inc(len(content), encoding=encoding, stage='compressed')
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
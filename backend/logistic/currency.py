@@ -0,0 +1,244 @@
+"""
+Пересчет сумм финансовых операций в одну валюту по истории курсов.
+
+Курсы хранятся в CurrencyRate как количество рублей за единицу валюты.
+Курс действует с даты записи до следующей записи по той же валюте, поэтому
+для операции берется последний курс с датой не позже даты оплаты.
+
+Пересчет выполняется в SQL: к каждой строке queryset подставляется
+коррелированный подзапрос курса на дату операции (по уникальному индексу
+(currency, date) это один переход по индексу), так что итоги по компании
+считаются одним запросом без обхода операций в Python. Если курса на дату
+нет, пересчитанная сумма равна NULL и не попадает в итог; количество таких
+операций возвращается отдельно.
+"""
+import datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Case, Count, DecimalField, F, Func, OuterRef, Q, Subquery, Sum, Value, When
+from rest_framework.exceptions import ValidationError
+
+from .models import CurrencyRate
+
+# Базовая валюта курсов
+BASE_CURRENCY = 'rub'
+# Безнал и НДС - те же рубли
+RUBLE_CURRENCIES = ('rub', 'rubbn', 'rubnds')
+# Валюты, курсы которых хранятся в CurrencyRate
+RATE_CURRENCIES = tuple(code for code, _ in CurrencyRate.CURRENCY_CHOICES)
+# Валюты, в которые можно пересчитать суммы
+TARGET_CURRENCIES = (BASE_CURRENCY,) + RATE_CURRENCIES
+
+AMOUNT_FIELD = DecimalField(max_digits=20, decimal_places=2)
+RATE_FIELD = DecimalField(max_digits=20, decimal_places=6)
+
+
+class Divide(Func):
+    """
+    Деление выражений. SQLite делит целые числа нацело (курс 90 хранится
+    как целое), поэтому там делимое приводится к вещественному числу.
+    """
+    arg_joiner = ' / '
+    template = '(%(expressions)s)'
+    output_field = RATE_FIELD
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, arg_joiner=' * 1.0 / ', **extra_context)
+
+
+def target_currency(request, default=BASE_CURRENCY):
+    """
+    Валюта пересчета из параметра запроса currency.
+    Разновидности рубля (rubbn, rubnds) приводятся к rub.
+    Принимает запрос DRF или Django (асинхронные представления).
+    """
+    params = getattr(request, 'query_params', request.GET)
+    currency = (params.get('currency') or default or '').lower()
+    if currency in RUBLE_CURRENCIES:
+        return BASE_CURRENCY
+    if currency not in TARGET_CURRENCIES:
+        raise ValidationError({'currency': f'Поддерживаются валюты: {", ".join(TARGET_CURRENCIES)}'})
+    return currency
+
+
+def effective_rate(currency, on_date):
+    """
+    Подзапрос курса валюты на дату: последний курс с датой не позже on_date.
+    currency и on_date - значения или выражения (например, OuterRef).
+    """
+    rates = CurrencyRate.objects.filter(currency=currency, date__lte=on_date).order_by('-date')
+    return Subquery(rates.values('rate')[:1], output_field=RATE_FIELD)
+
+
+def converted_amount(target=BASE_CURRENCY, amount_field='amount', currency_field='currency', date_field='payment_date'):
+    """
+    Выражение суммы amount_field в валюте target по курсам на дату date_field.
+    Равно NULL, если нужного курса на дату нет.
+    """
+    # Курс исходной валюты к рублю
+    source_rate = Case(
+        When(**{f'{currency_field}__in': RUBLE_CURRENCIES}, then=Value(Decimal('1'))),
+        default=effective_rate(OuterRef(currency_field), OuterRef(date_field)),
+        output_field=RATE_FIELD,
+    )
+    amount = F(amount_field) * source_rate
+    if target != BASE_CURRENCY:
+        amount = Divide(amount, effective_rate(target, OuterRef(date_field)))
+    return Case(
+        # Сумма уже в нужной валюте - курс не нужен
+        When(**{currency_field: target}, then=F(amount_field)),
+        default=amount,
+        output_field=AMOUNT_FIELD,
+    )
+
+
+def annotate_converted(queryset, target=BASE_CURRENCY, name='converted_amount', **fields):
+    """Добавляет к операциям сумму в валюте target (аннотация name)."""
+    return queryset.annotate(**{name: converted_amount(target, **fields)})
+
+
+def converted_totals(amount_field='amount'):
+    """
+    Агрегаты для values(...).annotate(...) или aggregate(...): пересчитанная
+    сумма ('converted') и количество операций без курса ('unconverted').
+    Queryset должен содержать аннотацию converted_amount (annotate_converted).
+    """
+    return {
+        'converted': Sum('converted_amount'),
+        'unconverted': Count('pk', filter=Q(converted_amount__isnull=True, **{f'{amount_field}__isnull': False})),
+    }
+
+
+def rates_on(on_date=None, currencies=RATE_CURRENCIES):
+    """
+    Курсы валют к рублю на дату (по умолчанию на сегодня) одним запросом.
+    Валюты без курса на дату отсутствуют в словаре.
+    """
+    on_date = on_date or datetime.date.today()
+    latest_date = CurrencyRate.objects.filter(
+        currency=OuterRef('currency'), date__lte=on_date,
+    ).order_by('-date').values('date')[:1]
+    rates = CurrencyRate.objects.filter(currency__in=currencies, date=Subquery(latest_date))
+    return dict(rates.values_list('currency', 'rate'))
+
+
+def finance_totals(queryset, target=BASE_CURRENCY, group_by=()):
+    """
+    Итоги операций по полям group_by, типу операции и валюте одним запросом:
+    сумма в исходной валюте ('total'), сумма в валюте target ('converted')
+    и количество операций без курса ('unconverted').
+    """
+    return annotate_converted(queryset, target).values(*group_by, 'operation_type', 'currency').annotate(
+        total=Sum('amount'), **converted_totals()
+    )
+
+
+def money(amount):
+    """
+    Сумма, округленная до копеек. Произведение суммы на курс в SQL имеет
+    больше двух знаков после запятой, а DecimalField(decimal_places=2)
+    сериализаторов такие значения не принимает.
+    """
+    return (amount or Decimal('0')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+class BalanceTotals:
+    """
+    Накапливает строки finance_totals: доходы, расходы и баланс по валютам
+    и те же итоги, пересчитанные в одну валюту. Итоги накапливаются без
+    округления и округляются до копеек при чтении.
+    """
+
+    def __init__(self, currency):
+        self.currency = currency
+        self._income = {}
+        self._expenses = {}
+        self._total_income = Decimal('0')
+        self._total_expenses = Decimal('0')
+        self.unconverted = 0
+
+    def add(self, row):
+        currency = row['currency']
+        total = row['total'] or Decimal('0')
+        converted = row['converted'] or Decimal('0')
+        if row['operation_type'] == 'in':
+            self._income[currency] = self._income.get(currency, Decimal('0')) + total
+            self._total_income += converted
+        elif row['operation_type'] == 'out':
+            self._expenses[currency] = self._expenses.get(currency, Decimal('0')) + total
+            self._total_expenses += converted
+        else:
+            return
+        self.unconverted += row['unconverted']
+
+    @property
+    def income(self):
+        return {currency: money(amount) for currency, amount in self._income.items()}
+
+    @property
+    def expenses(self):
+        return {currency: money(amount) for currency, amount in self._expenses.items()}
+
+    @property
+    def balance(self):
+        return {
+            currency: money(self._income.get(currency, Decimal('0')) - self._expenses.get(currency, Decimal('0')))
+            for currency in {**self._income, **self._expenses}
+        }
+
+    @property
+    def total_income(self):
+        return money(self._total_income)
+
+    @property
+    def total_expenses(self):
+        return money(self._total_expenses)
+
+    @property
+    def total_balance(self):
+        return money(self._total_income - self._total_expenses)
+
+
+# Поля контрагента для группировки итогов
+COUNTERPARTY_FIELDS = ('counterparty_id', 'counterparty__username', 'counterparty__first_name', 'counterparty__last_name')
+
+
+def balance_data(totals):
+    """Данные BalanceSerializer из накопленных итогов."""
+    return {
+        'income': {currency: float(amount) for currency, amount in totals.income.items()},
+        'expenses': {currency: float(amount) for currency, amount in totals.expenses.items()},
+        'balance': {currency: float(amount) for currency, amount in totals.balance.items()},
+        'currency': totals.currency,
+        'total_income': float(totals.total_income),
+        'total_expenses': float(totals.total_expenses),
+        'total_balance': float(totals.total_balance),
+        'unconverted_operations': totals.unconverted,
+    }
+
+
+def counterparty_balances(rows, currency):
+    """
+    Данные CounterpartyBalanceSerializer из строк finance_totals,
+    сгруппированных по COUNTERPARTY_FIELDS.
+    """
+    counterparties = {}
+    for row in rows:
+        totals, name = counterparties.get(row['counterparty_id'], (None, None))
+        if totals is None:
+            totals = BalanceTotals(currency)
+            full_name = f"{row['counterparty__first_name']} {row['counterparty__last_name']}".strip()
+            name = full_name or row['counterparty__username']
+            counterparties[row['counterparty_id']] = (totals, name)
+        totals.add(row)
+    return [
+        {
+            'id': counterparty_id,
+            'name': name,
+            'balances': {code: float(amount) for code, amount in totals.balance.items()},
+            'currency': currency,
+            'total_balance': float(totals.total_balance),
+            'unconverted_operations': totals.unconverted,
+        }
+        for counterparty_id, (totals, name) in counterparties.items()
+    ]
@@ -0,0 +1,154 @@
+"""
+Маршрутизация чтения на реплику базы данных.
+
+Все запросы по умолчанию идут в основную базу ('default'). Чтение
+направляется на реплику (DATABASES[REPLICA_DATABASE_ALIAS], задается
+DATABASE_REPLICA_URL) только явно:
+- в представлениях DRF с ReplicaReadMixin - для действий из
+  replica_read_actions (list, retrieve, GET аналитики и балансов);
+- в любом коде - внутри блока use_replica().
+
+Реплика отстает от основной базы, поэтому после успешного изменяющего
+запроса пользователь REPLICA_STICKY_SECONDS секунд читает из основной
+базы (read-your-writes). Отметка хранится в кеше Django: при нескольких
+процессах нужен общий кеш (REDIS_URL).
+
+Если реплика не настроена, все запросы идут в основную базу.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_read_alias = contextvars.ContextVar('logistic_read_alias', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replica_alias():
+    """Псевдоним реплики или None, если реплика не настроена."""
+    alias = getattr(settings, 'REPLICA_DATABASE_ALIAS', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def _sticky_key(user_id):
+    return f'logistic:replica_sticky:{user_id}'
+
+
+def mark_sticky(user_id):
+    """После записи пользователь временно читает из основной базы."""
+    if replica_alias() and user_id:
+        cache.set(_sticky_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user_id):
+    return bool(user_id) and cache.get(_sticky_key(user_id)) is not None
+
+
+@contextmanager
+def use_replica(user_id=None):
+    """
+    Чтение внутри блока идет на реплику, если она настроена и
+    пользователь не изменял данные в последние REPLICA_STICKY_SECONDS секунд.
+    """
+    alias = replica_alias()
+    if alias is None or is_sticky(user_id):
+        yield
+        return
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Роутер баз данных: запись, миграции и чтение по умолчанию - основная
+    база; чтение внутри use_replica() - реплика.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None:
+            return None
+        # Внутри транзакции основной базы читаем свои же незафиксированные изменения
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadMixin:
+    """
+    Примесь для представлений DRF: GET-запросы действий из
+    replica_read_actions читаются с реплики. Для APIView без действий
+    (action отсутствует) на реплику идут все GET-запросы.
+    """
+    replica_read_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        # Пользователь определяется аутентификацией JWT внутри initial
+        super().initial(request, *args, **kwargs)
+        action = getattr(self, 'action', None)
+        if request.method in SAFE_METHODS and (action is None or action in self.replica_read_actions):
+            alias = replica_alias()
+            if alias is not None and not is_sticky(request.user.pk):
+                self._replica_token = _read_alias.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Сериализация ответа уже выполнена, чтение с реплики больше не нужно
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _read_alias.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaStickinessMiddleware:
+    """
+    После успешного изменяющего запроса (POST, PUT, PATCH, DELETE)
+    отмечает пользователя для чтения из основной базы.
+    Поддерживает синхронный (WSGI) и асинхронный (ASGI) режимы.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self._mark(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        await sync_to_async(self._mark)(request, response)
+        return response
+
+    def _mark(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400 or replica_alias() is None:
+            return
+        # Для JWT пользователь известен только запросу DRF, который доступен из ответа
+        renderer_context = getattr(response, 'renderer_context', None) or {}
+        user = getattr(renderer_context.get('request'), 'user', None) or getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            mark_sticky(user.pk)
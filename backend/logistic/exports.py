@@ -0,0 +1,347 @@
+"""
+Потоковая выгрузка списков заявок, отправок и финансовых операций в CSV и XLSX.
+
+Строки читаются из базы курсором (QuerySet.values_list().iterator(), для
+PostgreSQL - серверный курсор) пачками по EXPORT_CHUNK_SIZE и сразу
+записываются в ответ блоками около EXPORT_BUFFER_SIZE байт, поэтому память
+не зависит от количества строк. Выборка - та же, что у списка
+(get_queryset + filter_queryset представления): фильтры роли и параметры
+запроса действуют так же.
+
+XLSX собирается без сторонних библиотек: zip-архив пишется в поток
+(zipfile поддерживает запись в поток без перемотки), лист содержит
+строки со встроенными значениями (inlineStr), без таблицы общих строк.
+"""
+import codecs
+import csv
+import datetime
+import io
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Concat, NullIf, Trim
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Finance
+
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+EXPORT_FORMATS = ('csv', 'xlsx')
+# Максимум строк листа Excel, включая заголовок
+XLSX_MAX_ROWS = 1048576
+
+# Столбцы выгрузки: (заголовок, поле или выражение для values_list, преобразование значения)
+REQUEST_EXPORT_COLUMNS = (
+    ('Номер', 'number', None),
+    ('Дата создания', 'created_at', None),
+    ('Клиент', 'client__name', None),
+    ('Менеджер', 'manager__name', None),
+    ('Статус', 'status__name', None),
+    ('Отправка', 'shipment__number', None),
+    ('Описание', 'description', None),
+    ('Номер на складе', 'warehouse_number', None),
+    ('Количество мест', 'col_mest', None),
+    ('Заявленный вес', 'declared_weight', None),
+    ('Заявленный объем', 'declared_volume', None),
+    ('Фактический вес', 'actual_weight', None),
+    ('Фактический объем', 'actual_volume', None),
+    ('Ставка', 'rate', None),
+    ('Комментарий', 'comment', None),
+)
+
+SHIPMENT_EXPORT_COLUMNS = (
+    ('Номер', 'number', None),
+    ('Дата создания', 'created_at', None),
+    ('Статус', 'status__name', None),
+    ('Создал', 'created_by__name', None),
+    # Аннотация ShipmentViewSet.filter_queryset
+    ('Количество заявок', 'requests_count', None),
+    ('Комментарий', 'comment', None),
+)
+
+
+def _choices(field_name):
+    """Преобразование кода выбора поля Finance в его название."""
+    names = dict(Finance._meta.get_field(field_name).choices)
+    return lambda value: names.get(value, value)
+
+
+# Имя контрагента как в балансах: полное имя или логин
+_COUNTERPARTY_NAME = Coalesce(
+    NullIf(Trim(Concat(F('counterparty__first_name'), Value(' '), F('counterparty__last_name'))), Value('')),
+    F('counterparty__username'),
+)
+
+FINANCE_EXPORT_COLUMNS = (
+    ('Номер', 'number', None),
+    ('Дата создания', 'created_at', None),
+    ('Дата оплаты', 'payment_date', None),
+    ('Тип операции', 'operation_type', _choices('operation_type')),
+    ('Тип документа', 'document_type', _choices('document_type')),
+    ('Валюта', 'currency', _choices('currency')),
+    ('Сумма', 'amount', None),
+    ('Оплачен', 'is_paid', None),
+    ('Статья', 'article__name', None),
+    ('Контрагент', _COUNTERPARTY_NAME, None),
+    ('Отправка', 'shipment__number', None),
+    ('Заявка', 'request__number', None),
+    ('Основание', 'basis__number', None),
+    ('Комментарий', 'comment', None),
+    ('Создал', 'created_by__name', None),
+)
+
+
+def iter_rows(queryset, columns):
+    """
+    Значения столбцов построчно. Выборка читается курсором пачками
+    по EXPORT_CHUNK_SIZE строк.
+    """
+    converters = [convert for _, _, convert in columns]
+    rows = queryset.values_list(*[lookup for _, lookup, _ in columns]).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE
+    )
+    for row in rows:
+        yield [
+            convert(value) if convert is not None and value is not None else value
+            for convert, value in zip(converters, row)
+        ]
+
+
+def _local(value):
+    """Время в часовом поясе проекта без указания пояса."""
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+
+# CSV
+
+# Значения, которые табличные редакторы считают формулой
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_value(value):
+    value = _local(value)
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'да' if value else 'нет'
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(headers, rows):
+    """
+    Блоки CSV (UTF-8 с BOM, чтобы Excel распознал кодировку).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        if buffer.tell() >= settings.EXPORT_BUFFER_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+# XLSX
+
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Стили ячеек: 0 - обычный, 1 - заголовок (жирный), 2 - дата, 3 - дата и время
+_STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="dd.mm.yyyy hh:mm"/></numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_FOOTER = '</sheetData></worksheet>'
+
+# Символы, недопустимые в XML 1.0
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+_EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+
+def _xlsx_string(value, style=0):
+    text = escape(_ILLEGAL_XML_CHARS.sub('', value))
+    style_attr = f' s="{style}"' if style else ''
+    return f'<c t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_cell(value):
+    value = _local(value)
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime.datetime):
+        delta = value - _EXCEL_EPOCH
+        return f'<c s="3"><v>{delta.days + delta.seconds / 86400:.6f}</v></c>'
+    if isinstance(value, datetime.date):
+        return f'<c s="2"><v>{(value - _EXCEL_EPOCH.date()).days}</v></c>'
+    return _xlsx_string(str(value))
+
+
+class _Pipe:
+    """
+    Файлоподобный объект без перемотки: накапливает записанные байты,
+    которые забираются методом drain().
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        self.size = 0
+        return data
+
+
+def xlsx_chunks(headers, rows, sheet_name):
+    """
+    Блоки XLSX-файла с одним листом. Строки сверх XLSX_MAX_ROWS не выгружаются.
+    """
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES_XML)
+        archive.writestr('_rels/.rels', _ROOT_RELS_XML)
+        archive.writestr('xl/workbook.xml', _WORKBOOK_XML.format(name=escape(sheet_name, {'"': '&quot;'})))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS_XML)
+        archive.writestr('xl/styles.xml', _STYLES_XML)
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            writer = codecs.getwriter('utf-8')(sheet)
+            writer.write(_SHEET_HEADER)
+            writer.write('<row>' + ''.join(_xlsx_string(header, style=1) for header in headers) + '</row>')
+            for index, row in enumerate(rows, start=2):
+                if index > XLSX_MAX_ROWS:
+                    break
+                writer.write('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>')
+                if pipe.size >= settings.EXPORT_BUFFER_SIZE:
+                    yield pipe.drain()
+            writer.write(_SHEET_FOOTER)
+    yield pipe.drain()
+
+
+def _async_chunks(chunks):
+    """
+    Асинхронный итератор по синхронному генератору блоков для ASGI.
+    Без него Django под ASGI собирает весь синхронный поток в память.
+    Блоки читаются в потоке запроса (thread_sensitive), где открыт курсор.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+
+    async def iterate():
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    return iterate()
+
+
+def export_response(request, queryset, columns, basename):
+    """
+    Потоковый ответ с выгрузкой выборки в формате из параметра file_format
+    (csv по умолчанию или xlsx).
+
+    База данных для чтения выбирается сразу: роутер реплики учитывает
+    обработку запроса представлением, а строки читаются уже после нее.
+    """
+    file_format = request.query_params.get('file_format', 'csv').lower()
+    if file_format not in EXPORT_FORMATS:
+        raise ValidationError({'file_format': f'Допустимые форматы: {", ".join(EXPORT_FORMATS)}'})
+    queryset = queryset.using(queryset.db)
+    headers = [header for header, _, _ in columns]
+    rows = iter_rows(queryset, columns)
+    filename = f'{basename}_{timezone.localdate():%Y%m%d}.{file_format}'
+    if file_format == 'xlsx':
+        chunks, content_type = xlsx_chunks(headers, rows, basename), XLSX_CONTENT_TYPE
+    else:
+        chunks, content_type = csv_chunks(headers, rows), CSV_CONTENT_TYPE
+
+    if isinstance(request._request, ASGIRequest):
+        chunks = _async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+    return response
@@ -0,0 +1,49 @@
+"""
+Версия дерева файлов отправки для ETag эндпоинта files/tree.
+
+Версия хранится в кеше и меняется сигналами при изменении папок и файлов
+отправки, а также после генерации превью ее блобов. ETag строится из
+версии до чтения дерева, поэтому ответ 304 не выполняет ни запросов к
+папкам и файлам, ни сериализации.
+
+Смену версии видят процессы с тем же кешем. С кешем в памяти процесса
+(без REDIS_URL) остальные процессы узнают об изменении, когда версия
+истечет: она хранится FILE_TREE_VERSION_SECONDS секунд.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import ShipmentFile
+
+
+def _version_key(shipment_id):
+    return f'logistic:file_tree_version:{shipment_id}'
+
+
+def file_tree_version(shipment_id):
+    """Текущая версия дерева файлов отправки (создается при первом обращении)."""
+    key = _version_key(shipment_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add не перезапишет версию, которую параллельно создал другой процесс
+        if not cache.add(key, version, settings.FILE_TREE_VERSION_SECONDS):
+            version = cache.get(key) or version
+    return version
+
+
+def bump_file_tree_version(shipment_ids):
+    """Меняет версию деревьев файлов отправок после фиксации транзакции."""
+    keys = [_version_key(shipment_id) for shipment_id in shipment_ids if shipment_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def bump_blob_file_trees(blob_id):
+    """Превью или веб-версия блоба изменились - меняет версию деревьев отправок с этим блобом."""
+    bump_file_tree_version(
+        ShipmentFile.objects.filter(blob_id=blob_id).values_list('shipment_id', flat=True).distinct()
+    )
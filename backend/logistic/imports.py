@@ -0,0 +1,665 @@
+"""
+Массовый импорт заявок и финансовых операций из CSV/XLSX.
+
+Файл читается потоком (CSV - построчно, XLSX - разбором XML листа по
+строкам) и обрабатывается пачками по IMPORT_CHUNK_SIZE строк:
+- ссылки на клиентов, менеджеров, статусы, статьи, контрагентов и отправки
+  разрешаются по справочникам, загруженным в память один раз на задание;
+  заявки и операции-основания (их может быть очень много) ищутся одним
+  запросом на пачку;
+- строки проверяются (типы, выбор, длины полей), строки с ошибками
+  пропускаются и попадают в отчет об ошибках;
+- корректные строки вставляются bulk_create в транзакции вместе с
+  обновлением прогресса задания, поэтому после сбоя импорт продолжается
+  со следующей пачки без дублей. Прогресс обновляется условно (только если
+  processed_rows не изменился с начала пачки): если задание продолжил другой
+  процесс (resume устаревшего задания, когда прежний процесс еще жив),
+  опоздавший откатывает свою пачку и останавливается.
+
+В пробном режиме (dry_run) выполняется только проверка.
+
+Заголовки столбцов совпадают с выгрузкой (exports.py) или с именами полей
+модели, поэтому выгруженный файл можно загрузить обратно.
+"""
+import csv
+import datetime
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from xml.etree.ElementTree import iterparse
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .cleanup import LOGISTIC_ROOT, schedule_deletion
+from .models import Article, Finance, ImportJob, Request, RequestStatus, Shipment, UserProfile
+from .status_history import initial_transitions, record_transitions
+from .storage import COPY_CHUNK_SIZE, get_storage
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('.csv', '.xlsx')
+
+
+def import_storage_name(job_id, file_name):
+    """Имя исходного файла задания в хранилище."""
+    extension = os.path.splitext(file_name)[1].lower()
+    return f'{LOGISTIC_ROOT}/imports/{job_id}/source{extension}'
+
+
+class RowError(Exception):
+    """Ошибка значения ячейки."""
+
+
+class ImportFileError(Exception):
+    """Файл не может быть импортирован (формат, заголовок)."""
+
+
+class ImportJobTaken(Exception):
+    """Пачку задания уже зафиксировал другой процесс."""
+
+
+# Чтение файлов
+
+def _xlsx_column_index(reference):
+    """Номер столбца (с 0) по ссылке на ячейку, например 'AB12' -> 27."""
+    index = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - ord('A') + 1
+    return index - 1
+
+
+def _xlsx_tag(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def _xlsx_text(element):
+    """Текст элемента <si> или <is>: все <t>, включая форматированные фрагменты."""
+    return ''.join(node.text or '' for node in element.iter() if _xlsx_tag(node) == 't')
+
+
+def _xlsx_sheet_name(archive):
+    names = sorted(name for name in archive.namelist() if name.startswith('xl/worksheets/sheet'))
+    if 'xl/worksheets/sheet1.xml' in names:
+        return 'xl/worksheets/sheet1.xml'
+    if not names:
+        raise ImportFileError('В файле XLSX нет листов')
+    return names[0]
+
+
+def read_xlsx(path):
+    """
+    Строки первого листа XLSX (списки значений). Таблица общих строк
+    загружается в память, лист разбирается по строкам.
+    """
+    with zipfile.ZipFile(path) as archive:
+        shared_strings = []
+        if 'xl/sharedStrings.xml' in archive.namelist():
+            with archive.open('xl/sharedStrings.xml') as source:
+                for _, element in iterparse(source):
+                    if _xlsx_tag(element) == 'si':
+                        shared_strings.append(_xlsx_text(element))
+                        element.clear()
+
+        with archive.open(_xlsx_sheet_name(archive)) as source:
+            for _, element in iterparse(source):
+                if _xlsx_tag(element) != 'row':
+                    continue
+                values = []
+                for cell in element:
+                    if _xlsx_tag(cell) != 'c':
+                        continue
+                    reference = cell.get('r')
+                    if reference:
+                        index = _xlsx_column_index(reference)
+                        values.extend([None] * (index - len(values)))
+                    values.append(_xlsx_value(cell, shared_strings))
+                element.clear()
+                yield values
+
+
+def _xlsx_value(cell, shared_strings):
+    cell_type = cell.get('t', 'n')
+    if cell_type == 'inlineStr':
+        for child in cell:
+            if _xlsx_tag(child) == 'is':
+                return _xlsx_text(child)
+        return None
+    raw = None
+    for child in cell:
+        if _xlsx_tag(child) == 'v':
+            raw = child.text
+    if raw is None:
+        return None
+    if cell_type == 's':
+        return shared_strings[int(raw)]
+    if cell_type == 'b':
+        return raw == '1'
+    if cell_type in ('str', 'e'):
+        return raw
+    number = float(raw)
+    return int(number) if number.is_integer() else number
+
+
+def read_csv(path):
+    """
+    Строки CSV (UTF-8, допускается BOM). Разделитель - запятая,
+    точка с запятой или табуляция - определяется по началу файла.
+    """
+    with open(path, encoding='utf-8-sig', newline='') as source:
+        sample = source.read(64 * 1024)
+        source.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(source, dialect)
+
+
+def read_rows(path, file_name):
+    if file_name.lower().endswith('.xlsx'):
+        return read_xlsx(path)
+    return read_csv(path)
+
+
+def _is_blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+# Разбор значений
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else str(value)
+
+
+def parse_string(value):
+    text = _text(value)
+    # Апостроф, которым выгрузка CSV экранирует значения, похожие на формулы
+    if text[:1] == "'" and text[1:2] in ('=', '+', '-', '@'):
+        return text[1:]
+    return text
+
+
+def parse_int(value):
+    if isinstance(value, bool):
+        raise RowError('Ожидается целое число')
+    if isinstance(value, int):
+        return value
+    try:
+        number = Decimal(_text(value).replace(' ', '').replace(',', '.'))
+    except InvalidOperation:
+        raise RowError('Ожидается целое число')
+    if number != number.to_integral_value():
+        raise RowError('Ожидается целое число')
+    return int(number)
+
+
+def parse_float(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return float(_text(value).replace(' ', '').replace(',', '.'))
+    except ValueError:
+        raise RowError('Ожидается число')
+
+
+def parse_decimal(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return Decimal(str(value))
+    try:
+        number = Decimal(_text(value).replace(' ', '').replace(',', '.'))
+    except InvalidOperation:
+        raise RowError('Ожидается число')
+    if not number.is_finite():
+        raise RowError('Ожидается число')
+    return number
+
+
+_TRUE_VALUES = {'1', 'да', 'yes', 'true', '+', 'y', 'д'}
+_FALSE_VALUES = {'0', 'нет', 'no', 'false', '-', 'n', 'н'}
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = _text(value).lower()
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    raise RowError('Ожидается да/нет')
+
+
+_EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+_DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y', '%d.%m.%y')
+_DATETIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M')
+
+
+def _parse_datetime_value(value, formats):
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Дата XLSX - количество дней от 30.12.1899
+        return _EXCEL_EPOCH + datetime.timedelta(days=value)
+    text = _text(value)
+    for date_format in formats:
+        try:
+            return datetime.datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    raise RowError('Неверный формат даты')
+
+
+def parse_date(value):
+    return _parse_datetime_value(value, _DATE_FORMATS + _DATETIME_FORMATS).date()
+
+
+def parse_datetime(value):
+    result = _parse_datetime_value(value, _DATETIME_FORMATS + _DATE_FORMATS)
+    if timezone.is_naive(result):
+        result = timezone.make_aware(result)
+    return result
+
+
+def choice_parser(model, field_name):
+    """Значение выбора поля модели по коду или названию (без учета регистра)."""
+    choices = {}
+    for code, name in model._meta.get_field(field_name).choices:
+        choices[code.lower()] = code
+        choices[name.lower()] = code
+
+    def parse(value):
+        code = choices.get(_text(value).lower())
+        if code is None:
+            raise RowError('Недопустимое значение')
+        return code
+    return parse
+
+
+# Справочники
+
+def _key(value):
+    """Ключ поиска по справочнику: текст без учета регистра, число без дробной части."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return _text(value).lower()
+
+
+_AMBIGUOUS = object()
+
+
+class Lookup:
+    """
+    Справочник: значение ячейки -> id объекта. Одно значение, подходящее
+    нескольким объектам, считается ошибкой.
+    """
+
+    def __init__(self, entries=()):
+        self.ids = {}
+        for keys, pk in entries:
+            self._add(keys, pk)
+
+    def _add(self, keys, pk):
+        for key in {_key(key) for key in keys if not _is_blank(key)}:
+            current = self.ids.get(key)
+            self.ids[key] = pk if current in (None, pk) else _AMBIGUOUS
+
+    def prepare(self, keys):
+        """Подготовка к разбору пачки строк с указанными ключами."""
+
+    def resolve(self, value):
+        pk = self.ids.get(_key(value))
+        if pk is None:
+            raise RowError(f'Не найдено: {_text(value)}')
+        if pk is _AMBIGUOUS:
+            raise RowError(f'Неоднозначное значение: {_text(value)}')
+        return pk
+
+
+class NumberLookup(Lookup):
+    """
+    Справочник по целочисленному номеру, загружаемый одним запросом
+    на пачку строк (для больших таблиц).
+    """
+
+    def __init__(self, queryset, field):
+        super().__init__()
+        self.queryset = queryset
+        self.field = field
+
+    def prepare(self, keys):
+        self.ids = {}
+        numbers = set()
+        for key in keys:
+            try:
+                numbers.add(parse_int(key))
+            except RowError:
+                continue
+        if numbers:
+            for number, pk in self.queryset.filter(**{f'{self.field}__in': numbers}).values_list(self.field, 'pk'):
+                self._add([number], pk)
+
+
+def build_lookups(company, kind):
+    """Справочники компании для разбора ссылок в строках файла."""
+    if kind == ImportJob.KIND_REQUESTS:
+        profiles = UserProfile.objects.filter(company=company).values_list(
+            'pk', 'user_group', 'name', 'user__username', 'user__email'
+        )
+        clients, managers = [], []
+        for pk, user_group, name, username, email in profiles:
+            if user_group == 'client':
+                clients.append(((name, username, email), pk))
+            elif user_group in ('manager', 'boss', 'admin'):
+                managers.append(((name, username, email), pk))
+        return {
+            'client': Lookup(clients),
+            'manager': Lookup(managers),
+            'status': Lookup(
+                ((code, name), pk)
+                for pk, code, name in RequestStatus.objects.filter(company=company).values_list('pk', 'code', 'name')
+            ),
+            'shipment': Lookup(
+                ((number,), pk) for pk, number in Shipment.objects.filter(company=company).values_list('pk', 'number')
+            ),
+        }
+
+    counterparties = User.objects.filter(userprofile__company=company).values_list(
+        'pk', 'username', 'email', 'first_name', 'last_name'
+    )
+    return {
+        'article': Lookup(
+            ((name,), pk) for pk, name in Article.objects.filter(company=company).values_list('pk', 'name')
+        ),
+        'counterparty': Lookup(
+            ((username, email, f'{first_name} {last_name}'.strip()), pk)
+            for pk, username, email, first_name, last_name in counterparties
+        ),
+        'shipment': Lookup(
+            ((number,), pk) for pk, number in Shipment.objects.filter(company=company).values_list('pk', 'number')
+        ),
+        'request': NumberLookup(Request.objects.filter(company=company), 'number'),
+        'basis': NumberLookup(Finance.objects.filter(company=company), 'number'),
+    }
+
+
+# Столбцы: (поле модели, заголовки, разбор значения или имя справочника)
+
+REQUEST_IMPORT_COLUMNS = (
+    ('number', ('Номер', 'number'), parse_int),
+    ('created_at', ('Дата создания', 'created_at'), parse_datetime),
+    ('client', ('Клиент', 'client'), 'client'),
+    ('manager', ('Менеджер', 'manager'), 'manager'),
+    ('status', ('Статус', 'status'), 'status'),
+    ('shipment', ('Отправка', 'shipment'), 'shipment'),
+    ('description', ('Описание', 'description'), parse_string),
+    ('warehouse_number', ('Номер на складе', 'warehouse_number'), parse_string),
+    ('col_mest', ('Количество мест', 'col_mest'), parse_float),
+    ('declared_weight', ('Заявленный вес', 'declared_weight'), parse_float),
+    ('declared_volume', ('Заявленный объем', 'declared_volume'), parse_float),
+    ('actual_weight', ('Фактический вес', 'actual_weight'), parse_float),
+    ('actual_volume', ('Фактический объем', 'actual_volume'), parse_float),
+    ('rate', ('Ставка', 'rate'), parse_string),
+    ('comment', ('Комментарий', 'comment'), parse_string),
+)
+
+FINANCE_IMPORT_COLUMNS = (
+    ('payment_date', ('Дата оплаты', 'payment_date'), parse_date),
+    ('operation_type', ('Тип операции', 'operation_type'), choice_parser(Finance, 'operation_type')),
+    ('document_type', ('Тип документа', 'document_type'), choice_parser(Finance, 'document_type')),
+    ('currency', ('Валюта', 'currency'), choice_parser(Finance, 'currency')),
+    ('amount', ('Сумма', 'amount'), parse_decimal),
+    ('is_paid', ('Оплачен', 'is_paid'), parse_bool),
+    ('article', ('Статья', 'article'), 'article'),
+    ('counterparty', ('Контрагент', 'counterparty'), 'counterparty'),
+    ('shipment', ('Отправка', 'shipment'), 'shipment'),
+    ('request', ('Заявка', 'request'), 'request'),
+    ('basis', ('Основание', 'basis'), 'basis'),
+    ('comment', ('Комментарий', 'comment'), parse_string),
+)
+
+IMPORT_SPECS = {
+    ImportJob.KIND_REQUESTS: (Request, REQUEST_IMPORT_COLUMNS, ('client',)),
+    ImportJob.KIND_FINANCES: (Finance, FINANCE_IMPORT_COLUMNS, ('payment_date', 'operation_type', 'document_type', 'currency')),
+}
+
+
+class RowParser:
+    """
+    Разбор и проверка строк файла одного задания.
+    """
+
+    def __init__(self, job, header):
+        self.job = job
+        self.model, columns, self.required = IMPORT_SPECS[job.kind]
+        self.lookups = build_lookups(job.company, job.kind)
+        self.default_status_id = None
+        # Коды статусов заявок по id - для журнала смены статусов
+        self.status_codes = None
+        if job.kind == ImportJob.KIND_REQUESTS:
+            self.default_status_id = RequestStatus.objects.filter(
+                company=job.company, is_default=True
+            ).values_list('pk', flat=True).first()
+            self.status_codes = dict(RequestStatus.objects.filter(company=job.company).values_list('pk', 'code'))
+
+        positions = {_key(name): index for index, name in enumerate(header) if not _is_blank(name)}
+        # (поле, заголовок из файла, позиция столбца, разбор)
+        self.columns = []
+        for field, headers, parser in columns:
+            for name in headers:
+                if _key(name) in positions:
+                    self.columns.append((field, name, positions[_key(name)], parser))
+                    break
+        # Заголовки столбцов файла по полям модели - для отчета об ошибках
+        self.headers = {field: name for field, name, _, _ in self.columns}
+        found = set(self.headers)
+        missing = [headers[0] for field, headers, _ in columns if field in self.required and field not in found]
+        if missing:
+            raise ImportFileError(f'В файле нет обязательных столбцов: {", ".join(missing)}')
+        # Внешние ключи проверяются справочниками, а не запросами clean_fields
+        self.exclude = [field.name for field in self.model._meta.concrete_fields if field.is_relation] + ['number']
+
+    def prepare(self, rows):
+        """Загружает данные справочников, которые ищутся по пачке."""
+        for field, _, position, parser in self.columns:
+            if isinstance(parser, str):
+                self.lookups[parser].prepare({
+                    row[position] for _, row in rows
+                    if position < len(row) and not _is_blank(row[position])
+                })
+
+    def parse(self, row):
+        """
+        Возвращает несохраненный объект модели и список ошибок
+        [(заголовок, сообщение)].
+        """
+        values, errors, failed = {}, [], set()
+        for field, name, position, parser in self.columns:
+            value = row[position] if position < len(row) else None
+            if _is_blank(value):
+                continue
+            try:
+                if isinstance(parser, str):
+                    values[f'{field}_id'] = self.lookups[parser].resolve(value)
+                else:
+                    values[field] = parser(value)
+            except RowError as e:
+                errors.append((name, str(e)))
+                failed.add(field)
+
+        if self.job.kind == ImportJob.KIND_REQUESTS:
+            if 'status_id' not in values and 'status' not in failed:
+                if self.default_status_id is None:
+                    errors.append((self.headers.get('status', 'Статус'), 'У компании нет статуса заявки по умолчанию'))
+                values['status_id'] = self.default_status_id
+        else:
+            values['created_by_id'] = self.job.created_by_id
+
+        for field in self.required:
+            if field not in values and f'{field}_id' not in values and field not in failed:
+                errors.append((self.headers.get(field, field), 'Обязательное значение'))
+
+        instance = self.model(company_id=self.job.company_id, **values)
+        if not errors:
+            try:
+                instance.clean_fields(exclude=self.exclude)
+            except ValidationError as e:
+                for field, messages in e.message_dict.items():
+                    errors.extend((self.headers.get(field, field), message) for message in messages)
+        return instance, errors
+
+
+def _local_copy(storage, name):
+    """
+    Путь к локальному файлу для чтения. Для хранилищ без локальной
+    файловой системы файл копируется во временный (второй элемент - его путь).
+    """
+    try:
+        return storage.path(name), None
+    except NotImplementedError:
+        fd, tmp_path = tempfile.mkstemp(dir=storage.temp_dir(), suffix=os.path.splitext(name)[1])
+        with os.fdopen(fd, 'wb') as destination, storage.open(name) as source:
+            shutil.copyfileobj(source, destination, COPY_CHUNK_SIZE)
+        return tmp_path, tmp_path
+
+
+def _numbered_rows(rows):
+    """Непустые строки данных с номером строки файла (заголовок - строка 1)."""
+    for number, row in enumerate(rows, start=2):
+        if not all(_is_blank(value) for value in row):
+            yield number, row
+
+
+def _process(job, path):
+    rows = read_rows(path, job.file_name)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('Файл пуст')
+    parser = RowParser(job, header)
+
+    if job.total_rows is None:
+        # Отдельный проход по файлу без обращений к базе - для отображения прогресса
+        job.total_rows = sum(1 for _ in _numbered_rows(islice(read_rows(path, job.file_name), 1, None)))
+        job.save(update_fields=['total_rows', 'updated_at'])
+
+    data_rows = _numbered_rows(rows)
+    # Продолжение после сбоя: уже зафиксированные строки пропускаются
+    skipped = 0
+    while skipped < job.processed_rows and next(data_rows, None) is not None:
+        skipped += 1
+
+    while True:
+        chunk = list(islice(data_rows, settings.IMPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        parser.prepare(chunk)
+        instances, chunk_errors = [], []
+        for number, row in chunk:
+            instance, errors = parser.parse(row)
+            if errors:
+                chunk_errors.append((number, errors))
+            else:
+                instances.append(instance)
+
+        with transaction.atomic():
+            if not job.dry_run and instances:
+                if parser.status_codes is not None:
+                    now = timezone.now()
+                    for instance in instances:
+                        instance.status_changed_at = now
+                parser.model.objects.bulk_create(instances)
+                if parser.status_codes is not None:
+                    # Начальные статусы импортированных заявок - в журнал одним bulk_create
+                    user = job.created_by.user if job.created_by_id else None
+                    record_transitions(initial_transitions(instances, user, parser.status_codes))
+            processed_before = job.processed_rows
+            job.processed_rows += len(chunk)
+            job.imported_rows += len(instances)
+            job.error_rows += len(chunk_errors)
+            for number, errors in chunk_errors:
+                for column, message in errors:
+                    if len(job.errors) >= settings.IMPORT_MAX_ERRORS:
+                        break
+                    job.errors.append({'row': number, 'column': column, 'message': message})
+            job.updated_at = timezone.now()
+            # Сравнение с прочитанным значением: из двух процессов пачку фиксирует один
+            updated = ImportJob.objects.filter(pk=job.pk, processed_rows=processed_before).update(
+                processed_rows=job.processed_rows, imported_rows=job.imported_rows, error_rows=job.error_rows,
+                errors=job.errors, updated_at=job.updated_at,
+            )
+            if not updated:
+                raise ImportJobTaken()
+
+
+def run_import_job(job_id):
+    """
+    Выполняет задание импорта (в фоновом потоке). Задание должно быть
+    в статусе 'pending'; повторный запуск продолжает с processed_rows.
+    """
+    now = timezone.now()
+    claimed = ImportJob.objects.filter(pk=job_id, status=ImportJob.STATUS_PENDING).update(
+        status=ImportJob.STATUS_RUNNING, message=None, updated_at=now
+    )
+    if not claimed:
+        return
+    job = ImportJob.objects.select_related('company').get(pk=job_id)
+    if job.started_at is None:
+        job.started_at = now
+        job.save(update_fields=['started_at'])
+
+    storage = get_storage()
+    tmp_path = None
+    try:
+        path, tmp_path = _local_copy(storage, job.storage_name)
+        _process(job, path)
+    except ImportJobTaken:
+        # Пачка откатилась, задание выполняет другой процесс
+        logger.warning("Импорт #%s продолжен другим процессом, выполнение остановлено", job_id)
+        return
+    except (ImportFileError, zipfile.BadZipFile, UnicodeDecodeError, csv.Error) as e:
+        job.status = ImportJob.STATUS_FAILED
+        if isinstance(e, UnicodeDecodeError):
+            job.message = 'Файл CSV должен быть в кодировке UTF-8'
+        elif isinstance(e, zipfile.BadZipFile):
+            job.message = 'Файл XLSX поврежден'
+        else:
+            job.message = str(e)
+        job.save(update_fields=['status', 'message', 'updated_at'])
+        return
+    except Exception as e:
+        logger.exception("Ошибка импорта #%s", job_id)
+        job.status = ImportJob.STATUS_FAILED
+        job.message = str(e)
+        job.save(update_fields=['status', 'message', 'updated_at'])
+        return
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    with transaction.atomic():
+        now = timezone.now()
+        # Завершает задание только один из процессов, дошедших до конца файла
+        completed = ImportJob.objects.filter(
+            pk=job.pk, status=ImportJob.STATUS_RUNNING, processed_rows=job.processed_rows
+        ).update(status=ImportJob.STATUS_COMPLETED, finished_at=now, updated_at=now)
+        if completed and not job.dry_run:
+            # После импорта исходный файл больше не нужен
+            schedule_deletion(job.storage_name)
+            ImportJob.objects.filter(pk=job.pk).update(storage_name='')
+
+
+def error_report_rows(job):
+    """Строки отчета об ошибках: номер строки файла, столбец, сообщение."""
+    for error in job.errors:
+        yield [error['row'], error['column'], error['message']]
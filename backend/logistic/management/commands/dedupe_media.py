@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+
+from logistic.blobstore import acquire_stored_file, blob_transaction, hash_stored_file
+from logistic.cleanup import schedule_deletion
+from logistic.models import RequestFile, ShipmentFile
+from logistic.storage import get_storage
+
+
+class Command(BaseCommand):
+    """
+    Переносит файлы, загруженные до появления хранилища блобов,
+    в хранилище с адресацией по содержимому.
+
+    Для каждой записи без блоба вычисляется SHA-256 файла, запись привязывается
+    к блобу (новому или уже существующему), а старый файл ставится в журнал
+    удаления. Одинаковые файлы после переноса хранятся на диске один раз.
+    """
+    help = 'Дедупликация существующих файлов заявок и отправок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, без изменений')
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки записей')
+
+    def handle(self, *args, **options):
+        for model in (RequestFile, ShipmentFile):
+            self._dedupe_model(model, options['dry_run'], options['batch_size'])
+
+    def _dedupe_model(self, model, dry_run, batch_size):
+        ids = list(model.objects.filter(blob__isnull=True).values_list('id', flat=True))
+        migrated = duplicates = missing = 0
+        saved_bytes = 0
+        seen_hashes = set()
+
+        storage = get_storage()
+        related = ['folder'] if model is ShipmentFile else []
+        for start in range(0, len(ids), batch_size):
+            batch = model.objects.filter(id__in=ids[start:start + batch_size]).select_related(*related)
+            for file_obj in batch:
+                name = file_obj.get_storage_name()
+                if not storage.exists(name):
+                    missing += 1
+                    continue
+
+                sha256, size = hash_stored_file(name)
+                if dry_run:
+                    if sha256 in seen_hashes:
+                        duplicates += 1
+                        saved_bytes += size
+                    seen_hashes.add(sha256)
+                    migrated += 1
+                    continue
+
+                with blob_transaction():
+                    blob = acquire_stored_file(name, sha256, size)
+                    model.objects.filter(pk=file_obj.pk).update(blob=blob)
+                    # Старый файл удаляется после фиксации, если на него больше никто не ссылается
+                    schedule_deletion(name)
+
+                if blob.ref_count > 1:
+                    duplicates += 1
+                    saved_bytes += size
+                migrated += 1
+
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: перенесено {migrated}, дубликатов {duplicates}, '
+            f'нет на диске {missing}, освобождено {saved_bytes} байт'
+        )
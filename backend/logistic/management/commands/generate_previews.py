@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+
+from logistic.models import FileBlob
+from logistic.previews import generate_previews
+
+
+class Command(BaseCommand):
+    """
+    Генерирует превью для блобов, у которых их еще нет.
+
+    Новые загрузки обрабатываются автоматически. Команда нужна для
+    блобов, созданных до появления превью (например, командой dedupe_media),
+    и для повторной обработки после ошибок (--retry-failed).
+    --renditions повторно обрабатывает готовые блобы без веб-версии, чтобы
+    создать ее для изображений, загруженных до появления веб-версий.
+    --recheck-renditions повторно обрабатывает блобы с веб-версией: у
+    изображений, которым она не положена (PNG, TIFF, GIF, многокадровые),
+    веб-версия удаляется и скачивается оригинал.
+    """
+    help = 'Генерирует миниатюры и превью для загруженных файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='Повторить обработку блобов с ошибкой')
+        parser.add_argument(
+            '--renditions', action='store_true', help='Создать веб-версии изображений, загруженных до их появления'
+        )
+        parser.add_argument(
+            '--recheck-renditions', action='store_true',
+            help='Удалить веб-версии изображений, которые не являются фотографиями'
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            FileBlob.objects.filter(preview_status=FileBlob.PREVIEW_FAILED).update(
+                preview_status=FileBlob.PREVIEW_PENDING
+            )
+        if options['renditions']:
+            FileBlob.objects.filter(preview_status=FileBlob.PREVIEW_READY, rendition_size__isnull=True).update(
+                preview_status=FileBlob.PREVIEW_PENDING
+            )
+
+        if options['recheck_renditions']:
+            FileBlob.objects.filter(preview_status=FileBlob.PREVIEW_READY, rendition_size__isnull=False).update(
+                preview_status=FileBlob.PREVIEW_PENDING
+            )
+
+        blob_ids = list(
+            FileBlob.objects.filter(preview_status=FileBlob.PREVIEW_PENDING).values_list('id', flat=True)
+        )
+        for blob_id in blob_ids:
+            generate_previews(blob_id)
+
+        stats = dict.fromkeys(dict(FileBlob.PREVIEW_STATUS_CHOICES), 0)
+        for status in FileBlob.objects.filter(id__in=blob_ids).values_list('preview_status', flat=True):
+            stats[status] += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано блобов: {len(blob_ids)}, '
+            f'готово: {stats[FileBlob.PREVIEW_READY]}, '
+            f'не поддерживается: {stats[FileBlob.PREVIEW_UNSUPPORTED]}, '
+            f'ошибок: {stats[FileBlob.PREVIEW_FAILED]}'
+        ))
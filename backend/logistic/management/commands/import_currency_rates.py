@@ -0,0 +1,131 @@
+import csv
+import datetime
+import os
+from decimal import Decimal, InvalidOperation
+from xml.etree import ElementTree
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from logistic.models import CurrencyRate
+
+# Коды валют ЦБ РФ в выгрузках динамики курсов (XML_dynamic)
+CBR_CURRENCY_IDS = {'R01235': 'usd', 'R01239': 'eur'}
+
+SUPPORTED_CURRENCIES = {code for code, _ in CurrencyRate.CURRENCY_CHOICES}
+
+
+def _parse_decimal(value):
+    return Decimal(str(value).strip().replace(' ', '').replace(',', '.'))
+
+
+def _parse_date(value):
+    value = value.strip()
+    for date_format in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Неизвестный формат даты: {value}')
+
+
+def read_csv_rates(path):
+    """
+    Курсы из CSV с колонками date, currency, rate и необязательной nominal
+    (курс за nominal единиц). Разделитель - запятая или точка с запятой.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as source:
+        sample = source.read(4096)
+        source.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        for line, row in enumerate(csv.DictReader(source, dialect=dialect), start=2):
+            row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+            try:
+                nominal = _parse_decimal(row.get('nominal') or '1')
+                yield _parse_date(row['date']), row['currency'].lower(), _parse_decimal(row['rate']) / nominal
+            except (KeyError, ValueError, InvalidOperation, ZeroDivisionError) as exc:
+                raise CommandError(f'Строка {line}: {exc}')
+
+
+def read_cbr_xml_rates(path):
+    """
+    Курсы из XML ЦБ РФ: ежедневной выгрузки (ValCurs/Valute с CharCode)
+    или динамики курса одной валюты (ValCurs/Record).
+    """
+    try:
+        root = ElementTree.parse(path).getroot()
+    except ElementTree.ParseError as exc:
+        raise CommandError(f'Некорректный XML: {exc}')
+    daily_date = root.get('Date')
+    for element in root:
+        try:
+            if element.tag == 'Valute':
+                currency = (element.findtext('CharCode') or '').lower()
+                on_date = _parse_date(daily_date)
+            elif element.tag == 'Record':
+                currency = CBR_CURRENCY_IDS.get(element.get('Id') or root.get('ID'), '')
+                on_date = _parse_date(element.get('Date'))
+            else:
+                continue
+            rate = _parse_decimal(element.findtext('Value')) / _parse_decimal(element.findtext('Nominal') or '1')
+        except (TypeError, AttributeError, ValueError, InvalidOperation, ZeroDivisionError) as exc:
+            raise CommandError(f'Элемент {element.tag}: {exc}')
+        yield on_date, currency, rate
+
+
+class Command(BaseCommand):
+    """
+    Загружает историю курсов валют из локального файла в CurrencyRate.
+
+    Поддерживаются CSV (date, currency, rate[, nominal]) и XML ЦБ РФ
+    (XML_daily.asp и XML_dynamic.asp). Валюты, которые не используются в
+    финансовых операциях, пропускаются. Существующие курсы на ту же дату
+    обновляются, поэтому файл можно загружать повторно.
+    """
+    help = 'Импорт курсов валют из CSV или XML ЦБ РФ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы с курсами')
+        parser.add_argument('--format', choices=['csv', 'xml'], help='Формат файла (по умолчанию по расширению)')
+        parser.add_argument('--source', default='', help='Источник курсов (например, cbr)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пакета записи')
+
+    def handle(self, *args, **options):
+        rates = {}
+        skipped = 0
+        for path in options['paths']:
+            if not os.path.isfile(path):
+                raise CommandError(f'Файл не найден: {path}')
+            file_format = options['format'] or os.path.splitext(path)[1].lower().lstrip('.')
+            if file_format == 'csv':
+                rows = read_csv_rates(path)
+            elif file_format == 'xml':
+                rows = read_cbr_xml_rates(path)
+            else:
+                raise CommandError(f'Неизвестный формат файла: {path}')
+            for on_date, currency, rate in rows:
+                if currency not in SUPPORTED_CURRENCIES:
+                    skipped += 1
+                    continue
+                if rate <= 0:
+                    raise CommandError(f'Некорректный курс {currency} на {on_date}: {rate}')
+                # Повтор даты в файлах - действует последнее значение
+                rates[(currency, on_date)] = rate.quantize(Decimal('0.000001'))
+
+        objects = [
+            CurrencyRate(currency=currency, date=on_date, rate=rate, source=options['source'])
+            for (currency, on_date), rate in sorted(rates.items())
+        ]
+        with transaction.atomic():
+            CurrencyRate.objects.bulk_create(
+                objects,
+                batch_size=options['batch_size'],
+                update_conflicts=True,
+                unique_fields=['currency', 'date'],
+                update_fields=['rate', 'source'],
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Загружено курсов: {len(objects)}, пропущено строк: {skipped}'))
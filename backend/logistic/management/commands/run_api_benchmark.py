@@ -0,0 +1,94 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from logistic.benchmark import (
+    ROLES, compare_with_baseline, failed_results, load_results, run_benchmark, save_results,
+)
+from logistic.models import Company
+
+
+class Command(BaseCommand):
+    """
+    Замеряет время ответа, количество запросов, прочитанные строки и память
+    для маршрутов API от имени каждой роли.
+
+    Запускается на базе, заполненной командой seed_benchmark_data.
+    Запросы выполняются через тестовый клиент Django, без сетевого слоя.
+    Маршруты, ответившие не 2xx (кроме 401/403 для закрытых для роли
+    маршрутов), не замеряются, и команда завершается с кодом 1, если не
+    указан --allow-errors.
+    С --baseline результаты сравниваются с сохраненным замером; с
+    --fail-on-regression команда завершается с ошибкой при регрессиях
+    (для CI).
+    """
+    help = 'Нагрузочные замеры маршрутов API по ролям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, default=None, help='ID компании с данными')
+        parser.add_argument('--roles', default=','.join(ROLES), help='Роли через запятую')
+        parser.add_argument('--endpoints', default='', help='Фильтр по именам маршрутов через запятую')
+        parser.add_argument('--iterations', type=int, default=20, help='Количество замеров на маршрут')
+        parser.add_argument('--warmup', type=int, default=2, help='Количество прогревочных запросов')
+        parser.add_argument('--output', default='benchmark_results.json', help='Файл для результатов')
+        parser.add_argument('--baseline', default=None, help='Файл базового замера для сравнения')
+        parser.add_argument('--time-threshold', type=float, default=0.2,
+                            help='Допустимый относительный рост p90 (0.2 = 20%%)')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Завершиться с кодом 1 при регрессиях')
+        parser.add_argument('--allow-errors', action='store_true',
+                            help='Не завершаться с ошибкой при неуспешных ответах маршрутов')
+
+    def handle(self, *args, **options):
+        company = None
+        if options['company']:
+            company = Company.objects.filter(id=options['company']).first()
+            if company is None:
+                raise CommandError(f"Компания {options['company']} не найдена")
+
+        roles = [role.strip() for role in options['roles'].split(',') if role.strip()]
+        unknown = set(roles) - set(ROLES)
+        if unknown:
+            raise CommandError(f"Неизвестные роли: {', '.join(sorted(unknown))}")
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+
+        # Тестовое окружение: разрешенный хост testserver, почта в памяти
+        setup_test_environment()
+        try:
+            results = run_benchmark(
+                company=company,
+                roles=roles,
+                endpoints=endpoints,
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            teardown_test_environment()
+
+        save_results(results, options['output'])
+        self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {options['output']}"))
+
+        failed = failed_results(results)
+        if failed:
+            self.stdout.write(self.style.ERROR(f'Неуспешные ответы, время не замерено ({len(failed)}):'))
+            for item in failed:
+                self.stdout.write(f"  {item['endpoint']}:{item['role']} {item['path']}: {item['error']}")
+
+        regressions = []
+        if options['baseline']:
+            regressions = compare_with_baseline(
+                results, load_results(options['baseline']), time_threshold=options['time_threshold']
+            )
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Регрессии ({len(regressions)}):'))
+                for line in regressions:
+                    self.stdout.write(f'  {line}')
+
+        if failed and not options['allow_errors'] or regressions and options['fail_on_regression']:
+            sys.exit(1)
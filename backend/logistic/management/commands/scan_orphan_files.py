@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from logistic.cleanup import expected_file_paths, find_missing_files, find_orphan_files, sweep_pending_deletions
+from logistic.models import PendingFileDeletion
+
+
+class Command(BaseCommand):
+    """
+    Сверяет файлы в MEDIA_ROOT/logistic с записями RequestFile и ShipmentFile.
+
+    Выводит файлы, на которые не ссылается ни одна запись (сироты),
+    и записи, для которых нет файла на диске. С флагом --delete
+    файлы-сироты ставятся в журнал удаления и удаляются.
+    """
+    help = 'Поиск файлов без записей в базе и записей без файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help='Удалить найденные файлы-сироты')
+
+    def handle(self, *args, **options):
+        expected = expected_file_paths()
+        orphans = find_orphan_files(expected)
+        missing = find_missing_files(expected)
+
+        for path in orphans:
+            self.stdout.write(f'Сирота: {path}')
+        for path in missing:
+            self.stdout.write(f'Нет файла: {path}')
+
+        self.stdout.write(f'Файлов-сирот: {len(orphans)}, записей без файла: {len(missing)}')
+
+        if options['delete'] and orphans:
+            with transaction.atomic():
+                PendingFileDeletion.objects.bulk_create(
+                    [PendingFileDeletion(path=path) for path in orphans],
+                    batch_size=1000,
+                )
+            processed = sweep_pending_deletions()
+            self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {processed}'))
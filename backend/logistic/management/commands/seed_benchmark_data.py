@@ -0,0 +1,417 @@
+import hashlib
+import random
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from logistic.models import (
+    DEFAULT_REQUEST_STATUSES, DEFAULT_SHIPMENT_STATUSES,
+    Article, Company, FileBlob, Finance, Request, RequestFile, RequestStatus,
+    Shipment, ShipmentFile, ShipmentFolder, ShipmentStatus, UserProfile,
+)
+from logistic.storage import get_storage
+
+ROLES = ['admin', 'boss', 'manager', 'warehouse', 'client']
+
+ARTICLE_NAMES = ['Перевозка', 'Таможня', 'Склад', 'Страховка', 'Погрузка', 'Сертификация', 'Агентские']
+FOLDER_NAMES = ['Документы', 'Фото', 'Таможня', 'Счета', 'Накладные', 'Сертификаты']
+FILE_EXTENSIONS = ['pdf', 'jpg', 'png', 'xlsx', 'docx']
+CURRENCIES = ['rub', 'rubbn', 'rubnds', 'eur', 'usd']
+
+
+def parse_distribution(spec):
+    """
+    Разбирает описание распределения целого числа.
+
+    Форматы:
+    - '10' - всегда 10;
+    - '5-50' - равномерно от 5 до 50 включительно;
+    - 'exp:20' - экспоненциальное со средним 20 (длинный хвост).
+
+    Returns:
+        function: функция random.Random -> int
+    """
+    spec = str(spec).strip()
+    try:
+        if spec.startswith('exp:'):
+            mean = float(spec[4:])
+            return lambda rng: int(rng.expovariate(1 / mean)) if mean > 0 else 0
+        if '-' in spec:
+            low, high = (int(part) for part in spec.split('-', 1))
+            if low > high:
+                raise ValueError
+            return lambda rng: rng.randint(low, high)
+        value = int(spec)
+        return lambda rng: value
+    except ValueError:
+        raise CommandError(f'Некорректное распределение: {spec!r}')
+
+
+def parse_roles(spec):
+    """
+    Разбирает количество пользователей по ролям: 'manager=5,client=50'.
+    """
+    result = {}
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        role, _, value = part.partition('=')
+        role = role.strip()
+        if role not in ROLES:
+            raise CommandError(f'Неизвестная роль: {role!r}')
+        result[role] = parse_distribution(value)
+    return result
+
+
+def chunks(iterable, size):
+    """Разбивает поток объектов на списки размером size."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    """
+    Заполняет базу синтетическими данными для нагрузочного тестирования.
+
+    Создает компании со статусами и статьями, пользователей по ролям,
+    отправки с папками и файлами, заявки клиентов с файлами и финансовые
+    операции. Количество объектов задается распределениями, генерация
+    детерминирована (--seed). Данные вставляются через bulk_create пачками
+    и генерируются потоком, поэтому память не растет с объемом данных.
+
+    Все пользователи получают один пароль (--password), который хешируется
+    один раз. Содержимое файлов берется из небольшого набора блобов (--blobs),
+    на которые ссылаются все записи файлов.
+    """
+    help = 'Генерирует синтетические данные для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=1, help='Количество компаний')
+        parser.add_argument('--users', default='admin=1,boss=1,manager=5,warehouse=3,client=50',
+                            help='Пользователи на компанию по ролям: role=распределение,...')
+        parser.add_argument('--requests-per-client', default='exp:20', help='Заявок на клиента')
+        parser.add_argument('--requests-per-shipment', default='5-30', help='Заявок в отправке')
+        parser.add_argument('--unassigned-ratio', type=float, default=0.2,
+                            help='Доля заявок без отправки')
+        parser.add_argument('--finances-per-request', default='0-3', help='Финансовых операций на заявку')
+        parser.add_argument('--finances-per-shipment', default='1-5', help='Финансовых операций на отправку')
+        parser.add_argument('--files-per-request', default='0-3', help='Файлов на заявку')
+        parser.add_argument('--folders-per-shipment', default='0-3', help='Папок в отправке')
+        parser.add_argument('--files-per-shipment', default='exp:8', help='Файлов в отправке')
+        parser.add_argument('--blobs', type=int, default=200, help='Количество различных файлов (блобов)')
+        parser.add_argument('--blob-size', default='1000-200000', help='Размер блоба в байтах')
+        parser.add_argument('--no-blob-content', action='store_true',
+                            help='Не записывать содержимое блобов в хранилище')
+        parser.add_argument('--days', type=int, default=365, help='Период дат создания в днях')
+        parser.add_argument('--seed', type=int, default=42, help='Начальное значение генератора')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Размер пачки bulk_create')
+        parser.add_argument('--password', default='benchmark', help='Пароль всех пользователей')
+        parser.add_argument('--prefix', default='bench', help='Префикс имен пользователей')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+        self.stats = Counter()
+        self.blob_refs = Counter()
+
+        self.dist = {
+            name: parse_distribution(options[name])
+            for name in (
+                'requests_per_client', 'requests_per_shipment', 'finances_per_request',
+                'finances_per_shipment', 'files_per_request', 'folders_per_shipment',
+                'files_per_shipment', 'blob_size',
+            )
+        }
+        self.roles = parse_roles(options['users'])
+        if 'client' not in self.roles:
+            raise CommandError('Нужен хотя бы один клиент (--users client=N)')
+        self.unassigned_ratio = options['unassigned_ratio']
+        self.password_hash = make_password(options['password'])
+        self.prefix = options['prefix']
+
+        self.blobs = self._create_blobs(options['blobs'], write_content=not options['no_blob_content'])
+
+        companies = Company.objects.bulk_create([
+            Company(name=f'{self.prefix} {index + 1}', email=f'company{index + 1}@{self.prefix}.example')
+            for index in range(options['companies'])
+        ])
+        self._create_statuses(companies)
+        self.stats['companies'] = len(companies)
+
+        for company in companies:
+            self._seed_company(company)
+            self.stdout.write(f'Компания {company.name}: готово')
+
+        self._update_blob_refs()
+
+        summary = ', '.join(f'{name}: {count}' for name, count in sorted(self.stats.items()))
+        self.stdout.write(self.style.SUCCESS(f'Создано - {summary}'))
+
+    # Вспомогательные методы
+
+    def _random_date(self):
+        return self.now - timedelta(seconds=self.rng.randint(0, self.days * 86400))
+
+    def _bulk(self, model, objects):
+        created = model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.stats[model._meta.model_name] += len(created)
+        return created
+
+    def _pick_blob(self):
+        blob = self.rng.choice(self.blobs)
+        self.blob_refs[blob.id] += 1
+        return blob
+
+    def _file_name(self, index):
+        return f'document_{index}.{self.rng.choice(FILE_EXTENSIONS)}'
+
+    # Общие данные
+
+    def _create_blobs(self, count, write_content):
+        """
+        Создает набор блобов, на которые будут ссылаться записи файлов.
+        """
+        storage = get_storage()
+        contents = {}
+        for _ in range(count):
+            size = max(1, self.dist['blob_size'](self.rng))
+            content = self.rng.getrandbits(size * 8).to_bytes(size, 'little')
+            contents[hashlib.sha256(content).hexdigest()] = content
+
+        FileBlob.objects.bulk_create(
+            [
+                FileBlob(sha256=sha, size=len(content), preview_status=FileBlob.PREVIEW_UNSUPPORTED)
+                for sha, content in contents.items()
+            ],
+            ignore_conflicts=True,
+        )
+        blobs = list(FileBlob.objects.filter(sha256__in=contents).order_by('sha256'))
+        if write_content:
+            for blob in blobs:
+                name = blob.get_storage_name()
+                if not storage.exists(name):
+                    storage.save(name, [contents[blob.sha256]])
+        return blobs
+
+    def _update_blob_refs(self):
+        blobs = [blob for blob in self.blobs if self.blob_refs[blob.id]]
+        for blob in blobs:
+            blob.ref_count += self.blob_refs[blob.id]
+        FileBlob.objects.bulk_update(blobs, ['ref_count'], batch_size=self.batch_size)
+
+    def _create_statuses(self, companies):
+        RequestStatus.objects.bulk_create([
+            RequestStatus(company=company, **status_data)
+            for company in companies for status_data in DEFAULT_REQUEST_STATUSES
+        ])
+        ShipmentStatus.objects.bulk_create([
+            ShipmentStatus(company=company, **status_data)
+            for company in companies for status_data in DEFAULT_SHIPMENT_STATUSES
+        ])
+
+    # Данные компании
+
+    def _seed_company(self, company):
+        request_statuses = list(RequestStatus.objects.filter(company=company))
+        shipment_statuses = list(ShipmentStatus.objects.filter(company=company))
+        articles = self._bulk(Article, [Article(company=company, name=name) for name in ARTICLE_NAMES])
+        profiles = self._create_users(company)
+
+        self.ctx = {
+            'company': company,
+            'request_statuses': request_statuses,
+            'shipment_statuses': shipment_statuses,
+            'articles': articles,
+            'managers': profiles.get('manager') or profiles.get('boss') or profiles.get('admin') or [None],
+            'staff': [p for role in ('manager', 'warehouse', 'boss') for p in profiles.get(role, [])] or [None],
+        }
+
+        clients = profiles['client']
+        requests_per_client = [self.dist['requests_per_client'](self.rng) for _ in clients]
+        assigned_total = int(sum(requests_per_client) * (1 - self.unassigned_ratio))
+
+        shipment_slots = self._create_shipments(assigned_total)
+        self._create_requests(clients, requests_per_client, shipment_slots)
+
+    def _create_users(self, company):
+        """
+        Создает пользователей и профили компании.
+        Пароль хешируется один раз и используется для всех пользователей.
+        """
+        plan = [(role, self.roles[role](self.rng)) for role in ROLES if role in self.roles]
+        users = []
+        for role, count in plan:
+            for index in range(count):
+                username = f'{self.prefix}{company.id}_{role}_{index + 1}'
+                users.append(User(
+                    username=username,
+                    email=f'{username}@{self.prefix}.example',
+                    password=self.password_hash,
+                    first_name=role.title(),
+                ))
+        users = self._bulk(User, users)
+
+        profiles = []
+        user_iter = iter(users)
+        for role, count in plan:
+            for index in range(count):
+                profiles.append(UserProfile(
+                    user=next(user_iter),
+                    company=company,
+                    user_group=role,
+                    name=f'{role.title()} {index + 1}',
+                ))
+        result = {}
+        for profile in self._bulk(UserProfile, profiles):
+            result.setdefault(profile.user_group, []).append(profile)
+        # Клиент гарантированно есть, даже если распределение дало ноль
+        if 'client' not in result:
+            user = self._bulk(User, [User(
+                username=f'{self.prefix}{company.id}_client_1', password=self.password_hash,
+            )])[0]
+            result['client'] = self._bulk(UserProfile, [UserProfile(
+                user=user, company=company, user_group='client', name='Client 1',
+            )])
+        return result
+
+    def _shipment_rows(self, assigned_total):
+        """
+        Генерирует отправки, пока их емкость не покроет assigned_total заявок.
+        """
+        company = self.ctx['company']
+        number = 0
+        remaining = assigned_total
+        while remaining > 0:
+            number += 1
+            capacity = max(1, self.dist['requests_per_shipment'](self.rng))
+            remaining -= capacity
+            shipment = Shipment(
+                number=f'{self.prefix.upper()}-{company.id}-{number}',
+                company=company,
+                status=self.rng.choice(self.ctx['shipment_statuses']),
+                created_at=self._random_date(),
+                created_by=self.rng.choice(self.ctx['managers']),
+            )
+            shipment.capacity = capacity
+            yield shipment
+
+    def _create_shipments(self, assigned_total):
+        """
+        Создает отправки с папками, файлами и финансовыми операциями.
+
+        Returns:
+            list: id отправок, повторенные по количеству мест для заявок
+        """
+        slots = []
+        for chunk in chunks(self._shipment_rows(assigned_total), self.batch_size):
+            shipments = self._bulk(Shipment, chunk)
+
+            folders = []
+            for shipment in shipments:
+                slots.extend([shipment.id] * shipment.capacity)
+                names = self.rng.sample(FOLDER_NAMES, min(len(FOLDER_NAMES), self.dist['folders_per_shipment'](self.rng)))
+                folders.extend(
+                    ShipmentFolder(shipment=shipment, name=name, created_by=self.rng.choice(self.ctx['staff']))
+                    for name in names
+                )
+            folders_by_shipment = {}
+            for folder in self._bulk(ShipmentFolder, folders):
+                folders_by_shipment.setdefault(folder.shipment_id, []).append(folder)
+
+            self._bulk(ShipmentFile, (
+                ShipmentFile(
+                    shipment=shipment,
+                    folder=self.rng.choice([None] + folders_by_shipment.get(shipment.id, [])),
+                    file=self._file_name(index),
+                    blob=self._pick_blob(),
+                    uploaded_by=self.rng.choice(self.ctx['staff']),
+                )
+                for shipment in shipments
+                for index in range(self.dist['files_per_shipment'](self.rng))
+            ) if self.blobs else [])
+
+            self._bulk(Finance, [
+                self._finance(shipment=shipment)
+                for shipment in shipments
+                for _ in range(self.dist['finances_per_shipment'](self.rng))
+            ])
+
+        self.rng.shuffle(slots)
+        return slots
+
+    def _request_rows(self, clients, requests_per_client, shipment_slots):
+        company = self.ctx['company']
+        slots = iter(shipment_slots)
+        number = 0
+        for client, count in zip(clients, requests_per_client):
+            for _ in range(count):
+                number += 1
+                weight = round(self.rng.uniform(10, 5000), 1)
+                volume = round(weight / self.rng.uniform(150, 400), 2)
+                yield Request(
+                    number=number,
+                    company=company,
+                    description=f'Груз {number}',
+                    warehouse_number=f'W{company.id}-{number}',
+                    col_mest=self.rng.randint(1, 40),
+                    declared_weight=weight,
+                    declared_volume=volume,
+                    actual_weight=round(weight * self.rng.uniform(0.95, 1.05), 1),
+                    actual_volume=round(volume * self.rng.uniform(0.95, 1.05), 2),
+                    rate=f'{self.rng.randint(2, 12)} $/кг',
+                    status=self.rng.choice(self.ctx['request_statuses']),
+                    client=client,
+                    manager=self.rng.choice(self.ctx['managers']),
+                    shipment_id=next(slots, None),
+                    created_at=self._random_date(),
+                )
+
+    def _create_requests(self, clients, requests_per_client, shipment_slots):
+        """
+        Создает заявки клиентов с файлами и финансовыми операциями.
+        """
+        rows = self._request_rows(clients, requests_per_client, shipment_slots)
+        for chunk in chunks(rows, self.batch_size):
+            requests = self._bulk(Request, chunk)
+
+            self._bulk(RequestFile, (
+                RequestFile(
+                    request=request,
+                    file=self._file_name(index),
+                    blob=self._pick_blob(),
+                    uploaded_by=request.client,
+                )
+                for request in requests
+                for index in range(self.dist['files_per_request'](self.rng))
+            ) if self.blobs else [])
+
+            self._bulk(Finance, [
+                self._finance(request=request, counterparty=request.client.user)
+                for request in requests
+                for _ in range(self.dist['finances_per_request'](self.rng))
+            ])
+
+    def _finance(self, shipment=None, request=None, counterparty=None):
+        return Finance(
+            company=self.ctx['company'],
+            operation_type=self.rng.choice(['in', 'out']),
+            payment_date=self._random_date().date(),
+            document_type=self.rng.choice(['bill', 'payment']),
+            currency=self.rng.choice(CURRENCIES),
+            counterparty=counterparty,
+            article=self.rng.choice(self.ctx['articles']),
+            amount=Decimal(self.rng.randint(1000, 50000000)) / 100,
+            shipment_id=shipment.id if shipment else request.shipment_id,
+            request=request,
+            is_paid=self.rng.random() < 0.6,
+            created_by=self.rng.choice(self.ctx['managers']),
+        )
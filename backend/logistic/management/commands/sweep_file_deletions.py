@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from logistic.cleanup import sweep_pending_deletions
+
+
+class Command(BaseCommand):
+    """
+    Обрабатывает журнал отложенного удаления файлов.
+
+    Обычно журнал обрабатывается автоматически после фиксации транзакции.
+    Команда нужна для периодического запуска (cron), чтобы дочистить записи,
+    оставшиеся после перезапуска процесса или временных ошибок.
+    """
+    help = 'Удаляет файлы из журнала отложенного удаления'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Размер пачки')
+        parser.add_argument('--max-attempts', type=int, default=None, help='Максимальное количество попыток')
+
+    def handle(self, *args, **options):
+        processed = sweep_pending_deletions(
+            batch_size=options['batch_size'],
+            max_attempts=options['max_attempts'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Удалено путей: {processed}'))
@@ -0,0 +1,137 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from logistic.models import Article, Finance, ImportJob, Request, RequestStatus, Shipment, ShipmentStatus, UserProfile
+
+
+# Фильтры представлений до перехода на менеджеры for_user.
+# Используются только для сверки результатов на реальных данных.
+
+def legacy_requests(user):
+    if user.is_superuser:
+        return Request.objects.all()
+    user_profile = user.userprofile
+    if user_profile.user_group in ('admin', 'boss', 'warehouse'):
+        return Request.objects.filter(client__company=user_profile.company)
+    if user_profile.user_group == 'manager':
+        return Request.objects.filter(
+            Q(client__company=user_profile.company) & (Q(manager=user_profile) | Q(manager__isnull=True))
+        )
+    return Request.objects.filter(client=user_profile)
+
+
+def legacy_shipments(user):
+    user_profile = user.userprofile
+    if user_profile.user_group in ('superuser', 'admin', 'boss', 'manager', 'warehouse'):
+        return Shipment.objects.filter(company=user_profile.company)
+    if user_profile.user_group == 'client':
+        return Shipment.objects.filter(company=user_profile.company, request__client=user_profile).distinct()
+    return Shipment.objects.none()
+
+
+def legacy_finances(user):
+    user_profile = user.userprofile
+    if not user_profile.company:
+        return Finance.objects.none()
+    if user_profile.user_group == 'client':
+        client_requests = Request.objects.filter(client=user_profile)
+        return Finance.objects.filter(company=user_profile.company).filter(request__in=client_requests).distinct()
+    return Finance.objects.filter(company=user_profile.company)
+
+
+def legacy_profiles(user):
+    if user.is_superuser or user.userprofile.user_group == 'superuser':
+        return UserProfile.objects.all()
+    if user.userprofile.company:
+        return UserProfile.objects.filter(company=user.userprofile.company)
+    return UserProfile.objects.none()
+
+
+def legacy_company_objects(model):
+    def queryset(user):
+        if user.userprofile.company:
+            return model.objects.filter(company=user.userprofile.company)
+        return model.objects.none()
+    return queryset
+
+
+CHECKS = [
+    ('Request', Request, legacy_requests),
+    ('Shipment', Shipment, legacy_shipments),
+    ('Finance', Finance, legacy_finances),
+    ('UserProfile', UserProfile, legacy_profiles),
+    ('Article', Article, legacy_company_objects(Article)),
+    ('ShipmentStatus', ShipmentStatus, legacy_company_objects(ShipmentStatus)),
+    ('RequestStatus', RequestStatus, legacy_company_objects(RequestStatus)),
+    ('ImportJob', ImportJob, legacy_company_objects(ImportJob)),
+]
+
+
+class Command(BaseCommand):
+    """
+    Сверяет выборки менеджеров for_user с прежними фильтрами представлений.
+
+    Для каждого пользователя с профилем (по одному на роль и компанию или
+    всех с --all-users) и каждой модели проверяет, что обе выборки содержат
+    одинаковые строки; разница считается в базе через EXISTS. Дополнительно
+    выводит заявки, у которых компания не совпадает с компанией клиента:
+    для них фильтр по Request.company расходится с прежним client__company.
+    С --explain печатает план запроса списка заявок для каждой роли.
+    """
+    help = 'Сверка фильтров for_user с прежними фильтрами представлений по ролям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Проверять только пользователей компании')
+        parser.add_argument('--all-users', action='store_true', help='Проверять всех пользователей, а не по одному на роль')
+        parser.add_argument('--explain', action='store_true', help='Показать планы запросов списка заявок')
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.select_related('user', 'company').order_by('company_id', 'user_group', 'pk')
+        if options['company']:
+            profiles = profiles.filter(company_id=options['company'])
+        if not options['all_users']:
+            # Один пользователь на пару (компания, роль)
+            seen = set()
+            sample = []
+            for profile in profiles:
+                key = (profile.company_id, profile.user_group)
+                if key not in seen:
+                    seen.add(key)
+                    sample.append(profile)
+            profiles = sample
+
+        mismatches = 0
+        checked = 0
+        for profile in profiles:
+            user = profile.user
+            user.userprofile = profile
+            for name, model, legacy in CHECKS:
+                current = model.objects.for_user(user)
+                previous = legacy(user)
+                missing = previous.exclude(pk__in=current.values('pk')).count()
+                extra = current.exclude(pk__in=previous.values('pk')).count()
+                checked += 1
+                if missing or extra:
+                    mismatches += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'{name}: {user.username} ({profile.user_group}, компания {profile.company_id}) - '
+                        f'пропало строк: {missing}, добавилось строк: {extra}'
+                    ))
+            if options['explain']:
+                self.stdout.write(f'План для {user.username} ({profile.user_group}):')
+                self.stdout.write(Request.objects.for_user(user).order_by('-created_at')[:20].explain())
+
+        foreign = Request.objects.exclude(company_id=F('client__company_id')) | Request.objects.filter(
+            client__company__isnull=True
+        )
+        foreign_count = foreign.count()
+        if foreign_count:
+            self.stdout.write(self.style.WARNING(
+                f'Заявок с компанией, отличной от компании клиента: {foreign_count} '
+                f'(например, {", ".join(str(pk) for pk in foreign.values_list("pk", flat=True)[:10])})'
+            ))
+
+        self.stdout.write(f'Проверено выборок: {checked}, расхождений: {mismatches}')
+        if mismatches:
+            raise CommandError('Выборки for_user расходятся с прежними фильтрами')
+        self.stdout.write(self.style.SUCCESS('Выборки совпадают'))
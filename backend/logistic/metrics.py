@@ -0,0 +1,343 @@
+"""
+Метрики приложения в текстовом формате Prometheus.
+
+Счетчики и гистограммы хранятся в памяти процесса, увеличение значения -
+это словарная операция под общей блокировкой. Когда задан
+METRICS_MULTIPROC_DIR (несколько воркеров gunicorn), каждый процесс не чаще
+раза в METRICS_FLUSH_INTERVAL секунд сохраняет снимок своих значений в файл
+'<pid>.json' этой директории, а при чтении /api/metrics/ снимки всех
+процессов суммируются. Директорию нужно очищать при запуске сервера.
+
+Пока метрики никто не читает, накладные расходы ограничены обновлением
+словарей и редкой записью снимка.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+_lock = threading.Lock()
+_registry = {}
+_last_flush = 0.0
+
+# Границы гистограмм по умолчанию
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2, 1024 ** 3)
+
+
+class Metric:
+    """
+    Базовый класс метрики с набором меток.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labelnames)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        return [[list(key), value] for key, value in self.values.items()]
+
+    @staticmethod
+    def merge(target, samples):
+        for key, value in samples:
+            key = tuple(key)
+            target[key] = target.get(key, 0) + value
+
+    def exposition(self, values):
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                # Счетчики по корзинам (последняя - +Inf), сумма, количество
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self):
+        return [[list(key), list(counts), total, count] for key, (counts, total, count) in self.values.items()]
+
+    @staticmethod
+    def merge(target, samples):
+        for key, counts, total, count in samples:
+            key = tuple(key)
+            state = target.get(key)
+            if state is None:
+                target[key] = [list(counts), total, count]
+                continue
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += total
+            state[2] += count
+
+    def exposition(self, values):
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+# Метрики приложения
+
+HTTP_REQUESTS = Counter(
+    'logistic_http_requests_total', 'Количество HTTP-запросов',
+    ['route', 'action', 'method', 'status', 'role'],
+)
+HTTP_DURATION = Histogram(
+    'logistic_http_request_duration_seconds', 'Время обработки HTTP-запроса',
+    ['route', 'action', 'method'], buckets=DURATION_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'logistic_http_request_db_queries', 'Количество SQL-запросов на HTTP-запрос',
+    ['route', 'action'], buckets=QUERY_COUNT_BUCKETS,
+)
+UPLOADED_BYTES = Counter(
+    'logistic_attachment_uploaded_bytes_total', 'Объем загруженных файлов', ['kind'],
+)
+UPLOADED_FILES = Counter(
+    'logistic_attachment_uploaded_files_total', 'Количество загруженных файлов', ['kind'],
+)
+DOWNLOADED_BYTES = Counter(
+    'logistic_attachment_downloaded_bytes_total', 'Объем отданных файлов', ['kind'],
+)
+ZIP_SIZE = Histogram(
+    'logistic_zip_archive_bytes', 'Размер собранных ZIP-архивов', ['kind'], buckets=SIZE_BUCKETS,
+)
+EMAILS = Counter(
+    'logistic_email_send_total', 'Результаты отправки email', ['outcome'],
+)
+COMPRESSED_RESPONSES = Counter(
+    'logistic_http_compressed_responses_total', 'Сжатые ответы по кодировке и источнику (сжатие, кеш, поток)',
+    ['encoding', 'source'],
+)
+COMPRESSION_BYTES = Counter(
+    'logistic_http_compression_bytes_total', 'Объем ответов до и после сжатия', ['encoding', 'stage'],
+)
+BUNDLE_CACHE = Counter(
+    'logistic_zip_bundle_cache_total', 'Обращения к кешу ZIP-архивов (hit - готовый архив, miss - сборка)', ['result'],
+)
+BUNDLE_FILES = Counter(
+    'logistic_zip_bundle_files_total', 'Файлы в собранных ZIP-архивах по способу хранения', ['method'],
+)
+
+
+def _multiproc_dir():
+    return getattr(settings, 'METRICS_MULTIPROC_DIR', '') or ''
+
+
+def flush(force=False):
+    """
+    Сохраняет снимок метрик процесса в METRICS_MULTIPROC_DIR.
+    Без force запись выполняется не чаще раза в METRICS_FLUSH_INTERVAL секунд.
+    """
+    global _last_flush
+    directory = _multiproc_dir()
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+        return
+    _last_flush = now
+
+    with _lock:
+        data = {name: metric.snapshot() for name, metric in _registry.items() if metric.values}
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as destination:
+        json.dump(data, destination)
+    os.replace(tmp_path, os.path.join(directory, f'{os.getpid()}.json'))
+
+
+atexit.register(lambda: flush(force=True))
+
+
+def _collect():
+    """
+    Возвращает значения всех метрик: из памяти процесса или, в
+    многопроцессном режиме, суммой снимков всех процессов.
+    """
+    directory = _multiproc_dir()
+    if not directory:
+        with _lock:
+            return {
+                name: {key: (value if metric.type == 'counter' else [list(value[0]), value[1], value[2]])
+                       for key, value in metric.values.items()}
+                for name, metric in _registry.items()
+            }
+
+    flush(force=True)
+    merged = {name: {} for name in _registry}
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as source:
+                data = json.load(source)
+        except (OSError, ValueError):
+            continue
+        for name, samples in data.items():
+            metric = _registry.get(name)
+            if metric is not None:
+                metric.merge(merged[name], samples)
+    return merged
+
+
+def render_exposition():
+    """Текст метрик в формате Prometheus."""
+    values = _collect()
+    lines = []
+    for name, metric in _registry.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        lines.extend(metric.exposition(values.get(name, {})))
+    return '\n'.join(lines) + '\n'
+
+
+def _request_labels(request, response):
+    """
+    Метки запроса: имя маршрута, действие ViewSet и роль пользователя.
+    Для JWT пользователь известен только запросу DRF, который доступен из ответа.
+    """
+    match = getattr(request, 'resolver_match', None)
+    route = match.view_name if match else 'unmatched'
+    renderer_context = getattr(response, 'renderer_context', None) or {}
+    view = renderer_context.get('view')
+    action = getattr(view, 'action', None) or request.method.lower()
+    user = getattr(renderer_context.get('request'), 'user', None) or getattr(request, 'user', None)
+    role = 'anonymous'
+    if user is not None and user.is_authenticated:
+        profile = getattr(user, 'userprofile', None)
+        role = 'superuser' if user.is_superuser else getattr(profile, 'user_group', None) or 'unknown'
+    return route, action, role
+
+
+class MetricsMiddleware:
+    """
+    Считает запросы, время ответа и количество SQL-запросов.
+    Поддерживает синхронный (WSGI) и асинхронный (ASGI) режимы.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        queries = [0]
+        started = time.perf_counter()
+        with _counting_queries(queries):
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        queries = [0]
+        started = time.perf_counter()
+        with _counting_queries(queries):
+            response = await self.get_response(request)
+        # Роль пользователя может потребовать запроса к базе
+        await sync_to_async(self._record)(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    def _record(self, request, response, duration, queries):
+        route, action, role = _request_labels(request, response)
+        HTTP_REQUESTS.inc(route=route, action=action, method=request.method, status=response.status_code, role=role)
+        HTTP_DURATION.observe(duration, route=route, action=action, method=request.method)
+        DB_QUERIES.observe(queries, route=route, action=action)
+        flush()
+
+
+def _counting_queries(queries):
+    """Считает запросы ко всем базам (основной и реплике)."""
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(_query_counter(queries)))
+    return stack
+
+
+def _query_counter(queries):
+    def count_query(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+    return count_query
+
+
+def record_upload(kind, files):
+    """Учитывает загруженные файлы (kind - 'shipment' или 'request')."""
+    UPLOADED_FILES.inc(len(files), kind=kind)
+    UPLOADED_BYTES.inc(sum(file.size or 0 for file in files), kind=kind)
+
+
+def record_download(kind, response):
+    """Учитывает отданный файл по заголовку Content-Length ответа."""
+    DOWNLOADED_BYTES.inc(int(response.get('Content-Length') or 0), kind=kind)
+
+
+def record_zip(kind, response):
+    """Учитывает размер собранного ZIP-архива."""
+    ZIP_SIZE.observe(int(response.get('Content-Length') or 0), kind=kind)
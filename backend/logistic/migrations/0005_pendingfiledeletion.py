@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-19 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistic', '0004_request_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingFileDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024, verbose_name='Путь относительно MEDIA_ROOT')),
+                ('is_directory', models.BooleanField(default=False, verbose_name='Директория')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Количество попыток')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Удаление файла',
+                'verbose_name_plural': 'Очередь удаления файлов',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistic', '0006_fileblob_requestfile_blob_shipmentfile_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pendingfiledeletion',
+            name='path',
+            field=models.CharField(max_length=1024, verbose_name='Имя в хранилище'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 02:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistic', '0007_alter_pendingfiledeletion_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileblob',
+            name='preview_status',
+            field=models.CharField(choices=[('pending', 'Ожидает генерации'), ('ready', 'Готово'), ('unsupported', 'Формат не поддерживается'), ('failed', 'Ошибка генерации')], default='pending', max_length=20, verbose_name='Статус превью'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.6 on 2026-10-19 02:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistic', '0008_fileblob_preview_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('requests', 'Заявки'), ('finances', 'Финансовые операции')], max_length=20, verbose_name='Тип данных')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('running', 'Выполняется'), ('completed', 'Завершено'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('dry_run', models.BooleanField(default=False, verbose_name='Пробный запуск')),
+                ('file_name', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('storage_name', models.CharField(blank=True, max_length=1024, verbose_name='Имя в хранилище')),
+                ('total_rows', models.PositiveIntegerField(blank=True, null=True, verbose_name='Всего строк')),
+                ('processed_rows', models.PositiveIntegerField(default=0, verbose_name='Обработано строк')),
+                ('imported_rows', models.PositiveIntegerField(default=0, verbose_name='Импортировано строк')),
+                ('error_rows', models.PositiveIntegerField(default=0, verbose_name='Строк с ошибками')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Ошибки')),
+                ('message', models.TextField(blank=True, null=True, verbose_name='Сообщение')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='logistic.company', verbose_name='Компания')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='import_jobs', to='logistic.userprofile', verbose_name='Создал')),
+            ],
+            options={
+                'verbose_name': 'Задание импорта',
+                'verbose_name_plural': 'Задания импорта',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-19 02:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistic', '0009_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('currency', models.CharField(choices=[('eur', 'Евро'), ('usd', 'Доллар')], max_length=10, verbose_name='Валюта')),
+                ('rate', models.DecimalField(decimal_places=6, max_digits=14, verbose_name='Курс (рублей за единицу)')),
+                ('source', models.CharField(blank=True, default='', max_length=50, verbose_name='Источник')),
+            ],
+            options={
+                'verbose_name': 'Курс валюты',
+                'verbose_name_plural': 'Курсы валют',
+                'ordering': ['currency', '-date'],
+                'constraints': [models.UniqueConstraint(fields=('currency', 'date'), name='currency_rate_unique_date')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistic', '0011_tenant_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileblob',
+            name='rendition_size',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Размер веб-версии'),
+        ),
+    ]
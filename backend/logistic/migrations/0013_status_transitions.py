@@ -0,0 +1,45 @@
+# Generated by Django 5.1.6 on 2026-10-19 03:13
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistic', '0012_fileblob_rendition_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='status_changed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата смены статуса'),
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='status_changed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата смены статуса'),
+        ),
+        migrations.CreateModel(
+            name='StatusTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(choices=[('shipment', 'Отправка'), ('request', 'Заявка')], max_length=20, verbose_name='Тип объекта')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID объекта')),
+                ('from_status', models.CharField(blank=True, max_length=50, verbose_name='Предыдущий статус')),
+                ('to_status', models.CharField(max_length=50, verbose_name='Новый статус')),
+                ('at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата перехода')),
+                ('duration_seconds', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Время в предыдущем статусе (с)')),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='logistic.userprofile', verbose_name='Изменил')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='logistic.company', verbose_name='Компания')),
+            ],
+            options={
+                'verbose_name': 'Смена статуса',
+                'verbose_name_plural': 'Журнал смены статусов',
+                'ordering': ['at', 'id'],
+                'indexes': [models.Index(fields=['company', 'entity', 'to_status', 'at'], name='transition_to_status_idx'), models.Index(fields=['company', 'entity', 'from_status', 'at'], name='transition_from_status_idx'), models.Index(fields=['entity', 'object_id', 'at'], name='transition_object_idx')],
+            },
+        ),
+    ]
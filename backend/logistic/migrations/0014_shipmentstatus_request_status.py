@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-19 03:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistic', '0013_status_transitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipmentstatus',
+            name='request_status',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='logistic.requeststatus', verbose_name='Статус заявок при переходе'),
+        ),
+    ]
@@ -1,13 +1,105 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 import os
 from django.utils import timezone
-from django.conf import settings
-import shutil
 from django.core.exceptions import ValidationError
-import io
-import zipfile
-from django.http import FileResponse
+
+def rendition_filename(filename):
+    """
+    Имя файла веб-версии изображения: исходное имя с расширением .jpg.
+    """
+    return f'{os.path.splitext(filename)[0]}.jpg'
+
+def _user_profile(user):
+    """
+    Профиль пользователя или None (анонимный пользователь, пользователь без профиля).
+    """
+    if user is None or not user.is_authenticated:
+        return None
+    return getattr(user, 'userprofile', None)
+
+class CompanyQuerySet(models.QuerySet):
+    """
+    Выборка объектов, принадлежащих компании.
+    Фильтры по компании строятся по локальному полю company_id, чтобы
+    запрос обслуживался составными индексами (company, ...) без соединений.
+    """
+
+    def for_company(self, company_id):
+        if company_id is None:
+            return self.none()
+        return self.filter(company_id=company_id)
+
+    def for_user(self, user):
+        """Объекты компании пользователя."""
+        profile = _user_profile(user)
+        if profile is None:
+            return self.none()
+        return self.for_company(profile.company_id)
+
+class UserProfileQuerySet(CompanyQuerySet):
+
+    def for_user(self, user):
+        """
+        Суперпользователи видят все профили, остальные - профили своей компании.
+        """
+        profile = _user_profile(user)
+        if user is not None and user.is_superuser or profile is not None and profile.user_group == 'superuser':
+            return self.all()
+        if profile is None:
+            return self.none()
+        return self.for_company(profile.company_id)
+
+class ShipmentQuerySet(CompanyQuerySet):
+
+    def for_user(self, user):
+        """
+        Сотрудники видят все отправки компании, клиенты - отправки со своими заявками.
+        """
+        profile = _user_profile(user)
+        if profile is None:
+            return self.none()
+        if profile.user_group in ('superuser', 'admin', 'boss', 'manager', 'warehouse'):
+            return self.for_company(profile.company_id)
+        if profile.user_group == 'client':
+            # EXISTS вместо соединения с заявками: не нужен DISTINCT
+            client_requests = Request.objects.filter(shipment_id=models.OuterRef('pk'), client_id=profile.pk)
+            return self.for_company(profile.company_id).filter(models.Exists(client_requests))
+        return self.none()
+
+class RequestQuerySet(CompanyQuerySet):
+
+    def for_user(self, user):
+        """
+        Суперпользователи видят все заявки; администраторы, руководители и
+        склад - заявки компании; менеджеры - свои и не назначенные заявки
+        компании; остальные - заявки, в которых они клиент.
+        """
+        if user is not None and user.is_superuser:
+            return self.all()
+        profile = _user_profile(user)
+        if profile is None:
+            return self.none()
+        if profile.user_group in ('admin', 'boss', 'warehouse'):
+            return self.for_company(profile.company_id)
+        if profile.user_group == 'manager':
+            return self.for_company(profile.company_id).filter(
+                models.Q(manager_id=profile.pk) | models.Q(manager__isnull=True)
+            )
+        return self.filter(client_id=profile.pk)
+
+class FinanceQuerySet(CompanyQuerySet):
+
+    def for_user(self, user):
+        """
+        Сотрудники видят все операции компании, клиенты - операции по своим заявкам.
+        """
+        profile = _user_profile(user)
+        if profile is None or profile.company_id is None:
+            return self.none()
+        if profile.user_group == 'client':
+            return self.for_company(profile.company_id).filter(request__client_id=profile.pk)
+        return self.for_company(profile.company_id)
 
 # Модель логистической компании
 class Company(models.Model):
@@ -52,17 +144,47 @@ class UserProfile(models.Model):
     user_group = models.CharField(max_length=50, choices=USER_GROUP_CHOICES, verbose_name='Группа пользователя')
     is_active = models.BooleanField(default=True, verbose_name='Активен')
     
+    objects = UserProfileQuerySet.as_manager()
+    
     def __str__(self):
         return f"{self.name or self.user.username} ({self.get_user_group_display()})"
     
     class Meta:
         verbose_name = 'Профиль пользователя'
         verbose_name_plural = 'Профили пользователей'
+        indexes = [
+            models.Index(fields=['company', 'user_group'], name='profile_company_group_idx'),
+        ]
         permissions = [
             ("view_own_company_data", "Может просматривать данные своей компании"),
             ("edit_own_company_data", "Может редактировать данные своей компании"),
         ]
 
+# Стандартные статусы, создаваемые для новой компании
+DEFAULT_REQUEST_STATUSES = [
+    {'code': 'new', 'name': 'Новая заявка', 'is_default': True, 'is_final': False, 'order': 1},
+    {'code': 'expected', 'name': 'Ожидается на складе', 'is_default': False, 'is_final': False, 'order': 2},
+    {'code': 'on_warehouse', 'name': 'Формируется', 'is_default': False, 'is_final': False, 'order': 3},
+    {'code': 'in_progress', 'name': 'В работе', 'is_default': False, 'is_final': False, 'order': 4},
+    {'code': 'ready', 'name': 'Готово к выдаче', 'is_default': False, 'is_final': False, 'order': 5},
+    {'code': 'delivered', 'name': 'Доставлено', 'is_default': False, 'is_final': True, 'order': 6}
+]
+
+DEFAULT_SHIPMENT_STATUSES = [
+    {'code': 'at_warehouse', 'name': 'На складе', 'is_default': True, 'is_final': False, 'order': 1},
+    {'code': 'document_preparation', 'name': 'Подготовка документов', 'is_default': False, 'is_final': False, 'order': 2},
+    {'code': 'departed', 'name': 'Отправлен', 'is_default': False, 'is_final': False, 'order': 3},
+    {'code': 'in_transit', 'name': 'В пути', 'is_default': False, 'is_final': False, 'order': 4},
+    {'code': 'delivered', 'name': 'Доставлен', 'is_default': False, 'is_final': True, 'order': 5},
+    {'code': 'cancelled', 'name': 'Отменен', 'is_default': False, 'is_final': True, 'order': 6}
+]
+
+# Каскадные переходы по умолчанию: код статуса отправки -> код статуса ее заявок
+DEFAULT_STATUS_CASCADES = {
+    'departed': 'in_progress',
+    'delivered': 'ready',
+}
+
 class ShipmentStatus(models.Model):
     """Модель статуса отправки"""
     company = models.ForeignKey(Company, on_delete=models.CASCADE, verbose_name='Компания')
@@ -71,9 +193,19 @@ class ShipmentStatus(models.Model):
     is_default = models.BooleanField(default=False, verbose_name='Статус по умолчанию')
     is_final = models.BooleanField(default=False, verbose_name='Финальный статус')
     order = models.PositiveIntegerField(default=0, verbose_name='Порядок')
+    # Каскадный переход: при переводе отправки в этот статус ее заявки переводятся
+    # в request_status (status_history.cascade_shipment_status)
+    request_status = models.ForeignKey(
+        'RequestStatus', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        verbose_name='Статус заявок при переходе'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = CompanyQuerySet.as_manager()
+    
     def clean(self):
+        if self.request_status_id and self.request_status.company_id != self.company_id:
+            raise ValidationError('Статус заявок должен принадлежать компании')
         if self.is_default and ShipmentStatus.objects.filter(
             company=self.company, is_default=True
         ).exclude(pk=self.pk).exists():
@@ -98,65 +230,64 @@ class Shipment(models.Model):
     number = models.CharField(max_length=50, verbose_name='Номер')
     company = models.ForeignKey(Company, on_delete=models.CASCADE, verbose_name='Компания')
     status = models.ForeignKey(ShipmentStatus, on_delete=models.PROTECT, verbose_name='Статус')
+    # Время последней смены статуса (status_history.py); None - до появления журнала переходов
+    status_changed_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата смены статуса')
     comment = models.TextField(blank=True, null=True, verbose_name='Комментарий')
     created_at = models.DateTimeField(default=timezone.now, verbose_name='Дата создания')
     created_by = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True, related_name='created_shipments', verbose_name='Создал')
     
+    objects = ShipmentQuerySet.as_manager()
+    
     def get_status_display(self):
         return self.status.name if self.status else None
 
     def __str__(self):
         return f"Отправка #{self.number} - {self.get_status_display()}"
     
-    def get_files_zip(self):
+    def get_files_zip(self, original=False):
         """
-        Создает ZIP-архив со всеми файлами отправки.
+        Создает ZIP-архив со всеми файлами отправки (logistic/bundles.py).
+        Изображения добавляются веб-версиями, если не запрошены оригиналы.
         
         Returns:
             FileResponse: Ответ с ZIP-файлом
         """
-        buffer = io.BytesIO()
-        with zipfile.ZipFile(buffer, 'w') as zip_file:
-            # Получаем все файлы из корня
-            root_files = ShipmentFile.objects.filter(shipment=self, folder=None)
-            for file_obj in root_files:
-                file_path = file_obj.get_file_path()
-                if os.path.exists(file_path):
-                    # Добавляем файл в архив
-                    zip_file.write(file_path, os.path.basename(file_path))
-            
-            # Получаем все файлы из папок
-            folders = ShipmentFolder.objects.filter(shipment=self)
-            for folder in folders:
-                folder_files = ShipmentFile.objects.filter(shipment=self, folder=folder)
-                for file_obj in folder_files:
-                    file_path = file_obj.get_file_path()
-                    if os.path.exists(file_path):
-                        # Добавляем файл в архив, сохраняя структуру папок
-                        zip_path = os.path.join(folder.name, os.path.basename(file_path))
-                        zip_file.write(file_path, zip_path)
-        
-        # Перемещаем указатель в начало буфера
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=True, filename=f'shipment_{self.number}_files.zip')
+        from .bundles import bundle_response  # Импорт здесь для избежания циклических зависимостей
+
+        # Файлы из корня под исходными именами
+        root_files = ShipmentFile.objects.filter(shipment=self, folder=None).select_related('blob')
+        entries = [file_obj.get_download(original) for file_obj in root_files]
+
+        # Файлы из папок одним запросом, с сохранением структуры папок
+        folder_files = ShipmentFile.objects.filter(shipment=self, folder__isnull=False).select_related(
+            'blob', 'folder'
+        ).order_by('folder_id', 'id')
+        for file_obj in folder_files:
+            storage_name, filename = file_obj.get_download(original)
+            entries.append((storage_name, os.path.join(file_obj.folder.name, filename)))
+
+        return bundle_response(entries, f'shipment_{self.number}_files.zip')
     
     class Meta:
         verbose_name = 'Отправка'
         verbose_name_plural = 'Отправки'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['company', '-created_at'], name='shipment_company_created_idx'),
+        ]
 
     def delete(self, *args, **kwargs):
         """
         Переопределенный метод удаления.
-        При удалении отправки также удаляет директорию с файлами отправки на сервере.
+        При удалении отправки ее файлы ставятся в очередь на удаление,
+        которая обрабатывается после фиксации транзакции.
         """
-        # Удаляем директорию с файлами на сервере
-        folder_path = os.path.join(settings.MEDIA_ROOT, 'logistic', 'shipments', str(self.id))
-        if os.path.exists(folder_path):
-            shutil.rmtree(folder_path)
+        from .cleanup import schedule_legacy_files  # Импорт здесь для избежания циклических зависимостей
 
-        # Удаляем объект из базы данных
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            schedule_legacy_files(ShipmentFile.objects.filter(shipment=self))
+            # Удаляем объект из базы данных
+            return super().delete(*args, **kwargs)
 
 # Модель заявки
 def request_directory_path(instance, filename):
@@ -183,6 +314,8 @@ class RequestStatus(models.Model):
     is_final = models.BooleanField(default=False, verbose_name='Финальный статус')
     order = models.PositiveIntegerField(default=0, verbose_name='Порядок')
     created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = CompanyQuerySet.as_manager()
 
     class Meta:
         unique_together = [('company', 'code')]
@@ -199,6 +332,28 @@ class RequestStatus(models.Model):
     def __str__(self):
         return f"{self.name} ({self.company.name})"
 
+
+def create_default_statuses(company):
+    """
+    Создает стандартные статусы заявок и отправок компании с каскадными
+    переходами по умолчанию. Уже существующие статусы (по коду) не меняются.
+    """
+    existing = set(RequestStatus.objects.filter(company=company).values_list('code', flat=True))
+    RequestStatus.objects.bulk_create([
+        RequestStatus(company=company, **status_data)
+        for status_data in DEFAULT_REQUEST_STATUSES if status_data['code'] not in existing
+    ])
+    request_statuses = {status.code: status for status in RequestStatus.objects.filter(company=company)}
+    existing = set(ShipmentStatus.objects.filter(company=company).values_list('code', flat=True))
+    ShipmentStatus.objects.bulk_create([
+        ShipmentStatus(
+            company=company,
+            request_status=request_statuses.get(DEFAULT_STATUS_CASCADES.get(status_data['code'])),
+            **status_data
+        )
+        for status_data in DEFAULT_SHIPMENT_STATUSES if status_data['code'] not in existing
+    ])
+
 class Request(models.Model):
     """
     Модель заявки на перевозку груза.
@@ -225,43 +380,115 @@ class Request(models.Model):
     rate = models.TextField(null=True, blank=True, verbose_name='Ставка')
     comment = models.TextField(blank=True, null=True, verbose_name='Комментарий')
     status = models.ForeignKey(RequestStatus, on_delete=models.PROTECT, verbose_name='Статус')
+    # Время последней смены статуса (status_history.py); None - до появления журнала переходов
+    status_changed_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата смены статуса')
     client = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='client_requests', verbose_name='Клиент')
     manager = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='manager_requests', verbose_name='Менеджер')
     shipment = models.ForeignKey(Shipment, null=True, blank=True, on_delete=models.SET_NULL, verbose_name='Отправка')
     created_at = models.DateTimeField(default=timezone.now, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     
+    objects = RequestQuerySet.as_manager()
+    
     def get_status_display(self):
         return self.status.name if self.status else None
 
     def __str__(self):
         return f"Заявка #{self.number} - {self.get_status_display()}"
     
-    def get_files_zip(self):
+    def get_files_zip(self, original=False):
         """
-        Создает ZIP-архив со всеми файлами заявки.
+        Создает ZIP-архив со всеми файлами заявки (logistic/bundles.py).
+        Изображения добавляются веб-версиями, если не запрошены оригиналы.
         
         Returns:
             FileResponse: Ответ с ZIP-файлом
         """
-        buffer = io.BytesIO()
-        with zipfile.ZipFile(buffer, 'w') as zip_file:
-            # Получаем все файлы заявки
-            files = RequestFile.objects.filter(request=self)
-            for file_obj in files:
-                file_path = file_obj.get_file_path()
-                if os.path.exists(file_path):
-                    # Добавляем файл в архив
-                    zip_file.write(file_path, os.path.basename(file_path))
-        
-        # Перемещаем указатель в начало буфера
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=True, filename=f'request_{self.number}_files.zip')
+        from .bundles import bundle_response  # Импорт здесь для избежания циклических зависимостей
+
+        files = RequestFile.objects.filter(request=self).select_related('blob')
+        return bundle_response(
+            [file_obj.get_download(original) for file_obj in files], f'request_{self.number}_files.zip'
+        )
     
     class Meta:
         verbose_name = 'Заявка'
         verbose_name_plural = 'Заявки'
         ordering = ['-created_at']
+        # Индексы под выборки RequestQuerySet.for_user с сортировкой по дате
+        indexes = [
+            models.Index(fields=['company', '-created_at'], name='request_company_created_idx'),
+            models.Index(fields=['company', 'manager'], name='request_company_manager_idx'),
+            models.Index(fields=['client', '-created_at'], name='request_client_created_idx'),
+        ]
+
+class FileBlob(models.Model):
+    """
+    Модель содержимого файла (блоба).
+    Файлы хранятся по SHA-256 содержимого, поэтому одинаковые документы,
+    загруженные в заявку и в отправку, занимают место на диске один раз.
+    ref_count - количество записей RequestFile/ShipmentFile, ссылающихся на блоб.
+    """
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name='SHA-256')
+    size = models.BigIntegerField(verbose_name='Размер')
+    PREVIEW_PENDING = 'pending'
+    PREVIEW_READY = 'ready'
+    PREVIEW_UNSUPPORTED = 'unsupported'
+    PREVIEW_FAILED = 'failed'
+    PREVIEW_STATUS_CHOICES = [
+        (PREVIEW_PENDING, 'Ожидает генерации'),
+        (PREVIEW_READY, 'Готово'),
+        (PREVIEW_UNSUPPORTED, 'Формат не поддерживается'),
+        (PREVIEW_FAILED, 'Ошибка генерации'),
+    ]
+
+    # Виды превью: миниатюра для списков файлов и крупное превью первой страницы
+    PREVIEW_KINDS = ('thumb', 'preview')
+
+    ref_count = models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')
+    preview_status = models.CharField(max_length=20, choices=PREVIEW_STATUS_CHOICES, default=PREVIEW_PENDING, verbose_name='Статус превью')
+    # Веб-версия изображения (без метаданных, с исправленной ориентацией, ограниченного размера).
+    # None - веб-версии нет: не изображение или оригинал уже подходит для просмотра
+    rendition_size = models.BigIntegerField(null=True, blank=True, verbose_name='Размер веб-версии')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+
+    def get_storage_name(self):
+        """
+        Имя блоба в хранилище вложений.
+        Первые символы хеша используются как подкаталоги, чтобы не создавать
+        директории с огромным количеством файлов.
+        """
+        return f'logistic/blobs/{self.sha256[:2]}/{self.sha256[2:4]}/{self.sha256}'
+
+    def get_preview_name(self, kind='thumb'):
+        """
+        Имя превью блоба в хранилище. Превью лежат рядом с блобом.
+        """
+        return f'{self.get_storage_name()}.{kind}.webp'
+
+    def get_rendition_name(self):
+        """
+        Имя веб-версии изображения в хранилище. Лежит рядом с блобом.
+        """
+        return f'{self.get_storage_name()}.web.jpg'
+
+    def get_preview_names(self):
+        """
+        Имена всех превью и веб-версии блоба, если они сгенерированы.
+        """
+        if self.preview_status != self.PREVIEW_READY:
+            return []
+        names = [self.get_preview_name(kind) for kind in self.PREVIEW_KINDS]
+        if self.rendition_size is not None:
+            names.append(self.get_rendition_name())
+        return names
+
+    def __str__(self):
+        return self.sha256
+
+    class Meta:
+        verbose_name = 'Содержимое файла'
+        verbose_name_plural = 'Содержимое файлов'
 
 class RequestFile(models.Model):
     """
@@ -270,16 +497,36 @@ class RequestFile(models.Model):
     """
     request = models.ForeignKey(Request, related_name='files', on_delete=models.CASCADE, verbose_name='Заявка')
     file = models.CharField(max_length=255, verbose_name='Файл')  # Храним только имя файла
+    blob = models.ForeignKey(FileBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='request_files', verbose_name='Содержимое')
     uploaded_by = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True, verbose_name='Загрузил')
     uploaded_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')
 
+    def get_storage_name(self):
+        """
+        Метод для получения имени файла в хранилище вложений.
+        Для файлов с блобом возвращается имя блоба, для старых файлов -
+        путь в директории заявки.
+        """
+        if self.blob_id:
+            return self.blob.get_storage_name()
+        return f'logistic/requests/{self.request_id}/{self.file}'
+
+    def get_download(self, original=False):
+        """
+        Имя в хранилище и имя файла для скачивания: веб-версия изображения,
+        если она есть и оригинал не запрошен, иначе исходный файл.
+        """
+        if not original and self.blob_id and self.blob.rendition_size is not None:
+            return self.blob.get_rendition_name(), rendition_filename(self.file)
+        return self.get_storage_name(), self.file
+
     def get_file_path(self):
         """
         Метод для получения полного пути к файлу.
-        Используется для доступа к файлу на сервере.
+        Доступен только для хранилищ на локальной файловой системе.
         """
-        # Динамическое построение полного пути к файлу
-        return os.path.join(settings.MEDIA_ROOT, f'logistic/requests/{self.request.id}/{self.file}')
+        from .storage import get_storage  # Импорт здесь для избежания циклических зависимостей
+        return get_storage().path(self.get_storage_name())
     
     class Meta:
         verbose_name = 'Файл заявки'
@@ -298,20 +545,6 @@ class ShipmentFolder(models.Model):
     def __str__(self):
         return f"Папка {self.name} (Отправка #{self.shipment.number})"
 
-    def save(self, *args, **kwargs):
-        """
-        Переопределенный метод сохранения.
-        При сохранении папки создает соответствующую директорию в файловой системе.
-        """
-        # Сначала сохраняем объект в базе данных
-        super().save(*args, **kwargs)
-
-        # Путь к папке, которую нужно создать
-        folder_path = os.path.join(settings.MEDIA_ROOT, f'logistic/shipments/{self.shipment.id}/{self.name}')
-
-        # Проверяем, существует ли уже папка, и создаем ее, если не существует
-        os.makedirs(folder_path, exist_ok=True)
-    
     class Meta:
         verbose_name = 'Папка отправки'
         verbose_name_plural = 'Папки отправок'
@@ -325,17 +558,38 @@ class ShipmentFile(models.Model):
     shipment = models.ForeignKey(Shipment, related_name='files', on_delete=models.CASCADE, verbose_name='Отправка')
     file = models.CharField(max_length=255, verbose_name='Файл')
     folder = models.ForeignKey(ShipmentFolder, null=True, blank=True, related_name='files', on_delete=models.CASCADE, verbose_name='Папка')
+    blob = models.ForeignKey(FileBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='shipment_files', verbose_name='Содержимое')
     uploaded_by = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True, verbose_name='Загрузил')
     uploaded_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')
 
+    def get_storage_name(self):
+        """
+        Метод для получения имени файла в хранилище вложений.
+        Для файлов с блобом возвращается имя блоба, для старых файлов -
+        путь в директории отправки с учетом папки.
+        """
+        if self.blob_id:
+            return self.blob.get_storage_name()
+        if self.folder:
+            return f'logistic/shipments/{self.shipment_id}/{self.folder.name}/{self.file}'
+        return f'logistic/shipments/{self.shipment_id}/{self.file}'
+
+    def get_download(self, original=False):
+        """
+        Имя в хранилище и имя файла для скачивания: веб-версия изображения,
+        если она есть и оригинал не запрошен, иначе исходный файл.
+        """
+        if not original and self.blob_id and self.blob.rendition_size is not None:
+            return self.blob.get_rendition_name(), rendition_filename(self.file)
+        return self.get_storage_name(), self.file
+
     def get_file_path(self):
         """
         Метод для получения полного пути к файлу.
-        Если файл находится в папке, учитывает путь к папке.
+        Доступен только для хранилищ на локальной файловой системе.
         """
-        if self.folder:
-            return os.path.join(settings.MEDIA_ROOT, f'logistic/shipments/{self.shipment.id}/{self.folder.name}/{self.file}')
-        return os.path.join(settings.MEDIA_ROOT, f'logistic/shipments/{self.shipment.id}/{self.file}')
+        from .storage import get_storage  # Импорт здесь для избежания циклических зависимостей
+        return get_storage().path(self.get_storage_name())
     
     class Meta:
         verbose_name = 'Файл отправки'
@@ -349,6 +603,8 @@ class Article(models.Model):
     name = models.CharField(max_length=255, verbose_name='Наименование статьи')
     company = models.ForeignKey(Company, on_delete=models.CASCADE, verbose_name='Компания')
     
+    objects = CompanyQuerySet.as_manager()
+    
     def __str__(self):
         return self.name
     
@@ -380,6 +636,8 @@ class Finance(models.Model):
     is_paid = models.BooleanField(default=False, verbose_name="Оплачен")
     created_by = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True, related_name='created_finances', verbose_name='Создал')
     
+    objects = FinanceQuerySet.as_manager()
+    
     def __str__(self):
         return f"Финансовая операция #{self.number} ({self.get_operation_type_display()})"
     
@@ -387,6 +645,9 @@ class Finance(models.Model):
         verbose_name = 'Финансовая операция'
         verbose_name_plural = 'Финансовые операции'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['company', '-created_at'], name='finance_company_created_idx'),
+        ]
 
 class ShipmentCalculation(models.Model):
     """
@@ -402,4 +663,144 @@ class ShipmentCalculation(models.Model):
     
     class Meta:
         verbose_name = 'Расчет отправки'
-        verbose_name_plural = 'Расчеты отправок'
\ No newline at end of file
+        verbose_name_plural = 'Расчеты отправок'
+
+class CurrencyRate(models.Model):
+    """
+    Курс валюты к рублю на дату.
+    Курс действует с указанной даты до даты следующей записи по той же
+    валюте: для операции берется последний курс с датой не позже ее даты.
+    """
+    CURRENCY_CHOICES = [('eur', 'Евро'), ('usd', 'Доллар')]
+
+    date = models.DateField(verbose_name='Дата')
+    currency = models.CharField(max_length=10, choices=CURRENCY_CHOICES, verbose_name='Валюта')
+    rate = models.DecimalField(max_digits=14, decimal_places=6, verbose_name='Курс (рублей за единицу)')
+    source = models.CharField(max_length=50, blank=True, default='', verbose_name='Источник')
+
+    def __str__(self):
+        return f"{self.get_currency_display()} {self.date}: {self.rate}"
+
+    class Meta:
+        verbose_name = 'Курс валюты'
+        verbose_name_plural = 'Курсы валют'
+        ordering = ['currency', '-date']
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'date'], name='currency_rate_unique_date'),
+        ]
+
+class PendingFileDeletion(models.Model):
+    """
+    Журнал отложенного удаления файлов.
+    Запись создается в той же транзакции, что и удаление данных из базы,
+    а сами файлы удаляются фоновой задачей после фиксации транзакции.
+    """
+    path = models.CharField(max_length=1024, verbose_name='Имя в хранилище')
+    is_directory = models.BooleanField(default=False, verbose_name='Директория')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Количество попыток')
+    last_error = models.TextField(blank=True, null=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        verbose_name = 'Удаление файла'
+        verbose_name_plural = 'Очередь удаления файлов'
+        ordering = ['id']
+
+class ImportJob(models.Model):
+    """
+    Задание импорта заявок или финансовых операций из CSV/XLSX.
+    Выполняется в фоне пачками строк (см. imports.py). processed_rows -
+    количество строк файла, обработка которых зафиксирована: при повторном
+    запуске эти строки пропускаются. Исходный файл хранится в хранилище
+    вложений до завершения импорта (не пробного).
+    """
+    KIND_REQUESTS = 'requests'
+    KIND_FINANCES = 'finances'
+    KIND_CHOICES = [
+        (KIND_REQUESTS, 'Заявки'),
+        (KIND_FINANCES, 'Финансовые операции'),
+    ]
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_COMPLETED, 'Завершено'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, verbose_name='Компания')
+    created_by = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True, related_name='import_jobs', verbose_name='Создал')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Тип данных')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='Статус')
+    dry_run = models.BooleanField(default=False, verbose_name='Пробный запуск')
+    file_name = models.CharField(max_length=255, verbose_name='Имя файла')
+    storage_name = models.CharField(max_length=1024, blank=True, verbose_name='Имя в хранилище')
+    total_rows = models.PositiveIntegerField(null=True, blank=True, verbose_name='Всего строк')
+    processed_rows = models.PositiveIntegerField(default=0, verbose_name='Обработано строк')
+    imported_rows = models.PositiveIntegerField(default=0, verbose_name='Импортировано строк')
+    error_rows = models.PositiveIntegerField(default=0, verbose_name='Строк с ошибками')
+    errors = models.JSONField(default=list, blank=True, verbose_name='Ошибки')
+    message = models.TextField(blank=True, null=True, verbose_name='Сообщение')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Начало')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Окончание')
+    
+    objects = CompanyQuerySet.as_manager()
+
+    def __str__(self):
+        return f"Импорт #{self.pk} ({self.get_kind_display()}, {self.get_status_display()})"
+
+    class Meta:
+        verbose_name = 'Задание импорта'
+        verbose_name_plural = 'Задания импорта'
+        ordering = ['-created_at']
+
+class StatusTransition(models.Model):
+    """
+    Журнал смены статусов отправок и заявок (только добавление записей).
+    Запись создается в той же транзакции, что и смена статуса (status_history.py).
+    from_status и to_status - коды статусов: они уникальны в компании и не
+    меняются при переименовании. duration_seconds - сколько объект пробыл
+    в from_status; None для первого статуса и для объектов, статус которых
+    менялся до появления журнала.
+    """
+    ENTITY_SHIPMENT = 'shipment'
+    ENTITY_REQUEST = 'request'
+    ENTITY_CHOICES = [
+        (ENTITY_SHIPMENT, 'Отправка'),
+        (ENTITY_REQUEST, 'Заявка'),
+    ]
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, verbose_name='Компания')
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES, verbose_name='Тип объекта')
+    object_id = models.PositiveIntegerField(verbose_name='ID объекта')
+    from_status = models.CharField(max_length=50, blank=True, verbose_name='Предыдущий статус')
+    to_status = models.CharField(max_length=50, verbose_name='Новый статус')
+    at = models.DateTimeField(default=timezone.now, verbose_name='Дата перехода')
+    duration_seconds = models.PositiveBigIntegerField(null=True, blank=True, verbose_name='Время в предыдущем статусе (с)')
+    changed_by = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Изменил')
+
+    objects = CompanyQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.get_entity_display()} #{self.object_id}: {self.from_status or '-'} -> {self.to_status}"
+
+    class Meta:
+        verbose_name = 'Смена статуса'
+        verbose_name_plural = 'Журнал смены статусов'
+        ordering = ['at', 'id']
+        indexes = [
+            # Поступления в статус (пропускная способность)
+            models.Index(fields=['company', 'entity', 'to_status', 'at'], name='transition_to_status_idx'),
+            # Время в статусе при выходе из него (SLA)
+            models.Index(fields=['company', 'entity', 'from_status', 'at'], name='transition_from_status_idx'),
+            # История одного объекта
+            models.Index(fields=['entity', 'object_id', 'at'], name='transition_object_idx'),
+        ]
@@ -0,0 +1,230 @@
+"""
+Обнаружение N+1 запросов.
+
+Во время обработки каждого запроса DRF (APIView.dispatch) SELECT-запросы
+группируются по «отпечатку» SQL (без параметров) и месту вызова - первой
+строке кода вне Django, из которой выполнялся запрос. Если один и тот же
+запрос из одного места выполняется NPLUSONE_THRESHOLD и более раз, это
+N+1: связанный объект загружается лениво для каждой строки выборки.
+
+Для каждой находки запоминается поле сериализатора, при заполнении которого
+выполнялся запрос (например, 'RequestListSerializer.client_name').
+
+Режим задается настройкой NPLUSONE_MODE:
+- 'log' - предупреждение в логгер logistic.nplusone;
+- 'raise' - исключение NPlusOneError после обработки запроса
+  (включается тестовым раннером logistic.test_runner.NPlusOneTestRunner);
+- 'off' - выключено.
+
+Намеренно повторяющиеся запросы оборачиваются в ignore().
+"""
+import contextvars
+import functools
+import logging
+import os
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+import django
+from django.conf import settings
+from django.db import connections
+
+from .profiling import fingerprint
+
+logger = logging.getLogger(__name__)
+
+_DJANGO_DIR = os.path.dirname(django.__file__) + os.sep
+# Модули с обертками методов ORM и DRF, которые не являются местом вызова
+_INSTRUMENTATION_FILES = {
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in ('nplusone.py', 'profiling.py', 'metrics.py')
+}
+
+_scope = contextvars.ContextVar('logistic_nplusone_scope', default=None)
+_field = contextvars.ContextVar('logistic_nplusone_field', default=None)
+_ignored = contextvars.ContextVar('logistic_nplusone_ignored', default=False)
+_hooks_installed = False
+
+
+class NPlusOneError(Exception):
+    """Обнаружены N+1 запросы (режим 'raise')."""
+
+
+class Detection:
+    """
+    Найденный N+1: отпечаток запроса, место вызова, поле сериализатора
+    и количество повторов.
+    """
+
+    def __init__(self, sql, call_site, field, count):
+        self.sql = sql
+        self.call_site = call_site
+        self.field = field
+        self.count = count
+
+    def __str__(self):
+        field = f', поле {self.field}' if self.field else ''
+        return f'{self.count} x [{self.call_site}{field}] {self.sql}'
+
+
+class Scope:
+    """
+    Счетчики запросов в пределах обработки одного запроса.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.counts = Counter()
+        self.fields = {}
+
+    def record(self, sql):
+        key = (fingerprint(sql), _call_site())
+        self.counts[key] += 1
+        if key not in self.fields:
+            self.fields[key] = _field.get()
+
+    def detections(self):
+        threshold = settings.NPLUSONE_THRESHOLD
+        return [
+            Detection(sql, call_site, self.fields[(sql, call_site)], count)
+            for (sql, call_site), count in self.counts.most_common()
+            if count >= threshold
+        ]
+
+
+def _short_path(filename):
+    """Путь относительно проекта или каталога установленных пакетов."""
+    base_dir = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(base_dir):
+        return filename[len(base_dir):]
+    marker = 'site-packages' + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return filename
+
+
+def _call_site():
+    """
+    Первая строка кода вне Django, из которой выполнен запрос.
+    Обертки execute_wrapper вызываются самим Django, поэтому кадры до
+    первого кадра Django пропускаются; обертки профилирования и метрик
+    вокруг методов ORM и DRF также не считаются местом вызова.
+    """
+    frame = sys._getframe(1)
+    seen_django = False
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_DJANGO_DIR):
+            seen_django = True
+        elif seen_django and filename not in _INSTRUMENTATION_FILES:
+            return f'{_short_path(filename)}:{frame.f_lineno} ({frame.f_code.co_name})'
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _query_recorder(scope):
+    def wrapper(execute, sql, params, many, context):
+        # Запросы вложенной области (isolated) не учитываются во внешней
+        if not many and not _ignored.get() and _scope.get() is scope and sql.lstrip()[:6].upper() == 'SELECT':
+            scope.record(sql)
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+@contextmanager
+def ignore():
+    """
+    Не учитывать запросы блока: для циклов, где отдельный запрос на
+    элемент ожидаем (например, поиск блоба по хешу для каждого файла).
+    """
+    token = _ignored.set(True)
+    try:
+        yield
+    finally:
+        _ignored.reset(token)
+
+
+@contextmanager
+def isolated():
+    """
+    Запросы DRF внутри блока проверяются каждый в своей области, а не во
+    внешней (подзапросы /api/batch/: одинаковые подзапросы - не N+1).
+    """
+    token = _scope.set(None)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def detect(label):
+    """
+    Собирает запросы блока и сообщает о найденных N+1 согласно NPLUSONE_MODE.
+    Вложенные вызовы используют внешнюю область.
+    """
+    mode = settings.NPLUSONE_MODE
+    if mode == 'off' or _scope.get() is not None:
+        yield
+        return
+
+    scope = Scope(label)
+    token = _scope.set(scope)
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(_query_recorder(scope)))
+            yield
+    finally:
+        _scope.reset(token)
+
+    detections = scope.detections()
+    if not detections:
+        return
+    report = '\n'.join(str(detection) for detection in detections)
+    if mode == 'raise':
+        raise NPlusOneError(f'N+1 запросы в {label}:\n{report}')
+    logger.warning('N+1 запросы в %s:\n%s', label, report)
+
+
+def _with_field(func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if _scope.get() is None or self.parent is None:
+            return func(self, *args, **kwargs)
+        token = _field.set(f'{type(self.parent).__name__}.{self.field_name}')
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            _field.reset(token)
+    return wrapper
+
+
+def _detected_dispatch(dispatch):
+    @functools.wraps(dispatch)
+    def wrapper(self, request, *args, **kwargs):
+        with detect(f'{request.method} {request.path}'):
+            return dispatch(self, request, *args, **kwargs)
+    return wrapper
+
+
+def install_hooks():
+    """
+    Включает обнаружение для всех представлений DRF (включая все действия
+    ViewSet) и запоминание текущего поля сериализатора.
+    """
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    _hooks_installed = True
+
+    from rest_framework import fields, serializers
+    from rest_framework.views import APIView
+
+    APIView.dispatch = _detected_dispatch(APIView.dispatch)
+    fields.Field.get_attribute = _with_field(fields.Field.get_attribute)
+    fields.SerializerMethodField.to_representation = _with_field(fields.SerializerMethodField.to_representation)
+    # Вложенные списки (many=True) выполняют запрос при обходе, а не в get_attribute
+    serializers.ListSerializer.to_representation = _with_field(serializers.ListSerializer.to_representation)
+
@@ -1,6 +1,26 @@
+import logging
+
 from rest_framework import permissions
 from .models import ShipmentStatus
 
+logger = logging.getLogger(__name__)
+
+
+def _log_permission_check(name, user, result):
+    """
+    Пишет в отладочный лог результат проверки разрешения.
+    Данные пользователя читаются, только если уровень DEBUG включен.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    profile = getattr(user, 'userprofile', None) if user.is_authenticated else None
+    logger.debug(
+        "%s: user=%s (ID: %s), authenticated=%s, superuser=%s, user_group=%s, company_id=%s, result=%s",
+        name, user.username, user.id, user.is_authenticated, user.is_superuser,
+        getattr(profile, 'user_group', None), getattr(profile, 'company_id', None), result,
+    )
+
+
 # Функция для проверки иерархии ролей
 def check_role_hierarchy(user, required_role):
     """
@@ -14,25 +34,17 @@ def check_role_hierarchy(user, required_role):
     5. warehouse
     6. client
     """
-    print(f"==== CHECK_ROLE_HIERARCHY ====")
-    print(f"User: {user.username} (ID: {user.id})")
-    print(f"Required role: {required_role}")
-    
     if not user.is_authenticated:
-        print("User is not authenticated")
         return False
         
     if not hasattr(user, 'userprofile'):
-        print("User has no userprofile")
         return False
         
     # Суперюзеры Django всегда имеют все права
     if user.is_superuser:
-        print("User is Django superuser")
         return True
         
     user_role = user.userprofile.user_group
-    print(f"User role: {user_role}")
     
     # Карта иерархии ролей (ключ роль имеет доступ ко всем ролям в значении)
     role_hierarchy = {
@@ -46,8 +58,7 @@ def check_role_hierarchy(user, required_role):
     
     # Если роль пользователя есть в иерархии и требуемая роль в списке доступных
     result = user_role in role_hierarchy and required_role in role_hierarchy.get(user_role, [])
-    print(f"Check result: {result}")
-    print(f"==== END CHECK_ROLE_HIERARCHY ====")
+    logger.debug("check_role_hierarchy: user_role=%s, required_role=%s, result=%s", user_role, required_role, result)
     return result
 
 class IsSuperuser(permissions.BasePermission):
@@ -61,22 +72,11 @@ class IsSuperuser(permissions.BasePermission):
     Эти пользователи имеют полный доступ ко всем данным во всех компаниях.
     """
     def has_permission(self, request, view):
-        print(f"==== IsSuperuser.has_permission ====")
-        print(f"User: {request.user.username} (ID: {request.user.id})")
-        print(f"Is authenticated: {request.user.is_authenticated}")
-        print(f"Is superuser: {request.user.is_superuser}")
-        
-        if hasattr(request.user, 'userprofile'):
-            print(f"User profile exists, user_group: {request.user.userprofile.user_group}")
-        else:
-            print(f"User has no profile")
-            
         result = request.user.is_authenticated and (
             request.user.is_superuser or 
             hasattr(request.user, 'userprofile') and request.user.userprofile.user_group == 'superuser'
         )
-        print(f"Permission result: {result}")
-        print(f"==== END IsSuperuser.has_permission ====")
+        _log_permission_check('IsSuperuser', request.user, result)
         return result
         
     def has_object_permission(self, request, view, obj):
@@ -100,20 +100,8 @@ class IsCompanyAdmin(permissions.BasePermission):
     но не могут видеть или изменять данные других компаний.
     """
     def has_permission(self, request, view):
-        print(f"==== IsCompanyAdmin.has_permission ====")
-        print(f"User: {request.user.username} (ID: {request.user.id})")
-        print(f"Is authenticated: {request.user.is_authenticated}")
-        print(f"Is superuser: {request.user.is_superuser}")
-        
-        if hasattr(request.user, 'userprofile'):
-            print(f"User profile exists, user_group: {request.user.userprofile.user_group}")
-            print(f"User company: {request.user.userprofile.company}")
-        else:
-            print(f"User has no profile")
-            
         result = check_role_hierarchy(request.user, 'admin')
-        print(f"Permission result: {result}")
-        print(f"==== END IsCompanyAdmin.has_permission ====")
+        _log_permission_check('IsCompanyAdmin', request.user, result)
         return result
     
     def has_object_permission(self, request, view, obj):
@@ -146,20 +134,8 @@ class IsCompanyBoss(permissions.BasePermission):
     включая управление финансами и аналитику.
     """
     def has_permission(self, request, view):
-        print(f"==== IsCompanyBoss.has_permission ====")
-        print(f"User: {request.user.username} (ID: {request.user.id})")
-        print(f"Is authenticated: {request.user.is_authenticated}")
-        print(f"Is superuser: {request.user.is_superuser}")
-        
-        if hasattr(request.user, 'userprofile'):
-            print(f"User profile exists, user_group: {request.user.userprofile.user_group}")
-            print(f"User company: {request.user.userprofile.company}")
-        else:
-            print(f"User has no profile")
-            
         result = check_role_hierarchy(request.user, 'boss')
-        print(f"Permission result: {result}")
-        print(f"==== END IsCompanyBoss.has_permission ====")
+        _log_permission_check('IsCompanyBoss', request.user, result)
         return result
     
     def has_object_permission(self, request, view, obj):
@@ -0,0 +1,210 @@
+"""
+Генерация миниатюр и превью загруженных документов.
+
+Для каждого нового блоба после фиксации транзакции в фоне создаются
+два изображения WEBP, которые хранятся рядом с блобом:
+- '<блоб>.thumb.webp' - миниатюра для списков файлов;
+- '<блоб>.preview.webp' - крупное превью (для PDF - первая страница).
+
+Поддерживаются изображения (все форматы, которые открывает Pillow) и PDF.
+PDF растеризуются пакетом PyMuPDF (requirements.txt); если он не
+установлен, PDF помечаются как неподдерживаемые. Содержимое блоба не меняется, поэтому превью
+генерируются один раз и могут кешироваться клиентом бессрочно.
+
+Для фотографий (однокадровые JPEG и HEIF, RENDITION_FORMATS) там же
+создается веб-версия '<блоб>.web.jpg': JPEG со стороной не больше
+RENDITION_MAX_SIDE, с ориентацией по EXIF и без метаданных (EXIF с
+геопозицией, XMP, профили). Она сохраняется, если меньше оригинала или
+оригинал содержит метаданные; ее размер записывается в
+FileBlob.rendition_size. Скачивание по умолчанию отдает веб-версию,
+оригинал остается в хранилище без изменений. PNG, TIFF, GIF, BMP и
+многокадровые изображения (сканы документов, анимации) веб-версии не
+получают и скачиваются как есть: JPEG исказил бы их или оставил только
+первый кадр.
+"""
+import io
+import logging
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .cleanup import schedule_deletion
+from .file_tree import bump_blob_file_trees
+from .models import FileBlob
+from .storage import COPY_CHUNK_SIZE, get_storage
+
+logger = logging.getLogger(__name__)
+
+# Максимальная сторона изображения для каждого вида превью
+PREVIEW_SIZES = {
+    'thumb': 256,
+    'preview': 1280,
+}
+
+PREVIEW_QUALITY = 80
+
+PDF_SIGNATURE = b'%PDF-'
+
+# Форматы фотографий с камер телефонов, для которых создается веб-версия.
+# MPO - JPEG с дополнительными кадрами (карта глубины, превью), основной кадр первый
+RENDITION_FORMATS = ('JPEG', 'MPO', 'HEIF', 'HEIC')
+
+
+def _read_source(blob):
+    """
+    Читает содержимое блоба в память.
+    Слишком большие файлы не обрабатываются.
+    """
+    max_size = settings.PREVIEW_MAX_SOURCE_SIZE
+    if blob.size > max_size:
+        return None
+    buffer = io.BytesIO()
+    with get_storage().open(blob.get_storage_name()) as source:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+            buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
+
+
+def _render_pdf_page(data, max_side):
+    """
+    Растеризует первую страницу PDF в изображение Pillow.
+    Возвращает None, если PyMuPDF не установлен.
+    """
+    try:
+        import pymupdf
+    except ImportError:
+        return None
+
+    with pymupdf.open(stream=data, filetype='pdf') as document:
+        if document.page_count == 0:
+            return None
+        page = document[0]
+        zoom = max_side / max(page.rect.width, page.rect.height)
+        pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+        return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def _is_pdf(source):
+    is_pdf = source.read(len(PDF_SIGNATURE)) == PDF_SIGNATURE
+    source.seek(0)
+    return is_pdf
+
+
+def _is_photo(image):
+    """Однокадровая фотография, для которой нужна веб-версия."""
+    if image.format == 'MPO':
+        return True
+    return image.format in RENDITION_FORMATS and getattr(image, 'n_frames', 1) == 1
+
+
+def _open_image(source, max_side):
+    """
+    Открывает изображение или первую страницу PDF.
+    Возвращает пару (изображение, фотография ли это) или (None, False)
+    для неподдерживаемых форматов.
+    """
+    if _is_pdf(source):
+        return _render_pdf_page(source.getvalue(), max_side), False
+
+    try:
+        image = Image.open(source)
+        # Для JPEG декодирование сразу в уменьшенном масштабе намного быстрее
+        image.draft('RGB', (max_side, max_side))
+        image.load()
+    except Image.DecompressionBombError:
+        raise
+    except Exception:
+        return None, False
+
+    is_photo = _is_photo(image)
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    return image, is_photo
+
+
+def _has_metadata(image):
+    return any(key in image.info for key in ('exif', 'xmp', 'XML:com.adobe.xmp', 'icc_profile', 'comment'))
+
+
+def _encode_rendition(image):
+    """
+    Веб-версия изображения в JPEG. Метаданные не передаются в save(),
+    поэтому в файл не попадают; прозрачность заменяется белым фоном.
+    """
+    rendition = image.copy()
+    rendition.thumbnail((settings.RENDITION_MAX_SIDE, settings.RENDITION_MAX_SIDE), Image.LANCZOS)
+    if rendition.mode == 'RGBA':
+        background = Image.new('RGB', rendition.size, (255, 255, 255))
+        background.paste(rendition, mask=rendition.getchannel('A'))
+        rendition = background
+    output = io.BytesIO()
+    rendition.save(output, format='JPEG', quality=settings.RENDITION_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def _save_rendition(blob, image):
+    """
+    Сохраняет веб-версию изображения, если она нужна. Возвращает ее размер или None.
+    """
+    data = _encode_rendition(image)
+    if len(data) >= blob.size and not _has_metadata(image):
+        return None
+    get_storage().save(blob.get_rendition_name(), [data])
+    return len(data)
+
+
+def _encode(image, max_side):
+    rendition = image.copy()
+    rendition.thumbnail((max_side, max_side), Image.LANCZOS)
+    output = io.BytesIO()
+    rendition.save(output, format='WEBP', quality=PREVIEW_QUALITY, method=4)
+    return output.getvalue()
+
+
+def generate_previews(blob_id):
+    """
+    Генерирует превью блоба и обновляет его статус.
+    Повторный вызов для уже обработанного блоба ничего не делает.
+    """
+    blob = FileBlob.objects.filter(pk=blob_id, preview_status=FileBlob.PREVIEW_PENDING).first()
+    if blob is None:
+        return
+
+    rendition_size = None
+    try:
+        source = _read_source(blob)
+        is_pdf = source is not None and _is_pdf(source)
+        # Изображения декодируются в размере, достаточном и для веб-версии
+        max_side = max(PREVIEW_SIZES.values()) if is_pdf else max(*PREVIEW_SIZES.values(), settings.RENDITION_MAX_SIDE)
+        image, is_photo = _open_image(source, max_side) if source else (None, False)
+        if image is None:
+            new_status = FileBlob.PREVIEW_UNSUPPORTED
+        else:
+            storage = get_storage()
+            for kind, max_side in PREVIEW_SIZES.items():
+                storage.save(blob.get_preview_name(kind), [_encode(image, max_side)])
+            if is_photo:
+                rendition_size = _save_rendition(blob, image)
+            new_status = FileBlob.PREVIEW_READY
+    except Exception:
+        logger.exception("Не удалось сгенерировать превью для блоба %s", blob.sha256)
+        new_status = FileBlob.PREVIEW_FAILED
+
+    updated = FileBlob.objects.filter(
+        pk=blob.pk, preview_status=FileBlob.PREVIEW_PENDING
+    ).update(preview_status=new_status, rendition_size=rendition_size)
+    if updated:
+        # Миниатюры и размеры файлов входят в дерево файлов отправок
+        bump_blob_file_trees(blob.pk)
+        if blob.rendition_size is not None and rendition_size is None:
+            # Повторная обработка (generate_previews --recheck-renditions): веб-версия больше не нужна
+            schedule_deletion(blob.get_rendition_name())
+
+    if not updated and not FileBlob.objects.filter(pk=blob.pk).exists():
+        # Блоб удалили, пока генерировались превью - убираем их за собой
+        for kind in FileBlob.PREVIEW_KINDS:
+            schedule_deletion(blob.get_preview_name(kind))
+        if rendition_size is not None:
+            schedule_deletion(blob.get_rendition_name())
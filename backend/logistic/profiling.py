@@ -0,0 +1,330 @@
+"""
+Профилирование отдельных запросов.
+
+RequestProfilingMiddleware включает профилирование для запроса, если:
+- передан заголовок X-Profile со значением REQUEST_PROFILING_TOKEN
+  (в режиме DEBUG подходит любое значение), или
+- запрос попал в выборку с вероятностью REQUEST_PROFILING_SAMPLE_RATE.
+
+Для профилируемого запроса записываются общее время, время этапов
+(аутентификация, проверка разрешений, выполнение запросов queryset,
+сериализация, рендеринг), количество и время SQL-запросов и повторяющиеся
+запросы (по «отпечатку» SQL без параметров). С заголовком X-Profile-Tree: 1
+дополнительно снимается дерево вызовов (pyinstrument, если установлен,
+иначе cProfile).
+
+Результат отдается в заголовке Server-Timing и сохраняется в кольцевом
+буфере процесса, который просматривается через /api/admin/profiles/.
+
+Время этапов включает вложенные этапы: например, выполнение queryset
+внутри сериализации учитывается и в «queryset», и в «serialization».
+"""
+import contextvars
+import cProfile
+import functools
+import io
+import itertools
+import pstats
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+# Этапы обработки запроса и их короткие имена для Server-Timing
+PHASES = {
+    'auth': 'Аутентификация',
+    'permissions': 'Проверка разрешений',
+    'queryset': 'Выполнение queryset',
+    'serialization': 'Сериализация',
+    'render': 'Рендеринг',
+}
+
+_current = contextvars.ContextVar('logistic_request_profile', default=None)
+_ids = itertools.count(1)
+_buffer = None
+_buffer_lock = threading.Lock()
+_hooks_installed = False
+
+_NUMBER_RE = re.compile(r'\b\d+(\.\d+)?\b')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:%s|\?|\d+|\'[^\']*\')\s*,?)+\)', re.IGNORECASE)
+
+
+def fingerprint(sql):
+    """
+    Нормализует SQL: литералы и списки IN заменяются плейсхолдерами,
+    чтобы одинаковые по структуре запросы давали один отпечаток.
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return ' '.join(sql.split())
+
+
+class RequestProfile:
+    """
+    Результаты профилирования одного запроса.
+    """
+
+    def __init__(self, request, with_tree=False):
+        self.id = next(_ids)
+        self.method = request.method
+        self.path = request.get_full_path()
+        self.started_at = timezone.now()
+        self.with_tree = with_tree
+        self.status = None
+        self.user = None
+        self.total_ms = 0.0
+        self.phases = Counter()
+        self.queries = 0
+        self.query_ms = 0.0
+        self.fingerprints = Counter()
+        self.fingerprint_ms = Counter()
+        self.tree = None
+        self._depth = Counter()
+
+    def record_query(self, sql, duration_ms):
+        self.queries += 1
+        self.query_ms += duration_ms
+        key = fingerprint(sql)
+        self.fingerprints[key] += 1
+        self.fingerprint_ms[key] += duration_ms
+
+    def duplicates(self, limit=20):
+        """Запросы, выполненные более одного раза, от самых частых."""
+        return [
+            {'sql': sql, 'count': count, 'total_ms': round(self.fingerprint_ms[sql], 2)}
+            for sql, count in self.fingerprints.most_common(limit)
+            if count > 1
+        ]
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing."""
+        parts = [f'total;dur={self.total_ms:.1f}', f'db;dur={self.query_ms:.1f};desc="{self.queries} queries"']
+        parts.extend(f'{name};dur={self.phases[name]:.1f}' for name in PHASES if name in self.phases)
+        return ', '.join(parts)
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'user': self.user,
+            'started_at': self.started_at,
+            'total_ms': round(self.total_ms, 2),
+            'queries': self.queries,
+            'query_ms': round(self.query_ms, 2),
+            'duplicate_queries': sum(count - 1 for count in self.fingerprints.values() if count > 1),
+        }
+
+    def as_dict(self):
+        data = self.summary()
+        data['phases'] = {name: round(self.phases[name], 2) for name in PHASES if name in self.phases}
+        data['duplicates'] = self.duplicates()
+        data['tree'] = self.tree
+        return data
+
+
+def current_profile():
+    """Профиль текущего запроса или None, если запрос не профилируется."""
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    """
+    Учитывает время блока в этапе name текущего профиля.
+    Вложенные вызовы одного этапа учитываются один раз.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    profile._depth[name] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile._depth[name] -= 1
+        if not profile._depth[name]:
+            profile.phases[name] += (time.perf_counter() - started) * 1000
+
+
+def _timed_method(func, name):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return func(*args, **kwargs)
+        with phase(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _timed_property(prop, name):
+    return property(_timed_method(prop.fget, name), prop.fset, prop.fdel, prop.__doc__)
+
+
+def install_hooks():
+    """
+    Оборачивает методы DRF и ORM, соответствующие этапам обработки запроса.
+    Обертки проверяют, профилируется ли текущий запрос, и без профиля
+    просто вызывают исходный метод.
+    """
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    _hooks_installed = True
+
+    from django.db.models.query import QuerySet
+    from rest_framework import serializers
+    from rest_framework.response import Response
+    from rest_framework.views import APIView
+
+    APIView.perform_authentication = _timed_method(APIView.perform_authentication, 'auth')
+    APIView.check_permissions = _timed_method(APIView.check_permissions, 'permissions')
+    APIView.check_object_permissions = _timed_method(APIView.check_object_permissions, 'permissions')
+    QuerySet._fetch_all = _timed_method(QuerySet._fetch_all, 'queryset')
+    serializers.Serializer.data = _timed_property(serializers.Serializer.data, 'serialization')
+    serializers.ListSerializer.data = _timed_property(serializers.ListSerializer.data, 'serialization')
+    Response.rendered_content = _timed_property(Response.rendered_content, 'render')
+
+
+def get_buffer():
+    """Кольцевой буфер последних профилей текущего процесса."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = deque(maxlen=settings.REQUEST_PROFILING_BUFFER_SIZE)
+    return _buffer
+
+
+def get_profile(profile_id):
+    for profile in list(get_buffer()):
+        if profile.id == profile_id:
+            return profile
+    return None
+
+
+def _query_recorder(profile):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            profile.record_query(sql, (time.perf_counter() - started) * 1000)
+    return wrapper
+
+
+@contextmanager
+def _call_tree(profile):
+    """
+    Снимает дерево вызовов: pyinstrument, если установлен, иначе cProfile.
+    """
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+
+    if Profiler is not None:
+        profiler = Profiler(async_mode='disabled')
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            profile.tree = profiler.output_text(unicode=True, color=False)
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(40)
+        profile.tree = output.getvalue()
+
+
+class RequestProfilingMiddleware:
+    """
+    Профилирует выбранные запросы (см. описание модуля).
+    Поддерживает синхронный (WSGI) и асинхронный (ASGI) режимы.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_hooks()
+
+    def _should_profile(self, request):
+        header = request.headers.get('X-Profile')
+        if header:
+            token = settings.REQUEST_PROFILING_TOKEN
+            if (token and header == token) or (not token and settings.DEBUG):
+                return True
+        rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    @contextmanager
+    def _profiling(self, request):
+        with_tree = request.headers.get('X-Profile-Tree') == '1'
+        profile = RequestProfile(request, with_tree=with_tree)
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(_query_recorder(profile)))
+                if with_tree:
+                    stack.enter_context(_call_tree(profile))
+                yield profile
+        finally:
+            profile.total_ms = (time.perf_counter() - started) * 1000
+            _current.reset(token)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._should_profile(request):
+            return self.get_response(request)
+        with self._profiling(request) as profile:
+            response = self.get_response(request)
+        return self._finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if not self._should_profile(request):
+            return await self.get_response(request)
+        with self._profiling(request) as profile:
+            response = await self.get_response(request)
+        # Определение пользователя может потребовать запроса к базе
+        return await sync_to_async(self._finish)(request, response, profile)
+
+    def _finish(self, request, response, profile):
+        profile.status = response.status_code
+        # Для JWT пользователь известен только запросу DRF, который доступен из ответа
+        renderer_context = getattr(response, 'renderer_context', None) or {}
+        user = getattr(renderer_context.get('request'), 'user', None) or getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            profile.user = user.username
+
+        get_buffer().append(profile)
+        response['Server-Timing'] = profile.server_timing()
+        response['X-Profile-Id'] = str(profile.id)
+        response['Access-Control-Expose-Headers'] = ', '.join(filter(None, [
+            response.get('Access-Control-Expose-Headers'), 'Server-Timing', 'X-Profile-Id',
+        ]))
+        return response
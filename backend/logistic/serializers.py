@@ -2,11 +2,48 @@ from rest_framework import serializers
 from .models import (
     UserProfile, Company, Shipment, Request, 
     RequestFile, ShipmentFolder, ShipmentFile, 
-    Article, Finance, ShipmentCalculation, ShipmentStatus, RequestStatus
+    Article, Finance, ShipmentCalculation, ShipmentStatus, RequestStatus, ImportJob, StatusTransition
 )
 from django.contrib.auth.models import User
 from drf_spectacular.utils import extend_schema_field
 from drf_spectacular.types import OpenApiTypes
+from django.urls import reverse
+from django.conf import settings
+import os
+from .imports import IMPORT_FORMATS
+
+
+def get_thumbnail_url(file_obj, url_name, parent_id):
+    """
+    Возвращает ссылку на миниатюру файла или None, если миниатюры нет.
+    Содержимое файла не меняется, поэтому ссылка постоянна и может кешироваться.
+    """
+    blob = file_obj.blob if file_obj.blob_id else None
+    if blob is None or blob.preview_status != blob.PREVIEW_READY:
+        return None
+    return reverse(url_name, kwargs={'pk': parent_id, 'file_id': file_obj.id})
+
+
+def get_download_size(file_obj):
+    """
+    Размер файла, который отдается при скачивании по умолчанию:
+    веб-версии изображения, если она есть, иначе оригинала.
+    None для старых файлов без блоба.
+    """
+    blob = file_obj.blob if file_obj.blob_id else None
+    if blob is None:
+        return None
+    return blob.rendition_size if blob.rendition_size is not None else blob.size
+
+
+def get_original_size(file_obj):
+    """Размер оригинала или None для старых файлов без блоба."""
+    return file_obj.blob.size if file_obj.blob_id else None
+
+
+def has_rendition(file_obj):
+    """Есть ли у файла веб-версия (оригинал скачивается с ?original=1)."""
+    return bool(file_obj.blob_id) and file_obj.blob.rendition_size is not None
 
 
 class UserProfileUserSerializer(serializers.ModelSerializer):
@@ -50,12 +87,35 @@ class RequestFileSerializer(serializers.ModelSerializer):
     Включает дополнительное поле для отображения имени загрузившего пользователя.
     """
     uploaded_by_name = serializers.CharField(source='uploaded_by.name', read_only=True)
+    thumbnail_url = serializers.SerializerMethodField()
+    size = serializers.SerializerMethodField()
+    original_size = serializers.SerializerMethodField()
+    has_rendition = serializers.SerializerMethodField()
     
     class Meta:
         model = RequestFile
-        fields = ['id', 'file', 'uploaded_by', 'uploaded_by_name', 'uploaded_at']
+        fields = [
+            'id', 'file', 'uploaded_by', 'uploaded_by_name', 'uploaded_at', 'thumbnail_url',
+            'size', 'original_size', 'has_rendition',
+        ]
         read_only_fields = ['uploaded_at']
 
+    @extend_schema_field(OpenApiTypes.STR)
+    def get_thumbnail_url(self, obj):
+        return get_thumbnail_url(obj, 'request-file-thumbnail', obj.request_id)
+
+    @extend_schema_field(OpenApiTypes.INT)
+    def get_size(self, obj):
+        return get_download_size(obj)
+
+    @extend_schema_field(OpenApiTypes.INT)
+    def get_original_size(self, obj):
+        return get_original_size(obj)
+
+    @extend_schema_field(OpenApiTypes.BOOL)
+    def get_has_rendition(self, obj):
+        return has_rendition(obj)
+
 
 class ShipmentFolderSerializer(serializers.ModelSerializer):
     """
@@ -74,12 +134,29 @@ class ShipmentFolderSerializer(serializers.ModelSerializer):
     def get_files(self, obj):
         """
         Метод для получения всех файлов, находящихся в данной папке.
+        Если файлы папок подгружены представлением, запрос не выполняется.
         """
-        files = obj.files.all()
+        if 'files' in getattr(obj, '_prefetched_objects_cache', {}):
+            files = obj.files.all()
+        else:
+            files = obj.files.select_related('blob', 'uploaded_by')
         from .serializers import ShipmentFileSerializer  # Импорт здесь для избежания циклических зависимостей
         return ShipmentFileSerializer(files, many=True).data
 
 
+class ShipmentFolderTreeSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор папки для дерева файлов отправки.
+    Файлы папки добавляются представлением, поэтому запросов по папкам нет.
+    """
+    created_by_name = serializers.CharField(source='created_by.name', read_only=True)
+
+    class Meta:
+        model = ShipmentFolder
+        fields = ['id', 'name', 'created_by', 'created_by_name', 'created_at']
+        read_only_fields = fields
+
+
 class ShipmentFileSerializer(serializers.ModelSerializer):
     """
     Сериализатор для файлов отправок.
@@ -87,12 +164,35 @@ class ShipmentFileSerializer(serializers.ModelSerializer):
     """
     folder_name = serializers.CharField(source='folder.name', read_only=True)
     uploaded_by_name = serializers.CharField(source='uploaded_by.name', read_only=True)
+    thumbnail_url = serializers.SerializerMethodField()
+    size = serializers.SerializerMethodField()
+    original_size = serializers.SerializerMethodField()
+    has_rendition = serializers.SerializerMethodField()
     
     class Meta:
         model = ShipmentFile
-        fields = ['id', 'file', 'folder', 'folder_name', 'uploaded_by', 'uploaded_by_name', 'uploaded_at']
+        fields = [
+            'id', 'file', 'folder', 'folder_name', 'uploaded_by', 'uploaded_by_name', 'uploaded_at', 'thumbnail_url',
+            'size', 'original_size', 'has_rendition',
+        ]
         read_only_fields = ['uploaded_at']
 
+    @extend_schema_field(OpenApiTypes.STR)
+    def get_thumbnail_url(self, obj):
+        return get_thumbnail_url(obj, 'shipment-file-thumbnail', obj.shipment_id)
+
+    @extend_schema_field(OpenApiTypes.INT)
+    def get_size(self, obj):
+        return get_download_size(obj)
+
+    @extend_schema_field(OpenApiTypes.INT)
+    def get_original_size(self, obj):
+        return get_original_size(obj)
+
+    @extend_schema_field(OpenApiTypes.BOOL)
+    def get_has_rendition(self, obj):
+        return has_rendition(obj)
+
 
 class ArticleSerializer(serializers.ModelSerializer):
     """
@@ -153,10 +253,26 @@ class RequestDetailSerializer(RequestListSerializer):
 
 
 class ShipmentStatusSerializer(serializers.ModelSerializer):
+    request_status_code = serializers.CharField(source='request_status.code', read_only=True, default=None)
+
     class Meta:
         model = ShipmentStatus
-        fields = ['id', 'code', 'name', 'is_default', 'is_final', 'order']
+        fields = ['id', 'code', 'name', 'is_default', 'is_final', 'order', 'request_status', 'request_status_code']
         read_only_fields = ['created_at']
+        extra_kwargs = {
+            'request_status': {'help_text': 'Статус, в который переводятся заявки отправки при переходе в этот статус'},
+        }
+
+    def validate_request_status(self, value):
+        """Каскадный переход возможен только в статус заявок своей компании."""
+        if value is None:
+            return value
+        request = self.context.get('request')
+        profile = getattr(getattr(request, 'user', None), 'userprofile', None)
+        company_id = self.instance.company_id if self.instance is not None else getattr(profile, 'company_id', None)
+        if value.company_id != company_id:
+            raise serializers.ValidationError('Статус заявок другой компании')
+        return value
 
 
 class ShipmentListSerializer(serializers.ModelSerializer):
@@ -183,7 +299,10 @@ class ShipmentListSerializer(serializers.ModelSerializer):
     def get_requests_count(self, obj: Shipment) -> int:
         """
         Вычисляет количество заявок, связанных с отправкой.
+        Использует аннотацию requests_count из представления, если она есть.
         """
+        if hasattr(obj, 'requests_count'):
+            return obj.requests_count
         return obj.request_set.count()
 
 
@@ -242,6 +361,55 @@ class FinanceDetailSerializer(FinanceListSerializer):
         fields = FinanceListSerializer.Meta.fields + ['comment', 'basis', 'basis_number']
 
 
+class ImportJobSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор задания импорта.
+    При создании принимает файл CSV или XLSX (поле file).
+    """
+    file = serializers.FileField(write_only=True, help_text="Файл CSV или XLSX")
+    kind_display = serializers.CharField(source='get_kind_display', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    created_by_name = serializers.CharField(source='created_by.name', read_only=True)
+    progress = serializers.SerializerMethodField(help_text="Процент обработанных строк")
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'kind', 'kind_display', 'status', 'status_display', 'dry_run', 'file',
+            'file_name', 'total_rows', 'processed_rows', 'imported_rows', 'error_rows',
+            'progress', 'message', 'created_by', 'created_by_name', 'created_at',
+            'started_at', 'finished_at'
+        ]
+        read_only_fields = [
+            'status', 'file_name', 'total_rows', 'processed_rows', 'imported_rows',
+            'error_rows', 'message', 'created_by', 'created_at', 'started_at', 'finished_at'
+        ]
+
+    @extend_schema_field(OpenApiTypes.INT)
+    def get_progress(self, obj):
+        if obj.status == ImportJob.STATUS_COMPLETED:
+            return 100
+        if not obj.total_rows:
+            return 0
+        return min(100, obj.processed_rows * 100 // obj.total_rows)
+
+    def validate_file(self, value):
+        if os.path.splitext(value.name)[1].lower() not in IMPORT_FORMATS:
+            raise serializers.ValidationError(f"Допустимые форматы: {', '.join(IMPORT_FORMATS)}")
+        if value.size > settings.IMPORT_MAX_FILE_SIZE:
+            raise serializers.ValidationError("Файл слишком большой")
+        return value
+
+
+class ImportJobDetailSerializer(ImportJobSerializer):
+    """
+    Задание импорта с ошибками строк (не больше IMPORT_MAX_ERRORS).
+    """
+    class Meta(ImportJobSerializer.Meta):
+        fields = ImportJobSerializer.Meta.fields + ['errors']
+        read_only_fields = ImportJobSerializer.Meta.read_only_fields + ['errors']
+
+
 class RequestStatusSerializer(serializers.ModelSerializer):
     """
     Сериализатор для статусов заявок.
@@ -267,16 +435,57 @@ class RequestSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
 
+class StatusTransitionSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор записи журнала смены статусов.
+    """
+    entity_display = serializers.CharField(source='get_entity_display', read_only=True)
+    changed_by_name = serializers.CharField(source='changed_by.name', read_only=True, default=None)
+
+    class Meta:
+        model = StatusTransition
+        fields = [
+            'id', 'entity', 'entity_display', 'object_id', 'from_status', 'to_status', 'at',
+            'duration_seconds', 'changed_by', 'changed_by_name'
+        ]
+        read_only_fields = fields
+
+
+class StatusAnalyticsItemSerializer(serializers.Serializer):
+    code = serializers.CharField()
+    name = serializers.CharField()
+    entered = serializers.IntegerField(help_text="Поступлений в статус за период")
+    left = serializers.IntegerField(help_text="Выходов из статуса за период")
+    avg_seconds = serializers.IntegerField(allow_null=True, help_text="Среднее время в статусе")
+    max_seconds = serializers.IntegerField(allow_null=True)
+    p50_seconds = serializers.IntegerField(allow_null=True)
+    p90_seconds = serializers.IntegerField(allow_null=True)
+    p95_seconds = serializers.IntegerField(allow_null=True)
+
+
+class StatusAnalyticsSerializer(serializers.Serializer):
+    """
+    Время в статусах (SLA) и пропускная способность по журналу смены статусов.
+    Время - по выходам из статуса за период, в секундах.
+    """
+    entity = serializers.CharField()
+    date_from = serializers.DateField(allow_null=True)
+    date_to = serializers.DateField(allow_null=True)
+    statuses = StatusAnalyticsItemSerializer(many=True)
+
+
 class AnalyticsSummarySerializer(serializers.Serializer):
     total_shipments = serializers.IntegerField()
     total_requests = serializers.IntegerField()
-    total_revenue = serializers.DecimalField(max_digits=10, decimal_places=2)
-    total_expenses = serializers.DecimalField(max_digits=10, decimal_places=2)
-    total_profit = serializers.DecimalField(max_digits=10, decimal_places=2)
+    currency = serializers.CharField(help_text="Валюта пересчета итогов")
+    total_revenue = serializers.DecimalField(max_digits=20, decimal_places=2)
+    total_expenses = serializers.DecimalField(max_digits=20, decimal_places=2)
+    total_profit = serializers.DecimalField(max_digits=20, decimal_places=2)
+    unconverted_operations = serializers.IntegerField(help_text="Операции без курса на дату оплаты, не вошедшие в итоги")
     shipments_by_status = serializers.DictField(child=serializers.IntegerField())
     requests_by_status = serializers.DictField(child=serializers.IntegerField())
-    revenue_by_currency = serializers.DictField(child=serializers.DecimalField(max_digits=10, decimal_places=2))
-    expenses_by_currency = serializers.DictField(child=serializers.DecimalField(max_digits=10, decimal_places=2))
+    revenue_by_currency = serializers.DictField(child=serializers.DecimalField(max_digits=20, decimal_places=2))
+    expenses_by_currency = serializers.DictField(child=serializers.DecimalField(max_digits=20, decimal_places=2))
 
 
 class BalanceSerializer(serializers.Serializer):
@@ -295,6 +504,11 @@ class BalanceSerializer(serializers.Serializer):
         child=serializers.FloatField(),
         help_text="Баланс по валютам"
     )
+    currency = serializers.CharField(help_text="Валюта пересчета итогов")
+    total_income = serializers.FloatField(help_text="Доходы в валюте пересчета")
+    total_expenses = serializers.FloatField(help_text="Расходы в валюте пересчета")
+    total_balance = serializers.FloatField(help_text="Баланс в валюте пересчета")
+    unconverted_operations = serializers.IntegerField(help_text="Операции без курса на дату оплаты")
 
 
 class CounterpartyBalanceSerializer(serializers.Serializer):
@@ -307,6 +521,9 @@ class CounterpartyBalanceSerializer(serializers.Serializer):
         child=serializers.FloatField(),
         help_text="Балансы по валютам"
     )
+    currency = serializers.CharField(help_text="Валюта пересчета итогов")
+    total_balance = serializers.FloatField(help_text="Баланс в валюте пересчета")
+    unconverted_operations = serializers.IntegerField(help_text="Операции без курса на дату оплаты")
 
 
 class EmailSerializer(serializers.Serializer):
@@ -328,4 +545,26 @@ class EmailSerializer(serializers.Serializer):
             'subject': instance.get('subject', 'Уведомление от логистической компании'),
             'message_plain': instance.get('message_plain', ''),
             'message_html': instance.get('message_html', '')
-        }
\ No newline at end of file
+        }
+
+class BatchItemSerializer(serializers.Serializer):
+    """
+    Подзапрос пакета.
+    """
+    id = serializers.CharField(help_text="Идентификатор подзапроса (по умолчанию - номер в пакете)", required=False, max_length=100)
+    path = serializers.CharField(help_text="Путь GET-запроса API со строкой запроса, например shipments/5/?page=2", max_length=2000)
+
+
+class BatchSerializer(serializers.Serializer):
+    """
+    Сериализатор пакета GET-запросов.
+    """
+    requests = BatchItemSerializer(many=True, allow_empty=False, help_text="Подзапросы")
+    parallel = serializers.BooleanField(help_text="Выполнять подзапросы параллельно", required=False, default=False)
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(f"В пакете не больше {settings.BATCH_MAX_REQUESTS} подзапросов")
+        for index, item in enumerate(value):
+            item.setdefault('id', str(index))
+        return value
@@ -0,0 +1,88 @@
+"""
+Обработчики сигналов моделей приложения.
+Подключаются в LogisticConfig.ready().
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_principals
+from .blobstore import release_blob
+from .bootstrap import bump_company_version
+from .file_tree import bump_file_tree_version
+from .models import (
+    Article, Company, RequestFile, RequestStatus, ShipmentFile, ShipmentFolder, ShipmentStatus, UserProfile,
+)
+
+
+@receiver(post_delete, sender=RequestFile)
+@receiver(post_delete, sender=ShipmentFile)
+def release_file_blob(sender, instance, **kwargs):
+    """
+    При удалении записи файла освобождает ссылку на его содержимое.
+    Срабатывает и при каскадном удалении заявок, отправок и папок.
+    """
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+
+
+@receiver(post_save, sender=ShipmentFile)
+@receiver(post_delete, sender=ShipmentFile)
+@receiver(post_save, sender=ShipmentFolder)
+@receiver(post_delete, sender=ShipmentFolder)
+def bump_shipment_file_tree(sender, instance, **kwargs):
+    """Файлы или папки отправки изменились - ETag дерева файлов устарел."""
+    bump_file_tree_version([instance.shipment_id])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_principal(sender, instance, **kwargs):
+    """
+    Сбрасывает кеш данных аутентификации пользователя после фиксации
+    транзакции, чтобы параллельный запрос не закешировал старые данные заново.
+    """
+    transaction.on_commit(lambda: invalidate_principals([instance.pk]))
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_principal(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_principals([instance.user_id]))
+
+
+@receiver(post_save, sender=Company)
+def invalidate_company_principals(sender, instance, **kwargs):
+    user_ids = list(UserProfile.objects.filter(company=instance).values_list('user_id', flat=True))
+    transaction.on_commit(lambda: invalidate_principals(user_ids))
+
+
+@receiver(post_save, sender=RequestStatus)
+@receiver(post_delete, sender=RequestStatus)
+@receiver(post_save, sender=ShipmentStatus)
+@receiver(post_delete, sender=ShipmentStatus)
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def bump_dictionaries_version(sender, instance, **kwargs):
+    """Справочники компании изменились - кеш стартовых данных устарел."""
+    bump_company_version(instance.company_id)
+
+
+@receiver(post_save, sender=Company)
+def bump_company_dictionaries_version(sender, instance, **kwargs):
+    bump_company_version(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def bump_user_company_version(sender, instance, update_fields=None, **kwargs):
+    """
+    Имя и email пользователя входят в списки клиентов и менеджеров.
+    Обновление только даты входа (при каждом логине) версию не меняет.
+    """
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    company_id = UserProfile.objects.filter(user_id=instance.pk).values_list('company_id', flat=True).first()
+    bump_company_version(company_id)
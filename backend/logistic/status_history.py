@@ -0,0 +1,223 @@
+"""
+Журнал смены статусов отправок и заявок и аналитика времени в статусах.
+
+Каждая смена статуса добавляет запись StatusTransition в той же
+транзакции, что и сохранение объекта. Время, проведенное в предыдущем
+статусе, вычисляется при записи по полю status_changed_at объекта и
+хранится в duration_seconds, поэтому аналитика не восстанавливает
+интервалы по истории каждого объекта.
+
+Массовые смены статуса (импорт, каскады) записываются одним bulk_create.
+Каскадные переходы: статус отправки может задавать статус ее заявок
+(ShipmentStatus.request_status). При переводе отправки в такой статус
+ее заявки переводятся одним UPDATE по shipment_id, а их переходы
+вставляются одним bulk_create - число запросов не зависит от количества
+заявок. Заявки в финальных статусах не меняются.
+
+Аналитика:
+- time_in_status - время в статусе по выходам из него: количество,
+  среднее, максимум и перцентили (PERCENTILES). Перцентили считаются в
+  базе оконной функцией CUME_DIST в одном запросе;
+- throughput - количество поступлений в каждый статус и выходов из него.
+"""
+from django.db import connections, transaction
+from django.db.models import Count, F, Window
+from django.db.models.functions import CumeDist
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Request, RequestStatus, Shipment, StatusTransition
+
+# Перцентили времени в статусе для SLA
+PERCENTILES = (50, 90, 95)
+
+
+def entity_of(instance):
+    """Тип объекта журнала для отправки или заявки."""
+    if isinstance(instance, Shipment):
+        return StatusTransition.ENTITY_SHIPMENT
+    if isinstance(instance, Request):
+        return StatusTransition.ENTITY_REQUEST
+    raise TypeError(f'Журнал статусов не ведется для {type(instance).__name__}')
+
+
+def _changed_by(user):
+    """Профиль пользователя, сменившего статус, или None (фоновые задачи, пользователь без профиля)."""
+    if user is None or not user.is_authenticated:
+        return None
+    return getattr(user, 'userprofile', None)
+
+
+def _transition(entity, company_id, object_id, status_changed_at, from_status, to_status, profile, at):
+    duration = None
+    if from_status and status_changed_at is not None:
+        duration = max(0, int((at - status_changed_at).total_seconds()))
+    return StatusTransition(
+        company_id=company_id,
+        entity=entity,
+        object_id=object_id,
+        from_status=from_status,
+        to_status=to_status,
+        at=at,
+        duration_seconds=duration,
+        changed_by=profile,
+    )
+
+
+def _instance_transition(instance, from_status, to_status, profile, at):
+    return _transition(
+        entity_of(instance), instance.company_id, instance.pk, instance.status_changed_at,
+        from_status, to_status, profile, at,
+    )
+
+
+def initial_transitions(instances, user=None, status_codes=None):
+    """
+    Записи о начальном статусе сохраненных объектов.
+    status_codes - коды статусов по id, чтобы не загружать статус каждого объекта.
+    Время перехода - status_changed_at объекта (или текущее время).
+    """
+    profile = _changed_by(user)
+    now = timezone.now()
+    transitions = []
+    for instance in instances:
+        to_status = status_codes[instance.status_id] if status_codes is not None else instance.status.code
+        transitions.append(_instance_transition(instance, '', to_status, profile, instance.status_changed_at or now))
+    return transitions
+
+
+def change_status(instance, new_status, user=None, at=None):
+    """
+    Устанавливает объекту новый статус и status_changed_at и возвращает
+    несохраненную запись перехода или None, если статус не изменился.
+    Объект и запись сохраняет вызывающий код в одной транзакции.
+    """
+    if new_status is None or new_status.pk == instance.status_id:
+        return None
+    at = at or timezone.now()
+    transition = _instance_transition(instance, instance.status.code, new_status.code, _changed_by(user), at)
+    instance.status = new_status
+    instance.status_changed_at = at
+    return transition
+
+
+def record_transitions(transitions):
+    """Сохраняет записи переходов одним запросом. None в списке пропускаются."""
+    transitions = [transition for transition in transitions if transition is not None]
+    if transitions:
+        StatusTransition.objects.bulk_create(transitions, batch_size=1000)
+    return transitions
+
+
+def bulk_change_status(queryset, new_status, user=None):
+    """
+    Переводит объекты выборки (отправки или заявки) в new_status.
+    Выполняется тремя запросами независимо от размера выборки: чтение
+    текущих статусов с блокировкой строк, один UPDATE и вставка переходов
+    bulk_create. Возвращает количество объектов, статус которых изменился.
+    """
+    entity = entity_of(queryset.model())
+    profile = _changed_by(user)
+    at = timezone.now()
+    queryset = queryset.exclude(status=new_status).order_by()
+    with transaction.atomic():
+        rows = list(queryset.select_for_update(of=('self',)).values_list(
+            'pk', 'company_id', 'status_changed_at', 'status__code'
+        ))
+        if not rows:
+            return 0
+        values = {'status': new_status, 'status_changed_at': at}
+        # UPDATE не заполняет поля auto_now, дата изменения ставится явно
+        if any(field.name == 'updated_at' for field in queryset.model._meta.concrete_fields):
+            values['updated_at'] = at
+        queryset.filter(pk__in=[row[0] for row in rows]).update(**values)
+        record_transitions([
+            _transition(entity, company_id, pk, changed_at, code, new_status.code, profile, at)
+            for pk, company_id, changed_at, code in rows
+        ])
+    return len(rows)
+
+
+def cascade_shipment_status(shipment, user=None):
+    """
+    Применяет каскадный переход статуса отправки к ее заявкам
+    (ShipmentStatus.request_status). Вызывается после смены статуса
+    отправки в той же транзакции. Возвращает количество измененных заявок.
+    """
+    target_id = shipment.status.request_status_id
+    if target_id is None:
+        return 0
+    target = RequestStatus.objects.get(pk=target_id)
+    requests = Request.objects.filter(shipment_id=shipment.pk, status__is_final=False)
+    return bulk_change_status(requests, target, user)
+
+
+class StatusHistoryMixin:
+    """
+    Примесь для ViewSet отправок и заявок: смена статуса через обновление
+    объекта записывается в журнал в той же транзакции.
+    """
+
+    def perform_update(self, serializer):
+        new_status = serializer.validated_data.get('status')
+        if new_status is not None and new_status.company_id != serializer.instance.company_id:
+            raise ValidationError({'status': 'Статус другой компании'})
+        with transaction.atomic():
+            transition = change_status(serializer.instance, new_status, self.request.user)
+            instance = serializer.save()
+            record_transitions([transition])
+            if transition is not None and isinstance(instance, Shipment):
+                cascade_shipment_status(instance, self.request.user)
+
+
+def time_in_status(queryset):
+    """
+    Время в статусах по записям журнала queryset (уже отфильтрованным по
+    компании, типу объекта и периоду).
+
+    Returns:
+        dict: код статуса -> {'count', 'avg_seconds', 'max_seconds', 'p50_seconds', ...}
+    """
+    ranked = queryset.exclude(from_status='').filter(duration_seconds__isnull=False).annotate(
+        cume=Window(CumeDist(), partition_by=[F('from_status')], order_by=F('duration_seconds').asc())
+    ).order_by().values('from_status', 'duration_seconds', 'cume')
+    inner_sql, params = ranked.query.sql_with_params()
+
+    connection = connections[queryset.db]
+    quote = connection.ops.quote_name
+    status, duration, cume = quote('from_status'), quote('duration_seconds'), quote('cume')
+    # Перцентиль p - наименьшее время, для которого доля значений не больше него >= p.
+    # ORM не умеет агрегировать по оконной функции, поэтому группировка - во внешнем запросе
+    percentiles = ''.join(
+        f', MIN(CASE WHEN {cume} >= %s THEN {duration} END)' for _ in PERCENTILES
+    )
+    sql = (
+        f'SELECT {status}, COUNT(*), AVG({duration}), MAX({duration}){percentiles} '
+        f'FROM ({inner_sql}) ranked GROUP BY {status}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [p / 100 for p in PERCENTILES] + list(params))
+        rows = cursor.fetchall()
+
+    result = {}
+    for code, count, avg, max_seconds, *values in rows:
+        item = {'count': count, 'avg_seconds': round(float(avg)), 'max_seconds': max_seconds}
+        for percentile, value in zip(PERCENTILES, values):
+            item[f'p{percentile}_seconds'] = value
+        result[code] = item
+    return result
+
+
+def throughput(queryset):
+    """
+    Поступления в статусы и выходы из них по записям журнала queryset.
+
+    Returns:
+        dict: код статуса -> {'entered', 'left'}
+    """
+    result = {}
+    for row in queryset.order_by().values('to_status').annotate(count=Count('id')):
+        result.setdefault(row['to_status'], {'entered': 0, 'left': 0})['entered'] = row['count']
+    for row in queryset.exclude(from_status='').order_by().values('from_status').annotate(count=Count('id')):
+        result.setdefault(row['from_status'], {'entered': 0, 'left': 0})['left'] = row['count']
+    return result
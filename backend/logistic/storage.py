@@ -0,0 +1,520 @@
+"""
+Хранилища файлов заявок и отправок.
+
+Весь ввод-вывод вложений выполняется через интерфейс AttachmentStorage.
+Имена файлов в хранилище - относительные пути вида
+'logistic/blobs/ab/cd/<sha256>' или 'logistic/requests/<id>/<файл>'.
+
+Реализации:
+- LocalStorage - файлы в одной директории (по умолчанию MEDIA_ROOT);
+- ShardedStorage - файлы распределяются по нескольким директориям (томам)
+  по хешу имени, внутри тома используются подкаталоги из префикса хеша;
+- S3Storage - S3-совместимое объектное хранилище (AWS S3, MinIO и т.п.),
+  требует установленного пакета boto3.
+
+Хранилище выбирается настройкой ATTACHMENT_STORAGE.
+"""
+import contextlib
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+# Соль для подписи ссылок на прямое скачивание
+SIGNED_URL_SALT = 'logistic.storage.download'
+
+# Размер блока при потоковом копировании
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Суффикс временных файлов, в которые идет запись до переименования
+PARTIAL_SUFFIX = '.part'
+
+# Маска прав процесса: mkstemp создает файлы с правами 0600, а сохраненные
+# файлы должны получать те же права, что и при обычном open()
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class AttachmentStorage:
+    """
+    Базовый интерфейс хранилища вложений.
+    """
+
+    def open(self, name):
+        """Открывает файл для потокового чтения (бинарный режим)."""
+        raise NotImplementedError
+
+    def save(self, name, chunks):
+        """
+        Потоково записывает файл из итератора блоков байтов.
+
+        Returns:
+            int: Размер записанного файла
+        """
+        raise NotImplementedError
+
+    def save_local_file(self, name, local_path, keep_source=False):
+        """
+        Помещает в хранилище локальный файл.
+        Если keep_source=False, исходный файл после этого удаляется
+        (реализации по возможности просто переименовывают его).
+        """
+        with open(local_path, 'rb') as source:
+            self.save(name, iter(lambda: source.read(COPY_CHUNK_SIZE), b''))
+        if not keep_source:
+            os.remove(local_path)
+
+    def copy(self, source_name, target_name):
+        """Копирует файл внутри хранилища."""
+        with self.open(source_name) as source:
+            self.save(target_name, iter(lambda: source.read(COPY_CHUNK_SIZE), b''))
+
+    def exists(self, name):
+        raise NotImplementedError
+
+    def size(self, name):
+        raise NotImplementedError
+
+    def modified_time(self, name):
+        """Время последнего изменения файла (aware datetime в UTC)."""
+        raise NotImplementedError
+
+    def delete(self, name):
+        """Удаляет файл. Отсутствие файла ошибкой не считается."""
+        raise NotImplementedError
+
+    def delete_tree(self, prefix):
+        """Удаляет все файлы с именами, начинающимися с prefix/."""
+        raise NotImplementedError
+
+    def walk(self, prefix):
+        """Возвращает имена всех файлов с именами, начинающимися с prefix/."""
+        raise NotImplementedError
+
+    def path(self, name):
+        """
+        Возвращает локальный путь к файлу.
+        Для хранилищ без локальной файловой системы вызывает NotImplementedError.
+        """
+        raise NotImplementedError('Хранилище не поддерживает локальные пути')
+
+    def temp_dir(self):
+        """
+        Директория для временных файлов загрузок.
+        Для локальных хранилищ она находится на том же томе, что и файлы,
+        чтобы итоговое размещение было переименованием, а не копированием.
+        """
+        path = getattr(settings, 'FILE_UPLOAD_TEMP_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def url(self, name, filename=None, expires=None):
+        """
+        Возвращает ссылку для прямого скачивания файла без авторизации,
+        действующую ограниченное время.
+        """
+        raise NotImplementedError
+
+
+class _FilesystemMixin:
+    """
+    Общая логика хранилищ на локальной файловой системе.
+    """
+
+    def _path(self, name):
+        raise NotImplementedError
+
+    def path(self, name):
+        return self._path(name)
+
+    def open(self, name):
+        return open(self._path(name), 'rb')
+
+    def save(self, name, chunks):
+        full_path = self._path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Пишем во временный файл рядом с итоговым и переименовываем: читатели
+        # не видят недописанный файл, а сбой записи не портит прежнюю версию
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(full_path), prefix=f'.{os.path.basename(full_path)}.', suffix=PARTIAL_SUFFIX
+        )
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as destination:
+                for chunk in chunks:
+                    destination.write(chunk)
+                    size += len(chunk)
+            os.chmod(temp_path, 0o666 & ~_UMASK)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+            raise
+        return size
+
+    def save_local_file(self, name, local_path, keep_source=False):
+        full_path = self._path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if not keep_source:
+            # Переименование в пределах тома, между томами - копирование
+            shutil.move(local_path, full_path)
+            return
+        try:
+            os.link(local_path, full_path)
+        except OSError:
+            shutil.copyfile(local_path, full_path)
+
+    def copy(self, source_name, target_name):
+        self.save_local_file(target_name, self._path(source_name), keep_source=True)
+
+    def exists(self, name):
+        return os.path.exists(self._path(name))
+
+    def size(self, name):
+        return os.path.getsize(self._path(name))
+
+    def modified_time(self, name):
+        return datetime.fromtimestamp(os.path.getmtime(self._path(name)), tz=dt_timezone.utc)
+
+    def delete(self, name):
+        full_path = self._path(name)
+        if os.path.lexists(full_path) and not os.path.isdir(full_path):
+            os.remove(full_path)
+
+    def url(self, name, filename=None, expires=None):
+        expires_at = int(time.time()) + (expires or settings.ATTACHMENT_URL_EXPIRES)
+        token = signing.dumps({'n': name, 'f': filename, 'e': expires_at}, salt=SIGNED_URL_SALT, compress=True)
+        return reverse('signed-file-download', kwargs={'token': token})
+
+    @staticmethod
+    def _safe_join(root, name):
+        """
+        Соединяет корень хранилища и имя файла.
+        Имена, выходящие за пределы корня, отклоняются.
+        """
+        root = os.path.realpath(root)
+        full_path = os.path.realpath(os.path.join(root, name))
+        if full_path == root or os.path.commonpath([root, full_path]) != root:
+            raise ValueError(f'Путь {name!r} находится вне хранилища')
+        return full_path
+
+
+class LocalStorage(_FilesystemMixin, AttachmentStorage):
+    """
+    Хранилище в одной локальной директории.
+    Имена файлов совпадают с путями относительно директории.
+    """
+
+    def __init__(self, location=None):
+        self.location = str(location or settings.MEDIA_ROOT)
+
+    def _path(self, name):
+        return self._safe_join(self.location, name)
+
+    def temp_dir(self):
+        path = os.path.join(self.location, 'logistic', 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def delete(self, name):
+        super().delete(name)
+        # Удаляем опустевшие родительские директории (кроме корня хранилища)
+        parent = os.path.dirname(self._path(name))
+        root = os.path.realpath(self.location)
+        while parent != root and os.path.commonpath([root, parent]) == root:
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+    def delete_tree(self, prefix):
+        full_path = self._path(prefix)
+        if os.path.isdir(full_path):
+            shutil.rmtree(full_path)
+        elif os.path.lexists(full_path):
+            os.remove(full_path)
+
+    def walk(self, prefix):
+        base = self._path(prefix)
+        for dirpath, dirnames, filenames in os.walk(base):
+            rel_dirpath = os.path.relpath(dirpath, self.location).replace(os.sep, '/')
+            for filename in filenames:
+                if not _is_partial(filename):
+                    yield f'{rel_dirpath}/{filename}'
+
+
+class ShardedStorage(_FilesystemMixin, AttachmentStorage):
+    """
+    Хранилище, распределяющее файлы по нескольким директориям (томам).
+
+    Том выбирается по хешу имени файла методом наибольшего веса (rendezvous
+    hashing): при добавлении тома переезжает только соответствующая ему доля
+    файлов. Внутри тома файл лежит в подкаталогах из префикса хеша
+    '<h[:2]>/<h[2:4]>/<имя>', чтобы не создавать огромных плоских директорий.
+    """
+
+    def __init__(self, locations):
+        if not locations:
+            raise ImproperlyConfigured('ShardedStorage требует хотя бы одну директорию')
+        self.locations = [str(location) for location in locations]
+
+    @staticmethod
+    def _name_hash(name):
+        return hashlib.sha256(name.encode('utf-8')).hexdigest()
+
+    def _location_for(self, name):
+        return max(
+            self.locations,
+            key=lambda location: hashlib.sha256(f'{location}:{name}'.encode('utf-8')).digest(),
+        )
+
+    def _path(self, name):
+        name_hash = self._name_hash(name)
+        return self._safe_join(
+            self._location_for(name),
+            f'{name_hash[:2]}/{name_hash[2:4]}/{name}',
+        )
+
+    def temp_dir(self):
+        path = os.path.join(self.locations[0], 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _shard_roots(self):
+        """
+        Возвращает существующие директории шардов '<том>/<h[:2]>/<h[2:4]>'.
+        """
+        for location in self.locations:
+            for first in _listdir(location):
+                if len(first) != 2:
+                    continue
+                for second in _listdir(os.path.join(location, first)):
+                    yield os.path.join(location, first, second)
+
+    def _prefix_dirs(self, prefix):
+        """
+        Возвращает пары (корень шарда, директория префикса) для всех шардов,
+        в которых есть файлы с именами, начинающимися с prefix/.
+        Файлы одной директории разнесены по шардам, но внутри шарда лежат
+        под тем же относительным путем, поэтому обходятся только они.
+        """
+        prefix = prefix.strip('/')
+        for shard_root in self._shard_roots():
+            prefix_dir = self._safe_join(shard_root, prefix)
+            if os.path.isdir(prefix_dir):
+                yield shard_root, prefix_dir
+
+    def delete_tree(self, prefix):
+        for shard_root, prefix_dir in list(self._prefix_dirs(prefix)):
+            shutil.rmtree(prefix_dir)
+
+    def walk(self, prefix):
+        for shard_root, prefix_dir in self._prefix_dirs(prefix):
+            for dirpath, dirnames, filenames in os.walk(prefix_dir):
+                rel_dirpath = os.path.relpath(dirpath, shard_root).replace(os.sep, '/')
+                for filename in filenames:
+                    if not _is_partial(filename):
+                        yield f'{rel_dirpath}/{filename}'
+
+
+def _is_partial(filename):
+    """Временный файл записи, которую выполняет _FilesystemMixin.save."""
+    return filename.startswith('.') and filename.endswith(PARTIAL_SUFFIX)
+
+
+def _listdir(path):
+    try:
+        return sorted(os.listdir(path))
+    except FileNotFoundError:
+        return []
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    Файлоподобный объект поверх итератора блоков байтов.
+    Нужен для потоковой передачи данных в boto3 без буферизации всего файла.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        count = min(len(target), len(self._buffer))
+        target[:count] = self._buffer[:count]
+        self._buffer = self._buffer[count:]
+        self.size += count
+        return count
+
+
+class S3Storage(AttachmentStorage):
+    """
+    Хранилище в S3-совместимом объектном хранилище.
+
+    Для локальной разработки и тестов можно указать endpoint_url
+    совместимого сервера (например, MinIO).
+    """
+
+    def __init__(self, bucket, endpoint_url=None, access_key=None, secret_key=None,
+                 region=None, prefix='', url_expires=None):
+        try:
+            import boto3
+        except ImportError as e:
+            raise ImproperlyConfigured('Для S3Storage необходимо установить пакет boto3') from e
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.url_expires = url_expires or settings.ATTACHMENT_URL_EXPIRES
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+            region_name=region or None,
+        )
+
+    def _key(self, name):
+        return f'{self.prefix}/{name}' if self.prefix else name
+
+    def _name(self, key):
+        return key[len(self.prefix) + 1:] if self.prefix else key
+
+    def _is_missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def open(self, name):
+        response = self.client.get_object(Bucket=self.bucket, Key=self._key(name))
+        return response['Body']
+
+    def save(self, name, chunks):
+        reader = _ChunkReader(chunks)
+        self.client.upload_fileobj(io.BufferedReader(reader, COPY_CHUNK_SIZE), self.bucket, self._key(name))
+        return reader.size
+
+    def save_local_file(self, name, local_path, keep_source=False):
+        self.client.upload_file(local_path, self.bucket, self._key(name))
+        if not keep_source:
+            os.remove(local_path)
+
+    def copy(self, source_name, target_name):
+        self.client.copy(
+            {'Bucket': self.bucket, 'Key': self._key(source_name)},
+            self.bucket,
+            self._key(target_name),
+        )
+
+    def _head(self, name):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def size(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['ContentLength']
+
+    def modified_time(self, name):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['LastModified']
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def _iter_keys(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix.rstrip('/') + '/')):
+            for item in page.get('Contents', []):
+                yield item['Key']
+
+    def delete_tree(self, prefix):
+        batch = []
+        for key in self._iter_keys(prefix):
+            batch.append({'Key': key})
+            # delete_objects принимает не более 1000 ключей за запрос
+            if len(batch) == 1000:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': batch})
+                batch = []
+        if batch:
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': batch})
+
+    def walk(self, prefix):
+        for key in self._iter_keys(prefix):
+            yield self._name(key)
+
+    def url(self, name, filename=None, expires=None):
+        params = {'Bucket': self.bucket, 'Key': self._key(name)}
+        if filename:
+            params['ResponseContentDisposition'] = f'attachment; filename="{filename}"'
+        return self.client.generate_presigned_url(
+            'get_object', Params=params, ExpiresIn=expires or self.url_expires
+        )
+
+
+_storage = None
+
+
+def get_storage():
+    """
+    Возвращает хранилище вложений, настроенное в ATTACHMENT_STORAGE.
+    """
+    global _storage
+    if _storage is None:
+        config = getattr(settings, 'ATTACHMENT_STORAGE', None) or {}
+        backend = import_string(config.get('BACKEND', 'logistic.storage.LocalStorage'))
+        _storage = backend(**config.get('OPTIONS', {}))
+    return _storage
+
+
+@receiver(setting_changed)
+def _reset_storage(setting, **kwargs):
+    """Сбрасывает кеш хранилища при изменении настроек (в тестах)."""
+    global _storage
+    if setting in ('ATTACHMENT_STORAGE', 'MEDIA_ROOT'):
+        _storage = None
+
+
+def load_signed_url(token):
+    """
+    Проверяет подпись ссылки на прямое скачивание.
+
+    Returns:
+        tuple: (имя файла в хранилище, имя файла для скачивания)
+
+    Raises:
+        signing.BadSignature: если подпись неверна или срок действия истек
+    """
+    data = signing.loads(token, salt=SIGNED_URL_SALT)
+    if data.get('e', 0) < time.time():
+        raise signing.SignatureExpired('Срок действия ссылки истек')
+    return data['n'], data.get('f')
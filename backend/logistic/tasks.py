@@ -0,0 +1,66 @@
+"""
+Фоновое выполнение задач.
+
+Задачи выполняются в пуле потоков текущего процесса. Каждая задача получает
+собственное соединение с базой данных, которое закрывается после выполнения.
+Если в настройках включен BACKGROUND_TASKS_SYNC (например, в тестах),
+задачи выполняются сразу в текущем потоке.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .nplusone import ignore as ignore_nplusone
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """
+    Возвращает общий пул потоков, создавая его при первом обращении.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BACKGROUND_TASKS_WORKERS', 2),
+                    thread_name_prefix='logistic-bg',
+                )
+    return _executor
+
+
+def _run_task(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Ошибка фоновой задачи %s", getattr(func, '__name__', func))
+    finally:
+        # Соединения с БД привязаны к потоку - закрываем их после задачи
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Запускает функцию в фоновом потоке.
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_SYNC', False):
+        # Запросы задачи не относятся к запросу API, в котором она запущена
+        with ignore_nplusone():
+            func(*args, **kwargs)
+        return
+    _get_executor().submit(_run_task, func, args, kwargs)
+
+
+def run_on_commit(func, *args, **kwargs):
+    """
+    Запускает функцию в фоновом потоке после фиксации текущей транзакции.
+    При откате транзакции задача не запускается.
+    """
+    transaction.on_commit(lambda: run_in_background(func, *args, **kwargs))
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+from .nplusone import install_hooks
+
+
+class NPlusOneTestRunner(DiscoverRunner):
+    """
+    Тестовый раннер, в котором N+1 запросы в любом действии API
+    приводят к исключению NPlusOneError (см. logistic/nplusone.py).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Перехватчики не установлены, если приложение запущено в режиме 'off'
+        install_hooks()
+        self._nplusone_mode = settings.NPLUSONE_MODE
+        settings.NPLUSONE_MODE = 'raise'
+
+    def teardown_test_environment(self, **kwargs):
+        settings.NPLUSONE_MODE = self._nplusone_mode
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,74 @@
+"""
+Общие данные для тестов: компания со статусами по умолчанию и
+пользователи всех ролей.
+"""
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from logistic.models import Company, RequestStatus, ShipmentStatus, UserProfile
+from logistic.views import CompanyViewSet
+
+ROLES = ('admin', 'boss', 'manager', 'warehouse', 'client')
+
+
+def create_company(name):
+    """Компания со статусами отправок и заявок по умолчанию."""
+    company = Company.objects.create(name=name)
+    CompanyViewSet()._create_default_statuses(company)
+    return company
+
+
+def create_profile(company, role, username=None):
+    username = username or f'{role}-{company.pk}'
+    user = User.objects.create_user(username=username, email=f'{username}@example.com', password='password')
+    return UserProfile.objects.create(user=user, company=company, user_group=role, name=username)
+
+
+def client_for(profile):
+    client = APIClient()
+    client.force_authenticate(profile.user)
+    return client
+
+
+class LogisticTestCase(TestCase):
+    """
+    Базовый класс тестов API: компания, профили всех ролей (self.profiles)
+    и статусы по коду (self.shipment_statuses, self.request_statuses).
+    Файлы пишутся во временный MEDIA_ROOT, фоновые задачи выполняются сразу.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media_root = tempfile.mkdtemp()
+        cls._settings = override_settings(
+            MEDIA_ROOT=cls._media_root,
+            BUNDLE_CACHE_DIR=f'{cls._media_root}/bundles',
+            BACKGROUND_TASKS_SYNC=True,
+        )
+        cls._settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._settings.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = create_company('Компания')
+        cls.profiles = {role: create_profile(cls.company, role) for role in ROLES}
+        cls.shipment_statuses = {status.code: status for status in ShipmentStatus.objects.filter(company=cls.company)}
+        cls.request_statuses = {status.code: status for status in RequestStatus.objects.filter(company=cls.company)}
+
+    def setUp(self):
+        # Кеши ответов (bootstrap, принципалы JWT) не должны переходить между тестами
+        cache.clear()
+
+    def client_for(self, role):
+        return client_for(self.profiles[role])
@@ -0,0 +1,86 @@
+"""
+Тесты сводной аналитики и балансов с пересчетом валют по курсам.
+"""
+import datetime
+from decimal import Decimal
+
+from logistic.currency import BalanceTotals
+from logistic.models import CurrencyRate, Finance
+
+from .base import ROLES, LogisticTestCase
+
+TODAY = datetime.date(2026, 3, 10)
+
+
+class FinanceTotalsTestCase(LogisticTestCase):
+    """
+    Операции в рублях, евро и долларах и курсы с шестью знаками после
+    запятой: пересчитанные суммы имеют больше двух знаков.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        CurrencyRate.objects.bulk_create([
+            CurrencyRate(date=TODAY, currency='eur', rate=Decimal('98.123457')),
+            CurrencyRate(date=TODAY, currency='usd', rate=Decimal('89.987651')),
+        ])
+        client = cls.profiles['client'].user
+        for operation_type, currency, amount in [
+            ('in', 'rub', '1000.10'),
+            ('in', 'eur', '333.33'),
+            ('in', 'usd', '10.01'),
+            ('out', 'eur', '12.34'),
+            ('out', 'rubbn', '0.05'),
+        ]:
+            Finance.objects.create(
+                company=cls.company, operation_type=operation_type, payment_date=TODAY,
+                document_type='bill', currency=currency, amount=Decimal(amount), counterparty=client,
+            )
+
+
+class AnalyticsSummaryTests(FinanceTotalsTestCase):
+
+    def test_summary_for_every_role(self):
+        for role in ROLES:
+            with self.subTest(role=role):
+                response = self.client_for(role).get('/api/analytics/summary/')
+                self.assertEqual(response.status_code, 200, response.content)
+
+    def test_totals_rounded_to_kopecks(self):
+        response = self.client_for('boss').get('/api/analytics/summary/')
+        self.assertEqual(response.status_code, 200, response.content)
+        revenue = Decimal('1000.10') + Decimal('333.33') * Decimal('98.123457') + Decimal('10.01') * Decimal('89.987651')
+        expenses = Decimal('12.34') * Decimal('98.123457') + Decimal('0.05')
+        self.assertEqual(Decimal(response.data['total_revenue']), revenue.quantize(Decimal('0.01')))
+        self.assertEqual(Decimal(response.data['total_expenses']), expenses.quantize(Decimal('0.01')))
+        self.assertEqual(Decimal(response.data['total_profit']), (revenue - expenses).quantize(Decimal('0.01')))
+        self.assertEqual(Decimal(response.data['revenue_by_currency']['eur']), Decimal('333.33'))
+
+    def test_summary_in_foreign_currency(self):
+        response = self.client_for('boss').get('/api/analytics/summary/', {'currency': 'usd'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['unconverted_operations'], 0)
+
+    def test_balance_endpoints(self):
+        client = self.client_for('boss')
+        for url in ('/api/finance/balance/', '/api/finance/counterparty-balance/'):
+            with self.subTest(url=url):
+                response = client.get(url, {'currency': 'eur'})
+                self.assertEqual(response.status_code, 200, response.content)
+
+
+class BalanceTotalsTests(LogisticTestCase):
+
+    def test_rounds_half_up(self):
+        totals = BalanceTotals('rub')
+        totals.add({'currency': 'eur', 'operation_type': 'in', 'total': Decimal('1.005'),
+                    'converted': Decimal('40408532.1650000'), 'unconverted': 0})
+        totals.add({'currency': 'eur', 'operation_type': 'out', 'total': Decimal('0.001'),
+                    'converted': Decimal('0.0049'), 'unconverted': 1})
+        self.assertEqual(totals.total_income, Decimal('40408532.17'))
+        self.assertEqual(totals.total_expenses, Decimal('0.00'))
+        self.assertEqual(totals.total_balance, Decimal('40408532.16'))
+        self.assertEqual(totals.income, {'eur': Decimal('1.01')})
+        self.assertEqual(totals.balance, {'eur': Decimal('1.00')})
+        self.assertEqual(totals.unconverted, 1)
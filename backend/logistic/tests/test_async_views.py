@@ -0,0 +1,67 @@
+"""
+Тесты асинхронных эндпоинтов /api/async/ (logistic/async_views.py).
+"""
+from decimal import Decimal
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient
+
+from logistic.authentication import ClaimsTokenObtainPairSerializer
+from logistic.currency import BalanceTotals
+from logistic.models import Shipment, ShipmentFile
+
+from .test_analytics import FinanceTotalsTestCase
+
+
+class JWTAsyncClient(AsyncClient):
+    """Асинхронный тестовый клиент с заголовком Authorization в каждом запросе."""
+
+    def __init__(self, authorization):
+        super().__init__()
+        self.authorization = authorization
+
+    def generic(self, *args, headers=None, **kwargs):
+        return super().generic(*args, headers={'Authorization': self.authorization, **(headers or {})}, **kwargs)
+
+
+class AsyncViewsTests(FinanceTotalsTestCase):
+
+    def jwt_client(self, role):
+        token = ClaimsTokenObtainPairSerializer.get_token(self.profiles[role].user).access_token
+        return JWTAsyncClient(f'Bearer {token}')
+
+    async def test_analytics_summary(self):
+        response = await self.jwt_client('boss').get('/api/async/analytics/summary/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['revenue_by_currency']['eur'], '333.33')
+
+    async def test_balances(self):
+        client = self.jwt_client('boss')
+        for url in ('/api/async/finance/balance/', '/api/async/finance/counterparty-balance/'):
+            with self.subTest(url=url):
+                response = await client.get(url, {'currency': 'usd'})
+                self.assertEqual(response.status_code, 200, response.content)
+
+    async def test_invalid_data_returns_400(self):
+        # Значение, которое сериализатор не принимает, - ответ 400, а не необработанное исключение (500)
+        unrounded = property(lambda totals: Decimal('1.001'))
+        with mock.patch.object(BalanceTotals, 'total_income', unrounded):
+            response = await self.jwt_client('boss').get('/api/async/analytics/summary/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('total_revenue', response.json())
+
+    async def test_unknown_currency(self):
+        response = await self.jwt_client('boss').get('/api/async/finance/balance/', {'currency': 'xyz'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_upload_files(self):
+        shipment = await Shipment.objects.acreate(
+            number='S-1', company=self.company, status=self.shipment_statuses['at_warehouse']
+        )
+        response = await self.jwt_client('manager').post(
+            f'/api/async/shipments/{shipment.pk}/upload-files/',
+            {'files': [SimpleUploadedFile('notes.txt', b'notes')]},
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(await ShipmentFile.objects.filter(shipment=shipment).acount(), 1)
@@ -0,0 +1,156 @@
+"""
+Тесты аутентификации JWT с утверждениями о роли и компании
+(logistic/authentication.py) и сброса кеша данных пользователя (signals.py).
+"""
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from logistic.authentication import ClaimsJWTAuthentication, _cache_key
+from logistic.models import UserProfile
+
+from .base import LogisticTestCase
+
+
+class ClaimsJWTAuthenticationTests(LogisticTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile = self.profiles['manager']
+        self.authentication = ClaimsJWTAuthentication()
+
+    def _obtain(self):
+        response = APIClient().post(
+            '/api/token/', {'username': self.profile.user.username, 'password': 'password'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def _refresh(self, refresh):
+        return APIClient().post('/api/token/refresh/', {'refresh': refresh}, format='json')
+
+    def _get(self, access):
+        return APIClient().get('/api/bootstrap/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def _authenticate(self, access):
+        return self.authentication.get_user(AccessToken(access))
+
+    def _change_role(self, role):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.user_group = role
+            self.profile.save()
+
+    def test_token_contains_claims(self):
+        access = AccessToken(self._obtain()['access'])
+        self.assertEqual(
+            (access['role'], access['company_id'], access['profile_id']),
+            ('manager', self.company.pk, self.profile.pk),
+        )
+        response = self._get(str(access))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['profile']['id'], self.profile.pk)
+
+    def test_principal_is_cached(self):
+        access = self._obtain()['access']
+        with self.assertNumQueries(1):
+            user = self._authenticate(access)
+        with self.assertNumQueries(0):
+            cached = self._authenticate(access)
+            self.assertEqual(cached.userprofile.company, self.company)
+        self.assertEqual((cached.pk, cached.userprofile.pk), (user.pk, self.profile.pk))
+
+    def test_claim_mismatch_is_rejected(self):
+        access = AccessToken(self._obtain()['access'])
+        for claim, value in (('role', 'boss'), ('company_id', self.company.pk + 1), ('profile_id', 0)):
+            with self.subTest(claim=claim):
+                forged = AccessToken(str(access))
+                forged[claim] = value
+                with self.assertRaises(InvalidToken):
+                    self.authentication.get_user(forged)
+
+    def test_role_downgrade_rejects_old_access_token(self):
+        tokens = self._obtain()
+        self.assertEqual(self._get(tokens['access']).status_code, 200)
+        self._change_role('client')
+
+        response = self._get(tokens['access'])
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+
+        # Обновленный токен получает текущую роль, а не роль из refresh-токена
+        response = self._refresh(tokens['refresh'])
+        self.assertEqual(response.status_code, 200, response.content)
+        access = response.json()['access']
+        self.assertEqual(AccessToken(access)['role'], 'client')
+        response = self._get(access)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(response.json()['requestStatuses'])
+
+    def test_signals_invalidate_cache(self):
+        access = self._obtain()['access']
+        key = _cache_key(self.profile.user_id)
+        changes = [
+            lambda: self.profile.user.save(),
+            lambda: self.profile.save(),
+            lambda: self.company.save(),
+        ]
+        for change in changes:
+            self._authenticate(access)
+            self.assertIsNotNone(cache.get(key))
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertIsNone(cache.get(key))
+
+    def test_change_without_signal_applies_after_cache_expires(self):
+        # Изменение в другом процессе с кешем в памяти: запись этого процесса не сброшена
+        access = self._obtain()['access']
+        self._authenticate(access)
+        UserProfile.objects.filter(pk=self.profile.pk).update(user_group='client')
+        self.assertEqual(self._authenticate(access).userprofile.user_group, 'manager')
+
+        expired = time.time() + settings.AUTH_PRINCIPAL_CACHE_SECONDS + 1
+        with mock.patch('django.core.cache.backends.locmem.time', mock.Mock(time=lambda: expired)):
+            with self.assertRaises(InvalidToken):
+                self._authenticate(access)
+
+    def test_inactive_user_is_rejected(self):
+        tokens = self._obtain()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.user.is_active = False
+            self.profile.user.save()
+
+        with self.assertRaises(AuthenticationFailed) as context:
+            self._authenticate(tokens['access'])
+        self.assertEqual(context.exception.get_codes(), 'user_inactive')
+        self.assertEqual(self._get(tokens['access']).status_code, 401)
+        self.assertEqual(self._refresh(tokens['refresh']).status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        access = self._obtain()['access']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.user.delete()
+        with self.assertRaises(AuthenticationFailed) as context:
+            self._authenticate(access)
+        self.assertEqual(context.exception.get_codes(), 'user_not_found')
+
+    def test_legacy_token_without_claims(self):
+        # Токен, выданный до появления утверждений: пользователь читается из базы
+        access = str(AccessToken.for_user(self.profile.user))
+        self.assertNotIn('role', AccessToken(access))
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                user = self._authenticate(access)
+        self.assertEqual(user, self.profile.user)
+        self.assertIsNone(cache.get(_cache_key(self.profile.user_id)))
+
+        response = self._get(access)
+        self.assertEqual(response.status_code, 200, response.content)
+        # После смены роли токен без утверждений по-прежнему принимается
+        self._change_role('client')
+        self.assertEqual(self._get(access).status_code, 200)
@@ -0,0 +1,140 @@
+"""
+Тесты пакетных GET-запросов /api/batch/ (logistic/batch.py).
+"""
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.test import override_settings
+
+from logistic import batch
+from logistic.models import Request, Shipment, ShipmentStatus
+
+from .base import LogisticTestCase, create_company
+
+
+class BatchTests(LogisticTestCase):
+
+    url = '/api/batch/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        status = cls.shipment_statuses['at_warehouse']
+        cls.shipment = Shipment.objects.create(number='S-1', company=cls.company, status=status)
+        cls.request = Request.objects.create(
+            number=1, company=cls.company, status=cls.request_statuses['expected'],
+            client=cls.profiles['client'], shipment=cls.shipment,
+        )
+        cls.foreign_status = ShipmentStatus.objects.get(company=create_company('Другая'), code='at_warehouse')
+
+    def _batch(self, paths, role='manager', parallel=False):
+        response = self.client_for(role).post(self.url, {
+            'requests': [{'path': path} for path in paths], 'parallel': parallel,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_results_match_standalone_requests(self):
+        paths = [
+            f'/api/shipments/{self.shipment.pk}/',
+            f'requests/?shipment={self.shipment.pk}',
+            '/api/shipment-statuses/',
+        ]
+        client = self.client_for('manager')
+        results = self._batch(paths)
+        self.assertEqual([result['id'] for result in results], ['0', '1', '2'])
+        for path, result in zip(paths, results):
+            with self.subTest(path=path):
+                standalone = client.get(path if path.startswith('/') else f'/api/{path}')
+                self.assertEqual(result['status'], standalone.status_code)
+                self.assertEqual(result['body'], standalone.json())
+
+    def test_per_item_statuses(self):
+        results = self._batch([
+            f'/api/shipments/{self.shipment.pk}/',
+            '/api/shipments/0/',
+            '/api/no-such-endpoint/',
+            '/api/requests/?page=100',
+        ])
+        self.assertEqual([result['status'] for result in results], [200, 404, 404, 404])
+        self.assertEqual(results[0]['body']['number'], 'S-1')
+
+    def test_only_api_paths(self):
+        paths = ['/admin/', 'https://example.com/api/shipments/', '//example.com/api/shipments/', '/media/x']
+        for result in self._batch(paths):
+            with self.subTest(path=paths[int(result['id'])]):
+                self.assertEqual(result['status'], 400)
+                self.assertIn('/api/', result['body']['detail'])
+
+    def test_unsupported_endpoints(self):
+        results = self._batch([
+            # Вложенный пакет и асинхронное представление
+            '/api/batch/',
+            '/api/async/analytics/summary/',
+            # Потоковая выгрузка не в JSON
+            '/api/requests/export/',
+            '/api/shipments/export/?file_format=xlsx',
+        ], role='boss')
+        self.assertEqual([result['status'] for result in results], [400, 400, 406, 406])
+        self.assertIn('JSON', results[2]['body']['detail'])
+
+    def test_client_gets_same_errors_as_standalone(self):
+        client = self.client_for('client')
+        paths = [
+            f'/api/shipment-statuses/{self.shipment_statuses["departed"].pk}/',
+            # Статус другой компании
+            f'/api/shipment-statuses/{self.foreign_status.pk}/',
+            # Эндпоинты, закрытые для клиента
+            f'/api/shipments/{self.shipment.pk}/',
+            f'/api/requests/{self.request.pk}/',
+            '/api/imports/',
+            '/api/finance/',
+        ]
+        results = self._batch(paths, role='client')
+        statuses = []
+        for path, result in zip(paths, results):
+            with self.subTest(path=path):
+                standalone = client.get(path)
+                self.assertEqual(result['status'], standalone.status_code)
+                self.assertEqual(result['body'], standalone.json())
+                statuses.append(result['status'])
+        # Сравнение не должно сводиться к одинаковым успешным ответам
+        self.assertEqual(statuses, [200, 404, 403, 403, 403, 403])
+
+    def test_batch_size_is_limited(self):
+        paths = ['/api/shipment-statuses/'] * (settings.BATCH_MAX_REQUESTS + 1)
+        response = self.client_for('manager').post(
+            self.url, {'requests': [{'path': path} for path in paths]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('requests', response.json())
+
+        response = self.client_for('manager').post(self.url, {'requests': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_authentication(self):
+        response = self.client_class().post(self.url, {'requests': [{'path': '/api/shipments/'}]}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(BATCH_WORKERS=4)
+    def test_parallel_results_keep_order(self):
+        def run_subrequest(request, item):
+            # Первые подзапросы выполняются дольше последних
+            time.sleep(0.01 * (5 - int(item['id'])))
+            return batch._result(item['id'], 200, {'path': item['path']})
+
+        paths = [f'/api/shipments/?page={page}' for page in range(5)]
+        with mock.patch.object(batch, 'run_subrequest', side_effect=run_subrequest) as runner, \
+                mock.patch.object(batch, '_executor', None):
+            results = self._batch(paths, parallel=True)
+        self.assertEqual(runner.call_count, 5)
+        self.assertEqual([result['id'] for result in results], ['0', '1', '2', '3', '4'])
+        self.assertEqual([result['body']['path'] for result in results], paths)
+
+    def test_custom_ids(self):
+        response = self.client_for('manager').post(self.url, {'requests': [
+            {'id': 'shipment', 'path': f'/api/shipments/{self.shipment.pk}/'},
+            {'path': '/api/shipment-statuses/'},
+        ]}, format='json')
+        self.assertEqual([result['id'] for result in response.json()['results']], ['shipment', '1'])
@@ -0,0 +1,56 @@
+"""
+Тесты нагрузочных замеров API (logistic/benchmark.py).
+"""
+from django.test import Client
+
+from logistic.benchmark import build_context, failed_results, measure, run_benchmark
+from logistic.models import Request, RequestFile, Shipment
+
+from .base import LogisticTestCase, create_profile
+
+
+class BenchmarkTests(LogisticTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        status = cls.request_statuses['expected']
+        other_manager = create_profile(cls.company, 'manager', username='other-manager')
+        cls.shipment = Shipment.objects.create(
+            number='S-1', company=cls.company, status=cls.shipment_statuses['at_warehouse']
+        )
+        # Заявка другого менеджера с наибольшим числом файлов: раньше ее подставляли всем ролям
+        cls.hidden = Request.objects.create(
+            number=1, company=cls.company, status=status, client=cls.profiles['client'], manager=other_manager,
+        )
+        RequestFile.objects.bulk_create([RequestFile(request=cls.hidden, file=f'{i}.txt') for i in range(3)])
+        cls.visible = Request.objects.create(
+            number=2, company=cls.company, status=status, client=cls.profiles['client'],
+            manager=cls.profiles['manager'], shipment=cls.shipment,
+        )
+
+    def test_context_uses_objects_visible_to_role(self):
+        self.assertEqual(build_context(self.profiles['manager'])['request'], self.visible.pk)
+        self.assertEqual(build_context(self.profiles['boss'])['request'], self.hidden.pk)
+
+    def test_non_success_response_is_marked(self):
+        client = Client()
+        client.force_login(self.profiles['boss'].user)
+        result = measure(client, '/api/requests/999999/', iterations=3, warmup=1)
+        self.assertEqual(result.status, 404)
+        self.assertEqual(result.error, 'код ответа 404')
+        self.assertEqual(result.samples, [])
+
+        client.force_login(self.profiles['warehouse'].user)
+        result = measure(client, '/api/companies/', iterations=3, warmup=1)
+        self.assertEqual(result.skipped, 'нет доступа (403)')
+
+    def test_run_has_no_failed_results(self):
+        results = run_benchmark(
+            company=self.company, iterations=1, warmup=0,
+            endpoints=['requests-list', 'requests-detail', 'shipments-detail', 'analytics-summary'],
+        )
+        self.assertEqual(failed_results(results), [])
+        measured = [item for item in results['results'] if not item['skipped']]
+        self.assertTrue(measured)
+        self.assertTrue(all(200 <= item['status'] < 300 for item in measured))
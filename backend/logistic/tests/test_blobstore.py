@@ -0,0 +1,132 @@
+"""
+Тесты хранилища содержимого по SHA-256 (logistic/blobstore.py): общие блобы
+одинаковых файлов, освобождение последней ссылки и откат загрузки.
+"""
+import hashlib
+import io
+import os
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+
+from logistic.blobstore import blob_transaction, store_upload
+from logistic.cleanup import sweep_pending_deletions
+from logistic.models import FileBlob, PendingFileDeletion, Request, RequestFile, Shipment, ShipmentFile
+from logistic.storage import get_storage
+
+from .base import LogisticTestCase
+
+
+def _image():
+    output = io.BytesIO()
+    Image.new('RGB', (320, 240), 'orange').save(output, format='PNG')
+    return output.getvalue()
+
+
+class BlobStoreTests(LogisticTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.shipment = Shipment.objects.create(
+            number='S-1', company=cls.company, status=cls.shipment_statuses['at_warehouse']
+        )
+        cls.request = Request.objects.create(
+            number=1, company=cls.company, status=cls.request_statuses['expected'],
+            client=cls.profiles['client'], manager=cls.profiles['manager'],
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for('manager')
+        self.storage = get_storage()
+
+    def _upload(self, url, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'files': [SimpleUploadedFile(name, content)]}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def _upload_twice(self, content):
+        self._upload(f'/api/shipments/{self.shipment.pk}/upload_files/', 'scan.png', content)
+        self._upload(f'/api/requests/{self.request.pk}/request_upload_files/', 'copy.png', content)
+        return ShipmentFile.objects.get(), RequestFile.objects.get()
+
+    def test_same_content_shares_blob(self):
+        content = _image()
+        shipment_file, request_file = self._upload_twice(content)
+        self.assertEqual(shipment_file.blob_id, request_file.blob_id)
+        blob = FileBlob.objects.get()
+        self.assertEqual((blob.sha256, blob.size, blob.ref_count), (hashlib.sha256(content).hexdigest(), len(content), 2))
+        with self.storage.open(blob.get_storage_name()) as stored:
+            self.assertEqual(stored.read(), content)
+        # Одна копия содержимого и превью
+        stored = self.storage.walk(os.path.dirname(blob.get_storage_name()))
+        self.assertEqual(sorted(stored), sorted([blob.get_storage_name(), *blob.get_preview_names()]))
+
+    def test_last_reference_schedules_blob_and_previews(self):
+        shipment_file, request_file = self._upload_twice(_image())
+        blob = FileBlob.objects.get()
+        names = [blob.get_storage_name(), *blob.get_preview_names()]
+        self.assertEqual(blob.preview_status, FileBlob.PREVIEW_READY)
+        self.assertEqual(len(names), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shipment_file.delete()
+        self.assertEqual(FileBlob.objects.get().ref_count, 1)
+        self.assertFalse(PendingFileDeletion.objects.exists())
+        self.assertTrue(all(self.storage.exists(name) for name in names))
+
+        with mock.patch('logistic.cleanup.request_sweep'):
+            with self.captureOnCommitCallbacks(execute=True):
+                request_file.delete()
+        self.assertFalse(FileBlob.objects.exists())
+        self.assertEqual(sorted(PendingFileDeletion.objects.values_list('path', flat=True)), sorted(names))
+
+        self.assertEqual(sweep_pending_deletions(), 3)
+        self.assertFalse(PendingFileDeletion.objects.exists())
+        self.assertFalse(any(self.storage.exists(name) for name in names))
+
+    def test_rollback_removes_placed_blob(self):
+        content = b'rolled back'
+        name = FileBlob(sha256=hashlib.sha256(content).hexdigest()).get_storage_name()
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with blob_transaction():
+                store_upload(SimpleUploadedFile('a.txt', content))
+                self.assertTrue(self.storage.exists(name))
+                raise RuntimeError('Сбой после размещения файла')
+        self.assertEqual(callbacks, [])
+        self.assertFalse(FileBlob.objects.exists())
+        self.assertFalse(self.storage.exists(name))
+
+    def test_failed_upload_request_leaves_no_blob_files(self):
+        create = ShipmentFile.objects.create
+        calls = []
+
+        def fail_on_second_file(**kwargs):
+            calls.append(kwargs['file'])
+            if len(calls) == 2:
+                raise RuntimeError('Сбой записи')
+            return create(**kwargs)
+
+        files = [SimpleUploadedFile('first.txt', b'first'), SimpleUploadedFile('second.txt', b'second')]
+        with mock.patch.object(ShipmentFile.objects, 'create', side_effect=fail_on_second_file):
+            with self.assertRaises(RuntimeError):
+                self.client.post(f'/api/shipments/{self.shipment.pk}/upload_files/', {'files': files}, format='multipart')
+        self.assertEqual(calls, ['first.txt', 'second.txt'])
+        self.assertFalse(ShipmentFile.objects.exists())
+        self.assertFalse(FileBlob.objects.exists())
+        for content in (b'first', b'second'):
+            name = FileBlob(sha256=hashlib.sha256(content).hexdigest()).get_storage_name()
+            self.assertFalse(self.storage.exists(name))
+
+    def test_rollback_keeps_file_of_existing_blob(self):
+        # Запись блоба есть, а файл потерян: загрузка восстанавливает файл, откат его не удаляет
+        content = b'restored'
+        blob = FileBlob.objects.create(sha256=hashlib.sha256(content).hexdigest(), size=len(content))
+        with self.assertRaises(RuntimeError):
+            with blob_transaction():
+                store_upload(SimpleUploadedFile('a.txt', content))
+                raise RuntimeError('Сбой')
+        self.assertTrue(self.storage.exists(blob.get_storage_name()))
+        self.assertEqual(FileBlob.objects.get().ref_count, 0)
@@ -0,0 +1,55 @@
+"""
+Тесты стартовых данных фронтенда (GET /api/bootstrap/) и версии справочников компании.
+"""
+import time
+from unittest import mock
+
+from django.conf import settings
+
+from logistic.models import Article
+
+from .base import LogisticTestCase
+
+
+class BootstrapTests(LogisticTestCase):
+
+    url = '/api/bootstrap/'
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for('boss')
+
+    def _get(self, etag=None):
+        if etag is None:
+            return self.client.get(self.url)
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_sections_by_role(self):
+        data = self._get().json()
+        self.assertEqual(data['profile']['id'], self.profiles['boss'].pk)
+        self.assertEqual(len(data['shipmentStatuses']), len(self.shipment_statuses))
+        client_data = self.client_for('client').get(self.url).json()
+        self.assertIsNotNone(client_data['shipmentStatuses'])
+        self.assertIsNone(client_data['requestStatuses'])
+        self.assertIsNone(client_data['articles'])
+
+    def test_change_bumps_version(self):
+        etag = self._get()['ETag']
+        self.assertEqual(self._get(etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Article.objects.create(name='Доставка', company=self.company)
+        response = self._get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([article['name'] for article in response.json()['articles']], ['Доставка'])
+
+    def test_change_in_other_process_is_seen_after_version_expires(self):
+        etag = self._get()['ETag']
+        # Статью создал другой процесс: его смена версии не попала в кеш этого процесса
+        Article.objects.bulk_create([Article(name='Доставка', company=self.company)])
+        self.assertEqual(self._get(etag).status_code, 304)
+
+        expired = time.time() + settings.BOOTSTRAP_VERSION_SECONDS + 1
+        with mock.patch('django.core.cache.backends.locmem.time', mock.Mock(time=lambda: expired)):
+            response = self._get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([article['name'] for article in response.json()['articles']], ['Доставка'])
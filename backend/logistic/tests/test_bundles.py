@@ -0,0 +1,117 @@
+"""
+Тесты ZIP-архивов «скачать все» (logistic/bundles.py).
+"""
+import io
+import os
+import zipfile
+import zlib
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from PIL import Image
+
+from logistic import bundles
+from logistic.models import Shipment, ShipmentFolder
+
+from .base import LogisticTestCase
+
+
+def _png():
+    output = io.BytesIO()
+    Image.new('RGB', (64, 64), 'green').save(output, format='PNG')
+    return output.getvalue()
+
+
+class BundleTests(LogisticTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.shipment = Shipment.objects.create(
+            number='S-1', company=cls.company, status=cls.shipment_statuses['at_warehouse']
+        )
+        cls.folder = ShipmentFolder.objects.create(shipment=cls.shipment, name='Документы')
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for('manager')
+        invoice = 'Счёт на оплату, позиция 1\n'.encode() * 2000
+        self.files = {
+            'Счёт №1.txt': invoice,
+            'скан.png': _png(),
+            # Случайные байты: по расширению сжимаются, но энтропия высокая
+            'шифр.bin': os.urandom(128 * 1024),
+            # То же содержимое под другим именем
+            'копия счёта.txt': invoice,
+        }
+        self.folder_files = {'опись.csv': 'Номер;Наименование\n1;Коробка\n'.encode() * 500}
+        self._upload(self.files)
+        self._upload(self.folder_files, folder_id=self.folder.pk)
+
+    def _upload(self, files, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/shipments/{self.shipment.pk}/upload_files/', {
+                'files': [SimpleUploadedFile(name, content) for name, content in files.items()], **data,
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def _download(self):
+        response = self.client.get(f'/api/shipments/{self.shipment.pk}/download-all-files/')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def _bundles(self):
+        if not os.path.isdir(settings.BUNDLE_CACHE_DIR):
+            return set()
+        return {name for name in os.listdir(settings.BUNDLE_CACHE_DIR) if name.endswith('.zip')}
+
+    def _assert_bundle(self, content):
+        expected = {**self.files, **{f'Документы/{name}': data for name, data in self.folder_files.items()}}
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            infos = {info.filename: info for info in archive.infolist()}
+            self.assertEqual(set(infos), set(expected))
+            for name, data in expected.items():
+                info = infos[name]
+                self.assertEqual(archive.read(name), data)
+                self.assertEqual((info.CRC, info.file_size), (zlib.crc32(data), len(data)))
+                # Имена не в ASCII помечены как UTF-8
+                self.assertTrue(info.flag_bits & 0x800)
+            methods = {name: info.compress_type for name, info in infos.items()}
+        self.assertEqual(methods, {
+            'Счёт №1.txt': zipfile.ZIP_DEFLATED,
+            'копия счёта.txt': zipfile.ZIP_DEFLATED,
+            'Документы/опись.csv': zipfile.ZIP_DEFLATED,
+            'скан.png': zipfile.ZIP_STORED,
+            'шифр.bin': zipfile.ZIP_STORED,
+        })
+
+    def test_mixed_entries_are_valid(self):
+        self._assert_bundle(self._download())
+
+    @override_settings(BUNDLE_WORKERS=2, BUNDLE_PARALLEL_MIN_SIZE=0)
+    def test_parallel_deflate(self):
+        with mock.patch.object(bundles, '_executor', None):
+            self._assert_bundle(self._download())
+            bundles._get_executor().shutdown()
+
+    def test_second_download_is_cache_hit(self):
+        # Каталог кэша общий для тестов класса
+        existing = self._bundles()
+        first = self._download()
+        cached = self._bundles() - existing
+        self.assertEqual(len(cached), 1)
+        with mock.patch.object(bundles, '_build') as build:
+            second = self._download()
+        build.assert_not_called()
+        self.assertEqual(second, first)
+        self.assertEqual(self._bundles() - existing, cached)
+
+        # Новый файл меняет набор - архив собирается заново
+        self._upload({'дополнение.txt': b'new'})
+        with zipfile.ZipFile(io.BytesIO(self._download())) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.read('дополнение.txt'), b'new')
+        self.assertEqual(len(self._bundles() - existing), 2)
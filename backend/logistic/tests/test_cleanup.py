@@ -0,0 +1,152 @@
+"""
+Тесты журнала отложенного удаления файлов (logistic/cleanup.py).
+"""
+import threading
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings, skipUnlessDBFeature
+
+from logistic.cleanup import request_dir, schedule_deletion, shipment_dir, sweep_pending_deletions
+from logistic.models import FileBlob, PendingFileDeletion, Request, RequestFile, Shipment
+from logistic.storage import get_storage
+
+from .base import LogisticTestCase
+
+
+class SweepTests(LogisticTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.storage = get_storage()
+
+    def _stored(self, *names):
+        for name in names:
+            self.storage.save(name, [b'content'])
+        return list(names)
+
+    def _journal(self, *names, **kwargs):
+        PendingFileDeletion.objects.bulk_create([PendingFileDeletion(path=name, **kwargs) for name in names])
+
+    def test_schedule_deletion_runs_after_commit(self):
+        name, = self._stored('logistic/requests/1/a.txt')
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            schedule_deletion(name)
+        # До фиксации файл на месте, запись журнала создана в той же транзакции
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(list(PendingFileDeletion.objects.values_list('path', flat=True)), [name])
+        for callback in callbacks:
+            callback()
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+    def test_failed_entry_is_retried(self):
+        names = self._stored('logistic/requests/1/a.txt', 'logistic/requests/1/b.txt', 'logistic/requests/1/c.txt')
+        self._journal(*names)
+        delete = type(self.storage).delete
+
+        def flaky_delete(storage, name):
+            if name == names[1]:
+                raise OSError('Диск недоступен')
+            delete(storage, name)
+
+        with mock.patch.object(type(self.storage), 'delete', autospec=True, side_effect=flaky_delete), \
+                self.assertLogs('logistic.cleanup', 'WARNING'):
+            self.assertEqual(sweep_pending_deletions(batch_size=2), 2)
+            self.assertEqual(sweep_pending_deletions(batch_size=2), 0)
+        entry = PendingFileDeletion.objects.get()
+        self.assertEqual((entry.path, entry.attempts, entry.last_error), (names[1], 2, 'Диск недоступен'))
+        self.assertEqual([self.storage.exists(name) for name in names], [False, True, False])
+
+        # После устранения ошибки запись обрабатывается
+        self.assertEqual(sweep_pending_deletions(), 1)
+        self.assertFalse(PendingFileDeletion.objects.exists())
+        self.assertFalse(self.storage.exists(names[1]))
+
+    def test_entries_over_max_attempts_are_kept(self):
+        name, = self._stored('logistic/requests/1/a.txt')
+        self._journal(name, attempts=3, last_error='Ошибка')
+        self.assertEqual(sweep_pending_deletions(max_attempts=3), 0)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(PendingFileDeletion.objects.get().attempts, 3)
+        self.assertEqual(sweep_pending_deletions(max_attempts=4), 1)
+        self.assertFalse(self.storage.exists(name))
+
+    @override_settings(FILE_CLEANUP_BATCH_SIZE=2)
+    def test_batches(self):
+        names = self._stored(*(f'logistic/requests/1/{index}.txt' for index in range(5)))
+        self._journal(*names)
+        # По одному запросу выборки на пачку и пустая выборка в конце
+        select = mock.patch.object(
+            PendingFileDeletion.objects, 'select_for_update', wraps=PendingFileDeletion.objects.select_for_update
+        )
+        with select as select_for_update:
+            self.assertEqual(sweep_pending_deletions(), 5)
+        self.assertEqual(select_for_update.call_count, 4)
+        select_for_update.assert_called_with(skip_locked=True)
+        self.assertFalse(any(self.storage.exists(name) for name in names))
+
+    def test_referenced_blob_is_kept(self):
+        blob = FileBlob.objects.create(sha256='a' * 64, size=7, ref_count=1, preview_status=FileBlob.PREVIEW_READY)
+        names = self._stored(blob.get_storage_name(), blob.get_preview_name('thumb'))
+        # Веб-версии у блоба нет - ее файл не занят
+        rendition, = self._stored(blob.get_rendition_name())
+        self._journal(*names, rendition)
+        self.assertEqual(sweep_pending_deletions(), 3)
+        self.assertFalse(PendingFileDeletion.objects.exists())
+        self.assertTrue(all(self.storage.exists(name) for name in names))
+        self.assertFalse(self.storage.exists(rendition))
+
+        # Блоб удален - те же пути удаляются
+        blob.delete()
+        self._journal(*names)
+        self.assertEqual(sweep_pending_deletions(), 2)
+        self.assertFalse(any(self.storage.exists(name) for name in names))
+
+    def test_reused_paths_are_kept(self):
+        shipment = Shipment.objects.create(
+            number='S-1', company=self.company, status=self.shipment_statuses['at_warehouse']
+        )
+        request = Request.objects.create(
+            number=1, company=self.company, status=self.request_statuses['expected'], client=self.profiles['client'],
+        )
+        # Старый файл без блоба загружен заново под тем же именем
+        RequestFile.objects.create(request=request, file='a.txt')
+        reused, deleted = self._stored(f'{request_dir(request.pk)}/a.txt', f'{request_dir(request.pk)}/b.txt')
+        tree, = self._stored(f'{shipment_dir(shipment.pk)}/c.txt')
+        self._journal(reused, deleted)
+        self._journal(shipment_dir(shipment.pk), is_directory=True)
+        self.assertEqual(sweep_pending_deletions(), 3)
+        self.assertEqual([self.storage.exists(name) for name in (reused, deleted, tree)], [True, False, True])
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class ConcurrentSweepTests(TransactionTestCase):
+    """Записи, заблокированные другим обработчиком, пропускаются, а не ожидаются."""
+
+    def test_locked_entries_are_skipped(self):
+        PendingFileDeletion.objects.bulk_create(
+            [PendingFileDeletion(path=f'logistic/requests/1/{index}.txt') for index in range(3)]
+        )
+        locked = PendingFileDeletion.objects.order_by('id').first()
+        acquired, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    PendingFileDeletion.objects.select_for_update().get(pk=locked.pk)
+                    acquired.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        try:
+            self.assertTrue(acquired.wait(10))
+            self.assertEqual(sweep_pending_deletions(), 2)
+            self.assertEqual(list(PendingFileDeletion.objects.values_list('pk', flat=True)), [locked.pk])
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(sweep_pending_deletions(), 1)
@@ -0,0 +1,66 @@
+"""
+Тесты сжатия ответов (logistic/compression.py).
+"""
+import gzip
+import json
+
+import brotli
+import zstandard
+
+from logistic.compression import ENCODERS, negotiate_encoding
+from logistic.models import Request
+
+from .base import LogisticTestCase
+
+DECODERS = {
+    'br': brotli.decompress,
+    'zstd': lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+    'gzip': gzip.decompress,
+}
+
+
+class CompressionTests(LogisticTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        status = cls.request_statuses['expected']
+        Request.objects.bulk_create([
+            Request(
+                number=i, company=cls.company, status=status, client=cls.profiles['client'],
+                description='Коробки с запчастями',
+            )
+            for i in range(20)
+        ])
+
+    def test_default_encodings_are_installed(self):
+        # br и zstd из COMPRESSION_ENCODINGS по умолчанию не должны молча выпадать
+        self.assertEqual(set(ENCODERS), {'br', 'zstd', 'gzip'})
+
+    def test_negotiation(self):
+        cases = [
+            ('gzip, deflate, br, zstd', 'br'),
+            ('gzip, br;q=0.5', 'gzip'),
+            ('zstd, gzip', 'zstd'),
+            ('*', 'br'),
+            ('identity', None),
+            ('br;q=0, gzip;q=0', None),
+        ]
+        for header, expected in cases:
+            with self.subTest(header=header):
+                self.assertEqual(negotiate_encoding(header), expected)
+        with self.settings(COMPRESSION_ENCODINGS=['gzip']):
+            self.assertIsNone(negotiate_encoding('br, zstd'))
+
+    def test_api_response_is_compressed(self):
+        client = self.client_for('boss')
+        plain = client.get('/api/requests/')
+        self.assertGreater(len(plain.content), 1024)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        for encoding, decompress in DECODERS.items():
+            with self.subTest(encoding=encoding):
+                response = client.get('/api/requests/', HTTP_ACCEPT_ENCODING=encoding)
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertLess(len(response.content), len(plain.content))
+                self.assertEqual(json.loads(decompress(response.content)), plain.json())
@@ -0,0 +1,111 @@
+"""
+Тесты дерева файлов отправки (GET /api/shipments/{id}/files/tree/).
+"""
+import io
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from logistic.models import FileBlob, Shipment, ShipmentFolder
+from logistic.previews import generate_previews
+
+from .base import LogisticTestCase
+
+
+def _png():
+    output = io.BytesIO()
+    Image.new('RGB', (64, 64), 'red').save(output, format='PNG')
+    return output.getvalue()
+
+
+class FileTreeTests(LogisticTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shipment = Shipment.objects.create(
+            number='S-1', company=self.company, status=self.shipment_statuses['at_warehouse']
+        )
+        self.client = self.client_for('manager')
+        self.url = f'/api/shipments/{self.shipment.pk}/files/tree/'
+
+    def _upload(self, name, content=b'content'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/shipments/{self.shipment.pk}/upload_files/',
+                {'files': [SimpleUploadedFile(name, content)]},
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def _etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_not_modified_skips_tree_queries(self):
+        self._upload('a.txt')
+        etag = self._etag()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        tree_tables = ('logistic_shipmentfile', 'logistic_shipmentfolder')
+        self.assertFalse([query['sql'] for query in queries if any(table in query['sql'] for table in tree_tables)])
+
+    def test_etag_changes_with_files_and_folders(self):
+        etags = [self._etag()]
+        self._upload('a.txt')
+        etags.append(self._etag())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/shipments/{self.shipment.pk}/create-folder/', {'folder_name': 'Документы'})
+        etags.append(self._etag())
+        folder = ShipmentFolder.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/shipments/{self.shipment.pk}/folders/{folder.pk}/')
+        etags.append(self._etag())
+        self.assertEqual(len(set(etags)), len(etags))
+        # Без изменений ETag стабилен
+        self.assertEqual(self._etag(), etags[-1])
+
+    def test_etag_depends_on_page(self):
+        self._upload('a.txt')
+        self.assertNotEqual(self._etag(), self.client.get(self.url, {'limit': 1})['ETag'])
+
+    def test_etag_changes_after_previews(self):
+        # Превью генерируются после фиксации загрузки; откладываем их, чтобы сравнить ETag до и после
+        with self.settings(BACKGROUND_TASKS_SYNC=False), self.captureOnCommitCallbacks():
+            self.client.post(
+                f'/api/shipments/{self.shipment.pk}/upload_files/',
+                {'files': [SimpleUploadedFile('photo.png', _png())]},
+                format='multipart',
+            )
+        etag = self._etag()
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_previews(FileBlob.objects.get().pk)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['files'][0]['thumbnail_url'])
+
+    def test_change_in_other_process_is_seen_after_version_expires(self):
+        self._upload('a.txt')
+        etag = self._etag()
+        # Папку создал другой процесс: его смена версии не попала в кеш этого процесса
+        ShipmentFolder.objects.bulk_create([ShipmentFolder(shipment=self.shipment, name='Документы')])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        expired = time.time() + settings.FILE_TREE_VERSION_SECONDS + 1
+        with mock.patch('django.core.cache.backends.locmem.time', mock.Mock(time=lambda: expired)):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([folder['name'] for folder in response.data['folders']], ['Документы'])
+
+    def test_lost_version_changes_etag(self):
+        self._upload('a.txt')
+        etag = self._etag()
+        cache.clear()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,215 @@
+"""
+Тесты импорта заявок и финансовых операций из CSV/XLSX (logistic/imports.py)
+и действий заданий импорта (ImportJobViewSet).
+"""
+import csv
+import datetime
+import io
+from decimal import Decimal
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import F
+from django.test import override_settings
+from django.utils import timezone
+
+from logistic.exports import xlsx_chunks
+from logistic.imports import RowParser, run_import_job
+from logistic.models import Article, Finance, ImportJob, Request, StatusTransition
+from logistic.storage import get_storage
+
+from .base import LogisticTestCase
+
+REQUEST_HEADER = ['Номер', 'Клиент', 'Статус', 'Описание', 'Заявленный вес']
+
+
+def _csv(header, rows, delimiter=';'):
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=delimiter)
+    writer.writerow(header)
+    writer.writerows(rows)
+    # BOM, как в файлах из Excel
+    return output.getvalue().encode('utf-8-sig')
+
+
+def _xlsx(header, rows):
+    return b''.join(xlsx_chunks(header, rows, 'Операции'))
+
+
+class ImportTests(LogisticTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for('manager')
+        self.client_name = self.profiles['client'].name
+
+    def _request_rows(self, count, start=1):
+        return [[number, self.client_name, 'В работе', f'Груз {number}', '1,5'] for number in range(start, start + count)]
+
+    def _create(self, name, content, kind=ImportJob.KIND_REQUESTS, dry_run=False):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/imports/', {
+                'file': SimpleUploadedFile(name, content), 'kind': kind, 'dry_run': dry_run,
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return ImportJob.objects.get(pk=response.json()['id'])
+
+    def _post(self, job, action):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/imports/{job.pk}/{action}/')
+
+    def test_csv_requests(self):
+        rows = [
+            *self._request_rows(2),
+            # Неизвестный клиент и неверное число; пустая строка пропускается
+            [3, 'Никто', '', 'Груз 3', 'много'],
+            ['', '', '', '', ''],
+            [4, self.profiles['client'].user.email, 'ready', '', ''],
+        ]
+        job = self._create('requests.csv', _csv(REQUEST_HEADER, rows))
+        self.assertEqual(job.status, ImportJob.STATUS_COMPLETED, job.message)
+        self.assertEqual((job.total_rows, job.processed_rows, job.imported_rows, job.error_rows), (4, 4, 3, 1))
+        self.assertEqual({error['column'] for error in job.errors}, {'Клиент', 'Заявленный вес'})
+        self.assertTrue(all(error['row'] == 4 for error in job.errors))
+
+        requests = {request.number: request for request in Request.objects.filter(company=self.company)}
+        self.assertEqual(set(requests), {1, 2, 4})
+        self.assertEqual(requests[1].status, self.request_statuses['in_progress'])
+        self.assertEqual(requests[1].declared_weight, 1.5)
+        self.assertEqual(requests[4].status, self.request_statuses['ready'])
+        self.assertEqual(requests[4].client, self.profiles['client'])
+        # Начальные статусы записаны в журнал
+        self.assertEqual(StatusTransition.objects.filter(entity=StatusTransition.ENTITY_REQUEST).count(), 3)
+        # Исходный файл удален после настоящего импорта
+        self.assertEqual(job.storage_name, '')
+
+    def test_xlsx_finances(self):
+        Article.objects.create(name='Доставка', company=self.company)
+        header = ['Дата оплаты', 'Тип операции', 'Тип документа', 'Валюта', 'Сумма', 'Оплачен', 'Статья', 'Контрагент']
+        counterparty = self.profiles['client'].user.username
+        rows = [
+            [datetime.date(2026, 3, 1), 'Входящий', 'Счёт', 'rub', Decimal('100.50'), True, 'Доставка', counterparty],
+            ['02.03.2026', 'out', 'payment', 'Евро', 20, False, '', ''],
+            [datetime.date(2026, 3, 3), 'Неизвестный', 'bill', 'usd', 'сто', None, 'Нет такой', ''],
+        ]
+        job = self._create('finances.xlsx', _xlsx(header, rows), kind=ImportJob.KIND_FINANCES)
+        self.assertEqual(job.status, ImportJob.STATUS_COMPLETED, job.message)
+        self.assertEqual((job.imported_rows, job.error_rows), (2, 1))
+        self.assertEqual(
+            {error['column'] for error in job.errors}, {'Тип операции', 'Сумма', 'Статья'}
+        )
+
+        first, second = Finance.objects.filter(company=self.company).order_by('payment_date')
+        self.assertEqual(
+            (first.payment_date, first.operation_type, first.document_type, first.currency),
+            (datetime.date(2026, 3, 1), 'in', 'bill', 'rub'),
+        )
+        self.assertEqual((first.amount, first.is_paid, first.article.name), (Decimal('100.50'), True, 'Доставка'))
+        self.assertEqual(first.counterparty, self.profiles['client'].user)
+        self.assertEqual(first.created_by, self.profiles['manager'])
+        self.assertEqual((second.payment_date, second.currency, second.is_paid), (datetime.date(2026, 3, 2), 'eur', False))
+
+    def test_file_errors(self):
+        cases = [
+            ('header_only.csv', b'\r\n', 'Клиент'),
+            ('no_client.csv', _csv(['Номер', 'Описание'], [[1, 'Груз']]), 'Клиент'),
+            ('broken.xlsx', b'PK not a zip', 'поврежден'),
+            ('cp1251.csv', 'Клиент\nИванов\n'.encode('cp1251'), 'UTF-8'),
+        ]
+        for name, content, message in cases:
+            with self.subTest(name=name):
+                job = self._create(name, content)
+                self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+                self.assertIn(message, job.message)
+        self.assertFalse(Request.objects.exists())
+
+    def test_dry_run_then_start(self):
+        job = self._create('requests.csv', _csv(REQUEST_HEADER, self._request_rows(3)), dry_run=True)
+        self.assertEqual(job.status, ImportJob.STATUS_COMPLETED)
+        self.assertEqual(job.imported_rows, 3)
+        self.assertFalse(Request.objects.exists())
+        # Файл сохраняется для настоящего импорта
+        self.assertTrue(get_storage().exists(job.storage_name))
+
+        response = self._post(job, 'start')
+        self.assertEqual(response.status_code, 200, response.content)
+        job.refresh_from_db()
+        self.assertFalse(job.dry_run)
+        self.assertEqual((job.status, job.processed_rows, job.imported_rows), (ImportJob.STATUS_COMPLETED, 3, 3))
+        self.assertEqual(Request.objects.filter(company=self.company).count(), 3)
+
+        # Повторный запуск невозможен
+        self.assertEqual(self._post(job, 'start').status_code, 400)
+        self.assertEqual(Request.objects.filter(company=self.company).count(), 3)
+
+    @override_settings(IMPORT_CHUNK_SIZE=2)
+    def test_resume_after_failure(self):
+        with mock.patch('logistic.imports.record_transitions', side_effect=[None, RuntimeError('Сбой')]):
+            job = self._create('requests.csv', _csv(REQUEST_HEADER, self._request_rows(5)))
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertEqual(job.message, 'Сбой')
+        # Первая пачка зафиксирована, вторая откатилась целиком
+        self.assertEqual((job.processed_rows, job.imported_rows), (2, 2))
+        self.assertEqual(Request.objects.filter(company=self.company).count(), 2)
+
+        response = self._post(job, 'resume')
+        self.assertEqual(response.status_code, 200, response.content)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_rows, job.imported_rows), (ImportJob.STATUS_COMPLETED, 5, 5))
+        numbers = Request.objects.filter(company=self.company).values_list('number', flat=True)
+        self.assertEqual(sorted(numbers), [1, 2, 3, 4, 5])
+
+        self.assertEqual(self._post(job, 'resume').status_code, 400)
+
+    def test_resume_running_job(self):
+        job = ImportJob.objects.create(
+            company=self.company, kind=ImportJob.KIND_REQUESTS, file_name='requests.csv',
+            status=ImportJob.STATUS_RUNNING,
+        )
+        with mock.patch('logistic.views.run_import_job') as runner:
+            # Задание обновлялось недавно - процесс импорта работает
+            self.assertEqual(self._post(job, 'resume').status_code, 400)
+            ImportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - datetime.timedelta(days=1))
+            self.assertEqual(self._post(job, 'resume').status_code, 200)
+        runner.assert_called_once_with(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_PENDING)
+
+    @override_settings(IMPORT_CHUNK_SIZE=2)
+    def test_runner_stops_when_other_runner_commits_chunk(self):
+        job = ImportJob.objects.create(
+            company=self.company, kind=ImportJob.KIND_REQUESTS, file_name='requests.csv',
+            storage_name='logistic/imports/test/source.csv',
+        )
+        get_storage().save(job.storage_name, [_csv(REQUEST_HEADER, self._request_rows(4))])
+
+        prepare = RowParser.prepare
+
+        def other_runner_commits(parser, rows):
+            # Пока пачка разбиралась, ее зафиксировал процесс, продолживший задание
+            ImportJob.objects.filter(pk=job.pk).update(processed_rows=F('processed_rows') + len(rows))
+            prepare(parser, rows)
+
+        with mock.patch.object(RowParser, 'prepare', autospec=True, side_effect=other_runner_commits):
+            run_import_job(job.pk)
+        job.refresh_from_db()
+        # Пачка опоздавшего процесса откатилась, задание не завершено и не помечено ошибкой
+        self.assertFalse(Request.objects.filter(company=self.company).exists())
+        self.assertEqual((job.status, job.processed_rows, job.imported_rows), (ImportJob.STATUS_RUNNING, 2, 0))
+        self.assertTrue(get_storage().exists(job.storage_name))
+
+    def test_error_report(self):
+        rows = [[1, 'Никто', 'Нет статуса', '', 'x'], *self._request_rows(1, start=2)]
+        job = self._create('requests.csv', _csv(REQUEST_HEADER, rows, delimiter=','))
+        response = self.client.get(f'/api/imports/{job.pk}/errors/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'import_{job.pk}_errors.csv', response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        report = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(report[0], ['Строка', 'Столбец', 'Ошибка'])
+        self.assertEqual(sorted(row[1] for row in report[1:]), ['Заявленный вес', 'Клиент', 'Статус'])
+        self.assertTrue(all(row[0] == '2' for row in report[1:]))
+
+        detail = self.client.get(f'/api/imports/{job.pk}/').json()
+        self.assertEqual(len(detail['errors']), 3)
+        self.assertEqual(detail['progress'], 100)
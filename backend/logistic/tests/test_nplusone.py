@@ -0,0 +1,77 @@
+"""
+Тесты обнаружения N+1 запросов (logistic/nplusone.py).
+
+Тесты запускаются раннером NPlusOneTestRunner, который включает режим
+'raise': представление, загружающее связанный объект для каждой строки,
+должно приводить к NPlusOneError.
+"""
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from logistic.models import Request
+from logistic.nplusone import NPlusOneError, ignore
+
+from .base import LogisticTestCase
+
+
+class _RequestClientSerializer(serializers.ModelSerializer):
+    client_name = serializers.CharField(source='client.name')
+
+    class Meta:
+        model = Request
+        fields = ['id', 'client_name']
+
+
+class _LazyClientsView(APIView):
+    """Клиент каждой заявки загружается отдельным запросом."""
+
+    def get(self, request):
+        return Response(_RequestClientSerializer(Request.objects.order_by('id'), many=True).data)
+
+
+class _PreloadedClientsView(APIView):
+
+    def get(self, request):
+        queryset = Request.objects.select_related('client').order_by('id')
+        return Response(_RequestClientSerializer(queryset, many=True).data)
+
+
+class _IgnoredClientsView(APIView):
+
+    def get(self, request):
+        with ignore():
+            return Response(_RequestClientSerializer(Request.objects.order_by('id'), many=True).data)
+
+
+class NPlusOneDetectionTests(LogisticTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        status = cls.request_statuses['expected']
+        Request.objects.bulk_create([
+            Request(number=i, company=cls.company, status=status, client=cls.profiles['client'])
+            for i in range(5)
+        ])
+
+    def _get(self, view):
+        request = APIRequestFactory().get('/n-plus-one/')
+        force_authenticate(request, user=self.profiles['boss'].user)
+        return view.as_view()(request)
+
+    def test_raises_on_n_plus_one(self):
+        with self.assertRaises(NPlusOneError) as context:
+            self._get(_LazyClientsView)
+        self.assertIn('_RequestClientSerializer.client_name', str(context.exception))
+
+    def test_preloaded_relations_pass(self):
+        self.assertEqual(len(self._get(_PreloadedClientsView).data), 5)
+
+    def test_ignored_block_passes(self):
+        self.assertEqual(len(self._get(_IgnoredClientsView).data), 5)
+
+    def test_off_mode(self):
+        with self.settings(NPLUSONE_MODE='off'):
+            self.assertEqual(len(self._get(_LazyClientsView).data), 5)
@@ -0,0 +1,182 @@
+"""
+Тесты превью и веб-версий изображений (logistic/previews.py) и скачивания
+оригинала и веб-версии.
+"""
+import io
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from PIL import Image, ImageCms
+
+from logistic.models import FileBlob, Request, RequestFile, Shipment, ShipmentFile
+from logistic.storage import get_storage
+
+from .base import LogisticTestCase
+
+GPS_IFD = 0x8825
+
+
+def _photo():
+    """JPEG с камеры телефона: EXIF с геопозицией и поворотом."""
+    image = Image.effect_noise((800, 600), 64).convert('RGB')
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: повернуть на 90 градусов
+    exif[GPS_IFD] = {1: 'N', 2: (55.0, 45.0, 0.0)}
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=95, exif=exif)
+    return output.getvalue()
+
+
+def _png_scan():
+    """Скан документа в PNG с цветовым профилем."""
+    image = Image.new('RGB', (400, 300), 'white')
+    output = io.BytesIO()
+    profile = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+    image.save(output, format='PNG', icc_profile=profile)
+    return output.getvalue()
+
+
+def _animated_gif():
+    frames = [Image.new('P', (64, 64), color) for color in (1, 2, 3)]
+    output = io.BytesIO()
+    frames[0].save(output, format='GIF', save_all=True, append_images=frames[1:], duration=100, loop=0)
+    return output.getvalue()
+
+
+def _multipage_tiff():
+    pages = [Image.new('RGB', (200, 300), color) for color in ('white', 'gray')]
+    output = io.BytesIO()
+    pages[0].save(output, format='TIFF', save_all=True, append_images=pages[1:])
+    return output.getvalue()
+
+
+def _bmp():
+    output = io.BytesIO()
+    Image.new('RGB', (64, 64), 'blue').save(output, format='BMP')
+    return output.getvalue()
+
+
+def _pdf():
+    """Двухстраничный PDF: альбомная первая страница с текстом."""
+    import pymupdf
+
+    with pymupdf.open() as document:
+        page = document.new_page(width=842, height=595)
+        page.insert_text((72, 72), 'Invoice 42', fontsize=36)
+        document.new_page()
+        return document.tobytes()
+
+
+def _content(response):
+    return b''.join(response.streaming_content)
+
+
+class RenditionTests(LogisticTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shipment = Shipment.objects.create(
+            number='S-1', company=self.company, status=self.shipment_statuses['at_warehouse']
+        )
+        self.client = self.client_for('manager')
+
+    def _upload(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/shipments/{self.shipment.pk}/upload_files/',
+                {'files': [SimpleUploadedFile(name, content)]},
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        return ShipmentFile.objects.select_related('blob').get(file=name)
+
+    def _download(self, file_obj, **params):
+        response = self.client.get(f'/api/shipments/{self.shipment.pk}/download-file/{file_obj.pk}/', params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_photo_gets_rendition(self):
+        original = _photo()
+        file_obj = self._upload('IMG_0001.jpeg', original)
+        self.assertEqual(file_obj.blob.preview_status, FileBlob.PREVIEW_READY)
+        self.assertIsNotNone(file_obj.blob.rendition_size)
+
+        response = self._download(file_obj)
+        self.assertIn('filename="IMG_0001.jpg"', response['Content-Disposition'])
+        rendition = Image.open(io.BytesIO(_content(response)))
+        self.assertEqual(rendition.format, 'JPEG')
+        # Поворот по EXIF применен, метаданные с геопозицией удалены
+        self.assertEqual(rendition.size, (600, 800))
+        self.assertNotIn(GPS_IFD, rendition.getexif())
+
+        response = self._download(file_obj, original='1')
+        self.assertIn('filename="IMG_0001.jpeg"', response['Content-Disposition'])
+        self.assertEqual(_content(response), original)
+
+    def test_non_photos_are_downloaded_as_is(self):
+        cases = [
+            ('scan.png', _png_scan()),
+            ('animation.gif', _animated_gif()),
+            ('contract.tiff', _multipage_tiff()),
+            ('logo.bmp', _bmp()),
+        ]
+        for name, original in cases:
+            with self.subTest(name=name):
+                file_obj = self._upload(name, original)
+                self.assertEqual(file_obj.blob.preview_status, FileBlob.PREVIEW_READY)
+                self.assertIsNone(file_obj.blob.rendition_size)
+                response = self._download(file_obj)
+                self.assertIn(f'filename="{name}"', response['Content-Disposition'])
+                self.assertEqual(_content(response), original)
+
+    def test_pdf_first_page_preview(self):
+        original = _pdf()
+        file_obj = self._upload('invoice.pdf', original)
+        blob = file_obj.blob
+        self.assertEqual(blob.preview_status, FileBlob.PREVIEW_READY)
+        self.assertIsNone(blob.rendition_size)
+        storage = get_storage()
+        for kind, max_side in (('thumb', 256), ('preview', 1280)):
+            with storage.open(blob.get_preview_name(kind)) as preview_file:
+                preview = Image.open(io.BytesIO(preview_file.read()))
+            self.assertEqual(preview.format, 'WEBP')
+            # Первая страница альбомная
+            self.assertEqual(preview.width, max_side)
+            self.assertLess(preview.height, preview.width)
+
+        response = self.client.get(f'/api/shipments/{self.shipment.pk}/files/tree/')
+        self.assertIsNotNone(response.data['files'][0]['thumbnail_url'])
+        self.assertEqual(_content(self._download(file_obj)), original)
+
+    def test_recheck_removes_old_renditions(self):
+        # Веб-версия PNG, созданная до ограничения форматами фотографий
+        file_obj = self._upload('scan.png', _png_scan())
+        blob = file_obj.blob
+        get_storage().save(blob.get_rendition_name(), [b'jpeg'])
+        FileBlob.objects.filter(pk=blob.pk).update(rendition_size=4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('generate_previews', recheck_renditions=True, stdout=io.StringIO())
+        blob.refresh_from_db()
+        self.assertEqual(blob.preview_status, FileBlob.PREVIEW_READY)
+        self.assertIsNone(blob.rendition_size)
+        self.assertFalse(get_storage().exists(blob.get_rendition_name()))
+        self.assertEqual(_content(self._download(file_obj)), _png_scan())
+
+    def test_request_file_download(self):
+        request = Request.objects.create(
+            number=1, company=self.company, status=self.request_statuses['expected'],
+            client=self.profiles['client'], manager=self.profiles['manager'],
+        )
+        original = _photo()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/requests/{request.pk}/request_upload_files/',
+                {'files': [SimpleUploadedFile('IMG_0002.jpg', original)]},
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        file_obj = RequestFile.objects.get(request=request)
+        url = f'/api/requests/{request.pk}/download-file/{file_obj.pk}/'
+        self.assertNotEqual(_content(self.client.get(url)), original)
+        self.assertEqual(_content(self.client.get(url, {'original': '1'})), original)
@@ -0,0 +1,221 @@
+"""
+Тесты журнала смены статусов и аналитики времени в статусах
+(logistic/status_history.py).
+"""
+import datetime
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from logistic.models import (
+    DEFAULT_REQUEST_STATUSES, DEFAULT_SHIPMENT_STATUSES, DEFAULT_STATUS_CASCADES, Company, Request, RequestStatus,
+    Shipment, ShipmentStatus, StatusTransition, create_default_statuses,
+)
+from logistic.status_history import bulk_change_status, throughput, time_in_status
+
+from .base import LogisticTestCase, client_for, create_company, create_profile
+
+AT = timezone.make_aware(datetime.datetime(2026, 3, 10, 12, 0))
+
+
+class StatusAnalyticsTests(LogisticTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        transitions = [
+            # Выходы из «Ожидается» за 1..10 часов
+            *(cls._transition(cls.company, 'expected', 'at_warehouse', hours * 3600) for hours in range(1, 11)),
+            # Повторяющиеся значения: 10, 10, 10, 20 минут
+            *(cls._transition(cls.company, 'at_warehouse', 'in_work', minutes * 60) for minutes in (10, 10, 10, 20)),
+            # Начальный статус и переход без известного времени в аналитику времени не входят
+            cls._transition(cls.company, '', 'expected', None),
+            cls._transition(cls.company, 'in_work', 'ready', None),
+            # Другая компания, другой тип объекта и другой период
+            cls._transition(create_company('Другая'), 'expected', 'at_warehouse', 1),
+            cls._transition(cls.company, 'expected', 'at_warehouse', 1, entity=StatusTransition.ENTITY_SHIPMENT),
+            cls._transition(cls.company, 'expected', 'at_warehouse', 1, at=AT - datetime.timedelta(days=30)),
+        ]
+        StatusTransition.objects.bulk_create(transitions)
+
+    @staticmethod
+    def _transition(company, from_status, to_status, duration, entity=StatusTransition.ENTITY_REQUEST, at=AT):
+        return StatusTransition(
+            company=company, entity=entity, object_id=1, from_status=from_status, to_status=to_status,
+            at=at, duration_seconds=duration,
+        )
+
+    def _requests(self):
+        return StatusTransition.objects.filter(
+            company=self.company, entity=StatusTransition.ENTITY_REQUEST, at__date=AT.date()
+        )
+
+    def test_percentiles(self):
+        durations = time_in_status(self._requests())
+        self.assertEqual(set(durations), {'expected', 'at_warehouse'})
+        self.assertEqual(durations['expected'], {
+            'count': 10, 'avg_seconds': 19800, 'max_seconds': 36000,
+            'p50_seconds': 5 * 3600, 'p90_seconds': 9 * 3600, 'p95_seconds': 10 * 3600,
+        })
+        # Перцентиль - наименьшее значение, не меньше которого доля p всех значений
+        self.assertEqual(durations['at_warehouse'], {
+            'count': 4, 'avg_seconds': 750, 'max_seconds': 1200,
+            'p50_seconds': 600, 'p90_seconds': 1200, 'p95_seconds': 1200,
+        })
+
+    def test_single_value(self):
+        durations = time_in_status(self._requests().filter(from_status='expected', duration_seconds=3600))
+        self.assertEqual(durations['expected']['p50_seconds'], 3600)
+        self.assertEqual(durations['expected']['p95_seconds'], 3600)
+
+    def test_throughput(self):
+        counts = throughput(self._requests())
+        self.assertEqual(counts['expected'], {'entered': 1, 'left': 10})
+        self.assertEqual(counts['at_warehouse'], {'entered': 10, 'left': 4})
+        self.assertEqual(counts['ready'], {'entered': 1, 'left': 0})
+
+    def test_analytics_endpoint(self):
+        response = self.client_for('manager').get(
+            '/api/status-transitions/analytics/', {'date_from': '2026-03-10', 'date_to': '2026-03-10'}
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual(data['entity'], 'request')
+        statuses = {item['code']: item for item in data['statuses']}
+        self.assertEqual(statuses['expected']['p90Seconds'], 9 * 3600)
+        self.assertEqual(statuses['expected']['left'], 10)
+        self.assertEqual(statuses['at_warehouse']['p50Seconds'], 600)
+        # Статус компании без переходов выводится с пустым временем
+        idle = next(item for code, item in statuses.items() if code not in ('expected', 'at_warehouse', 'in_work', 'ready'))
+        self.assertEqual((idle['entered'], idle['left'], idle['p50Seconds']), (0, 0, None))
+
+    def test_analytics_entity_is_validated(self):
+        client = self.client_for('manager')
+        for entity in ('order', ''):
+            with self.subTest(entity=entity):
+                response = client.get('/api/status-transitions/analytics/', {'entity': entity})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('entity', response.json())
+        response = client.get('/api/status-transitions/analytics/', {'entity': 'shipment'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['entity'], 'shipment')
+
+
+class StatusCascadeTests(LogisticTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.shipment = Shipment.objects.create(
+            number='S-1', company=cls.company, status=cls.shipment_statuses['at_warehouse'],
+            status_changed_at=AT,
+        )
+        statuses = cls.request_statuses
+        client = cls.profiles['client']
+
+        def create_request(number, code, shipment=cls.shipment):
+            return Request.objects.create(
+                number=number, company=cls.company, status=statuses[code], client=client,
+                shipment=shipment, status_changed_at=AT,
+            )
+
+        cls.moved = [create_request(number, 'expected') for number in range(1, 4)]
+        # Уже в целевом статусе «В работе» (каскад «Отправлен» -> «В работе»)
+        cls.already = create_request(4, 'in_progress')
+        cls.final = create_request(5, 'delivered')
+        cls.other = create_request(6, 'expected', shipment=None)
+
+    def _update_status(self, status_id):
+        return self.client_for('manager').post(
+            f'/api/shipments/{self.shipment.pk}/update-status/', {'status': status_id}, format='json'
+        )
+
+    def _request_transitions(self):
+        return StatusTransition.objects.filter(entity=StatusTransition.ENTITY_REQUEST)
+
+    def test_cascade_updates_requests_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._update_status(self.shipment_statuses['departed'].pk)
+        self.assertEqual(response.status_code, 200, response.content)
+
+        request_table = Request._meta.db_table
+        updates = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE') and request_table in query['sql'].split('SET')[0]
+        ]
+        self.assertEqual(len(updates), 1)
+
+        target = self.request_statuses['in_progress']
+        moved_ids = [request.pk for request in self.moved]
+        self.assertEqual(
+            set(Request.objects.filter(status=target).values_list('pk', flat=True)), {*moved_ids, self.already.pk}
+        )
+        transitions = self._request_transitions()
+        self.assertEqual(sorted(transitions.values_list('object_id', flat=True)), moved_ids)
+        for transition in transitions:
+            self.assertEqual((transition.from_status, transition.to_status), ('expected', 'in_progress'))
+            self.assertEqual(transition.changed_by, self.profiles['manager'])
+            self.assertGreater(transition.duration_seconds, 0)
+
+        # Заявки в целевом и финальном статусах и заявки других отправок не меняются
+        for request in (self.already, self.final, self.other):
+            refreshed = Request.objects.get(pk=request.pk)
+            self.assertEqual((refreshed.status_id, refreshed.status_changed_at), (request.status_id, AT))
+
+    def test_bulk_change_sets_updated_at(self):
+        before = Request.objects.get(pk=self.moved[0].pk).updated_at
+        changed = bulk_change_status(Request.objects.filter(shipment=self.shipment, status__is_final=False),
+                                     self.request_statuses['in_progress'])
+        self.assertEqual(changed, 3)
+        moved = Request.objects.get(pk=self.moved[0].pk)
+        self.assertGreater(moved.updated_at, before)
+        self.assertEqual(moved.updated_at, moved.status_changed_at)
+        self.assertEqual(Request.objects.get(pk=self.already.pk).updated_at, self.already.updated_at)
+
+    def test_status_of_other_company_is_rejected(self):
+        other = create_company('Другая')
+        foreign_status = ShipmentStatus.objects.get(company=other, code='departed')
+        response = self._update_status(foreign_status.pk)
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client_for('manager').patch(
+            f'/api/shipments/{self.shipment.pk}/', {'status': foreign_status.pk}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status', response.json())
+
+        foreign_request_status = RequestStatus.objects.get(company=other, code='ready')
+        response = self.client_for('manager').post(
+            f'/api/requests/{self.moved[0].pk}/update-status/', {'status': foreign_request_status.pk}, format='json'
+        )
+        self.assertEqual(response.status_code, 404)
+
+        self.assertEqual(Shipment.objects.get(pk=self.shipment.pk).status, self.shipment_statuses['at_warehouse'])
+        self.assertEqual(Request.objects.get(pk=self.moved[0].pk).status, self.request_statuses['expected'])
+        self.assertFalse(StatusTransition.objects.exists())
+
+
+class DefaultStatusesTests(LogisticTestCase):
+
+    def test_shipment_create_bootstraps_cascades(self):
+        # Компания без статусов (например, созданная не через API компаний)
+        company = Company.objects.create(name='Без статусов')
+        manager = create_profile(company, 'manager')
+        # Сериализатор требует company и status, статус затем заменяется статусом по умолчанию
+        response = client_for(manager).post('/api/shipments/', {
+            'number': 'S-1', 'company': company.pk, 'status': self.shipment_statuses['departed'].pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        statuses = {status.code: status for status in ShipmentStatus.objects.filter(company=company)}
+        self.assertEqual(set(statuses), {status['code'] for status in DEFAULT_SHIPMENT_STATUSES})
+        self.assertEqual(Shipment.objects.get(company=company).status, statuses['at_warehouse'])
+        for shipment_code, request_code in DEFAULT_STATUS_CASCADES.items():
+            self.assertEqual(statuses[shipment_code].request_status.code, request_code)
+            self.assertEqual(statuses[shipment_code].request_status.company, company)
+
+    def test_existing_statuses_are_kept(self):
+        create_default_statuses(self.company)
+        self.assertEqual(ShipmentStatus.objects.filter(company=self.company).count(), len(DEFAULT_SHIPMENT_STATUSES))
+        self.assertEqual(RequestStatus.objects.filter(company=self.company).count(), len(DEFAULT_REQUEST_STATUSES))
@@ -0,0 +1,271 @@
+"""
+Тесты хранилищ вложений (logistic/storage.py).
+
+Один набор проверок выполняется для каждого хранилища. S3Storage
+проверяется на S3-совместимом сервере: адрес MinIO задается переменной
+S3_TEST_ENDPOINT_URL (ключи - S3_TEST_ACCESS_KEY и S3_TEST_SECRET_KEY),
+без нее запускается локальный сервер moto, если пакет установлен.
+"""
+import io
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+import uuid
+import zipfile
+from datetime import datetime
+from unittest import mock
+from urllib.request import urlopen
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+
+from logistic.models import FileBlob, Shipment
+from logistic.storage import LocalStorage, ShardedStorage, get_storage
+
+from .base import LogisticTestCase
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+
+def _chunks(data, size=3):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+class StorageContract:
+    """Проверки, общие для всех хранилищ. self.storage задает подкласс."""
+
+    def test_save_open_size(self):
+        size = self.storage.save('a/b/file.txt', _chunks(b'hello world'))
+        self.assertEqual(size, 11)
+        self.assertTrue(self.storage.exists('a/b/file.txt'))
+        self.assertEqual(self.storage.size('a/b/file.txt'), 11)
+        with self.storage.open('a/b/file.txt') as source:
+            self.assertEqual(source.read(), b'hello world')
+        self.assertIsInstance(self.storage.modified_time('a/b/file.txt'), datetime)
+
+    def test_missing_file(self):
+        self.assertFalse(self.storage.exists('missing/file.txt'))
+        with self.assertRaises(FileNotFoundError):
+            self.storage.size('missing/file.txt')
+        # Удаление отсутствующего файла ошибкой не считается
+        self.storage.delete('missing/file.txt')
+
+    def test_save_local_file(self):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as destination:
+            destination.write(b'local')
+        self.storage.save_local_file('local/kept.txt', path, keep_source=True)
+        self.assertTrue(os.path.exists(path))
+        self.storage.save_local_file('local/moved.txt', path)
+        self.assertFalse(os.path.exists(path))
+        for name in ('local/kept.txt', 'local/moved.txt'):
+            with self.storage.open(name) as source:
+                self.assertEqual(source.read(), b'local')
+
+    def test_copy_and_delete(self):
+        self.storage.save('source.txt', [b'data'])
+        self.storage.copy('source.txt', 'copy/target.txt')
+        self.storage.delete('source.txt')
+        self.assertFalse(self.storage.exists('source.txt'))
+        with self.storage.open('copy/target.txt') as source:
+            self.assertEqual(source.read(), b'data')
+
+    def test_walk_and_delete_tree(self):
+        names = {'tree/one.txt', 'tree/sub/two.txt'}
+        for name in names | {'other/three.txt'}:
+            self.storage.save(name, [b'x'])
+        self.assertEqual(set(self.storage.walk('tree')), names)
+        self.storage.delete_tree('tree')
+        self.assertEqual(list(self.storage.walk('tree')), [])
+        self.assertTrue(self.storage.exists('other/three.txt'))
+
+
+class FilesystemStorageContract(StorageContract):
+    """Проверки хранилищ на локальной файловой системе."""
+
+    def _failing_chunks(self):
+        yield b'new'
+        raise OSError('Диск переполнен')
+
+    def test_failed_save_keeps_previous_file(self):
+        self.storage.save('a/file.txt', [b'old'])
+        with self.assertRaises(OSError):
+            self.storage.save('a/file.txt', self._failing_chunks())
+        with self.storage.open('a/file.txt') as source:
+            self.assertEqual(source.read(), b'old')
+        # Временный файл записи удален
+        directory = os.path.dirname(self.storage.path('a/file.txt'))
+        self.assertEqual(os.listdir(directory), ['file.txt'])
+
+    def test_failed_save_creates_no_file(self):
+        with self.assertRaises(OSError):
+            self.storage.save('a/file.txt', self._failing_chunks())
+        self.assertFalse(self.storage.exists('a/file.txt'))
+        self.assertEqual(os.listdir(os.path.dirname(self.storage.path('a/file.txt'))), [])
+
+    def test_save_keeps_default_permissions(self):
+        self.storage.save('a/file.txt', [b'x'])
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(os.stat(self.storage.path('a/file.txt')).st_mode & 0o777, 0o666 & ~umask)
+
+    def test_walk_skips_unfinished_writes(self):
+        self.storage.save('tree/one.txt', [b'x'])
+        directory = os.path.dirname(self.storage.path('tree/one.txt'))
+        with open(os.path.join(directory, '.two.txt.abc123.part'), 'wb'):
+            pass
+        self.assertEqual(list(self.storage.walk('tree')), ['tree/one.txt'])
+
+
+class LocalStorageTests(FilesystemStorageContract, SimpleTestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.storage = LocalStorage(self.location)
+
+    def test_rejects_path_outside_location(self):
+        with self.assertRaises(Exception):
+            self.storage.save('../outside.txt', [b'x'])
+
+
+class ShardedStorageTests(FilesystemStorageContract, SimpleTestCase):
+
+    def setUp(self):
+        self.locations = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        for location in self.locations:
+            self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.storage = ShardedStorage(self.locations)
+
+    def test_delete_tree_removes_prefix_on_every_volume(self):
+        names = [f'tree/{index}.txt' for index in range(20)]
+        others = [f'other/{index}.txt' for index in range(20)]
+        for name in names + others:
+            self.storage.save(name, [b'x'])
+        # Файлы разнесены по обоим томам
+        volumes = {location for location in self.locations for name in names
+                   if self.storage.path(name).startswith(os.path.realpath(location) + os.sep)}
+        self.assertEqual(len(volumes), 2)
+
+        # Удаляются директории префикса в шардах, остальные файлы не обходятся
+        with mock.patch('logistic.storage.os.walk', side_effect=AssertionError('Обход файлов')):
+            self.storage.delete_tree('tree/')
+        self.assertFalse(any(self.storage.exists(name) for name in names))
+        self.assertTrue(all(self.storage.exists(name) for name in others))
+        for location in self.locations:
+            for dirpath, dirnames, filenames in os.walk(location):
+                self.assertNotIn('tree', dirnames)
+
+    def test_delete_tree_rejects_path_outside_location(self):
+        self.storage.save('x/file.txt', [b'x'])
+        with self.assertRaises(ValueError):
+            self.storage.delete_tree('../../..')
+
+
+def _s3_endpoint(test_case):
+    """
+    Адрес S3-совместимого сервера для тестов и ключи доступа.
+    Без S3_TEST_ENDPOINT_URL запускает сервер moto на время тестов класса.
+    """
+    if boto3 is None:
+        raise unittest.SkipTest('Пакет boto3 не установлен')
+    endpoint = os.getenv('S3_TEST_ENDPOINT_URL')
+    if endpoint:
+        return endpoint, os.getenv('S3_TEST_ACCESS_KEY', 'minioadmin'), os.getenv('S3_TEST_SECRET_KEY', 'minioadmin')
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise unittest.SkipTest('Не задан S3_TEST_ENDPOINT_URL и не установлен moto')
+    # Журнал запросов встроенного HTTP-сервера moto в выводе тестов не нужен
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0)
+    server.start()
+    test_case.addClassCleanup(server.stop)
+    host, port = server.get_host_and_port()
+    return f'http://{host}:{port}', 'testing', 'testing'
+
+
+class S3StorageMixin:
+    """Создает отдельный бакет на S3-совместимом сервере для каждого класса тестов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        endpoint, access_key, secret_key = _s3_endpoint(cls)
+        cls.bucket = f'test-{uuid.uuid4().hex[:12]}'
+        cls.s3_options = {
+            'bucket': cls.bucket,
+            'endpoint_url': endpoint,
+            'access_key': access_key,
+            'secret_key': secret_key,
+            'region': 'us-east-1',
+            'prefix': 'attachments',
+        }
+        s3 = boto3.resource(
+            's3', endpoint_url=endpoint, aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key, region_name='us-east-1',
+        )
+        s3.create_bucket(Bucket=cls.bucket)
+        cls.addClassCleanup(cls._drop_bucket, s3.Bucket(cls.bucket))
+
+    @staticmethod
+    def _drop_bucket(bucket):
+        bucket.objects.all().delete()
+        bucket.delete()
+
+
+class S3StorageTests(S3StorageMixin, StorageContract, SimpleTestCase):
+
+    def setUp(self):
+        from logistic.storage import S3Storage
+        self.storage = S3Storage(**self.s3_options)
+
+    def test_keys_use_prefix(self):
+        self.storage.save('prefixed.txt', [b'x'])
+        keys = [item['Key'] for item in self.storage.client.list_objects_v2(Bucket=self.bucket)['Contents']]
+        self.assertIn('attachments/prefixed.txt', keys)
+
+    def test_presigned_url(self):
+        self.storage.save('signed.txt', [b'signed'])
+        with urlopen(self.storage.url('signed.txt', filename='report.txt'), timeout=10) as response:
+            self.assertEqual(response.read(), b'signed')
+            self.assertIn('report.txt', response.headers['Content-Disposition'])
+
+
+class S3AttachmentApiTests(S3StorageMixin, LogisticTestCase):
+    """Загрузка и скачивание вложений через API при хранении в S3."""
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(ATTACHMENT_STORAGE={
+            'BACKEND': 'logistic.storage.S3Storage',
+            'OPTIONS': self.s3_options,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.shipment = Shipment.objects.create(
+            number='S-1', company=self.company, status=self.shipment_statuses['at_warehouse']
+        )
+
+    def test_upload_and_download(self):
+        client = self.client_for('manager')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                f'/api/shipments/{self.shipment.pk}/upload_files/',
+                {'files': [SimpleUploadedFile('notes.txt', b'notes ' * 100)]},
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        blob = FileBlob.objects.get()
+        self.assertTrue(get_storage().exists(blob.get_storage_name()))
+
+        response = client.get(f'/api/shipments/{self.shipment.pk}/download-all-files/')
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.read('notes.txt'), b'notes ' * 100)
+        response.close()
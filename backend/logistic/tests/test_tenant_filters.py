@@ -0,0 +1,172 @@
+"""
+Матрица эквивалентности ролей: выборки for_user и эндпоинты списков
+должны содержать те же строки, что прежние фильтры представлений
+(logistic/management/commands/verify_tenant_filters.py).
+"""
+from datetime import date
+
+from django.contrib.auth.models import User
+
+from logistic.management.commands.verify_tenant_filters import CHECKS
+from logistic.models import Article, Finance, ImportJob, Request, RequestStatus, Shipment, ShipmentStatus, UserProfile
+
+from .base import LogisticTestCase, create_company, create_profile
+
+# Эндпоинты списков, модели, строки которых они выводят, и поле первичного ключа в ответе
+LIST_ENDPOINTS = [
+    ('/api/requests/', 'Request', 'id'),
+    ('/api/shipments/', 'Shipment', 'id'),
+    ('/api/finance/', 'Finance', 'number'),
+    ('/api/userprofiles/', 'UserProfile', 'id'),
+    ('/api/articles/', 'Article', 'id'),
+    ('/api/shipment-statuses/', 'ShipmentStatus', 'id'),
+    ('/api/request-statuses/', 'RequestStatus', 'id'),
+    ('/api/imports/', 'ImportJob', 'id'),
+]
+
+DETAIL_ENDPOINTS = [
+    ('/api/requests/{}/', Request),
+    ('/api/shipments/{}/', Shipment),
+    ('/api/finance/{}/', Finance),
+]
+
+
+class TenantFilterEquivalenceTests(LogisticTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_company = create_company('Другая компания')
+        cls.other_profiles = {
+            role: create_profile(cls.other_company, role) for role in ('boss', 'manager', 'client')
+        }
+        cls.second_manager = create_profile(cls.company, 'manager', username='second-manager')
+        cls.second_client = create_profile(cls.company, 'client', username='second-client')
+        superuser = User.objects.create_superuser(username='root', email='root@example.com', password='password')
+        cls.superuser = UserProfile.objects.create(user=superuser, company=cls.company, user_group='superuser', name='root')
+        homeless = User.objects.create_user(username='homeless', password='password')
+        cls.homeless = UserProfile.objects.create(user=homeless, company=None, user_group='manager', name='homeless')
+
+        for company, manager, clients in (
+            (cls.company, cls.profiles['manager'], [cls.profiles['client'], cls.second_client]),
+            (cls.other_company, cls.other_profiles['manager'], [cls.other_profiles['client']]),
+        ):
+            cls._create_company_data(company, manager, clients)
+
+    @classmethod
+    def _create_company_data(cls, company, manager, clients):
+        """
+        Для каждого клиента: заявка своего менеджера, чужого менеджера и без
+        менеджера; часть заявок привязана к отправке, часть операций - к заявкам.
+        """
+        request_status = RequestStatus.objects.get(company=company, code='expected')
+        shipment_status = ShipmentStatus.objects.get(company=company, code='at_warehouse')
+        article = Article.objects.create(name='Доставка', company=company)
+        ImportJob.objects.create(company=company, kind=ImportJob.KIND_REQUESTS, file_name='import.csv')
+        number = 0
+        for client in clients:
+            shipment = Shipment.objects.create(number=f'S-{client.pk}', company=company, status=shipment_status)
+            Shipment.objects.create(number=f'E-{client.pk}', company=company, status=shipment_status)
+            for request_manager in (manager, cls.second_manager if company == cls.company else None, None):
+                number += 1
+                request = Request.objects.create(
+                    number=number, company=company, status=request_status, client=client,
+                    manager=request_manager, shipment=shipment if number % 2 else None,
+                )
+                for paid_request in (request, None):
+                    Finance.objects.create(
+                        company=company, operation_type='in', payment_date=date(2026, 3, 1), document_type='bill',
+                        currency='rub', amount=100, article=article, request=paid_request,
+                        counterparty=client.user,
+                    )
+
+    def _users(self):
+        profiles = [
+            *self.profiles.values(), *self.other_profiles.values(),
+            self.second_manager, self.second_client, self.superuser, self.homeless,
+        ]
+        for profile in profiles:
+            yield f'{profile.name} ({profile.user_group})', profile.user
+
+    def _legacy_ids(self, name, user):
+        legacy = dict((check_name, queryset) for check_name, _, queryset in CHECKS)[name]
+        return set(legacy(user).values_list('pk', flat=True))
+
+    def _api_ids(self, client, url, key):
+        """Идентификаторы всех строк списка с учетом пагинации; None, если доступ запрещен."""
+        ids = set()
+        while url:
+            response = client.get(url)
+            if response.status_code == 403:
+                return None
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            if isinstance(data, list):
+                rows, url = data, None
+            else:
+                rows, url = data['results'], data['next']
+            ids.update(row[key] for row in rows)
+        return ids
+
+    def test_querysets_match_legacy_filters(self):
+        for label, user in self._users():
+            for name, model, _ in CHECKS:
+                with self.subTest(user=label, model=name):
+                    current = set(model.objects.for_user(user).values_list('pk', flat=True))
+                    self.assertEqual(current, self._legacy_ids(name, user))
+
+    def test_role_visibility(self):
+        # Матрица не должна сводиться к сравнению пустых выборок
+        self.assertEqual(self._legacy_ids('Request', self.profiles['boss'].user), set(
+            Request.objects.filter(company=self.company).values_list('pk', flat=True)
+        ))
+        manager_requests = Request.objects.for_user(self.profiles['manager'].user)
+        self.assertTrue(manager_requests.exists())
+        self.assertFalse(manager_requests.filter(manager=self.second_manager).exists())
+        client = self.profiles['client']
+        self.assertEqual(
+            set(Request.objects.for_user(client.user)), set(Request.objects.filter(client=client))
+        )
+        self.assertEqual(Shipment.objects.for_user(client.user).count(), 1)
+        self.assertEqual(Finance.objects.for_user(client.user).count(), 3)
+        self.assertFalse(Request.objects.for_user(self.homeless.user).exists())
+
+    def test_list_endpoints_match_legacy_filters(self):
+        for label, user in self._users():
+            client = self.client_class()
+            client.force_login(user)
+            for url, name, key in LIST_ENDPOINTS:
+                with self.subTest(user=label, url=url):
+                    ids = self._api_ids(client, url, key)
+                    if ids is None:
+                        continue
+                    if name == 'RequestStatus' and user.is_superuser:
+                        # Представление статусов заявок по-прежнему отдает суперпользователю все статусы
+                        expected = set(RequestStatus.objects.values_list('pk', flat=True))
+                    else:
+                        expected = self._legacy_ids(name, user)
+                    self.assertEqual(ids, expected)
+
+    def test_detail_endpoints_hide_foreign_rows(self):
+        for role in ('manager', 'client'):
+            user = self.profiles[role].user
+            client = self.client_for(role)
+            for url, model in DETAIL_ENDPOINTS:
+                visible = self._legacy_ids(model.__name__, user)
+                hidden = model.objects.exclude(pk__in=visible).values_list('pk', flat=True)
+                with self.subTest(role=role, model=model.__name__):
+                    self.assertTrue(hidden)
+                    for pk in hidden:
+                        self.assertIn(client.get(url.format(pk)).status_code, (403, 404))
+
+    def test_request_company_differs_from_client_company(self):
+        # Единственный случай расхождения: заявка записана на другую компанию, чем ее клиент.
+        # for_user смотрит на Request.company, прежний фильтр - на компанию клиента.
+        request = Request.objects.create(
+            number=100, company=self.other_company, client=self.profiles['client'],
+            status=RequestStatus.objects.get(company=self.other_company, code='expected'),
+        )
+        boss = self.profiles['boss'].user
+        self.assertIn(request.pk, self._legacy_ids('Request', boss))
+        self.assertFalse(Request.objects.for_user(boss).filter(pk=request.pk).exists())
+        self.assertTrue(Request.objects.for_user(self.other_profiles['boss'].user).filter(pk=request.pk).exists())
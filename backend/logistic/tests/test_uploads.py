@@ -0,0 +1,83 @@
+"""
+Тесты приема загрузок в хранилище вложений (logistic/uploads.py) и отклонения
+недопустимых файлов в эндпоинтах загрузки.
+"""
+import os
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+
+from logistic.models import FileBlob, Request, RequestFile, Shipment, ShipmentFile
+from logistic.storage import get_storage
+
+from .base import LogisticTestCase
+
+MAX_SIZE = 1024
+
+
+@override_settings(UPLOAD_MAX_FILE_SIZE=MAX_SIZE)
+class UploadRejectionTests(LogisticTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.shipment = Shipment.objects.create(
+            number='S-1', company=cls.company, status=cls.shipment_statuses['at_warehouse']
+        )
+        cls.request = Request.objects.create(
+            number=1, company=cls.company, status=cls.request_statuses['expected'],
+            client=cls.profiles['client'], manager=cls.profiles['manager'],
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for('manager')
+        self.temp_dir = get_storage().temp_dir()
+
+    def _post(self, url, files):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, {'files': files}, format='multipart')
+
+    def _files(self):
+        return [
+            SimpleUploadedFile('invoice.txt', b'Invoice 42'),
+            SimpleUploadedFile('setup.EXE', b'installer'),
+            SimpleUploadedFile('big.bin', b'x' * (MAX_SIZE + 1)),
+            # Исполняемый файл под видом документа
+            SimpleUploadedFile('report.doc', b'MZ\x90\x00' + b'\x00' * 60),
+        ]
+
+    def _assert_rejected(self, response):
+        self.assertEqual(response.status_code, 400, response.content)
+        rejected = {item['file']: item['error'] for item in response.json()['rejected']}
+        self.assertEqual(set(rejected), {'setup.EXE', 'big.bin', 'report.doc'})
+        self.assertIn('.exe', rejected['setup.EXE'])
+        self.assertIn('Исполняемые', rejected['report.doc'])
+        self.assertIn('больше', rejected['big.bin'])
+
+    def _assert_nothing_stored(self):
+        self.assertFalse(ShipmentFile.objects.exists())
+        self.assertFalse(RequestFile.objects.exists())
+        self.assertFalse(FileBlob.objects.exists())
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_shipment_upload_rejects_whole_request(self):
+        response = self._post(f'/api/shipments/{self.shipment.pk}/upload_files/', self._files())
+        self._assert_rejected(response)
+        self._assert_nothing_stored()
+
+    def test_request_upload_rejects_whole_request(self):
+        response = self._post(f'/api/requests/{self.request.pk}/request_upload_files/', self._files())
+        self._assert_rejected(response)
+        self._assert_nothing_stored()
+
+    def test_valid_files_are_moved_to_blobs(self):
+        files = [SimpleUploadedFile('invoice.txt', b'Invoice 42'), SimpleUploadedFile('photo.jpg', b'x' * MAX_SIZE)]
+        response = self._post(f'/api/shipments/{self.shipment.pk}/upload_files/', files)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(ShipmentFile.objects.count(), 2)
+        self.assertEqual(FileBlob.objects.count(), 2)
+        # Временные файлы переименованы в блобы, в директории загрузок ничего не осталось
+        self.assertEqual(os.listdir(self.temp_dir), [])
+        for blob in FileBlob.objects.all():
+            self.assertTrue(get_storage().exists(blob.get_storage_name()))
@@ -0,0 +1,133 @@
+"""
+Прием загружаемых файлов сразу в хранилище вложений.
+
+Стандартные обработчики Django держат файл в памяти или во временном
+файле в системной директории, после чего store_upload (blobstore.py)
+еще раз копировал его во временную директорию хранилища - каждый байт
+записывался на диск дважды.
+
+StorageUploadHandler пишет части multipart-запроса прямо во временную
+директорию хранилища (для локальных хранилищ - на том же томе, что и
+блобы) и по мере приема вычисляет SHA-256. store_upload затем только
+переименовывает готовый файл в блоб или удаляет его, если такой блоб
+уже есть.
+
+Ограничения проверяются во время приема:
+- размер файла - UPLOAD_MAX_FILE_SIZE (по Content-Length части, если он
+  передан, и по фактически принятым байтам);
+- расширение - UPLOAD_BLOCKED_EXTENSIONS;
+- содержимое - исполняемые файлы (PE, ELF) отклоняются по первым байтам.
+Отклоненный файл не записывается дальше, его частичный файл удаляется,
+а разбор запроса продолжается, чтобы сообщить обо всех отклоненных файлах.
+Представление в этом случае не создает ни одной записи.
+
+Временные файлы удаляются при закрытии загруженного файла (по окончании
+запроса), если они не были перемещены в хранилище, и при обрыве загрузки.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers
+from django.template.defaultfilters import filesizeformat
+
+from .storage import get_storage
+
+# Начало исполняемых файлов Windows (PE) и Linux (ELF)
+EXECUTABLE_SIGNATURES = (b'MZ', b'\x7fELF')
+
+
+class StoredUploadedFile(TemporaryUploadedFile):
+    """
+    Загруженный файл во временной директории хранилища вложений с
+    SHA-256, вычисленным при приеме.
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        file = tempfile.NamedTemporaryFile(suffix='.upload', dir=get_storage().temp_dir())
+        # TemporaryUploadedFile создает файл в FILE_UPLOAD_TEMP_DIR, поэтому его __init__ пропускается
+        super(TemporaryUploadedFile, self).__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = None
+
+
+class StorageUploadHandler(FileUploadHandler):
+    """
+    Обработчик загрузки, записывающий файлы во временную директорию
+    хранилища вложений с проверкой ограничений и вычислением SHA-256.
+    Отклоненные файлы перечисляются в request.upload_rejections.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        request.upload_rejections = []
+
+    def _reject(self, error):
+        self.request.upload_rejections.append({'file': self.file_name, 'error': error})
+        raise SkipFile()
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        # Предыдущий файл уже в request.FILES: при SkipFile Django закрывает handler.file
+        if hasattr(self, 'file'):
+            del self.file
+
+        extension = os.path.splitext(file_name)[1].lower()
+        if extension in settings.UPLOAD_BLOCKED_EXTENSIONS:
+            self._reject(f'Файлы {extension} загружать нельзя')
+        if content_length is not None and content_length > settings.UPLOAD_MAX_FILE_SIZE:
+            self._reject(f'Файл больше {filesizeformat(settings.UPLOAD_MAX_FILE_SIZE)}')
+
+        self.digest = hashlib.sha256()
+        self.file = StoredUploadedFile(file_name, content_type, 0, charset, content_type_extra)
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and raw_data.startswith(EXECUTABLE_SIGNATURES):
+            self._reject('Исполняемые файлы загружать нельзя')
+        if start + len(raw_data) > settings.UPLOAD_MAX_FILE_SIZE:
+            self._reject(f'Файл больше {filesizeformat(settings.UPLOAD_MAX_FILE_SIZE)}')
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        # seek сбрасывает буфер записи на диск
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.digest.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            # Закрытие временного файла удаляет его
+            self.file.close()
+
+
+def use_storage_upload(request):
+    """
+    Включает StorageUploadHandler для запроса Django.
+    Вызывается до первого обращения к request.FILES или request.POST.
+    """
+    request.upload_handlers = [StorageUploadHandler(request)]
+
+
+def upload_rejections(request):
+    """Файлы, отклоненные StorageUploadHandler: [{'file', 'error'}]."""
+    return getattr(request, 'upload_rejections', None) or []
+
+
+class StorageUploadMixin:
+    """
+    Примесь для ViewSet: действия из storage_upload_actions принимают
+    файлы через StorageUploadHandler.
+    """
+    storage_upload_actions = ()
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Действие определяется в ViewSetMixin.initialize_request, тело запроса еще не прочитано
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        if getattr(self, 'action', None) in self.storage_upload_actions:
+            use_storage_upload(request)
+        return drf_request
@@ -2,11 +2,14 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     UserProfileViewSet, ShipmentViewSet, RequestViewSet, 
-    ArticleList, ArticleDetail, FinanceList, FinanceDetail, 
+    ArticleList, ArticleDetail, FinanceList, FinanceDetail, FinanceExportView, 
     ShipmentCalculationViewSet, CompanyViewSet, ShipmentStatusViewSet,
     RequestStatusViewSet, AnalyticsSummaryView, BalanceView,
-    CounterpartyBalanceView, EmailView
+    CounterpartyBalanceView, EmailView, SignedFileDownloadView,
+    RequestProfileListView, RequestProfileDetailView, MetricsView, ImportJobViewSet,
+    BootstrapView, BatchView, StatusTransitionViewSet
 )
+from . import async_views
 
 # Настройка маршрутизации API
 router = DefaultRouter()
@@ -17,17 +20,26 @@ router.register(r'shipment-calculations', ShipmentCalculationViewSet)
 router.register(r'companies', CompanyViewSet)
 router.register(r'shipment-statuses', ShipmentStatusViewSet)
 router.register(r'request-statuses', RequestStatusViewSet)
+router.register(r'imports', ImportJobViewSet, basename='import-job')
+router.register(r'status-transitions', StatusTransitionViewSet, basename='status-transition')
 
 urlpatterns = [
     # Включаем все маршруты из роутера
     path('', include(router.urls)),
     
+    # Стартовые данные фронтенда
+    path('bootstrap/', BootstrapView.as_view(), name='bootstrap'),
+
+    # Несколько GET-запросов одним HTTP-запросом
+    path('batch/', BatchView.as_view(), name='batch'),
+    
     # Маршруты для аналитики
     path('analytics/summary/', AnalyticsSummaryView.as_view(), name='analytics-summary'),
     
     # Маршруты для финансов
     path('finance/', FinanceList.as_view(), name='finance-list'),
     path('finance/<int:number>/', FinanceDetail.as_view(), name='finance-detail'),
+    path('finance/export/', FinanceExportView.as_view(), name='finance-export'),
     path('finance/balance/', BalanceView.as_view(), name='balance'),
     path('finance/counterparty-balance/', CounterpartyBalanceView.as_view(), name='counterparty-balance'),
     
@@ -37,4 +49,26 @@ urlpatterns = [
     
     # Маршруты для email
     path('email/send/', EmailView.as_view(), name='send-email'),
+
+    # Скачивание файлов по подписанным ссылкам хранилища
+    path('files/signed/<str:token>/', SignedFileDownloadView.as_view(), name='signed-file-download'),
+
+    # Профили запросов (только для суперпользователей)
+    path('admin/profiles/', RequestProfileListView.as_view(), name='request-profile-list'),
+    path('admin/profiles/<int:profile_id>/', RequestProfileDetailView.as_view(), name='request-profile-detail'),
+
+    # Метрики в формате Prometheus
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+
+    # Асинхронные версии эндпоинтов с долгим вводом-выводом (для запуска под ASGI)
+    path('async/shipments/<int:pk>/download-file/<int:file_id>/', async_views.shipment_download_file, name='async-shipment-download-file'),
+    path('async/shipments/<int:pk>/download-all-files/', async_views.shipment_download_all_files, name='async-shipment-download-all-files'),
+    path('async/shipments/<int:pk>/upload-files/', async_views.shipment_upload_files, name='async-shipment-upload-files'),
+    path('async/requests/<int:pk>/download-file/<int:file_id>/', async_views.request_download_file, name='async-request-download-file'),
+    path('async/requests/<int:pk>/download-all-files/', async_views.request_download_all_files, name='async-request-download-all-files'),
+    path('async/requests/<int:pk>/upload-files/', async_views.request_upload_files, name='async-request-upload-files'),
+    path('async/email/send/', async_views.send_email, name='async-send-email'),
+    path('async/analytics/summary/', async_views.analytics_summary, name='async-analytics-summary'),
+    path('async/finance/balance/', async_views.finance_balance, name='async-balance'),
+    path('async/finance/counterparty-balance/', async_views.counterparty_balance, name='async-counterparty-balance'),
 ]
\ No newline at end of file
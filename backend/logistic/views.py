@@ -1,6 +1,6 @@
-from rest_framework import viewsets, status, generics
-from .models import UserProfile, Shipment, Request, RequestFile, ShipmentFile, ShipmentFolder, Article, Finance, ShipmentCalculation, Company, ShipmentStatus, RequestStatus
-from .serializers import UserProfileSerializer, ShipmentListSerializer, ShipmentDetailSerializer, RequestListSerializer, RequestDetailSerializer, RequestFileSerializer, ShipmentFileSerializer, ShipmentFolderSerializer, ArticleSerializer, FinanceListSerializer, FinanceDetailSerializer, ShipmentCalculationSerializer, CompanySerializer, ShipmentStatusSerializer, RequestStatusSerializer, AnalyticsSummarySerializer, BalanceSerializer, CounterpartyBalanceSerializer, EmailSerializer, RequestSerializer
+from rest_framework import viewsets, status, generics, mixins
+from .models import create_default_statuses, UserProfile, Shipment, Request, RequestFile, ShipmentFile, ShipmentFolder, FileBlob, Article, Finance, ShipmentCalculation, Company, ShipmentStatus, RequestStatus, ImportJob, StatusTransition
+from .serializers import UserProfileSerializer, ShipmentListSerializer, ShipmentDetailSerializer, RequestListSerializer, RequestDetailSerializer, RequestFileSerializer, ShipmentFileSerializer, ShipmentFolderSerializer, ShipmentFolderTreeSerializer, ArticleSerializer, FinanceListSerializer, FinanceDetailSerializer, ShipmentCalculationSerializer, CompanySerializer, ShipmentStatusSerializer, RequestStatusSerializer, ImportJobSerializer, ImportJobDetailSerializer, AnalyticsSummarySerializer, BalanceSerializer, CounterpartyBalanceSerializer, EmailSerializer, RequestSerializer, BatchSerializer, StatusTransitionSerializer, StatusAnalyticsSerializer
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes, renderer_classes, schema
 from rest_framework.parsers import MultiPartParser, FormParser
@@ -9,7 +9,6 @@ import os
 from django.http import HttpResponseBadRequest, FileResponse, Http404, JsonResponse
 from urllib.parse import unquote
 from django.utils.encoding import smart_str  # для безопасного декодирования в UTF-8
-import shutil
 from django.core.mail import send_mail
 from django.contrib.auth.models import User
 import smtplib
@@ -17,7 +16,7 @@ import ssl
 import certifi
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from django.db.models import Sum, Count
+from django.db.models import Count
 from decimal import Decimal, ROUND_HALF_UP
 from .permissions import (
     IsSuperuser, IsCompanyAdmin, IsCompanyBoss, 
@@ -27,6 +26,7 @@ from .permissions import (
 from django.shortcuts import get_object_or_404
 from django.conf import settings
 import json
+import hashlib
 import datetime
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ValidationError
@@ -34,6 +34,162 @@ from django.db.models import Q
 from rest_framework.renderers import JSONRenderer
 from rest_framework.schemas import AutoSchema
 from rest_framework import permissions
+from django.db import transaction
+from .batch import run_batch
+from .bootstrap import bootstrap_data, bootstrap_etag, company_version, profile_data
+from .cleanup import schedule_deletion, schedule_legacy_files
+from .blobstore import blob_transaction, store_upload
+from .storage import get_storage, load_signed_url
+from .profiling import get_buffer as get_profile_buffer, get_profile as get_request_profile
+from . import metrics
+from django.core import signing
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from . import nplusone
+from .db_router import ReplicaReadMixin
+from .currency import (
+    COUNTERPARTY_FIELDS, BalanceTotals, annotate_converted, balance_data, converted_totals, counterparty_balances,
+    finance_totals, rates_on, target_currency,
+)
+from .file_tree import file_tree_version
+from .exports import CSV_CONTENT_TYPE, FINANCE_EXPORT_COLUMNS, REQUEST_EXPORT_COLUMNS, SHIPMENT_EXPORT_COLUMNS, csv_chunks, export_response
+from .imports import error_report_rows, import_storage_name, run_import_job
+from .status_history import (
+    PERCENTILES, StatusHistoryMixin, cascade_shipment_status, change_status, initial_transitions, record_transitions,
+    throughput, time_in_status,
+)
+from .tasks import run_on_commit
+from .uploads import StorageUploadMixin, upload_rejections
+
+# Связанные объекты, которые читают сериализаторы заявок и финансовых операций.
+# Загружаются вместе с основной выборкой, чтобы не было отдельного запроса на строку.
+REQUEST_RELATED_FIELDS = ('client', 'manager', 'shipment', 'company', 'status')
+FINANCE_RELATED_FIELDS = ('article', 'counterparty', 'shipment', 'request', 'company', 'created_by')
+
+
+def wants_original(params):
+    """Запрошен ли оригинал изображения вместо веб-версии (?original=1)."""
+    return params.get('original') in ('1', 'true')
+
+
+def attachment_response(request, file_instance):
+    """
+    Возвращает ответ со скачиванием файла заявки или отправки.
+
+    По умолчанию содержимое отдается потоком из хранилища. С параметром
+    ?redirect=1 клиент перенаправляется на подписанную ссылку хранилища
+    (для S3 - напрямую в объектное хранилище, минуя приложение).
+    Для изображений с веб-версией отдается она, оригинал - с ?original=1.
+    """
+    storage = get_storage()
+    name, filename = file_instance.get_download(wants_original(request.query_params))
+
+    if request.query_params.get('redirect') in ('1', 'true'):
+        url = storage.url(name, filename=filename)
+        return HttpResponseRedirect(request.build_absolute_uri(url))
+
+    if not storage.exists(name):
+        raise Http404("Файл не найден")
+
+    response = FileResponse(storage.open(name), as_attachment=True)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+    metrics.record_download('shipment' if isinstance(file_instance, ShipmentFile) else 'request', response)
+    return response
+
+def thumbnail_response(request, file_instance):
+    """
+    Возвращает миниатюру (?size=thumb, по умолчанию) или превью первой
+    страницы (?size=preview) файла.
+
+    Превью привязаны к неизменяемому содержимому блоба, поэтому
+    отдаются с заголовками для бессрочного кеширования в браузере.
+    """
+    kind = request.query_params.get('size', 'thumb')
+    blob = file_instance.blob
+    if kind not in FileBlob.PREVIEW_KINDS or blob is None or blob.preview_status != FileBlob.PREVIEW_READY:
+        raise Http404("Превью не найдено")
+
+    etag = f'"{blob.sha256}-{kind}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        storage = get_storage()
+        name = blob.get_preview_name(kind)
+        if not storage.exists(name):
+            raise Http404("Превью не найдено")
+        response = FileResponse(storage.open(name), content_type='image/webp')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+def create_shipment_files(shipment_instance, files, folder, uploaded_by):
+    """
+    Сохраняет загруженные файлы отправки и возвращает созданные записи.
+    """
+    created_files = []
+    # Поиск блоба по хешу выполняется для каждого файла, это не N+1
+    with blob_transaction(), nplusone.ignore():
+        for file in files:
+            # Содержимое сохраняется в хранилище блобов, дубликаты не записываются повторно
+            file_obj = ShipmentFile.objects.create(
+                shipment=shipment_instance, 
+                file=file.name, 
+                folder=folder,
+                blob=store_upload(file),
+                uploaded_by=uploaded_by
+            )
+            created_files.append(file_obj)
+    metrics.record_upload('shipment', files)
+    return created_files
+
+def create_request_files(request_instance, files, uploaded_by):
+    """
+    Сохраняет загруженные файлы заявки и возвращает созданные записи.
+    """
+    created_files = []
+    with blob_transaction(), nplusone.ignore():
+        for file in files:
+            file_obj = RequestFile.objects.create(
+                request=request_instance, 
+                file=file.name,
+                blob=store_upload(file),
+                uploaded_by=uploaded_by
+            )
+            created_files.append(file_obj)
+    metrics.record_upload('request', files)
+    return created_files
+
+def build_email_message(data):
+    """
+    Создает MIME-сообщение из проверенных данных EmailSerializer.
+    """
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = data['subject']
+    msg['From'] = f"{data['sender_name']} <{data['sender_email']}>"
+    msg['To'] = data['recipient_email']
+    
+    # Добавляем текстовое содержимое
+    part1 = MIMEText(data['message_plain'], 'plain')
+    msg.attach(part1)
+
+    # Если есть HTML-содержимое, добавляем его
+    if data['message_html']:
+        part2 = MIMEText(data['message_html'], 'html')
+        msg.attach(part2)
+    return msg
+
+def send_email_message(data, msg):
+    """
+    Отправляет сообщение через SMTP-сервер с TLS.
+    """
+    context = ssl.create_default_context(cafile=certifi.where())
+    with smtplib.SMTP_SSL("smtp.example.com", 465, context=context) as server:
+        server.login(data['sender_email'], 'password')  # В реальной жизни пароль должен быть в безопасном хранилище
+        server.sendmail(data['sender_email'], data['recipient_email'], msg.as_string())
 
 
 class CompanyViewSet(viewsets.ModelViewSet):
@@ -112,33 +268,7 @@ class CompanyViewSet(viewsets.ModelViewSet):
         """
         Создает стандартные статусы для новой компании.
         """
-        # Статусы для заявок
-        request_statuses = [
-            {'code': 'new', 'name': 'Новая заявка', 'is_default': True, 'is_final': False, 'order': 1},
-            {'code': 'expected', 'name': 'Ожидается на складе', 'is_default': False, 'is_final': False, 'order': 2},
-            {'code': 'on_warehouse', 'name': 'Формируется', 'is_default': False, 'is_final': False, 'order': 3},
-            {'code': 'in_progress', 'name': 'В работе', 'is_default': False, 'is_final': False, 'order': 4},
-            {'code': 'ready', 'name': 'Готово к выдаче', 'is_default': False, 'is_final': False, 'order': 5},
-            {'code': 'delivered', 'name': 'Доставлено', 'is_default': False, 'is_final': True, 'order': 6}
-        ]
-        
-        # Статусы для отправок
-        shipment_statuses = [
-            {'code': 'at_warehouse', 'name': 'На складе', 'is_default': True, 'is_final': False, 'order': 1},
-            {'code': 'document_preparation', 'name': 'Подготовка документов', 'is_default': False, 'is_final': False, 'order': 2},
-            {'code': 'departed', 'name': 'Отправлен', 'is_default': False, 'is_final': False, 'order': 3},
-            {'code': 'in_transit', 'name': 'В пути', 'is_default': False, 'is_final': False, 'order': 4},
-            {'code': 'delivered', 'name': 'Доставлен', 'is_default': False, 'is_final': True, 'order': 5},
-            {'code': 'cancelled', 'name': 'Отменен', 'is_default': False, 'is_final': True, 'order': 6}
-        ]
-        
-        # Создаем статусы для заявок
-        for status_data in request_statuses:
-            RequestStatus.objects.create(company=company, **status_data)
-            
-        # Создаем статусы для отправок
-        for status_data in shipment_statuses:
-            ShipmentStatus.objects.create(company=company, **status_data)
+        create_default_statuses(company)
 
     @action(detail=True, methods=['get'])
     def admins(self, request, pk=None):
@@ -305,7 +435,7 @@ class CompanyViewSet(viewsets.ModelViewSet):
             )
 
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ViewSet для управления профилями пользователей.
     
@@ -339,15 +469,13 @@ class UserProfileViewSet(viewsets.ModelViewSet):
         Суперпользователи видят всех пользователей, администраторы и руководители - 
         только пользователей своей компании.
         """
-        if self.request.user.is_superuser or (hasattr(self.request.user, 'userprofile') and 
-                                             self.request.user.userprofile.user_group == 'superuser'):
-            return UserProfile.objects.all()
-        
-        if hasattr(self.request.user, 'userprofile') and self.request.user.userprofile.company:
-            company = self.request.user.userprofile.company
-            return UserProfile.objects.filter(company=company)
-        
-        return UserProfile.objects.none()
+        return UserProfile.objects.for_user(self.request.user)
+
+    def filter_queryset(self, queryset):
+        """
+        Подгружает пользователя и компанию, которые выводит сериализатор.
+        """
+        return super().filter_queryset(queryset).select_related('user', 'company')
 
     @action(detail=False, methods=['get'])
     def clients(self, request):
@@ -466,7 +594,7 @@ class ShipmentStatusViewSet(viewsets.ModelViewSet):
         """
         Возвращает только статусы компании пользователя.
         """
-        return ShipmentStatus.objects.filter(company=self.request.user.userprofile.company)
+        return ShipmentStatus.objects.for_user(self.request.user).select_related('request_status')
 
     def perform_create(self, serializer):
         """
@@ -476,14 +604,12 @@ class ShipmentStatusViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def available_statuses(self, request):
-        statuses = ShipmentStatus.objects.filter(
-            company=request.user.userprofile.company
-        ).order_by('order')
+        statuses = ShipmentStatus.objects.for_user(request.user).select_related('request_status').order_by('order')
         serializer = ShipmentStatusSerializer(statuses, many=True)
         return Response(serializer.data)
 
 
-class ShipmentViewSet(viewsets.ModelViewSet):
+class ShipmentViewSet(StatusHistoryMixin, StorageUploadMixin, ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ViewSet для управления отправками.
     
@@ -495,6 +621,8 @@ class ShipmentViewSet(viewsets.ModelViewSet):
     - Обновление статуса и комментария: сотрудники склада
     """
     queryset = Shipment.objects.all().order_by('-created_at')
+    replica_read_actions = ('list', 'retrieve', 'export')
+    storage_upload_actions = ('upload_files',)
     
     def get_permissions(self):
         """
@@ -523,84 +651,43 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         return ShipmentListSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        if not user.is_authenticated:
-            return Shipment.objects.none()
-        
-        user_profile = user.userprofile
-        company = user_profile.company
-        
-        if user_profile.user_group in ['superuser', 'admin']:
-            return Shipment.objects.filter(company=company)
-        elif user_profile.user_group == 'boss':
-            return Shipment.objects.filter(company=company)
-        elif user_profile.user_group == 'manager':
-            return Shipment.objects.filter(company=company)
-        elif user_profile.user_group == 'warehouse':
-            # Разрешаем сотрудникам склада видеть все отправления компании
-            return Shipment.objects.filter(company=company)
-        elif user_profile.user_group == 'client':
-            return Shipment.objects.filter(
-                company=company,
-                request__client=user_profile
-            ).distinct()
-        
-        return Shipment.objects.none()
-    
-    def _create_default_statuses(self, company):
-        """Создает дефолтные статусы для компании"""
-        default_statuses = [
-            {
-                'code': 'at_warehouse',
-                'name': 'На складе',
-                'is_default': False,
-                'is_final': False,
-                'order': 1
-            },
-            {
-                'code': 'document_preparation',
-                'name': 'Подготовка документов',
-                'is_default': False,
-                'is_final': False,
-                'order': 2
-            },
-            {
-                'code': 'departed',
-                'name': 'Отправлен',
-                'is_default': False,
-                'is_final': False,
-                'order': 3
-            },
-            {
-                'code': 'in_transit',
-                'name': 'В пути',
-                'is_default': False,
-                'is_final': False,
-                'order': 4
-            },
-            {
-                'code': 'delivered',
-                'name': 'Доставлен',
-                'is_default': False,
-                'is_final': True,
-                'order': 5
-            },
-            {
-                'code': 'cancelled',
-                'name': 'Отменен',
-                'is_default': False,
-                'is_final': True,
-                'order': 6
-            }
-        ]
-        
-        for status_data in default_statuses:
-            ShipmentStatus.objects.get_or_create(
-                company=company,
-                code=status_data['code'],
-                defaults=status_data
+        """
+        Возвращает отправки в зависимости от роли пользователя.
+        """
+        return Shipment.objects.for_user(self.request.user)
+
+    def filter_queryset(self, queryset):
+        """
+        Подгружает связанные объекты, которые выводят сериализаторы отправки.
+
+        Количество заявок считается подзапросом, а для детального просмотра
+        папки, файлы и заявки загружаются отдельными запросами на всю отправку.
+        """
+        requests_count = Request.objects.filter(shipment=OuterRef('pk')).order_by().values('shipment').annotate(
+            count=Count('id')
+        ).values('count')
+        queryset = super().filter_queryset(queryset).select_related('company', 'status', 'created_by').annotate(
+            requests_count=Coalesce(Subquery(requests_count), 0)
+        )
+        if self.action == 'retrieve':
+            files = ShipmentFile.objects.select_related('folder', 'uploaded_by', 'blob')
+            queryset = queryset.select_related('calculation').prefetch_related(
+                Prefetch('folders', queryset=ShipmentFolder.objects.select_related('created_by')),
+                Prefetch('folders__files', queryset=files),
+                Prefetch('files', queryset=files),
+                Prefetch('request_set', queryset=Request.objects.select_related(*REQUEST_RELATED_FIELDS)),
             )
+        return queryset
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Выгрузка списка отправок в CSV или XLSX (?file_format=xlsx) потоком.
+        Выборка и фильтры те же, что у списка.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return export_response(request, queryset, SHIPMENT_EXPORT_COLUMNS, 'shipments')
+    
     def perform_create(self, serializer):
         user_profile = self.request.user.userprofile
         company = user_profile.company
@@ -613,7 +700,7 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         
         if not default_status:
             # Если нет дефолтного статуса, создаем все статусы
-            self._create_default_statuses(company)
+            create_default_statuses(company)
             default_status = ShipmentStatus.objects.filter(
                 company=company,
                 is_default=True
@@ -628,11 +715,14 @@ class ShipmentViewSet(viewsets.ModelViewSet):
                 if not default_status:
                     raise ValidationError('Не удалось создать статусы для компании')
         
-        serializer.save(
-            company=company,
-            created_by=user_profile,
-            status=default_status
-        )
+        with transaction.atomic():
+            shipment = serializer.save(
+                company=company,
+                created_by=user_profile,
+                status=default_status,
+                status_changed_at=timezone.now()
+            )
+            record_transitions(initial_transitions([shipment], self.request.user))
 
     @action(detail=True, methods=['post'], parser_classes=[MultiPartParser])
     def upload_files(self, request, pk=None):
@@ -645,6 +735,9 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         files = request.FILES.getlist('files')
         folder_id = request.data.get('folder_id')
 
+        rejected = upload_rejections(request)
+        if rejected:
+            return Response({"error": "Files rejected", "rejected": rejected}, status=status.HTTP_400_BAD_REQUEST)
         if not files:
             return Response({"error": "No files provided"}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -652,28 +745,10 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         if folder_id:
             folder = ShipmentFolder.objects.get(id=folder_id)
 
-        folder_path = os.path.join(
-            settings.MEDIA_ROOT, 
-            f'logistic/shipments/{shipment_instance.id}/{folder.name if folder else ""}'
+        created_files = create_shipment_files(
+            shipment_instance, files, folder, getattr(request.user, 'userprofile', None)
         )
 
-        os.makedirs(folder_path, exist_ok=True)
-
-        created_files = []
-        for file in files:
-            file_path = os.path.join(folder_path, file.name)
-            with open(file_path, 'wb+') as destination:
-                for chunk in file.chunks():
-                    destination.write(chunk)
-            
-            file_obj = ShipmentFile.objects.create(
-                shipment=shipment_instance, 
-                file=file.name, 
-                folder=folder,
-                uploaded_by=getattr(request.user, 'userprofile', None)
-            )
-            created_files.append(file_obj)
-
         serializer = ShipmentFileSerializer(created_files, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -686,9 +761,10 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         """
         try:
             shipment_instance = self.get_object()
-            response = shipment_instance.get_files_zip()
+            response = shipment_instance.get_files_zip(wants_original(request.query_params))
             response['Content-Disposition'] = f'attachment; filename="shipment_{shipment_instance.number}_files.zip"'
             response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+            metrics.record_zip('shipment', response)
             return response
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -701,31 +777,34 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         Возвращает конкретный файл отправки для скачивания.
         """
         try:
-            file_instance = ShipmentFile.objects.get(id=file_id, shipment_id=pk)
-            file_path = file_instance.get_file_path()
-
-            if not os.path.exists(file_path):
-                raise Http404("Файл не найден")
-
-            response = FileResponse(open(file_path, 'rb'), as_attachment=True)
-            response['Content-Disposition'] = f'attachment; filename="{file_instance.file}"'
-            response['Access-Control-Expose-Headers'] = 'Content-Disposition'
-            return response
+            file_instance = ShipmentFile.objects.select_related('blob', 'folder').get(id=file_id, shipment_id=pk)
+            return attachment_response(request, file_instance)
         except ShipmentFile.DoesNotExist:
             raise Http404("Файл не найден")
 
+    @action(detail=True, methods=['get'], url_path=r'files/(?P<file_id>\d+)/thumbnail', url_name='file-thumbnail')
+    def file_thumbnail(self, request, pk=None, file_id=None):
+        """
+        Возвращает миниатюру или превью первой страницы файла отправки.
+        """
+        shipment = self.get_object()
+        file_instance = get_object_or_404(ShipmentFile.objects.select_related('blob'), id=file_id, shipment=shipment)
+        return thumbnail_response(request, file_instance)
+
     @action(detail=True, methods=['delete'], url_path=r'files/(?P<file_id>\d+)')
     def delete_file(self, request, pk=None, file_id=None):
         """
         Удаляет файл отправки из базы данных и файловой системы.
         """
         try:
-            file_instance = ShipmentFile.objects.get(id=file_id, shipment_id=pk)
-            file_path = file_instance.get_file_path()
-
-            if os.path.exists(file_path):
-                os.remove(file_path)  # Удаление файла из файловой системы
-            file_instance.delete()  # Удаление записи из базы данных
+            file_instance = ShipmentFile.objects.select_related('folder').get(id=file_id, shipment_id=pk)
+
+            with transaction.atomic():
+                # Старый файл удаляется из хранилища после фиксации транзакции,
+                # ссылка на блоб освобождается при удалении записи
+                if not file_instance.blob_id:
+                    schedule_deletion(file_instance.get_storage_name())
+                file_instance.delete()  # Удаление записи из базы данных
             return Response({"message": "Файл успешно удален"}, status=status.HTTP_204_NO_CONTENT)
         except ShipmentFile.DoesNotExist:
             return Response({"error": "Файл не найден"}, status=status.HTTP_404_NOT_FOUND)
@@ -755,14 +834,14 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         """Удаление папки и всех связанных файлов"""
         try:
             folder = ShipmentFolder.objects.get(id=folder_id, shipment_id=pk)
-            folder_path = os.path.join(settings.MEDIA_ROOT, f'logistic/shipments/{folder.shipment.id}/{folder.name}')
 
-            if os.path.exists(folder_path):
-                shutil.rmtree(folder_path)  # Удаление папки и всех файлов в ней
+            with transaction.atomic():
+                # Файлы папки удаляются из хранилища после фиксации транзакции
+                schedule_legacy_files(folder.files.all())
 
-            # Удаление всех файлов, связанных с папкой, и самой папки из базы данных
-            folder.files.all().delete()
-            folder.delete()
+                # Удаление всех файлов, связанных с папкой, и самой папки из базы данных
+                folder.files.all().delete()
+                folder.delete()
 
             return Response({"message": "Папка и её содержимое удалены"}, status=status.HTTP_204_NO_CONTENT)
         except ShipmentFolder.DoesNotExist:
@@ -780,9 +859,11 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         - all_files: плоский список всех файлов (включая файлы в папках)
         """
         shipment = self.get_object()
-        root_files = ShipmentFile.objects.filter(shipment=shipment, folder=None)
-        folders = ShipmentFolder.objects.filter(shipment=shipment)
-        all_files = ShipmentFile.objects.filter(shipment=shipment)
+        root_files = ShipmentFile.objects.filter(shipment=shipment, folder=None).select_related('blob', 'uploaded_by')
+        all_files = ShipmentFile.objects.filter(shipment=shipment).select_related('blob', 'uploaded_by', 'folder')
+        folders = ShipmentFolder.objects.filter(shipment=shipment).select_related('created_by').prefetch_related(
+            Prefetch('files', queryset=ShipmentFile.objects.select_related('blob', 'uploaded_by', 'folder'))
+        )
 
         file_serializer = ShipmentFileSerializer(root_files, many=True)
         folder_serializer = ShipmentFolderSerializer(folders, many=True)
@@ -794,6 +875,75 @@ class ShipmentViewSet(viewsets.ModelViewSet):
             "all_files": all_files_serializer.data
         })
 
+    @action(detail=True, methods=['get'], url_path='files/tree', url_name='files-tree')
+    def files_tree(self, request, pk=None):
+        """
+        Возвращает дерево файлов отправки.
+
+        Папки и файлы (вместе с загрузившими их пользователями) читаются
+        двумя запросами, иерархия строится в памяти. Каждый файл
+        сериализуется один раз.
+
+        Файлы отдаются страницами по возрастанию id:
+        - limit: размер страницы (по умолчанию FILE_TREE_PAGE_SIZE)
+        - after: id последнего файла предыдущей страницы
+
+        Папки возвращаются на каждой странице, файлы папок от страницы
+        к странице дополняются. Ответ содержит ETag; при совпадении
+        If-None-Match возвращается 304. ETag строится из версии дерева
+        (logistic/file_tree.py) и версии справочников компании (имена
+        пользователей) до чтения папок и файлов.
+        """
+        shipment = self.get_object()
+
+        try:
+            limit = int(request.query_params.get('limit', settings.FILE_TREE_PAGE_SIZE))
+            after = int(request.query_params.get('after', 0))
+        except ValueError:
+            return Response({"error": "Параметры limit и after должны быть числами"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.FILE_TREE_MAX_PAGE_SIZE))
+
+        etag = '"%s"' % hashlib.md5(json.dumps([
+            file_tree_version(shipment.pk), company_version(shipment.company_id), limit, after,
+        ]).encode()).hexdigest()
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+
+        folders = list(ShipmentFolder.objects.filter(shipment=shipment).select_related('created_by').order_by('name', 'id'))
+        files = list(
+            ShipmentFile.objects.filter(shipment=shipment, id__gt=after)
+            .select_related('uploaded_by', 'blob')
+            .order_by('id')[:limit + 1]
+        )
+        has_more = len(files) > limit
+        files = files[:limit]
+
+        folders_by_id = {folder.id: folder for folder in folders}
+        for file_obj in files:
+            # Папка уже загружена - подставляем ее, чтобы folder.name не делал запрос
+            file_obj.folder = folders_by_id.get(file_obj.folder_id)
+
+        tree_folders = ShipmentFolderTreeSerializer(folders, many=True).data
+        folder_files = {folder['id']: folder.setdefault('files', []) for folder in tree_folders}
+        root_files = []
+        for file_data in ShipmentFileSerializer(files, many=True).data:
+            folder_files.get(file_data['folder'], root_files).append(file_data)
+
+        data = {
+            "folders": tree_folders,
+            "files": root_files,
+            "has_more": has_more,
+            "next_after": files[-1].id if has_more else None,
+        }
+
+        response = Response(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
     @action(detail=True, methods=['post'], url_path='update-status')
     def update_status(self, request, pk=None):
         """
@@ -810,16 +960,21 @@ class ShipmentViewSet(viewsets.ModelViewSet):
                             status=status.HTTP_400_BAD_REQUEST)
             
         try:
-            # Получаем статус из базы данных
-            shipment_status = ShipmentStatus.objects.get(id=status_id)
+            # Получаем статус из базы данных (только статусы компании отправки)
+            shipment_status = ShipmentStatus.objects.get(id=status_id, company_id=shipment.company_id)
             
-            # Обновляем поля отправления
-            shipment.status = shipment_status
+            # Обновляем поля отправления; смена статуса записывается в журнал в той же транзакции
+            transition = change_status(shipment, shipment_status, request.user)
             
             if comment is not None:
                 shipment.comment = comment
                 
-            shipment.save()
+            with transaction.atomic():
+                shipment.save()
+                record_transitions([transition])
+                # Заявки отправки переводятся по каскадному правилу статуса одним UPDATE
+                if transition is not None:
+                    cascade_shipment_status(shipment, request.user)
             
             # Возвращаем обновленное отправление
             serializer = ShipmentListSerializer(shipment) if self.action != 'retrieve' else ShipmentDetailSerializer(shipment)
@@ -830,9 +985,11 @@ class ShipmentViewSet(viewsets.ModelViewSet):
                             status=status.HTTP_404_NOT_FOUND)
 
 
-class RequestViewSet(viewsets.ModelViewSet):
+class RequestViewSet(StatusHistoryMixin, StorageUploadMixin, ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Request.objects.all().order_by('-created_at')
     permission_classes = [IsCompanyManager, IsCompanyClient]
+    replica_read_actions = ('list', 'retrieve', 'export')
+    storage_upload_actions = ('request_upload_files',)
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -857,26 +1014,27 @@ class RequestViewSet(viewsets.ModelViewSet):
         """
         Возвращает заявки в зависимости от роли пользователя.
         """
-        user = self.request.user
-        if user.is_superuser:
-            return Request.objects.all()
-        
-        user_profile = user.userprofile
-        if user_profile.user_group == 'admin':
-            return Request.objects.filter(client__company=user_profile.company)
-        elif user_profile.user_group == 'boss':
-            return Request.objects.filter(client__company=user_profile.company)
-        elif user_profile.user_group == 'manager':
-            return Request.objects.filter(
-                Q(client__company=user_profile.company) &
-                (Q(manager=user_profile) | Q(manager__isnull=True))
-            )
-        elif user_profile.user_group == 'warehouse':
-            return Request.objects.filter(
-                Q(client__company=user_profile.company)
+        return Request.objects.for_user(self.request.user)
+
+    def filter_queryset(self, queryset):
+        """
+        Подгружает связанные объекты, которые выводят сериализаторы заявки.
+        """
+        queryset = super().filter_queryset(queryset).select_related(*REQUEST_RELATED_FIELDS)
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(
+                Prefetch('files', queryset=RequestFile.objects.select_related('uploaded_by', 'blob'))
             )
-        else:  # client
-            return Request.objects.filter(client=user_profile)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Выгрузка списка заявок в CSV или XLSX (?file_format=xlsx) потоком.
+        Выборка и фильтры те же, что у списка.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).order_by('-created_at')
+        return export_response(request, queryset, REQUEST_EXPORT_COLUMNS, 'requests')
     
     def perform_create(self, serializer):
         """
@@ -884,7 +1042,9 @@ class RequestViewSet(viewsets.ModelViewSet):
         """
         company = self.request.user.userprofile.company
         default_status = RequestStatus.objects.get(company=company, is_default=True)
-        serializer.save(status=default_status, company=company)
+        with transaction.atomic():
+            request_obj = serializer.save(status=default_status, company=company, status_changed_at=timezone.now())
+            record_transitions(initial_transitions([request_obj], self.request.user))
         
     @action(detail=True, methods=['post'], url_path='update-status')
     def update_status(self, request, pk=None):
@@ -905,11 +1065,11 @@ class RequestViewSet(viewsets.ModelViewSet):
                            status=status.HTTP_400_BAD_REQUEST)
             
         try:
-            # Получаем статус из базы данных
-            request_status = RequestStatus.objects.get(id=status_id)
+            # Получаем статус из базы данных (только статусы компании заявки)
+            request_status = RequestStatus.objects.get(id=status_id, company_id=request_obj.company_id)
             
-            # Обновляем поля заявки
-            request_obj.status = request_status
+            # Обновляем поля заявки; смена статуса записывается в журнал в той же транзакции
+            transition = change_status(request_obj, request_status, request.user)
             
             if comment is not None:
                 request_obj.comment = comment
@@ -921,7 +1081,9 @@ class RequestViewSet(viewsets.ModelViewSet):
             if actual_volume is not None:
                 request_obj.actual_volume = actual_volume
                 
-            request_obj.save()
+            with transaction.atomic():
+                request_obj.save()
+                record_transitions([transition])
             
             # Используем RequestSerializer вместо RequestListSerializer
             serializer = RequestSerializer(request_obj)
@@ -936,46 +1098,17 @@ class RequestViewSet(viewsets.ModelViewSet):
         request_instance = self.get_object()
         files = request.FILES.getlist('files')
 
+        rejected = upload_rejections(request)
+        if rejected:
+            return Response({"error": "Files rejected", "rejected": rejected}, status=status.HTTP_400_BAD_REQUEST)
         if not files:
             return Response({"error": "No files provided"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Создаем папку с ID заявки, если её нет (для существующей заявки)
-        target_dir = os.path.join(settings.MEDIA_ROOT, f'logistic/requests/{request_instance.id}')
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-
-        created_files = []
-        # Сохраняем файлы в нужную папку
-        for file in files:
-            file_path = os.path.join(target_dir, file.name)
-            with open(file_path, 'wb+') as destination:
-                for chunk in file.chunks():
-                    destination.write(chunk)
-            
-            file_obj = RequestFile.objects.create(
-                request=request_instance, 
-                file=file.name,
-                uploaded_by=getattr(request.user, 'userprofile', None)
-            )
-            created_files.append(file_obj)
+        created_files = create_request_files(request_instance, files, getattr(request.user, 'userprofile', None))
 
         serializer = RequestFileSerializer(created_files, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    def _move_tmp_files(self, request_instance):
-        """ Перемещаем временные файлы в папку заявки после её создания. """
-        tmp_dir = os.path.join(settings.MEDIA_ROOT, 'logistic/requests/tmp')
-        target_dir = os.path.join(settings.MEDIA_ROOT, f'logistic/requests/{request_instance.id}')
-
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-
-        for file_instance in request_instance.files.all():
-            tmp_path = os.path.join(tmp_dir, file_instance.file)
-            target_path = os.path.join(target_dir, file_instance.file)
-            if os.path.exists(tmp_path):
-                os.rename(tmp_path, target_path)
-
     @action(detail=True, methods=['get'], url_path='download-all-files', url_name='download_all_files')
     def download_all_files(self, request, pk=None):
         """
@@ -985,9 +1118,10 @@ class RequestViewSet(viewsets.ModelViewSet):
         """
         try:
             request_instance = self.get_object()
-            response = request_instance.get_files_zip()
+            response = request_instance.get_files_zip(wants_original(request.query_params))
             response['Content-Disposition'] = f'attachment; filename="request_{request_instance.number}_files.zip"'
             response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+            metrics.record_zip('request', response)
             return response
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1000,43 +1134,42 @@ class RequestViewSet(viewsets.ModelViewSet):
         Возвращает конкретный файл заявки для скачивания.
         """
         try:
-            file_instance = RequestFile.objects.get(id=file_id, request_id=pk)
-            full_path = file_instance.get_file_path()
-
-            if not os.path.exists(full_path):
-                raise Http404("Файл не найден")
-
-            response = FileResponse(open(full_path, 'rb'), as_attachment=True)
-            response['Content-Disposition'] = f'attachment; filename="{file_instance.file}"'
-            response['Access-Control-Expose-Headers'] = 'Content-Disposition'
-            return response
+            file_instance = RequestFile.objects.select_related('blob').get(id=file_id, request_id=pk)
+            return attachment_response(request, file_instance)
         except RequestFile.DoesNotExist:
             raise Http404("Файл не найден")
 
+    @action(detail=True, methods=['get'], url_path=r'files/(?P<file_id>\d+)/thumbnail', url_name='file-thumbnail')
+    def file_thumbnail(self, request, pk=None, file_id=None):
+        """
+        Возвращает миниатюру или превью первой страницы файла заявки.
+        """
+        request_instance = self.get_object()
+        file_instance = get_object_or_404(RequestFile.objects.select_related('blob'), id=file_id, request=request_instance)
+        return thumbnail_response(request, file_instance)
+
     @action(detail=True, methods=['delete'], url_path=r'files/(?P<file_id>\d+)')
     def delete_file(self, request, pk=None, file_id=None):
         """ Удаление файла заявки. """
         try:
             file_instance = RequestFile.objects.get(id=file_id, request_id=pk)
-            full_path = file_instance.get_file_path()
 
-            if os.path.exists(full_path):
-                os.remove(full_path)
+            with transaction.atomic():
+                # Старый файл удаляется из хранилища после фиксации транзакции,
+                # ссылка на блоб освобождается при удалении записи
+                if not file_instance.blob_id:
+                    schedule_deletion(file_instance.get_storage_name())
                 file_instance.delete()
-                return Response({"message": "Файл успешно удален"}, status=status.HTTP_204_NO_CONTENT)
-            else:
-                return Response({"error": "Файл не найден"}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"message": "Файл успешно удален"}, status=status.HTTP_204_NO_CONTENT)
         except RequestFile.DoesNotExist:
             return Response({"error": "Файл не найден"}, status=status.HTTP_404_NOT_FOUND)
 
     def perform_destroy(self, instance):
         """ Удаление заявки и её файлов. """
-        folder_path = os.path.join(settings.MEDIA_ROOT, f'logistic/requests/{instance.id}')
-
-        if os.path.exists(folder_path):
-            shutil.rmtree(folder_path)
-
-        super().perform_destroy(instance)
+        with transaction.atomic():
+            # Файлы заявки удаляются из хранилища после фиксации транзакции
+            schedule_legacy_files(RequestFile.objects.filter(request=instance))
+            super().perform_destroy(instance)
 
     def list(self, request, *args, **kwargs):
         """
@@ -1053,7 +1186,48 @@ class RequestViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class AnalyticsSummaryView(generics.GenericAPIView):
+class BootstrapView(ReplicaReadMixin, APIView):
+    """
+    Стартовые данные фронтенда одним запросом: профиль, статусы заявок и
+    отправок, статьи, активные клиенты и менеджеры, данные и настройки
+    компании. Разделы, недоступные роли пользователя, равны null.
+
+    Справочники берутся из кеша компании. Ответ содержит ETag; при
+    совпадении If-None-Match возвращается 304 без обращений к базе.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        profile = profile_data(request.user)
+        etag = bootstrap_etag(request.user, profile)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            response = Response(bootstrap_data(request.user, profile))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class BatchView(generics.GenericAPIView):
+    """
+    Несколько GET-запросов API одним HTTP-запросом (см. batch.py).
+    Для каждого подзапроса возвращаются id, код ответа и тело ответа
+    в том виде, в каком его вернул бы отдельный запрос.
+    """
+    serializer_class = BatchSerializer
+    permission_classes = [IsAuthenticated]
+    # Тела подзапросов уже в формате своих эндпоинтов, повторно их ключи не преобразуются
+    renderer_classes = [JSONRenderer]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response({'results': run_batch(request, data['requests'], parallel=data['parallel'])})
+
+
+class AnalyticsSummaryView(ReplicaReadMixin, generics.GenericAPIView):
     serializer_class = AnalyticsSummarySerializer
     permission_classes = [IsAuthenticated]
     renderer_classes = [JSONRenderer]
@@ -1072,26 +1246,24 @@ class AnalyticsSummaryView(generics.GenericAPIView):
         total_requests = requests.count()
         requests_by_status = requests.values('status__code').annotate(count=Count('id'))
         
-        # Получаем финансовые данные
-        finances = Finance.objects.filter(company=user_profile.company)
-        total_revenue = finances.filter(operation_type='income').aggregate(total=Sum('amount'))['total'] or 0
-        total_expenses = finances.filter(operation_type='expense').aggregate(total=Sum('amount'))['total'] or 0
-        total_profit = total_revenue - total_expenses
-        
-        # Группируем по валютам
-        revenue_by_currency = finances.filter(operation_type='income').values('currency').annotate(total=Sum('amount'))
-        expenses_by_currency = finances.filter(operation_type='expense').values('currency').annotate(total=Sum('amount'))
+        # Финансовые итоги по валютам и в валюте пересчета одним запросом
+        currency = target_currency(request)
+        totals = BalanceTotals(currency)
+        for row in finance_totals(Finance.objects.filter(company=user_profile.company), currency):
+            totals.add(row)
         
         data = {
             'total_shipments': total_shipments,
             'total_requests': total_requests,
-            'total_revenue': total_revenue,
-            'total_expenses': total_expenses,
-            'total_profit': total_profit,
+            'currency': currency,
+            'total_revenue': totals.total_income,
+            'total_expenses': totals.total_expenses,
+            'total_profit': totals.total_balance,
+            'unconverted_operations': totals.unconverted,
             'shipments_by_status': {item['status__code']: item['count'] for item in shipments_by_status},
             'requests_by_status': {item['status__code']: item['count'] for item in requests_by_status},
-            'revenue_by_currency': {item['currency']: item['total'] for item in revenue_by_currency},
-            'expenses_by_currency': {item['currency']: item['total'] for item in expenses_by_currency}
+            'revenue_by_currency': totals.income,
+            'expenses_by_currency': totals.expenses
         }
         
         serializer = self.get_serializer(data=data)
@@ -1099,7 +1271,7 @@ class AnalyticsSummaryView(generics.GenericAPIView):
         return Response(serializer.data)
 
 
-class BalanceView(generics.GenericAPIView):
+class BalanceView(ReplicaReadMixin, generics.GenericAPIView):
     serializer_class = BalanceSerializer
     permission_classes = [IsAuthenticated]
     renderer_classes = [JSONRenderer]
@@ -1110,48 +1282,18 @@ class BalanceView(generics.GenericAPIView):
         
         company = request.user.userprofile.company
         
-        # Получаем суммы по входящим операциям (доходы)
-        income = Finance.objects.filter(
-            company=company,
-            operation_type='in'
-        ).values('currency').annotate(total=Sum('amount'))
-        
-        # Получаем суммы по исходящим операциям (расходы)
-        expenses = Finance.objects.filter(
-            company=company,
-            operation_type='out'
-        ).values('currency').annotate(total=Sum('amount'))
-        
-        # Форматируем результат
-        result = {
-            'income': {},
-            'expenses': {},
-            'balance': {}
-        }
-        
-        # Заполняем доходы
-        for item in income:
-            currency = item['currency']
-            result['income'][currency] = float(item['total'] or 0)
-            result['balance'][currency] = float(item['total'] or 0)
-        
-        # Заполняем расходы и обновляем баланс
-        for item in expenses:
-            currency = item['currency']
-            amount = float(item['total'] or 0)
-            result['expenses'][currency] = amount
-            
-            if currency in result['balance']:
-                result['balance'][currency] -= amount
-            else:
-                result['balance'][currency] = -amount
+        currency = target_currency(request)
+        totals = BalanceTotals(currency)
+        for row in finance_totals(Finance.objects.filter(company=company), currency):
+            totals.add(row)
+        result = balance_data(totals)
         
         serializer = self.get_serializer(data=result)
         serializer.is_valid(raise_exception=True)
         return Response(serializer.data)
 
 
-class CounterpartyBalanceView(generics.GenericAPIView):
+class CounterpartyBalanceView(ReplicaReadMixin, generics.GenericAPIView):
     serializer_class = CounterpartyBalanceSerializer
     permission_classes = [IsAuthenticated]
     renderer_classes = [JSONRenderer]
@@ -1162,41 +1304,11 @@ class CounterpartyBalanceView(generics.GenericAPIView):
         
         company = request.user.userprofile.company
         
-        # Получаем все операции по контрагентам
-        operations = Finance.objects.filter(
-            company=company,
-            counterparty__isnull=False
-        )
-        
-        counterparties = {}
-        
-        for op in operations:
-            counterparty_id = op.counterparty.id
-            counterparty_name = op.counterparty.get_full_name() or op.counterparty.username
-            currency = op.currency
-            amount = op.amount or 0
-            
-            if op.operation_type == 'out':
-                amount = -amount
-            
-            if counterparty_id not in counterparties:
-                counterparties[counterparty_id] = {
-                    'id': counterparty_id,
-                    'name': counterparty_name,
-                    'balances': {}
-                }
-            
-            if currency not in counterparties[counterparty_id]['balances']:
-                counterparties[counterparty_id]['balances'][currency] = 0
-                
-            counterparties[counterparty_id]['balances'][currency] += amount
-        
-        # Преобразуем в список и форматируем суммы как float
-        result = []
-        for cp_id, data in counterparties.items():
-            for currency in data['balances']:
-                data['balances'][currency] = float(data['balances'][currency])
-            result.append(data)
+        # Итоги по контрагентам и валютам считаются в базе
+        currency = target_currency(request)
+        operations = Finance.objects.filter(company=company, counterparty__isnull=False)
+        rows = finance_totals(operations, currency, group_by=COUNTERPARTY_FIELDS)
+        result = counterparty_balances(rows, currency)
         
         serializer = self.get_serializer(data=result, many=True)
         serializer.is_valid(raise_exception=True)
@@ -1215,30 +1327,15 @@ class EmailView(generics.GenericAPIView):
         data = serializer.validated_data
         
         try:
-            # Создаем MIME-сообщение
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = data['subject']
-            msg['From'] = f"{data['sender_name']} <{data['sender_email']}>"
-            msg['To'] = data['recipient_email']
-            
-            # Добавляем текстовое содержимое
-            part1 = MIMEText(data['message_plain'], 'plain')
-            msg.attach(part1)
-
-            # Если есть HTML-содержимое, добавляем его
-            if data['message_html']:
-                part2 = MIMEText(data['message_html'], 'html')
-                msg.attach(part2)
-
-            # Создаем SMTP-соединение с TLS
-            context = ssl.create_default_context(cafile=certifi.where())
-            with smtplib.SMTP_SSL("smtp.example.com", 465, context=context) as server:
-                server.login(data['sender_email'], 'password')  # В реальной жизни пароль должен быть в безопасном хранилище
-                server.sendmail(data['sender_email'], data['recipient_email'], msg.as_string())
+            # Создаем MIME-сообщение и отправляем через SMTP с TLS
+            msg = build_email_message(data)
+            send_email_message(data, msg)
 
+            metrics.EMAILS.inc(outcome='success')
             return Response({"message": "Email sent successfully"}, status=status.HTTP_200_OK)
         except Exception as e:
             # Обработка ошибок отправки
+            metrics.EMAILS.inc(outcome='failure')
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
@@ -1247,9 +1344,7 @@ class ArticleList(generics.ListCreateAPIView):
     permission_classes = [IsCompanyBoss]
     
     def get_queryset(self):
-        if hasattr(self.request.user, 'userprofile') and self.request.user.userprofile.company:
-            return Article.objects.filter(company=self.request.user.userprofile.company)
-        return Article.objects.none()
+        return Article.objects.for_user(self.request.user).select_related('company')
     
     def perform_create(self, serializer):
         if hasattr(self.request.user, 'userprofile') and self.request.user.userprofile.company:
@@ -1261,35 +1356,22 @@ class ArticleDetail(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsCompanyBoss]
     
     def get_queryset(self):
-        if hasattr(self.request.user, 'userprofile') and self.request.user.userprofile.company:
-            return Article.objects.filter(company=self.request.user.userprofile.company)
-        return Article.objects.none()
+        return Article.objects.for_user(self.request.user).select_related('company')
 
 
-class FinanceList(generics.ListCreateAPIView):
+class FinanceList(ReplicaReadMixin, generics.ListCreateAPIView):
     serializer_class = FinanceListSerializer
     permission_classes = [IsCompanyManager]
     
     def get_queryset(self):
-        if hasattr(self.request.user, 'userprofile'):
-            user_profile = self.request.user.userprofile
-            company = user_profile.company
-            
-            if not company:
-                return Finance.objects.none()
-            
-            # Клиенты видят только свои финансы
-            if user_profile.user_group == 'client':
-                # Финансы по заявкам клиента
-                client_requests = Request.objects.filter(client=user_profile)
-                return Finance.objects.filter(company=company).filter(
-                    request__in=client_requests
-                ).distinct()
-            
-            # Остальные видят все финансы своей компании
-            return Finance.objects.filter(company=company)
-        
-        return Finance.objects.none()
+        # Клиенты видят только операции по своим заявкам, остальные - все операции компании
+        return Finance.objects.for_user(self.request.user)
+
+    def filter_queryset(self, queryset):
+        """
+        Подгружает связанные объекты, которые выводит сериализатор операции.
+        """
+        return super().filter_queryset(queryset).select_related(*FINANCE_RELATED_FIELDS)
     
     def perform_create(self, serializer):
         if hasattr(self.request.user, 'userprofile') and self.request.user.userprofile.company:
@@ -1299,31 +1381,32 @@ class FinanceList(generics.ListCreateAPIView):
             )
 
 
-class FinanceDetail(generics.RetrieveUpdateDestroyAPIView):
+class FinanceDetail(ReplicaReadMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = FinanceDetailSerializer
     permission_classes = [IsCompanyManager]
     lookup_field = 'number'
 
     def get_queryset(self):
-        if hasattr(self.request.user, 'userprofile'):
-            user_profile = self.request.user.userprofile
-            company = user_profile.company
-            
-            if not company:
-                return Finance.objects.none()
-            
-            # Клиенты видят только свои финансы
-            if user_profile.user_group == 'client':
-                # Финансы по заявкам клиента
-                client_requests = Request.objects.filter(client=user_profile)
-                return Finance.objects.filter(company=company).filter(
-                    request__in=client_requests
-                ).distinct()
-            
-            # Остальные видят все финансы своей компании
-            return Finance.objects.filter(company=company)
-        
-        return Finance.objects.none()
+        # Клиенты видят только операции по своим заявкам, остальные - все операции компании
+        return Finance.objects.for_user(self.request.user)
+
+    def filter_queryset(self, queryset):
+        """
+        Подгружает связанные объекты, которые выводит сериализатор операции.
+        """
+        return super().filter_queryset(queryset).select_related(*FINANCE_RELATED_FIELDS, 'basis')
+
+
+class FinanceExportView(FinanceList):
+    """
+    Выгрузка финансовых операций в CSV или XLSX (?file_format=xlsx) потоком.
+    Выборка и фильтры те же, что у списка.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).order_by('-created_at', '-number')
+        return export_response(request, queryset, FINANCE_EXPORT_COLUMNS, 'finances')
 
 
 class ShipmentCalculationViewSet(viewsets.ModelViewSet):
@@ -1335,7 +1418,7 @@ class ShipmentCalculationViewSet(viewsets.ModelViewSet):
     def calculation_related_requests(self, request, pk=None):
         # Получить заявки, связанные с отправлением
         calculation = self.get_object()
-        requests = Request.objects.filter(shipment=calculation.shipment)
+        requests = Request.objects.filter(shipment=calculation.shipment).select_related(*REQUEST_RELATED_FIELDS)
         serializer = RequestListSerializer(requests, many=True)
         return Response(serializer.data)
 
@@ -1351,21 +1434,36 @@ class ShipmentCalculationViewSet(viewsets.ModelViewSet):
     def calculate_costs(self, request, pk=None):
         """
         Расчет затрат на основе курсов валют и связанных заявок.
+        
+        Курсы берутся из запроса (euro_rate, usd_rate), иначе из истории
+        курсов на дату rate_date (если она указана или курс в расчете не
+        заполнен; по умолчанию - сегодня), иначе из сохраненного расчета.
         """
         calculation = self.get_object()
         
         # Получаем параметры расчета
         data = request.data
-        euro_rate = Decimal(str(data.get('euro_rate', calculation.euro_rate)))
-        usd_rate = Decimal(str(data.get('usd_rate', calculation.usd_rate)))
+        rates = {'eur': calculation.euro_rate, 'usd': calculation.usd_rate}
+        rate_date = data.get('rate_date')
+        if rate_date or not all(rates.values()):
+            try:
+                on_date = datetime.date.fromisoformat(str(rate_date)) if rate_date else datetime.date.today()
+            except ValueError:
+                raise ValidationError({'rate_date': 'Дата должна быть в формате ГГГГ-ММ-ДД'})
+            for currency, rate in rates_on(on_date).items():
+                if rate_date or not rates[currency]:
+                    # В расчете курс хранится с точностью до копейки
+                    rates[currency] = rate.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        euro_rate = Decimal(str(data.get('euro_rate', rates['eur'])))
+        usd_rate = Decimal(str(data.get('usd_rate', rates['usd'])))
         
         # Обновляем курсы
         calculation.euro_rate = euro_rate
         calculation.usd_rate = usd_rate
         calculation.save()
         
-        # Получаем связанные заявки
-        requests = Request.objects.filter(shipment=calculation.shipment)
+        # Получаем связанные заявки вместе с клиентами
+        requests = Request.objects.filter(shipment=calculation.shipment).select_related('client__user')
         
         # Рассчитываем суммы в зависимости от валюты для каждой заявки
         result = {
@@ -1426,6 +1524,7 @@ class ShipmentCalculationViewSet(viewsets.ModelViewSet):
         result['totals']['usd'] = float(result['totals']['usd'])
         result['totals']['eur'] = float(result['totals']['eur'])
         result['totals']['rub'] = float(result['totals']['rub'])
+        result['rates'] = {'eur': float(euro_rate), 'usd': float(usd_rate)}
         
         return Response(result)
 
@@ -1477,6 +1576,11 @@ class ShipmentCalculationViewSet(viewsets.ModelViewSet):
         # Переводим в float для JSON
         for key in result['totals']:
             result['totals'][key] = float(result['totals'][key])
+        
+        # Итог в рублях по курсам на даты оплаты
+        converted = annotate_converted(expenses).aggregate(**converted_totals())
+        result['total_rub'] = float(converted['converted'] or 0)
+        result['unconverted_operations'] = converted['unconverted']
             
         return Response(result)
 
@@ -1511,9 +1615,249 @@ class RequestStatusViewSet(viewsets.ModelViewSet):
         if self.request.user.is_superuser:
             return RequestStatus.objects.all().order_by('name')
         
-        if hasattr(self.request.user, 'userprofile') and self.request.user.userprofile.company:
-            return RequestStatus.objects.filter(
-                company=self.request.user.userprofile.company
-            ).order_by('name')
-        
-        return RequestStatus.objects.none()
+        return RequestStatus.objects.for_user(self.request.user).order_by('name')
+
+
+class ImportJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    """
+    ViewSet заданий импорта заявок и финансовых операций из CSV/XLSX.
+
+    Создание задания загружает файл и запускает импорт в фоне; ход
+    выполнения виден в полях задания. Доступ: менеджеры и выше.
+    """
+    permission_classes = [IsCompanyManager]
+
+    def get_queryset(self):
+        return ImportJob.objects.for_user(self.request.user).select_related('created_by')
+
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return ImportJobDetailSerializer
+        return ImportJobSerializer
+
+    def perform_create(self, serializer):
+        """
+        Сохраняет файл в хранилище и запускает импорт после фиксации транзакции.
+        """
+        user_profile = self.request.user.userprofile
+        if user_profile.company is None:
+            raise ValidationError({'error': 'Пользователь не привязан к компании'})
+        file = serializer.validated_data.pop('file')
+        with transaction.atomic():
+            job = serializer.save(company=user_profile.company, created_by=user_profile, file_name=file.name)
+            job.storage_name = import_storage_name(job.pk, file.name)
+            get_storage().save(job.storage_name, file.chunks())
+            job.save(update_fields=['storage_name'])
+            run_on_commit(run_import_job, job.pk)
+
+    @action(detail=True, methods=['get'])
+    def errors(self, request, pk=None):
+        """
+        Отчет об ошибках строк в CSV: номер строки файла, столбец, сообщение.
+        """
+        job = self.get_object()
+        response = StreamingHttpResponse(
+            csv_chunks(['Строка', 'Столбец', 'Ошибка'], error_report_rows(job)), content_type=CSV_CONTENT_TYPE
+        )
+        response['Content-Disposition'] = f'attachment; filename="import_{job.pk}_errors.csv"'
+        response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+        return response
+
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        """
+        Продолжает прерванный импорт с первой необработанной строки.
+        Доступно для заданий с ошибкой и для заданий, которые не обновлялись
+        IMPORT_STALE_SECONDS секунд (процесс был остановлен).
+        """
+        job = self.get_object()
+        stale_before = timezone.now() - datetime.timedelta(seconds=settings.IMPORT_STALE_SECONDS)
+        is_stale = job.status == ImportJob.STATUS_RUNNING and job.updated_at < stale_before
+        if job.status != ImportJob.STATUS_FAILED and not is_stale:
+            return Response({'error': 'Задание не прервано'}, status=status.HTTP_400_BAD_REQUEST)
+        # Задание не должно было измениться после чтения: иначе процесс импорта еще работает
+        # или задание уже продолжено другим запросом
+        now = timezone.now()
+        resumed = ImportJob.objects.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+            status=ImportJob.STATUS_PENDING, updated_at=now
+        )
+        if not resumed:
+            return Response({'error': 'Задание не прервано'}, status=status.HTTP_400_BAD_REQUEST)
+        job.status, job.updated_at = ImportJob.STATUS_PENDING, now
+        run_on_commit(run_import_job, job.pk)
+        return Response(ImportJobSerializer(job).data)
+
+    @action(detail=True, methods=['post'])
+    def start(self, request, pk=None):
+        """
+        Запускает настоящий импорт файла после успешного пробного запуска.
+        """
+        job = self.get_object()
+        if not job.dry_run or job.status != ImportJob.STATUS_COMPLETED:
+            return Response({'error': 'Запуск возможен только после завершенного пробного импорта'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        job.dry_run = False
+        job.status = ImportJob.STATUS_PENDING
+        job.processed_rows = job.imported_rows = job.error_rows = 0
+        job.errors = []
+        job.message = None
+        job.started_at = job.finished_at = None
+        job.save()
+        run_on_commit(run_import_job, job.pk)
+        return Response(ImportJobSerializer(job).data)
+
+
+class StatusTransitionViewSet(ReplicaReadMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Журнал смены статусов отправок и заявок и аналитика времени в статусах.
+
+    Фильтры списка и аналитики: ?entity=shipment|request, ?date_from и
+    ?date_to (ГГГГ-ММ-ДД, включительно); списка - также ?object_id и
+    ?status (новый статус). Доступ: менеджеры и выше; в истории заявок
+    менеджер видит только доступные ему заявки.
+    """
+    serializer_class = StatusTransitionSerializer
+    permission_classes = [IsCompanyManager]
+    replica_read_actions = ('list', 'analytics')
+
+    def _entity_param(self, default=None):
+        entity = self.request.query_params.get('entity', default)
+        if entity is not None and entity not in dict(StatusTransition.ENTITY_CHOICES):
+            raise ValidationError({'entity': 'Допустимые значения: shipment, request'})
+        return entity
+
+    def _filter_params(self, queryset):
+        params = self.request.query_params
+        for name, lookup in (('date_from', 'at__date__gte'), ('date_to', 'at__date__lte')):
+            if params.get(name):
+                try:
+                    queryset = queryset.filter(**{lookup: datetime.date.fromisoformat(params[name])})
+                except ValueError:
+                    raise ValidationError({name: 'Ожидается дата в формате ГГГГ-ММ-ДД'})
+        return queryset
+
+    def get_queryset(self):
+        user = self.request.user
+        visible_requests = Request.objects.for_user(user).values('pk')
+        queryset = StatusTransition.objects.for_user(user).filter(
+            Q(entity=StatusTransition.ENTITY_SHIPMENT)
+            | Q(entity=StatusTransition.ENTITY_REQUEST, object_id__in=visible_requests)
+        ).select_related('changed_by')
+        entity = self._entity_param()
+        if entity is not None:
+            queryset = queryset.filter(entity=entity)
+        queryset = self._filter_params(queryset)
+        params = self.request.query_params
+        if params.get('object_id', '').isdigit():
+            queryset = queryset.filter(object_id=params['object_id'])
+        if params.get('status'):
+            queryset = queryset.filter(to_status=params['status'])
+        return queryset.order_by('-at', '-id')
+
+    @action(detail=False, methods=['get'], serializer_class=StatusAnalyticsSerializer)
+    def analytics(self, request):
+        """
+        Время в статусах (количество выходов, среднее, максимум, перцентили
+        p50/p90/p95 в секундах) и поступления/выходы по каждому статусу за
+        период. По умолчанию - заявки. Агрегаты считаются в базе по всей компании.
+        """
+        entity = self._entity_param(StatusTransition.ENTITY_REQUEST)
+        queryset = self._filter_params(StatusTransition.objects.for_user(request.user).filter(entity=entity))
+        durations = time_in_status(queryset)
+        counts = throughput(queryset)
+
+        status_model = ShipmentStatus if entity == StatusTransition.ENTITY_SHIPMENT else RequestStatus
+        names = dict(status_model.objects.for_user(request.user).order_by('order').values_list('code', 'name'))
+        # Статусы компании по порядку, затем удаленные статусы, оставшиеся в журнале
+        codes = list(names) + sorted((set(durations) | set(counts)) - set(names))
+        empty_durations = dict.fromkeys(
+            ['avg_seconds', 'max_seconds'] + [f'p{percentile}_seconds' for percentile in PERCENTILES]
+        )
+        statuses = [
+            {
+                'code': code,
+                'name': names.get(code, code),
+                **counts.get(code, {'entered': 0, 'left': 0}),
+                **{key: value for key, value in durations.get(code, empty_durations).items() if key != 'count'},
+            }
+            for code in codes
+        ]
+        data = {
+            'entity': entity,
+            'date_from': request.query_params.get('date_from') or None,
+            'date_to': request.query_params.get('date_to') or None,
+            'statuses': statuses,
+        }
+        return Response(StatusAnalyticsSerializer(data).data)
+
+
+class SignedFileDownloadView(APIView):
+    """
+    Скачивание файла по подписанной ссылке.
+
+    Ссылки выдаются хранилищем (AttachmentStorage.url) и содержат имя файла
+    и срок действия, поэтому аутентификация не требуется.
+    """
+    authentication_classes = []
+    permission_classes = []
+    schema = None
+
+    def get(self, request, token):
+        try:
+            name, filename = load_signed_url(token)
+        except signing.SignatureExpired:
+            return Response({"error": "Срок действия ссылки истек"}, status=status.HTTP_403_FORBIDDEN)
+        except signing.BadSignature:
+            raise Http404("Файл не найден")
+
+        storage = get_storage()
+        if not storage.exists(name):
+            raise Http404("Файл не найден")
+
+        return FileResponse(storage.open(name), as_attachment=True, filename=filename or os.path.basename(name))
+
+
+class RequestProfileListView(APIView):
+    """
+    Последние профили запросов текущего процесса (см. logistic/profiling.py).
+    Доступно только суперпользователям.
+    """
+    permission_classes = [IsSuperuser]
+
+    def get(self, request):
+        profiles = reversed(list(get_profile_buffer()))
+        return Response([profile.summary() for profile in profiles])
+
+
+class RequestProfileDetailView(APIView):
+    """
+    Подробный профиль запроса: этапы, повторяющиеся SQL-запросы и дерево вызовов.
+    Доступно только суперпользователям.
+    """
+    permission_classes = [IsSuperuser]
+
+    def get(self, request, profile_id):
+        profile = get_request_profile(profile_id)
+        if profile is None:
+            raise Http404("Профиль не найден")
+        return Response(profile.as_dict())
+
+
+class MetricsView(APIView):
+    """
+    Метрики приложения в текстовом формате Prometheus (см. logistic/metrics.py).
+
+    Требует заголовок 'Authorization: Bearer <METRICS_TOKEN>'. Если токен не
+    задан, метрики доступны только в режиме DEBUG.
+    """
+    authentication_classes = []
+    permission_classes = []
+    schema = None
+
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        header = request.headers.get('Authorization', '')
+        if not (token and header == f'Bearer {token}') and not (not token and settings.DEBUG):
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(metrics.render_exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
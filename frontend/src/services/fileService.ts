@@ -18,6 +18,7 @@ export interface ShipmentFile {
   uploaded_by: number | null;
   uploaded_by_name: string;
   uploaded_at: string;
+  thumbnail_url: string | null;
 }
 
 export interface FilesResponse {